@@ -0,0 +1,8 @@
+"""An asyncio engine for RestPipe (Python 3.7+). It speaks the same wire
+protocol as the gevent engine, so either side can use either engine, and it
+calls event-handlers with the same API. Handlers may also be coroutine
+functions. Plain functions are called directly on the loop and must not block.
+
+Nothing here imports gevent or depends on monkey-patching, so it can be
+embedded in an existing asyncio application (and run under uvloop).
+"""
@@ -0,0 +1,151 @@
+"""The asyncio half of rpipe.tools.engine_benchmark."""
+
+import asyncio
+import logging
+import time
+
+import rpipe.config.client
+import rpipe.config.engine_benchmark
+import rpipe.config.server
+
+import rpipe.tools.engine_benchmark
+import rpipe.tools.measure
+import rpipe.aio.client
+import rpipe.aio.event
+import rpipe.aio.server
+import rpipe.aio.transport
+
+_EVENT_NOUN = 'time'
+
+_logger = logging.getLogger(__name__)
+
+
+class _BenchmarkClientEventHandler(object):
+    """Answer every event with a fixed-size payload, like the load-generator's
+    simulated clients.
+    """
+
+    def __init__(self, payload_bytes):
+        self.__payload = 'x' * payload_bytes
+
+    def get_time(self, ctx, post_data):
+        return ('text/plain', 0, self.__payload)
+
+
+async def _run(result, request_count, payload_bytes, idle_s,
+               external_clients):
+    binding = rpipe.tools.engine_benchmark.get_binding()
+
+    transport = rpipe.aio.transport.TlsTcpTransport(
+                    rpipe.config.server.KEY_FILEPATH,
+                    rpipe.config.server.CRT_FILEPATH,
+                    ca_certs=rpipe.config.server.CA_CRT_FILEPATH,
+                    admission_preamble=rpipe.config.server.ADMISSION_PREAMBLE)
+
+    server = rpipe.aio.server.Server(
+                rpipe.aio.server.TestServerEventHandler,
+                transport=transport,
+                binding=binding)
+
+    await server.start()
+
+    source_ips = rpipe.tools.measure.get_source_ips(result.client_count)
+    event_handler = _BenchmarkClientEventHandler(payload_bytes)
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    async def run_client(source_ip):
+        client_transport = rpipe.aio.transport.TlsTcpTransport(
+                            rpipe.config.client.KEY_FILEPATH,
+                            rpipe.config.client.CRT_FILEPATH,
+                            source_ip=source_ip,
+                            admission_preamble=\
+                                rpipe.config.client.ADMISSION_PREAMBLE)
+
+        c = rpipe.aio.client.ClientConnectionHandler(
+                event_handler,
+                transport=client_transport,
+                binding=binding)
+
+        await c.open()
+        await c.process_requests()
+
+    clients = []
+    if external_clients is False:
+        clients = [asyncio.ensure_future(run_client(source_ip))
+                   for source_ip
+                   in source_ips]
+
+    connections = await asyncio.gather(*[
+                    server.catalog.wait_for_connection(
+                        source_ip,
+                        timeout_s=\
+                            rpipe.config.engine_benchmark.CONNECT_TIMEOUT_S)
+                    for source_ip
+                    in source_ips])
+
+    result.connect_wall_s = time.time() - started_at
+    result.connect_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    await asyncio.sleep(idle_s)
+
+    result.idle_wall_s = time.time() - started_at
+    result.idle_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    remaining = [request_count]
+
+    async def send_requests(offset):
+        i = offset
+        while remaining[0] > 0:
+            remaining[0] -= 1
+
+            c = connections[i % len(connections)]
+            i += result.concurrency
+
+            request_started_at = time.time()
+
+            try:
+                await rpipe.aio.event.send_message_to_remote(
+                        c,
+                        'get',
+                        _EVENT_NOUN,
+                        '')
+            except Exception:
+                _logger.exception("Request failed.")
+                result.request_failures += 1
+            else:
+                result.latency.add(time.time() - request_started_at)
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    await asyncio.gather(*[send_requests(i)
+                           for i
+                           in range(result.concurrency)])
+
+    result.request_count = request_count
+    result.request_wall_s = time.time() - started_at
+    result.request_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    for task in clients:
+        task.cancel()
+
+    await server.stop()
+
+def run(result, request_count, payload_bytes, idle_s, external_clients,
+        use_uvloop=False):
+    if use_uvloop is True:
+        import uvloop
+        uvloop.install()
+
+    asyncio.run(
+        _run(
+            result,
+            request_count,
+            payload_bytes,
+            idle_s,
+            external_clients))
@@ -0,0 +1,314 @@
+import asyncio
+import datetime
+import logging
+import time
+
+import rpipe.config.client
+import rpipe.config.statsd
+import rpipe.config.heartbeat
+import rpipe.config.protocol
+
+import rpipe.capabilities
+import rpipe.client.backoff
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.stats
+import rpipe.utility
+import rpipe.aio.message_exchange
+import rpipe.aio.message_loop
+import rpipe.aio.transport
+
+_logger = logging.getLogger(__name__)
+
+
+class TestClientEventHandler(object):
+    def get_time(self, ctx, post_data):
+        _logger.info("TEST: get_time()")
+        return { 'time_from_client': time.time() }
+
+    async def get_cat(self, ctx, post_data, x, y):
+        _logger.info("TEST: get_cat()")
+        return { 'result_from_client': str(x) + str(y) }
+
+
+def get_transport_and_binding(source_ip=None):
+    """Build the configured transport and the binding to connect to with it.
+    """
+
+    name = rpipe.config.client.TRANSPORT
+
+    if name == rpipe.aio.transport.TRANSPORT_TLS:
+        transport = rpipe.aio.transport.TlsTcpTransport(
+                        rpipe.config.client.KEY_FILEPATH,
+                        rpipe.config.client.CRT_FILEPATH,
+                        source_ip=source_ip,
+                        admission_preamble=\
+                            rpipe.config.client.ADMISSION_PREAMBLE)
+
+        binding = (rpipe.config.client.TARGET_HOSTNAME,
+                   rpipe.config.client.TARGET_PORT)
+    elif name == rpipe.aio.transport.TRANSPORT_UNIX:
+        transport = rpipe.aio.transport.UnixTransport()
+        binding = rpipe.config.client.UNIX_SOCKET_PATH
+    else:
+        raise ValueError("Transport not valid: [%s]" % (name,))
+
+    return (transport, binding)
+
+
+class ClientConnectionHandler(object):
+    """A single connection to the server. Unlike the gevent client, there can
+    be any number of these in one process.
+    """
+
+    def __init__(self, event_handler=None, transport=None, binding=None):
+        if event_handler is None:
+            event_handler_cls = rpipe.utility.load_cls_from_string(
+                                    rpipe.config.client.EVENT_HANDLER_FQ_CLASS)
+
+            event_handler = event_handler_cls()
+
+        if transport is None:
+            (transport, binding) = get_transport_and_binding()
+
+        self.__eh = event_handler
+        self.__transport = transport
+        self.__binding = binding
+
+        self.__exchange = None
+        self.__heartbeat_task = None
+        self.__peer = rpipe.capabilities.UNKNOWN
+
+        self.__heartbeat_msg = rpipe.protocol.get_obj_from_type(
+                                rpipe.protocols.MT_HEARTBEAT)
+
+        self.__heartbeat_msg.version = 1
+
+    async def open(self):
+        _logger.info("Connecting to: %s", self.__binding)
+
+        if self.connected is True:
+            raise IOError("Client already connected.")
+
+        self.__exchange = await self.__transport.connect(
+                            self.__binding,
+                            rpipe.aio.message_exchange.MessageExchange)
+
+        _logger.debug("Scheduling heartbeat.")
+        self.__heartbeat_task = asyncio.ensure_future(self.__heartbeat_loop())
+
+        await self.__say_hello()
+
+    async def __say_hello(self):
+        """See rpipe.client.connection._ClientConnectionHandler. The reply 
+        doesn't need the message-loop, so we can wait for it here.
+        """
+
+        hr = rpipe.capabilities.get_hello_refusals()
+        if hr.should_say_hello(self.__binding) is False:
+            _logger.info("Not saying hello to a server that doesn't support "
+                         "it. Assuming nothing about it.")
+            return
+
+        hello_obj = rpipe.capabilities.build_hello(
+                        rpipe.protocols.MT_HELLO,
+                        self.__eh)
+
+        try:
+            reply_obj = await self.initiate_message(
+                            hello_obj,
+                            timeout_s=rpipe.config.protocol.HELLO_TIMEOUT_S)
+        except rpipe.aio.message_exchange.ResponseTimeoutError:
+            _logger.warning("The server didn't answer our hello. Assuming "
+                            "nothing about it.")
+            return
+        except rpipe.exceptions.RpConnectionClosed:
+            # The caller reconnects, and we won't say hello next time.
+            hr.refused(self.__binding)
+            raise
+
+        hr.accepted(self.__binding)
+
+        self.__peer = rpipe.capabilities.get_peer_capabilities(
+                        reply_obj.capabilities)
+
+        _logger.info("Server said hello: %s", self.__peer)
+
+        self.__exchange.set_frame_version(self.__peer.frame_version)
+
+        self.__exchange.set_can_cancel(
+            self.__peer.supports(rpipe.config.protocol.FEATURE_CANCEL))
+
+    def close(self):
+        _logger.info("Closing connection.")
+
+        if self.__heartbeat_task is not None:
+            self.__heartbeat_task.cancel()
+            self.__heartbeat_task = None
+
+        if self.__exchange is not None:
+            self.__exchange.close()
+
+    async def __heartbeat_loop(self):
+        while 1:
+            await asyncio.sleep(rpipe.config.heartbeat.HEARTBEAT_INTERVAL_S)
+
+            _logger.debug("Sending heartbeart.")
+
+            with rpipe.stats.time_and_post(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_CLIENT_HEARTBEAT_TIMING):
+                try:
+                    await self.initiate_message(
+                        self.__heartbeat_msg,
+                        rpipe.config.heartbeat.HEARTBEAT_TIMEOUT_S)
+                except rpipe.aio.message_exchange.ResponseTimeoutError:
+                    _logger.error("Heartbeat timed-out. Closing "
+                                  "connection.")
+
+                    self.__heartbeat_task = None
+                    self.close()
+                    return
+                except rpipe.exceptions.RpConnectionClosed:
+                    return
+
+            _logger.debug("Heartbeat response received.")
+
+    async def initiate_message(self, message_obj, timeout_s=None):
+        if self.__exchange is None:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "Client not connected.")
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SEND_TICK)
+
+        with rpipe.stats.time_and_post(
+                rpipe.config.statsd.EVENT_CONNECTION_SEND_TIMING):
+            return await self.__exchange.send_and_receive(
+                            message_obj,
+                            timeout_s=timeout_s)
+
+    def send_message(self, message_obj):
+        if self.__exchange is None:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "Client not connected.")
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SEND_TICK)
+
+        self.__exchange.send(message_obj, expect_response=False)
+
+    async def process_requests(self):
+        assert self.__exchange is not None
+
+        try:
+            ctx = rpipe.event_handling.CONNECTION_CONTEXT_T(self.__binding)
+            cml = rpipe.aio.message_loop.CommonMessageLoop(
+                    self.__exchange,
+                    self.__eh,
+                    ctx)
+
+            await cml.handle()
+        finally:
+            # The message-loop has terminated. Make sure we close the
+            # connection (thereby disqualifying it for reuse).
+            self.close()
+
+    @property
+    def connected(self):
+        return self.__exchange is not None and \
+               self.__exchange.is_alive is True
+
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
+
+async def connection_cycle(connection_factory=ClientConnectionHandler,
+                           connected_cb=None):
+    """Stay connected to the server, reconnecting with the same backoff as the
+    gevent client. `connected_cb` is called with every new connection.
+    """
+
+    event_class_name = rpipe.config.client.\
+                            CONNECTION_STATE_CHANGE_EVENT_CLASS
+
+    state_change_event_cls = rpipe.utility.load_cls_from_string(
+                                event_class_name)
+
+    sce = state_change_event_cls()
+    retry_attempts = 0
+    last_disconnected_dt = None
+
+    backoff = rpipe.client.backoff.DecorrelatedJitterBackoff(
+                rpipe.config.client.\
+                    MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S,
+                rpipe.config.client.\
+                    MAXIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S)
+
+    while 1:
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_CLIENT_NEW_TICK)
+
+        try:
+            _logger.info("Attempting connection to server.")
+
+            c = connection_factory()
+            await c.open()
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_CONNECTION_CLIENT_CONNECTED_TICK)
+
+            sce.connect_success(retry_attempts, last_disconnected_dt)
+
+            if last_disconnected_dt is not None:
+                recovery_s = (datetime.datetime.now() -
+                              last_disconnected_dt).total_seconds()
+
+                _logger.info("Reconnected after (%.1f) seconds and (%d) "
+                             "attempts.", recovery_s, retry_attempts)
+
+                rpipe.stats.post_timing(
+                    rpipe.config.statsd.EVENT_CONNECTION_CLIENT_RECOVERY_TIMING,
+                    recovery_s)
+
+            backoff.reset()
+            retry_attempts = 0
+            last_disconnected_dt = None
+
+            if connected_cb is not None:
+                connected_cb(c)
+
+            await c.process_requests()
+
+            raise rpipe.exceptions.RpConnectionClosed("Connection closed.")
+        except rpipe.exceptions.RpConnectionRetry as e:
+            _logger.warning("Connection has broken or a reattempt has been "
+                            "unsuccessful: %s", str(e))
+
+            if retry_attempts == 0:
+                last_disconnected_dt = datetime.datetime.now()
+
+            sce.connect_fail(retry_attempts, last_disconnected_dt)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_CONNECTION_CLIENT_BROKEN_TICK)
+
+            if isinstance(e, rpipe.exceptions.RpConnectionRetryAfter) is True:
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_CLIENT_RETRY_AFTER_TICK)
+
+                wait_time_s = backoff.next_wait_s(
+                                retry_after_s=e.retry_after_s)
+            else:
+                wait_time_s = backoff.next_wait_s()
+
+            _logger.info("Waiting for (%.1f) seconds before reconnect.",
+                         wait_time_s)
+
+            await asyncio.sleep(wait_time_s)
+
+            retry_attempts += 1
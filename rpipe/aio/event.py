@@ -0,0 +1,60 @@
+import logging
+
+import rpipe.event
+
+_logger = logging.getLogger(__name__)
+
+async def send_message_to_remote(c, verb, noun, data, mimetype=None, 
+                                 timeout_s=None):
+    """The asyncio version of rpipe.event.send_message_to_remote(). `c` can be 
+    a client or a server connection.
+    """
+
+    if c.peer_capabilities.handles(verb, noun) is False:
+        r = rpipe.event.build_unrouted_reply(verb, noun)
+        return (r.code, r.mimetype, r.data)
+
+    _logger.info("Emitting [%s] [%s]: (%d) bytes", verb, noun, len(data))
+
+    message_obj = rpipe.event.build_event(
+                    verb, 
+                    noun, 
+                    data, 
+                    mimetype, 
+                    timeout_s=timeout_s)
+
+    r = await c.initiate_message(message_obj, timeout_s=timeout_s)
+
+    return (r.code, r.mimetype, r.data)
+
+async def send_event_batch(c, events, timeout_s=None):
+    """The asyncio version of rpipe.event.send_event_batch()."""
+
+    peer = c.peer_capabilities
+    routed = rpipe.event.get_routed_events(peer, events)
+
+    if routed:
+        _logger.info("Emitting batch of (%d) events.", len(routed))
+
+        message_obj = rpipe.event.build_event_batch(
+                        routed, 
+                        timeout_s=timeout_s)
+
+        r = await c.initiate_message(message_obj, timeout_s=timeout_s)
+        replies = r.replies
+    else:
+        replies = []
+
+    return rpipe.event.merge_batch_replies(peer, events, replies)
+
+def send_cache_invalidation(c, noun=None):
+    """See rpipe.event.send_cache_invalidation(). This doesn't wait on 
+    anything, so it isn't a coroutine.
+    """
+
+    if rpipe.event.can_invalidate_cache(c) is False:
+        return
+
+    _logger.info("Invalidating cached responses: [%s]", noun)
+
+    c.send_message(rpipe.event.build_cache_invalidation(noun))
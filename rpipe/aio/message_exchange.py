@@ -0,0 +1,240 @@
+import asyncio
+import logging
+
+import rpipe.config.statsd
+
+import rpipe.capture
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.stats
+import rpipe.aio.transport
+
+_logger = logging.getLogger(__name__)
+
+
+class ResponseTimeoutError(Exception):
+    pass
+
+
+class MessageExchange(asyncio.Protocol):
+    """Frames and unframes the messages for a single connection, and matches
+    replies to the requests that are waiting on them. Unlike the gevent
+    exchange there's no reader or writer task: messages are parsed as the data
+    arrives and frames are handed straight to the transport.
+    """
+
+    def __init__(self, connected_cb=None):
+        self.__connected_cb = connected_cb
+
+        self.__transport = None
+        self.__address = None
+        self.__buffer = bytearray()
+        self.__incoming_cb = None
+
+        # Anything that arrives before a message-loop is attached.
+        self.__unclaimed = []
+
+        self.__replied = {}
+        self.__frame_version = rpipe.protocol.FRAME_V1
+        self.__can_cancel = False
+
+        self.__closed = asyncio.get_event_loop().create_future()
+
+        self.__can_write = asyncio.Event()
+        self.__can_write.set()
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        self.__address = rpipe.aio.transport.get_peer_address(transport)
+
+        _logger.info("Message exchange running for connection: %s",
+                     self.__address)
+
+        if self.__connected_cb is not None:
+            self.__connected_cb(self)
+
+    def data_received(self, data):
+        self.__buffer += data
+
+        while 1:
+            message = rpipe.protocol.read_message_from_buffer(
+                        self.__buffer, 
+                        stream=self)
+            if message is None:
+                break
+
+            (message_info, message_obj) = message
+            message_id = rpipe.protocol.get_message_id_from_info(
+                            message_info)
+
+            try:
+                future = self.__replied[message_id]
+            except KeyError:
+                if rpipe.protocol.get_is_response_from_info(
+                        message_info) is True:
+                    # Whoever was waiting has already timed-out.
+                    _logger.warning("Dropping late reply: %s",
+                                    rpipe.protocol.get_string_from_message_id(
+                                        message_id))
+
+                    rpipe.stats.post_to_counter(
+                        rpipe.config.statsd.EVENT_MESSAGE_REPLY_LATE_TICK)
+                elif self.__incoming_cb is None:
+                    self.__unclaimed.append(message)
+                else:
+                    self.__incoming_cb(message)
+            else:
+                if future.done() is False:
+                    future.set_result(message)
+
+    def connection_lost(self, exc):
+        _logger.warning("Message-exchange terminating for [%s].",
+                        self.__address)
+
+        self.__transport = None
+
+        for future in self.__replied.values():
+            if future.done() is False:
+                future.set_exception(
+                    rpipe.exceptions.RpConnectionClosed(
+                        "Connection closed while waiting on reply."))
+
+        # Release anybody blocked on flow-control.
+        self.__can_write.set()
+
+        if self.__closed.done() is False:
+            self.__closed.set_result(None)
+
+    def pause_writing(self):
+        self.__can_write.clear()
+
+    def resume_writing(self):
+        self.__can_write.set()
+
+    def set_incoming_cb(self, incoming_cb):
+        self.__incoming_cb = incoming_cb
+
+        unclaimed = self.__unclaimed
+        self.__unclaimed = []
+
+        for message in unclaimed:
+            incoming_cb(message)
+
+    def send(self, message_obj, reply_to_message_id=None,
+             expect_response=True, message_id=None):
+        if self.__transport is None or self.__transport.is_closing() is True:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "Connection is closed: [%s]" % (self.__address,))
+
+        if reply_to_message_id is not None:
+            message_id = reply_to_message_id
+        elif message_id is None:
+            message_id = rpipe.protocol.id_generator()
+
+        if expect_response is True:
+            # Add the tracking information to track the future reply.
+            self.__replied[message_id] = \
+                asyncio.get_event_loop().create_future()
+
+        (data, message_id) = rpipe.protocol.serialize_message_obj(
+                                message_obj,
+                                message_id=message_id,
+                                is_response=reply_to_message_id is not None,
+                                frame_version=self.__frame_version)
+
+        rpipe.protocol.capture_frame(
+            self, 
+            rpipe.capture.DIRECTION_SENT, 
+            data)
+
+        self.__transport.write(data)
+
+        return message_id
+
+    def set_frame_version(self, frame_version):
+        """Only switch once the peer has said that it reads the new format.
+        """
+
+        self.__frame_version = frame_version
+
+    def set_can_cancel(self, can_cancel):
+        """Only send cancellations once the peer has said that it reads
+        them. One that doesn't would hang up.
+        """
+
+        self.__can_cancel = can_cancel
+
+    async def drain(self):
+        """Wait until the transport's buffer has room again."""
+
+        await self.__can_write.wait()
+
+    async def wait_on_reply(self, message_id, timeout_s=None):
+        future = self.__replied[message_id]
+
+        try:
+            return await asyncio.wait_for(future, timeout_s)
+        except asyncio.TimeoutError:
+            raise ResponseTimeoutError()
+        finally:
+            del self.__replied[message_id]
+
+    def send_cancel(self, message_id):
+        """Tell the other side that we're no longer waiting on the given
+        event.
+        """
+
+        _logger.info("Cancelling event: [%s]",
+                     rpipe.protocol.get_string_from_message_id(message_id))
+
+        cancel_message_obj = rpipe.protocol.get_obj_from_type(
+                                rpipe.protocols.MT_CANCEL)
+
+        cancel_message_obj.version = 1
+
+        self.send(
+            cancel_message_obj,
+            expect_response=False,
+            message_id=message_id)
+
+    async def send_and_receive(self, message_obj, timeout_s=None):
+        """A convenience function to send a message and wait on a reply. If
+        we stop waiting on an event early (a timeout, or our task is
+        cancelled), the other side is told to abandon it (if it said, in its
+        hello, that it can).
+        """
+
+        await self.drain()
+
+        message_id = self.send(message_obj, expect_response=True)
+
+        try:
+            message = await self.wait_on_reply(message_id, timeout_s=timeout_s)
+        except (ResponseTimeoutError, asyncio.CancelledError):
+            if rpipe.protocols.get_type_from_obj(message_obj) in \
+               (rpipe.protocols.MT_EVENT, rpipe.protocols.MT_EVENT_BATCH) and \
+               self.__can_cancel is True and \
+               self.is_alive is True:
+                self.send_cancel(message_id)
+
+            raise
+
+        (message_info, message_obj) = message
+
+        return message_obj
+
+    def close(self):
+        if self.__transport is not None:
+            self.__transport.close()
+
+    async def wait_closed(self):
+        await asyncio.shield(self.__closed)
+
+    @property
+    def is_alive(self):
+        return self.__closed.done() is False
+
+    @property
+    def address(self):
+        return self.__address
@@ -0,0 +1,498 @@
+import asyncio
+import logging
+import time
+
+import rpipe.config.protocol
+import rpipe.config.statsd
+import rpipe.config.heartbeat
+
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.stats
+import rpipe.event_handling
+
+_logger = logging.getLogger(__name__)
+
+
+class CommonMessageLoop(object):
+    """The asyncio version of rpipe.message_loop.CommonMessageLoop. Messages
+    are dispatched as the exchange parses them. Coroutine handlers run in
+    their own tasks so that a slow handler doesn't hold up the connection.
+    Streamed bodies are assembled before the handler is called.
+    """
+
+    def __init__(self, exchange, event_handler, connection_context,
+                 watch_heartbeats=False, message_handlers=None):
+        assert exchange is not None
+
+        if message_handlers is None:
+            message_handlers = {}
+
+        self.__exchange = exchange
+        self.__eh = event_handler
+        self.__ctx = connection_context
+        self.__watch_heartbeats = watch_heartbeats
+        self.__message_handlers = message_handlers
+
+        heartbeat_reply_message_obj = \
+            rpipe.protocol.get_obj_from_type(
+                rpipe.protocols.MT_HEARTBEAT_R)
+
+        heartbeat_reply_message_obj.version = 1
+
+        self.__heartbeat_reply_message_obj = heartbeat_reply_message_obj
+
+        self.__last_heartbeat_epoch = None
+        self.__exit_on_unknown = False
+
+        # The tasks running coroutine handlers, by message-ID, so that they
+        # can be cancelled.
+        self.__tasks = {}
+
+        # Streamed events whose bodies are still arriving, by message-ID.
+        self.__bodies = {}
+
+    async def __heartbeat_watchdog(self):
+        """Make sure that heartbeats are happening on this connection."""
+
+        alarm_threshold_s = rpipe.config.heartbeat.HEARTBEAT_INTERVAL_S * 2
+
+        _logger.debug("Starting heartbeat watchdog: ALARM_THRESHOLD=(%d)s",
+                      alarm_threshold_s)
+
+        while 1:
+            await asyncio.sleep(alarm_threshold_s)
+
+            if self.__last_heartbeat_epoch is None:
+                _logger.error("No heartbeats have occurred yet. Terminating "
+                              "connection: [%s]",
+                              self.__ctx.participant_address)
+
+                self.__exchange.close()
+                return
+
+            time_since_last_heartbeat_s = time.time() - \
+                                          self.__last_heartbeat_epoch
+
+            # Was there a heartbeat since the last check?
+            if time_since_last_heartbeat_s > alarm_threshold_s:
+                _logger.error("Heartbeats are not being received, or not "
+                              "keeping up. Terminating connection. "
+                              "SINCE_LAST=(%d)s > CHECK_INTERVAL=(%d)s "
+                              "ADDRESS=[%s]",
+                              time_since_last_heartbeat_s,
+                              alarm_threshold_s,
+                              self.__ctx.participant_address)
+
+                self.__exchange.close()
+                return
+
+            _logger.debug("Heartbeats are still timely: (%d)s < (%d)s",
+                          time_since_last_heartbeat_s,
+                          alarm_threshold_s)
+
+    async def handle(self, exit_on_unknown=False):
+        """Dispatch messages until the connection closes."""
+
+        self.__exit_on_unknown = exit_on_unknown
+
+        _logger.debug("Starting loop for messages from participant: %s",
+                      self.__ctx.participant_address)
+
+        self.__exchange.set_incoming_cb(self.__dispatch)
+
+        if self.__watch_heartbeats is True:
+            watchdog_task = asyncio.ensure_future(self.__heartbeat_watchdog())
+        else:
+            watchdog_task = None
+
+        try:
+            await self.__exchange.wait_closed()
+        finally:
+            if watchdog_task is not None:
+                watchdog_task.cancel()
+
+            for task in list(self.__tasks.values()):
+                task.cancel()
+
+        _logger.warning("Message exchange has ended. Terminating "
+                        "message-loop.")
+
+    def __dispatch(self, message):
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_TICK)
+
+        (message_info, message_obj) = message
+
+        message_type = rpipe.protocol.get_message_type_from_info(message_info)
+        message_id = rpipe.protocol.get_message_id_from_info(message_info)
+
+        if message_type == rpipe.protocols.MT_HEARTBEAT:
+            handler = self.__handle_heartbeat
+        elif message_type == rpipe.protocols.MT_EVENT:
+            if rpipe.event_handling.is_expired(
+                    message_info,
+                    message_obj) is True:
+                # The sender has stopped waiting, so don't bother.
+                self.__drop_expired_event(message_id, message_obj)
+                return
+
+            if message_obj.is_streamed is True:
+                handler = self.__start_body
+            else:
+                handler = self.__handle_event
+        elif message_type == rpipe.protocols.MT_EVENT_BATCH:
+            if rpipe.event_handling.is_expired(
+                    message_info,
+                    message_obj) is True:
+                _logger.warning("Dropping batch whose deadline has passed: "
+                                "[%s]",
+                                rpipe.protocol.get_string_from_message_id(
+                                    message_id))
+
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_EXPIRED_TICK)
+
+                return
+
+            handler = self.__handle_batch
+        elif message_type == rpipe.protocols.MT_EVENT_CHUNK:
+            handler = self.__handle_chunk
+        elif message_type == rpipe.protocols.MT_CANCEL:
+            handler = self.__handle_cancel
+        elif message_type in self.__message_handlers:
+            handler = self.__message_handlers[message_type]
+        else:
+            _logger.warning("Received unhandled message (%d) [%s].",
+                            message_type, message_obj.__class__.__name__)
+
+            if self.__exit_on_unknown is True:
+                # If we're running in a server, the client will probably
+                # block for a response. So, it's better to just close and get
+                # the client to reestablish the connection.
+
+                _logger.warning("Leaving message-loop. If this is a server, "
+                                "the connection will automatically be "
+                                "reestablished by the client.")
+
+                self.__exchange.close()
+
+            return
+
+        # We're called from the exchange as the data arrives, so anything 
+        # that escapes would take the connection down with it.
+        try:
+            with rpipe.stats.time_and_post(
+                    rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_HANDLE_TIMING):
+                handler(message_id, message_obj)
+        except Exception:
+            _logger.exception("Could not handle message (%d) [%s]: [%s]",
+                              message_type, message_obj.__class__.__name__,
+                              rpipe.protocol.get_string_from_message_id(
+                                message_id))
+
+    def __handle_heartbeat(self, message_id, message_obj):
+        _logger.debug("Responding to heartbeat: %s",
+                      self.__ctx.participant_address)
+
+        self.__last_heartbeat_epoch = time.time()
+
+        self.__exchange.send(
+            self.__heartbeat_reply_message_obj,
+            reply_to_message_id=message_id,
+            expect_response=False)
+
+    def __start_body(self, message_id, message_obj):
+        self.__bodies[message_id] = (message_obj, [])
+
+    def __handle_chunk(self, message_id, message_obj):
+        try:
+            (event_message_obj, chunks) = self.__bodies[message_id]
+        except KeyError:
+            # The event has already been cancelled or dropped.
+            _logger.debug("Ignoring chunk for unknown body: [%s]",
+                          rpipe.protocol.get_string_from_message_id(
+                            message_id))
+            return
+
+        chunks.append(message_obj.data)
+
+        if message_obj.is_last is True:
+            del self.__bodies[message_id]
+
+            self.__handle_event(
+                message_id,
+                event_message_obj,
+                data=b''.join(chunks))
+
+    def __handle_cancel(self, message_id, message_obj):
+        if self.__bodies.pop(message_id, None) is not None:
+            _logger.info("Cancelling event before its body arrived: [%s]",
+                         rpipe.protocol.get_string_from_message_id(
+                            message_id))
+            return
+
+        # Plain handlers have already finished by the time we get here.
+        task = self.__tasks.pop(message_id, None)
+        if task is None:
+            _logger.debug("Event to cancel has already finished: [%s]",
+                          rpipe.protocol.get_string_from_message_id(
+                            message_id))
+            return
+
+        _logger.info("Cancelling event: [%s]",
+                     rpipe.protocol.get_string_from_message_id(message_id))
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_CANCEL_TICK)
+
+        task.cancel()
+
+    def __drop_expired_event(self, message_id, message_obj):
+        _logger.warning("Dropping event whose deadline has passed: [%s] "
+                        "[%s] [%s]",
+                        rpipe.protocol.get_string_from_message_id(message_id),
+                        message_obj.verb, message_obj.noun)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_EXPIRED_TICK)
+
+    def __handle_event(self, message_id, message_obj, data=None):
+        if message_obj.no_reply is True:
+            reply_to_message_id = None
+        else:
+            reply_to_message_id = message_id
+
+        reply = self.__get_safe_event_reply(message_obj, data)
+
+        if asyncio.iscoroutine(reply) is False:
+            self.__send_reply(reply_to_message_id, reply)
+            return
+
+        task = asyncio.ensure_future(
+                self.__send_reply_async(reply_to_message_id, reply))
+
+        self.__track_task(message_id, task)
+
+    def __handle_batch(self, message_id, message_obj):
+        _logger.info("Received batch of (%d) events from [%s].",
+                     len(message_obj.events), self.__ctx.participant_address)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_BATCH_TICK)
+
+        # The plain handlers run right away (one after the other). The 
+        # coroutines run together afterwards.
+        replies = [self.__get_safe_event_reply(event_obj)
+                   for event_obj
+                   in message_obj.events]
+
+        coroutines = [reply
+                      for reply
+                      in replies
+                      if asyncio.iscoroutine(reply) is True]
+
+        if not coroutines:
+            self.__send_batch_reply(message_id, replies)
+            return
+
+        task = asyncio.ensure_future(
+                self.__finish_batch(message_id, replies, coroutines))
+
+        self.__track_task(message_id, task)
+
+    async def __finish_batch(self, message_id, replies, coroutines):
+        finished = iter(await asyncio.gather(*coroutines))
+
+        replies = [next(finished) if asyncio.iscoroutine(reply) is True
+                                  else reply
+                   for reply
+                   in replies]
+
+        if self.__exchange.is_alive is False:
+            return
+
+        await self.__exchange.drain()
+        self.__send_batch_reply(message_id, replies)
+
+    def __send_batch_reply(self, message_id, replies):
+        reply_message_obj = rpipe.protocol.get_obj_from_type(
+                                rpipe.protocols.MT_EVENT_BATCH_R)
+
+        reply_message_obj.version = 1
+        reply_message_obj.replies.extend(replies)
+
+        self.__send_reply(message_id, reply_message_obj)
+
+    def __get_safe_event_reply(self, message_obj, data=None):
+        """Anything that goes wrong outside of the handler (a body that can't 
+        be decoded, or a result that can't be encoded) is still answered, so 
+        that the sender isn't left waiting, and one failed event doesn't take 
+        the rest of a batch with it.
+        """
+
+        try:
+            reply = self.__get_event_reply(message_obj, data)
+        except Exception as e:
+            return rpipe.event_handling.get_exception_reply(
+                    message_obj.noun,
+                    e)
+
+        if asyncio.iscoroutine(reply) is True:
+            return self.__await_safe_event_reply(message_obj.noun, reply)
+
+        return reply
+
+    async def __await_safe_event_reply(self, noun, reply):
+        try:
+            return await reply
+        except Exception as e:
+            return rpipe.event_handling.get_exception_reply(noun, e)
+
+    def __track_task(self, message_id, task):
+        """Keep the task so that it can be cancelled."""
+
+        self.__tasks[message_id] = task
+
+        def task_done_cb(task):
+            if self.__tasks.get(message_id) is task:
+                del self.__tasks[message_id]
+
+        task.add_done_callback(task_done_cb)
+
+    def __get_event_reply(self, message_obj, data=None):
+        """Return the reply, or, for a coroutine handler, a coroutine that 
+        returns it.
+        """
+
+        _logger.info("Received event from [%s]: [%s] [%s]",
+                     self.__ctx.participant_address, message_obj.verb,
+                     message_obj.noun)
+
+        (event_handler_name, parameters) = \
+            rpipe.event_handling.get_handler_name_and_parameters(
+                message_obj.verb,
+                message_obj.noun,
+                message_obj.parameters)
+
+        try:
+            handler = getattr(self.__eh, event_handler_name)
+        except AttributeError:
+            _logger.warning("Event is not handled: METHOD=[%s]",
+                            event_handler_name)
+
+            return rpipe.event_handling.build_event_reply(
+                    rpipe.config.protocol.UNHANDLED_EVENT_DEFAULT_RESULT_CODE)
+
+        counter_name = rpipe.config.statsd.EVENT_HANDLER_TICK_TEMPLATE % \
+                       { 'handler_name': event_handler_name }
+
+        rpipe.stats.post_to_counter(counter_name)
+
+        # Entity-tag methods are always plain functions (they're supposed to 
+        # be cheap).
+        etag = rpipe.event_handling.get_etag(
+                self.__eh,
+                event_handler_name,
+                self.__ctx,
+                parameters)
+
+        if rpipe.event_handling.is_etag_matched(
+                etag,
+                message_obj.if_none_match) is True:
+            _logger.debug("Sender's copy is current: [%s] [%s]",
+                          event_handler_name, etag)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_MESSAGE_REPLY_NOT_MODIFIED_TICK)
+
+            return rpipe.event_handling.build_event_reply(
+                    0,
+                    etag=etag,
+                    is_not_modified=True)
+
+        if data is None:
+            data = message_obj.data
+
+        data = rpipe.event_handling.decode_request_data(
+                message_obj.mimetype,
+                data)
+
+        arguments = (
+            handler,
+            event_handler_name,
+            message_obj.noun,
+            parameters,
+            message_obj.mimetype,
+            data,
+            etag)
+
+        if asyncio.iscoroutinefunction(handler) is True:
+            return self.__process_event_async(*arguments)
+        else:
+            return self.__process_event(*arguments)
+
+    def __get_timer_name(self, handler_name):
+        return rpipe.config.statsd.EVENT_HANDLER_TIMING_TEMPLATE % \
+               { 'handler_name': handler_name }
+
+    def __process_event(self, handler, handler_name, noun, parameters, 
+                        mimetype, data, etag):
+        with rpipe.stats.time_and_post(self.__get_timer_name(handler_name)):
+            try:
+                result = handler(self.__ctx, (mimetype, data), *parameters)
+            except Exception as e:
+                result = rpipe.event_handling.get_exception_result(e)
+
+        return self.__get_reply_from_result(handler_name, noun, result, etag)
+
+    async def __process_event_async(self, handler, handler_name, noun,
+                                    parameters, mimetype, data, etag):
+        with rpipe.stats.time_and_post(self.__get_timer_name(handler_name)):
+            try:
+                result = await handler(
+                            self.__ctx,
+                            (mimetype, data),
+                            *parameters)
+            except Exception as e:
+                result = rpipe.event_handling.get_exception_result(e)
+
+        return self.__get_reply_from_result(handler_name, noun, result, etag)
+
+    def __get_reply_from_result(self, handler_name, noun, result, etag):
+        (mimetype, code, result_data, cache_ttl_s) = \
+            rpipe.event_handling.get_reply_from_result(
+                handler_name,
+                noun,
+                result)
+
+        return rpipe.event_handling.build_event_reply(
+                code,
+                mimetype,
+                result_data,
+                cache_ttl_s=cache_ttl_s,
+                etag=etag)
+
+    async def __send_reply_async(self, reply_to_message_id, reply):
+        reply_message_obj = await reply
+
+        if self.__exchange.is_alive is False:
+            return
+
+        await self.__exchange.drain()
+        self.__send_reply(reply_to_message_id, reply_message_obj)
+
+    def __send_reply(self, reply_to_message_id, reply_message_obj):
+        if reply_to_message_id is None:
+            _logger.debug("Not responding to event (no reply wanted).")
+            return
+
+        _logger.debug("Responding to message [%s] with [%s]",
+                      rpipe.protocol.get_string_from_message_id(
+                        reply_to_message_id),
+                      reply_message_obj.__class__.__name__)
+
+        self.__exchange.send(
+            reply_message_obj,
+            reply_to_message_id=reply_to_message_id,
+            expect_response=False)
@@ -0,0 +1,325 @@
+import asyncio
+import logging
+import time
+
+import rpipe.config.protocol
+import rpipe.config.server
+import rpipe.config.statsd
+
+import rpipe.capabilities
+import rpipe.event_handling
+import rpipe.protocols
+import rpipe.server.exceptions
+import rpipe.stats
+import rpipe.utility
+import rpipe.aio.message_exchange
+import rpipe.aio.message_loop
+import rpipe.aio.transport
+
+_logger = logging.getLogger(__name__)
+
+
+class TestServerEventHandler(object):
+    """Example server event-handler."""
+
+    def get_time(self, ctx, post_data):
+        _logger.info("TEST: get_time()")
+        return { 'time_from_server': time.time() }
+
+    async def get_cat(self, ctx, post_data, x, y):
+        _logger.info("TEST: get_cat()")
+        return { 'result_from_server': str(x) + str(y) }
+
+
+def get_transport_and_binding():
+    """Build the configured transport and the binding to listen on."""
+
+    name = rpipe.config.server.TRANSPORT
+
+    if name == rpipe.aio.transport.TRANSPORT_TLS:
+        transport = rpipe.aio.transport.TlsTcpTransport(
+                        rpipe.config.server.KEY_FILEPATH,
+                        rpipe.config.server.CRT_FILEPATH,
+                        ca_certs=rpipe.config.server.CA_CRT_FILEPATH,
+                        admission_preamble=\
+                            rpipe.config.server.ADMISSION_PREAMBLE,
+                        max_concurrent_handshakes=\
+                            rpipe.config.server.MAX_CONCURRENT_HANDSHAKES,
+                        handshake_retry_after_s=\
+                            rpipe.config.server.HANDSHAKE_RETRY_AFTER_S,
+                        handshake_timeout_s=\
+                            rpipe.config.server.HANDSHAKE_TIMEOUT_S)
+
+        binding = (rpipe.config.server.BIND_IP,
+                   rpipe.config.server.BIND_PORT)
+    elif name == rpipe.aio.transport.TRANSPORT_UNIX:
+        transport = rpipe.aio.transport.UnixTransport()
+        binding = rpipe.config.server.UNIX_SOCKET_PATH
+    else:
+        raise ValueError("Transport not valid: [%s]" % (name,))
+
+    return (transport, binding)
+
+
+class ConnectionCatalog(object):
+    """Keep track of connections by the IP of the client (see
+    rpipe.server.connection._ConnectionCatalog).
+    """
+
+    def __init__(self):
+        self.__connections = {}
+        self.__waiters = {}
+
+        event_class_name = rpipe.config.server.\
+                                CONNECTION_STATE_CHANGE_EVENT_CLASS
+
+        cls = rpipe.utility.load_cls_from_string(event_class_name)
+
+        self.__server_events = cls()
+
+    def __post_count(self):
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_COUNT_GAUGE,
+            len(self.__connections))
+
+    def register(self, c):
+        if c.ip in self.__connections:
+            _logger.error("The incoming connection is redundant and will be "
+                          "closed: [%s]", c)
+
+            c.close()
+
+            raise ValueError("Can not register already-registered connection. "
+                             "A previous connection from this client might "
+                             "not've been deregistered [properly]: %s" %
+                             (c.ip))
+
+        _logger.debug("Registering client: [%s]", c.ip)
+
+        self.__connections[c.ip] = c
+
+        # Wake anybody waiting for this client.
+        for future in self.__waiters.pop(c.ip, []):
+            if future.done() is False:
+                future.set_result(c)
+
+        self.__post_count()
+        self.__server_events.connection_added(c.ip, len(self.__connections))
+
+    def deregister(self, c):
+        if self.__connections.get(c.ip) is not c:
+            raise ValueError("Can not deregister unregistered connection: %s" %
+                             (c.ip))
+
+        _logger.debug("Deregistering client: [%s]", c.ip)
+        del self.__connections[c.ip]
+
+        self.__post_count()
+        self.__server_events.connection_removed(
+            c.ip,
+            len(self.__connections))
+
+    def get_connection_by_ip(self, ip):
+        return self.__connections[ip]
+
+    async def wait_for_connection(
+            self,
+            ip,
+            timeout_s=rpipe.config.server.DEFAULT_CONNECTION_WAIT_TIMEOUT_S):
+        """Wait for a client to connect (if not immediately available)."""
+
+        try:
+            return self.__connections[ip]
+        except KeyError:
+            pass
+
+        future = asyncio.get_event_loop().create_future()
+        self.__waiters.setdefault(ip, []).append(future)
+
+        try:
+            return await asyncio.wait_for(future, timeout_s)
+        except asyncio.TimeoutError:
+            raise rpipe.server.exceptions.RpNoConnectionException(ip)
+        finally:
+            waiters = self.__waiters.get(ip)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+
+                if not waiters:
+                    del self.__waiters[ip]
+
+    @property
+    def count(self):
+        return len(self.__connections)
+
+
+class ServerConnectionHandler(object):
+    """Represents a single client connection."""
+
+    def __init__(self, exchange, catalog):
+        self.__exchange = exchange
+        self.__catalog = catalog
+        self.__address = exchange.address
+        self.__eh = None
+        self.__peer = rpipe.capabilities.UNKNOWN
+
+    def close(self):
+        self.__exchange.close()
+
+    async def handle(self, event_handler):
+        ctx = rpipe.event_handling.CONNECTION_CONTEXT_T(self.__address)
+
+        self.__eh = event_handler
+        self.__catalog.register(self)
+
+        try:
+            start_hook = getattr(event_handler, 'start_hook', None)
+            if start_hook is not None:
+                start_hook()
+
+            message_handlers = {
+                rpipe.protocols.MT_CACHE_INVALIDATE: 
+                    self.__handle_cache_invalidate,
+                rpipe.protocols.MT_HELLO: 
+                    self.__handle_hello,
+            }
+
+            cml = rpipe.aio.message_loop.CommonMessageLoop(
+                    self.__exchange,
+                    event_handler,
+                    ctx,
+                    watch_heartbeats=True,
+                    message_handlers=message_handlers)
+
+            _logger.debug("Common message-loop running.")
+
+            await cml.handle()
+        finally:
+            _logger.info("Connection from [%s] closed.", self.__address)
+            self.__catalog.deregister(self)
+
+            self.close()
+
+            stop_hook = getattr(event_handler, 'stop_hook', None)
+            if stop_hook is not None:
+                stop_hook()
+
+        _logger.warning("Common message-loop ended.")
+
+    def __handle_cache_invalidate(self, message_id, message_obj):
+        # There's no response-cache in front of this engine, but the client 
+        # doesn't need to know that.
+        _logger.debug("Ignoring cache invalidation from [%s].", self.ip)
+
+    def __handle_hello(self, message_id, message_obj):
+        self.__peer = rpipe.capabilities.get_peer_capabilities(
+                        message_obj.capabilities)
+
+        _logger.info("Client [%s] said hello: %s", self.ip, self.__peer)
+
+        self.__exchange.set_frame_version(self.__peer.frame_version)
+
+        self.__exchange.set_can_cancel(
+            self.__peer.supports(rpipe.config.protocol.FEATURE_CANCEL))
+
+        reply_message_obj = rpipe.capabilities.build_hello(
+                                rpipe.protocols.MT_HELLO_R,
+                                self.__eh)
+
+        self.__exchange.send(
+            reply_message_obj,
+            reply_to_message_id=message_id,
+            expect_response=False)
+
+    async def initiate_message(self, message_obj, timeout_s=None, **kwargs):
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SEND_TICK)
+
+        with rpipe.stats.time_and_post(
+                rpipe.config.statsd.EVENT_CONNECTION_SEND_TIMING):
+            return await self.__exchange.send_and_receive(
+                            message_obj,
+                            timeout_s=timeout_s)
+
+    @property
+    def ip(self):
+        return self.__address[0]
+
+    @property
+    def address(self):
+        return self.__address
+
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
+    def __str__(self):
+        return ('ServerConnectionHandler<%s>' % (self.__address,))
+
+
+class Server(object):
+    """Accept client connections on the running loop."""
+
+    def __init__(self, event_handler_cls=None, transport=None, binding=None,
+                 catalog=None):
+        if event_handler_cls is None:
+            event_handler_cls = rpipe.utility.load_cls_from_string(
+                                    rpipe.config.server.EVENT_HANDLER_FQ_CLASS)
+
+        if transport is None:
+            (transport, binding) = get_transport_and_binding()
+
+        if catalog is None:
+            catalog = ConnectionCatalog()
+
+        self.__event_handler_cls = event_handler_cls
+        self.__transport = transport
+        self.__binding = binding
+        self.__catalog = catalog
+
+        self.__server = None
+        self.__tasks = set()
+
+    def __create_exchange(self):
+        return rpipe.aio.message_exchange.MessageExchange(
+                connected_cb=self.__handle_new_connection)
+
+    def __handle_new_connection(self, exchange):
+        task = asyncio.ensure_future(self.__handle_connection(exchange))
+
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __handle_connection(self, exchange):
+        c = ServerConnectionHandler(exchange, self.__catalog)
+
+        try:
+            await c.handle(self.__event_handler_cls())
+        except ValueError:
+            # A redundant connection. It has already been closed.
+            pass
+        except Exception:
+            _logger.exception("There was a problem while handling a "
+                              "connection.")
+
+    async def start(self):
+        _logger.info("Running server: %s", self.__binding)
+
+        self.__server = await self.__transport.create_server(
+                            self.__binding,
+                            self.__create_exchange)
+
+    async def stop(self):
+        self.__server.close()
+        await self.__server.wait_closed()
+
+        for task in list(self.__tasks):
+            task.cancel()
+
+    async def serve_forever(self):
+        await self.start()
+        await self.__server.serve_forever()
+
+    @property
+    def catalog(self):
+        return self.__catalog
@@ -0,0 +1,320 @@
+"""The asyncio counterparts of the TLS/TCP and Unix-socket transports in
+rpipe.transport. Rather than producing streams, they connect a protocol (see
+rpipe.aio.message_exchange) to the socket.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import ssl
+import struct
+
+import rpipe.config.statsd
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.stats
+
+TRANSPORT_TLS = 'tls'
+TRANSPORT_UNIX = 'unix'
+
+
+_contexts = {}
+
+_logger = logging.getLogger(__name__)
+
+
+def _get_ssl_context(keyfile, certfile, ca_certs=None, server_side=False):
+    """Return the process-wide SSL context for the given identity (see
+    rpipe.transport._get_ssl_context()).
+    """
+
+    key = (keyfile, certfile, ca_certs, server_side)
+
+    try:
+        return _contexts[key]
+    except KeyError:
+        pass
+
+    if server_side is True:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(ca_certs)
+    else:
+        # As before, the client authenticates itself but doesn't verify the
+        # server.
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    context.load_cert_chain(certfile, keyfile=keyfile)
+
+    _contexts[key] = context
+    return context
+
+def _post_handshake(transport):
+    ssl_object = transport.get_extra_info('ssl_object')
+    if ssl_object is None:
+        return
+
+    if ssl_object.session_reused is True:
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_TLS_HANDSHAKE_RESUMED_TICK)
+    else:
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_TLS_HANDSHAKE_FULL_TICK)
+
+async def _recv_exactly(loop, s, length):
+    parts = []
+    while length > 0:
+        data = await loop.sock_recv(s, length)
+        if not data:
+            raise rpipe.exceptions.RpConnectionFail(
+                    "Connection closed during admission.")
+
+        parts.append(data)
+        length -= len(data)
+
+    return b''.join(parts)
+
+
+class Transport(object):
+    async def connect(self, binding, protocol_factory):
+        """Connect to the given binding and return the protocol."""
+
+        raise NotImplementedError()
+
+    async def create_server(self, binding, protocol_factory):
+        """Return an asyncio.Server that connects a new protocol to every
+        connection. The protocol's connection_made() is only called once the
+        connection is ready for messages.
+        """
+
+        raise NotImplementedError()
+
+
+class TlsTcpTransport(Transport):
+    """TLS over TCP, with the same (optional) admission preamble as
+    rpipe.transport.TlsTcpTransport. asyncio already disables Nagle on TCP
+    sockets.
+    """
+
+    def __init__(self, keyfile, certfile, ca_certs=None, source_ip=None,
+                 admission_preamble=False, max_concurrent_handshakes=None,
+                 handshake_retry_after_s=5, handshake_timeout_s=None,
+                 reuse_port=False):
+        self.__keyfile = keyfile
+        self.__certfile = certfile
+        self.__ca_certs = ca_certs
+        self.__source_ip = source_ip
+        self.__admission_preamble = admission_preamble
+        self.__max_concurrent_handshakes = max_concurrent_handshakes
+        self.__handshake_retry_after_s = handshake_retry_after_s
+        self.__handshake_timeout_s = handshake_timeout_s
+        self.__reuse_port = reuse_port
+
+        self.__active_handshakes = 0
+
+    def __get_client_context(self):
+        return _get_ssl_context(self.__keyfile, self.__certfile)
+
+    def __get_server_context(self):
+        return _get_ssl_context(
+                self.__keyfile,
+                self.__certfile,
+                ca_certs=self.__ca_certs,
+                server_side=True)
+
+    async def __read_admission(self, loop, s):
+        response = await _recv_exactly(
+                    loop,
+                    s,
+                    len(rpipe.protocol.ADMISSION_ACCEPT))
+
+        if response == rpipe.protocol.ADMISSION_ACCEPT:
+            return
+
+        if response != rpipe.protocol.ADMISSION_RETRY:
+            raise rpipe.exceptions.RpConnectionFail(
+                    "Admission response not valid: [%r]" % (response,))
+
+        length = struct.calcsize(rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT)
+        (retry_after_s,) = struct.unpack(
+                            rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT,
+                            await _recv_exactly(loop, s, length))
+
+        raise rpipe.exceptions.RpConnectionRetryAfter(retry_after_s)
+
+    async def connect(self, binding, protocol_factory):
+        loop = asyncio.get_event_loop()
+
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(False)
+
+        if self.__source_ip is not None:
+            s.bind((self.__source_ip, 0))
+
+        try:
+            await loop.sock_connect(s, binding)
+
+            if self.__admission_preamble is True:
+                await self.__read_admission(loop, s)
+
+            (transport, protocol) = await loop.create_connection(
+                                        protocol_factory,
+                                        sock=s,
+                                        ssl=self.__get_client_context(),
+                                        server_hostname=binding[0])
+        except (OSError, ssl.SSLError) as e:
+            s.close()
+            raise rpipe.exceptions.RpConnectionFail(str(e))
+        except rpipe.exceptions.RpConnectionFail:
+            s.close()
+            raise
+
+        _post_handshake(transport)
+
+        return protocol
+
+    def __set_active_handshakes(self, count):
+        self.__active_handshakes = count
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_HANDSHAKE_ACTIVE_GAUGE,
+            count)
+
+    async def __admit_and_wrap(self, transport, protocol_factory):
+        loop = asyncio.get_event_loop()
+        address = transport.get_extra_info('peername')
+
+        if self.__max_concurrent_handshakes is not None and \
+           self.__active_handshakes >= self.__max_concurrent_handshakes:
+            _logger.debug("Too many concurrent handshakes (%d). Asking [%s] "
+                          "to retry after (%d) seconds.",
+                          self.__active_handshakes, address,
+                          self.__handshake_retry_after_s)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.\
+                    EVENT_CONNECTION_SERVER_HANDSHAKE_REJECT_TICK)
+
+            transport.write(rpipe.protocol.ADMISSION_RETRY +
+                            struct.pack(
+                                rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT,
+                                self.__handshake_retry_after_s))
+
+            transport.close()
+            return
+
+        self.__set_active_handshakes(self.__active_handshakes + 1)
+
+        protocol = protocol_factory()
+
+        try:
+            # Nothing can arrive until the client sees this, and start_tls()
+            # takes the socket over before it yields.
+            transport.write(rpipe.protocol.ADMISSION_ACCEPT)
+
+            with rpipe.stats.time_and_post(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_SERVER_HANDSHAKE_TIMING):
+                tls_transport = await loop.start_tls(
+                                    transport,
+                                    protocol,
+                                    self.__get_server_context(),
+                                    server_side=True,
+                                    ssl_handshake_timeout=\
+                                        self.__handshake_timeout_s)
+        except (OSError, ssl.SSLError, asyncio.TimeoutError) as e:
+            _logger.warning("Handshake with [%s] failed: %s", address, str(e))
+            transport.close()
+            return
+        finally:
+            self.__set_active_handshakes(self.__active_handshakes - 1)
+
+        _post_handshake(tls_transport)
+        protocol.connection_made(tls_transport)
+
+    async def create_server(self, binding, protocol_factory):
+        loop = asyncio.get_event_loop()
+        (host, port) = binding
+
+        reuse_port = True if self.__reuse_port is True else None
+
+        if self.__admission_preamble is False:
+            return await loop.create_server(
+                    protocol_factory,
+                    host,
+                    port,
+                    ssl=self.__get_server_context(),
+                    ssl_handshake_timeout=self.__handshake_timeout_s,
+                    reuse_port=reuse_port)
+
+        # We do the TLS ourselves so that we can decide whether to do it at
+        # all.
+        admit_and_wrap = self.__admit_and_wrap
+
+        class _AdmissionProtocol(asyncio.Protocol):
+            def connection_made(self, raw_transport):
+                loop.create_task(
+                    admit_and_wrap(raw_transport, protocol_factory))
+
+        return await loop.create_server(
+                _AdmissionProtocol,
+                host,
+                port,
+                reuse_port=reuse_port)
+
+
+class UnixTransport(Transport):
+    """Plaintext Unix-domain sockets for co-located, trusted peers. The
+    binding is the socket path.
+    """
+
+    async def connect(self, binding, protocol_factory):
+        loop = asyncio.get_event_loop()
+
+        try:
+            (transport, protocol) = await loop.create_unix_connection(
+                                        protocol_factory,
+                                        binding)
+        except OSError as e:
+            raise rpipe.exceptions.RpConnectionFail(str(e))
+
+        return protocol
+
+    async def create_server(self, binding, protocol_factory):
+        loop = asyncio.get_event_loop()
+
+        if os.path.exists(binding) is True:
+            os.unlink(binding)
+
+        return await loop.create_unix_server(protocol_factory, binding)
+
+
+def get_peer_address(transport):
+    """Return the address to catalog the peer under. Unix sockets have no peer
+    address, so we make one up from the peer's PID (or, where the kernel won't 
+    tell us that, the descriptor, which is unique among the open 
+    connections). It's a loopback address (PIDs fit in 24 bits) so that every 
+    peer is cataloged under its own IP.
+    """
+
+    address = transport.get_extra_info('peername')
+    if isinstance(address, tuple) is True:
+        return address[:2]
+
+    s = transport.get_extra_info('socket')
+
+    try:
+        creds = s.getsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_PEERCRED,
+                    struct.calcsize('3i'))
+    except (AttributeError, OSError):
+        n = s.fileno()
+    else:
+        (n, uid, gid) = struct.unpack('3i', creds)
+
+    ip = '127.%d.%d.%d' % ((n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff)
+    return (ip, n)
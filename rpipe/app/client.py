@@ -1,6 +1,5 @@
 import sys
 import logging
-import time
 import json
 import datetime
 
@@ -8,11 +7,13 @@ import web
 import gevent
 
 import rpipe.config
+import rpipe.config.client
 import rpipe.config.client_web
 import rpipe.config.statsd
 import rpipe.stats
 import rpipe.exceptions
 import rpipe.client.connection
+import rpipe.client.backoff
 import rpipe.utility
 
 _logger = logging.getLogger(__name__)
@@ -32,6 +33,12 @@ def connection_cycle():
     retry_attempts = 0
     last_disconnected_dt = None
 
+    backoff = rpipe.client.backoff.DecorrelatedJitterBackoff(
+                rpipe.config.client.\
+                    MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S,
+                rpipe.config.client.\
+                    MAXIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S)
+
     while 1:
         rpipe.stats.post_to_counter(
             rpipe.config.statsd.EVENT_CONNECTION_CLIENT_NEW_TICK)
@@ -50,7 +57,6 @@ def connection_cycle():
                     fail_event=\
                         rpipe.config.statsd.\
                             EVENT_CONNECTION_CLIENT_HEARTBEAT_FAIL_TICK):
-                last_attempt = time.time()
                 c = rpipe.client.connection.get_connection()
 
             rpipe.stats.post_to_counter(
@@ -58,12 +64,24 @@ def connection_cycle():
 
             sce.connect_success(retry_attempts, last_disconnected_dt)
 
+            if last_disconnected_dt is not None:
+                recovery_s = (datetime.datetime.now() - 
+                              last_disconnected_dt).total_seconds()
+
+                _logger.info("Reconnected after (%.1f) seconds and (%d) "
+                             "attempts.", recovery_s, retry_attempts)
+
+                rpipe.stats.post_timing(
+                    rpipe.config.statsd.EVENT_CONNECTION_CLIENT_RECOVERY_TIMING,
+                    recovery_s)
+
+            backoff.reset()
             retry_attempts = 0
             last_disconnected_dt = None
 
             # Start the local socket-server.
             c.process_requests()
-        except rpipe.exceptions.RpConnectionRetry:
+        except rpipe.exceptions.RpConnectionRetry as e:
             _logger.exception("Connection has broken or a reattempt has been "
                               "unsuccessful.")
 
@@ -75,24 +93,20 @@ def connection_cycle():
             rpipe.stats.post_to_counter(
                 rpipe.config.statsd.EVENT_CONNECTION_CLIENT_BROKEN_TICK)
 
-            time_since_attempt_s = (time.time() - last_attempt)
-            wait_time_s = \
-                rpipe.config.client.\
-                    MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S - \
-                time_since_attempt_s
+            if isinstance(e, rpipe.exceptions.RpConnectionRetryAfter) is True:
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_CLIENT_RETRY_AFTER_TICK)
 
-            _logger.debug("TIME_SINCE_ATTEMPT_S=(%d) MINIMAL_CONNECTION_FAIL_"
-                          "REATTEMPT_WAIT_TIME_S=(%d) WAIT_TIME_S=(%d)",
-                          time_since_attempt_s,
-                          rpipe.config.client.\
-                            MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S,
-                          wait_time_s)
+                wait_time_s = backoff.next_wait_s(
+                                retry_after_s=e.retry_after_s)
+            else:
+                wait_time_s = backoff.next_wait_s()
 
-            if wait_time_s > 0:
-                _logger.info("Waiting for (%d) seconds before reconnect.", 
-                             wait_time_s)
+            _logger.info("Waiting for (%.1f) seconds before reconnect.", 
+                         wait_time_s)
 
-                gevent.sleep(wait_time_s)
+            gevent.sleep(wait_time_s)
 
             retry_attempts += 1
 
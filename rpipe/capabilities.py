@@ -0,0 +1,165 @@
+"""The hello that each side sends at the start of a connection: the protocol
+version, the optional features, the limits, and the routes (handlers) that it
+has. Until the peer's hello arrives (or if it never sends one), nothing is
+assumed: no optional features are used and every event is sent.
+
+A server from before the hello doesn't know the message, and hangs up on a
+client that sends one. The client remembers that, and stops saying hello to
+that server for a while (see HELLO_RETRY_INTERVAL_S).
+"""
+
+import logging
+import time
+
+import rpipe.config.protocol
+import rpipe.event_handling
+import rpipe.protocol
+
+_logger = logging.getLogger(__name__)
+
+
+class PeerCapabilities(object):
+    def __init__(self, protocol_version=None, features=(),
+                 max_batch_events=None, routes=None):
+        self.__protocol_version = protocol_version
+        self.__features = frozenset(features)
+        self.__max_batch_events = max_batch_events
+
+        if routes is not None:
+            routes = frozenset(routes)
+
+        self.__routes = routes
+
+    def supports(self, feature):
+        """Can the optional feature be used with the peer? (It's implied that
+        we support it.)
+        """
+
+        return feature in self.__features and \
+               feature in rpipe.config.protocol.SUPPORTED_FEATURES
+
+    def handles(self, verb, noun):
+        """Will the peer have a handler for the event? If it didn't tell us
+        its routes, we assume that it does.
+        """
+
+        if self.__routes is None:
+            return True
+
+        (handler_name, parameters) = \
+            rpipe.event_handling.get_handler_name_and_parameters(verb, noun)
+
+        return handler_name in self.__routes
+
+    @property
+    def frame_version(self):
+        """The frame format to send to the peer."""
+
+        if self.supports(rpipe.config.protocol.FEATURE_FRAME_V2) is True:
+            return rpipe.protocol.FRAME_V2
+
+        return rpipe.protocol.FRAME_V1
+
+    @property
+    def protocol_version(self):
+        return self.__protocol_version
+
+    @property
+    def max_batch_events(self):
+        return self.__max_batch_events
+
+    def __str__(self):
+        if self.__routes is None:
+            routes_phrase = 'unknown'
+        else:
+            routes_phrase = '(%d)' % (len(self.__routes),)
+
+        return ('PeerCapabilities<VERSION=%s FEATURES=%s ROUTES=%s>' %
+                (self.__protocol_version, sorted(self.__features),
+                 routes_phrase))
+
+UNKNOWN = PeerCapabilities()
+
+def get_routes(event_handler):
+    """Return the names of the handlers that the event-handler has (and,
+    possibly, some other public methods; it only matters that none are
+    missing).
+    """
+
+    return sorted(name
+                  for name
+                  in dir(event_handler)
+                  if name.startswith('_') is False and \
+                     name.startswith('etag_') is False and \
+                     callable(getattr(event_handler, name)) is True)
+
+def build_hello(message_type, event_handler):
+    """Build a hello (or its reply) describing this side."""
+
+    message_obj = rpipe.protocol.get_obj_from_type(message_type)
+    message_obj.version = 1
+
+    c = message_obj.capabilities
+    c.protocol_version = rpipe.config.protocol.PROTOCOL_VERSION
+    c.features.extend(rpipe.config.protocol.SUPPORTED_FEATURES)
+    c.max_batch_events = rpipe.config.protocol.MAXIMUM_BATCH_EVENTS
+
+    if rpipe.config.protocol.ADVERTISE_ROUTES is True:
+        c.has_routes = True
+        c.routes.extend(get_routes(event_handler))
+
+    return message_obj
+
+def get_peer_capabilities(capabilities_obj):
+    c = capabilities_obj
+
+    if c.has_routes is True:
+        routes = c.routes
+    else:
+        routes = None
+
+    if c.HasField('max_batch_events') is True:
+        max_batch_events = c.max_batch_events
+    else:
+        max_batch_events = None
+
+    if c.protocol_version != rpipe.config.protocol.PROTOCOL_VERSION:
+        _logger.warning("Peer speaks a different protocol version: (%d) != "
+                        "(%d)", c.protocol_version,
+                        rpipe.config.protocol.PROTOCOL_VERSION)
+
+    return PeerCapabilities(
+            c.protocol_version,
+            c.features,
+            max_batch_events,
+            routes)
+
+
+class HelloRefusals(object):
+    """The servers (by binding) that hung up on our hello, and when."""
+
+    def __init__(self, 
+                 retry_interval_s=rpipe.config.protocol.HELLO_RETRY_INTERVAL_S):
+        self.__retry_interval_s = retry_interval_s
+        self.__refused_at = {}
+
+    def refused(self, binding):
+        _logger.warning("Server [%s] hung up on our hello. Not saying hello to "
+                        "it for (%d) seconds.", binding, 
+                        self.__retry_interval_s)
+
+        self.__refused_at[binding] = time.time()
+
+    def accepted(self, binding):
+        self.__refused_at.pop(binding, None)
+
+    def should_say_hello(self, binding):
+        refused_at = self.__refused_at.get(binding)
+
+        return refused_at is None or \
+               time.time() - refused_at >= self.__retry_interval_s
+
+_hr = HelloRefusals()
+
+def get_hello_refusals():
+    return _hr
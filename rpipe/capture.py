@@ -0,0 +1,123 @@
+"""Record the frames that go over the tunnel to a file, so that the traffic can
+be looked at, or replayed (see rp_replay), later. This is enabled with
+RP_CAPTURE_FILEPATH.
+
+The file starts with a magic string. Each frame follows as a record header
+(the time, the direction, the ID of the connection, and the length of the
+frame) and the frame itself, exactly as it was written to or read from the
+connection. Connections are numbered from one, in the order that they were
+first seen (zero means that it wasn't known).
+"""
+
+import logging
+import atexit
+import collections
+import os
+import struct
+import time
+import weakref
+
+import rpipe.config.protocol
+
+DIRECTION_SENT = 0
+DIRECTION_RECEIVED = 1
+
+_MAGIC = b'RPCAP1'
+_RECORD_HEADER_FORMAT = '!dBII'
+_RECORD_HEADER_LENGTH = struct.calcsize(_RECORD_HEADER_FORMAT)
+
+_logger = logging.getLogger(__name__)
+
+CAPTURE_RECORD_T = collections.namedtuple(
+                    'CaptureRecord',
+                    ['timestamp', 'direction', 'connection_id', 'frame'])
+
+
+class CaptureWriter(object):
+    """Frames are buffered, so the last few might be lost if the process
+    doesn't exit cleanly.
+    """
+
+    def __init__(self, filepath):
+        _logger.info("Capturing frames: [%s]", filepath)
+
+        self.__f = open(filepath, 'wb')
+        self.__f.write(_MAGIC)
+
+        self.__connection_ids = weakref.WeakKeyDictionary()
+        self.__next_connection_id = 1
+
+    def __get_connection_id(self, stream):
+        if stream is None:
+            return 0
+
+        try:
+            return self.__connection_ids[stream]
+        except KeyError:
+            connection_id = self.__next_connection_id
+            self.__next_connection_id += 1
+
+            self.__connection_ids[stream] = connection_id
+
+            return connection_id
+
+    def record(self, stream, direction, frame):
+        if self.__f is None:
+            return
+
+        header = struct.pack(
+                    _RECORD_HEADER_FORMAT,
+                    time.time(),
+                    direction,
+                    self.__get_connection_id(stream),
+                    len(frame))
+
+        self.__f.write(header)
+        self.__f.write(bytes(frame))
+
+    def close(self):
+        if self.__f is None:
+            return
+
+        self.__f.close()
+        self.__f = None
+
+
+def read_capture(file_):
+    """Yield a CAPTURE_RECORD_T for each frame in the capture."""
+
+    if file_.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("Not a capture file.")
+
+    while 1:
+        header = file_.read(_RECORD_HEADER_LENGTH)
+        if not header:
+            break
+
+        if len(header) < _RECORD_HEADER_LENGTH:
+            _logger.warning("Capture ends with a partial record.")
+            break
+
+        (timestamp, direction, connection_id, length) = \
+            struct.unpack(_RECORD_HEADER_FORMAT, header)
+
+        frame = file_.read(length)
+        if len(frame) < length:
+            _logger.warning("Capture ends with a partial record.")
+            break
+
+        yield CAPTURE_RECORD_T(timestamp, direction, connection_id, frame)
+
+def get_capture_writer():
+    """Return the configured writer, or None if capturing is disabled."""
+
+    if rpipe.config.protocol.CAPTURE_FILEPATH == '':
+        return None
+
+    # Each process needs its own file (e.g. with several acceptors).
+    filepath = rpipe.config.protocol.CAPTURE_FILEPATH % { 'pid': os.getpid() }
+
+    cw = CaptureWriter(filepath)
+    atexit.register(cw.close)
+
+    return cw
@@ -0,0 +1,31 @@
+import random
+
+
+class DecorrelatedJitterBackoff(object):
+    """Produce reconnect delays using "decorrelated jitter": every delay is 
+    drawn between the base and three times the previous delay (capped). 
+    Clients that were disconnected at the same moment quickly drift apart 
+    instead of reconnecting in lockstep.
+    """
+
+    def __init__(self, base_s, cap_s):
+        self.__base_s = base_s
+        self.__cap_s = cap_s
+
+        self.reset()
+
+    def reset(self):
+        self.__last_s = self.__base_s
+
+    def next_wait_s(self, retry_after_s=None):
+        wait_s = min(self.__cap_s, 
+                     random.uniform(self.__base_s, self.__last_s * 3))
+
+        if retry_after_s is not None:
+            # Spread the clients that were turned away together over the 
+            # following interval rather than having them all return at once.
+            wait_s = max(wait_s, 
+                         retry_after_s + random.uniform(0, retry_after_s))
+
+        self.__last_s = wait_s
+        return wait_s
@@ -5,13 +5,14 @@ import os.path
 import time
 
 import gevent
-import gevent.socket
-import gevent.ssl
+import gevent.event
 
 import rpipe.config.client
 import rpipe.config.statsd
 import rpipe.config.heartbeat
+import rpipe.config.protocol
 
+import rpipe.capabilities
 import rpipe.exceptions
 import rpipe.protocol
 import rpipe.protocols
@@ -20,6 +21,7 @@ import rpipe.request_server
 import rpipe.message_loop
 import rpipe.message_exchange
 import rpipe.stats
+import rpipe.transport
 
 _logger = logging.getLogger(__name__)
 
@@ -42,20 +44,56 @@ class TestClientEventHandler(ClientEventHandler):
         return { 'result_from_client': str(x) + str(y) }
 
 
+def get_transport_and_binding():
+    """Build the configured transport and the binding to connect to with it.
+    """
+
+    name = rpipe.config.client.TRANSPORT
+
+    if name == rpipe.transport.TRANSPORT_TLS:
+        transport = rpipe.transport.TlsTcpTransport(
+                        rpipe.config.client.KEY_FILEPATH,
+                        rpipe.config.client.CRT_FILEPATH,
+                        write_timeout_s=rpipe.config.protocol.WRITE_TIMEOUT_S,
+                        admission_preamble=\
+                            rpipe.config.client.ADMISSION_PREAMBLE)
+
+        binding = (rpipe.config.client.TARGET_HOSTNAME, 
+                   rpipe.config.client.TARGET_PORT)
+    elif name == rpipe.transport.TRANSPORT_UNIX:
+        transport = rpipe.transport.UnixTransport(
+                        write_timeout_s=rpipe.config.protocol.WRITE_TIMEOUT_S)
+
+        binding = rpipe.config.client.UNIX_SOCKET_PATH
+    elif name == rpipe.transport.TRANSPORT_MEMORY:
+        transport = rpipe.transport.get_memory_transport()
+        binding = rpipe.transport.DEFAULT_MEMORY_BINDING
+    else:
+        raise ValueError("Transport not valid: [%s]" % (name,))
+
+    return (transport, binding)
+
+
 class _ClientConnectionHandler(
         rpipe.connection.Connection, 
         rpipe.request_server.RequestServer):
-    def __init__(self):
+    def __init__(self, transport=None, binding=None, ready_cb=None):
         self.__ws = None
         self.__connected = False
+        self.__is_ready = False
+        self.__ready_cb = ready_cb
+        self.__peer = rpipe.capabilities.UNKNOWN
 
         self.__heartbeat_msg = rpipe.protocol.get_obj_from_type(
                                 rpipe.protocols.MT_HEARTBEAT)
 
         self.__heartbeat_msg.version = 1
 
-        self.__binding = (rpipe.config.client.TARGET_HOSTNAME, 
-                          rpipe.config.client.TARGET_PORT)
+        if transport is None:
+            (transport, binding) = get_transport_and_binding()
+
+        self.__transport = transport
+        self.__binding = binding
 
     def __del__(self):
         if self.__connected is True:
@@ -68,31 +106,18 @@ class _ClientConnectionHandler(
         if self.__connected is True:
             raise IOError("Client already connected.")
 
-        socket = gevent.socket.socket(
-                    gevent.socket.AF_INET, 
-                    gevent.socket.SOCK_STREAM)
-
-        ss = gevent.ssl.wrap_socket(
-                socket,
-                keyfile=rpipe.config.client.KEY_FILEPATH,
-                certfile=rpipe.config.client.CRT_FILEPATH)
-
-        try:
-            ss.connect(self.__binding)
-        except gevent.socket.error:
-            raise rpipe.exceptions.RpConnectionFail(str(gevent.socket.error))
-
-        ss.settimeout(rpipe.config.protocol.WRITE_TIMEOUT_S)
-
-        self.__ws = rpipe.protocol.SocketWrapper(ss, ss.makefile())
+        self.__ws = self.__transport.connect(self.__binding)
         self.__connected = True
 
+        if rpipe.config.client.BANDWIDTH_LIMIT_BPS > 0:
+            self.__ws.set_shaper(
+                rpipe.transport.BandwidthShaper(
+                    rpipe.config.client.BANDWIDTH_LIMIT_BPS,
+                    rpipe.config.client.BANDWIDTH_BURST_BYTES))
+
         _logger.debug("Scheduling heartbeat.")
         self.__schedule_heartbeat()
 
-# TODO(dustin): Do startup tasks (such as sending a list of events that we're 
-#               interested in receiving).
-
     def close(self):
         _logger.info("Closing connection.")
 
@@ -100,6 +125,7 @@ class _ClientConnectionHandler(
             raise rpipe.exceptions.RpConnectionClosed("Client no longer connected.")
 
         self.__connected = False
+        self.__is_ready = False
 
         try:
             self.__ws.close()
@@ -146,7 +172,49 @@ class _ClientConnectionHandler(
 
         self.__schedule_heartbeat()
 
-    def initiate_message(self, message_obj, timeout_s=None):
+    def __say_hello(self, event_handler):
+        """Tell the server what we can do (and which events we handle), and 
+        learn the same about it.
+        """
+
+        hr = rpipe.capabilities.get_hello_refusals()
+        if hr.should_say_hello(self.__binding) is False:
+            _logger.info("Not saying hello to a server that doesn't support "
+                         "it. Assuming nothing about it.")
+            return
+
+        hello_obj = rpipe.capabilities.build_hello(
+                        rpipe.protocols.MT_HELLO, 
+                        event_handler)
+
+        try:
+            reply_obj = self.initiate_message(
+                            hello_obj, 
+                            timeout_s=rpipe.config.protocol.HELLO_TIMEOUT_S)
+        except rpipe.message_exchange.ResponseTimeoutError:
+            _logger.warning("The server didn't answer our hello. Assuming "
+                            "nothing about it.")
+            return
+        except rpipe.exceptions.RpConnectionClosed:
+            hr.refused(self.__binding)
+            return
+
+        hr.accepted(self.__binding)
+
+        self.__peer = rpipe.capabilities.get_peer_capabilities(
+                        reply_obj.capabilities)
+
+        _logger.info("Server said hello: %s", self.__peer)
+
+        rpipe.message_exchange.set_frame_version(
+            self.__binding, 
+            self.__peer.frame_version)
+
+        rpipe.message_exchange.set_can_cancel(
+            self.__binding, 
+            self.__peer.supports(rpipe.config.protocol.FEATURE_CANCEL))
+
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None):
         # This only works because the CommonMessageLoop has already been 
         # started and has registered the other participant with the 
         # MessageExchange.
@@ -159,7 +227,28 @@ class _ClientConnectionHandler(
             return rpipe.message_exchange.send_and_receive(
                     self.__binding, 
                     message_obj,
-                    timeout_s=timeout_s)
+                    timeout_s=timeout_s,
+                    chunks=chunks)
+
+    def send_message(self, message_obj):
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SEND_TICK)
+
+        rpipe.message_exchange.send(
+            self.__binding, 
+            message_obj, 
+            expect_response=False)
+
+    def __ready_g_cb(self, hello_g):
+        """We've said hello, so events can be sent."""
+
+        if self.__connected is False:
+            return
+
+        self.__is_ready = True
+
+        if self.__ready_cb is not None:
+            self.__ready_cb()
 
     def process_requests(self):
         assert self.__ws is not None
@@ -175,7 +264,14 @@ class _ClientConnectionHandler(
             ctx = rpipe.message_loop.CONNECTION_CONTEXT_T(self.__binding)
             cml = rpipe.message_loop.CommonMessageLoop(self.__ws, eh, ctx)
 
-            cml.handle()
+            # This runs as soon as the message-loop is reading.
+            hello_g = gevent.spawn(self.__say_hello, eh)
+            hello_g.link_value(self.__ready_g_cb)
+
+            try:
+                cml.handle()
+            finally:
+                hello_g.kill(block=False)
         finally:
             # The message-loop has terminated (either purposely or via 
             # exception). Make sure we close the connection (thereby 
@@ -186,6 +282,17 @@ class _ClientConnectionHandler(
     def connected(self):
         return self.__connected
 
+    @property
+    def is_ready(self):
+        # The message-exchange stops as soon as the connection breaks, a 
+        # little before we notice and close.
+        return self.__is_ready is True and \
+               rpipe.message_exchange.is_alive(self.__binding) is True
+
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
 
 class _ClientManager(object):
     """Establish a connection, and recall it from one invocation to the next. 
@@ -194,6 +301,7 @@ class _ClientManager(object):
 
     def __init__(self):
         self.__c = None
+        self.__ready_e = gevent.event.Event()
 
     def __del__(self):
         if self.__c is not None:
@@ -203,7 +311,7 @@ class _ClientManager(object):
     def connection(self):
         if self.__c is None or self.__c.connected is False:
             _logger.info("Establishing new connection.")
-            c = _ClientConnectionHandler()
+            c = _ClientConnectionHandler(ready_cb=self.__ready_e.set)
             c.open()
             self.__c = c
         else:
@@ -211,7 +319,38 @@ class _ClientManager(object):
 
         return self.__c
 
+    def wait_for_connection(self, timeout_s=None):
+        """Wait for the connection-cycle to have a connection ready (one that 
+        has said hello), without connecting ourselves. Raise 
+        RpConnectionClosed if there isn't one in `timeout_s`.
+        """
+
+        if timeout_s is not None:
+            stop_at = time.time() + timeout_s
+
+        while 1:
+            c = self.__c
+            if c is not None and c.is_ready is True:
+                return c
+
+            self.__ready_e.clear()
+
+            if timeout_s is not None:
+                timeout_s = max(0, stop_at - time.time())
+
+            if self.__ready_e.wait(timeout_s) is False:
+                raise rpipe.exceptions.RpConnectionClosed(
+                        "No connection to the server.")
+
 _cm = _ClientManager()
 
 def get_connection():
+    """Return the current connection, connecting if necessary. Only the 
+    connection-cycle should do this. Anybody else should use 
+    wait_for_connection().
+    """
+
     return _cm.connection
+
+def wait_for_connection(timeout_s=None):
+    return _cm.wait_for_connection(timeout_s=timeout_s)
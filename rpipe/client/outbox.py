@@ -0,0 +1,102 @@
+"""Hold requests for the server while the connection is down, and send them
+once the connection-cycle has it back up.
+"""
+
+import logging
+import time
+
+import rpipe.config.client
+import rpipe.config.statsd
+
+import rpipe.client.connection
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+
+class OutboxFullError(rpipe.exceptions.RpClientException):
+    pass
+
+
+class Outbox(object):
+    """Requests wait here for a connection. Only so many can wait at once, and
+    the rest are refused rather than piling-up. If the connection drops while
+    a request is waiting on its reply, it's sent again once the connection is
+    back, but only if its verb is idempotent and it has no streamed body (which
+    can only be read once).
+    """
+
+    def __init__(self,
+                 max_pending=rpipe.config.client.OUTBOX_MAX_PENDING,
+                 idempotent_verbs=rpipe.config.client.IDEMPOTENT_VERBS):
+        self.__max_pending = max_pending
+        self.__idempotent_verbs = idempotent_verbs
+        self.__pending = 0
+
+    def __wait_for_connection(self, stop_at):
+        try:
+            return rpipe.client.connection.wait_for_connection(timeout_s=0)
+        except rpipe.exceptions.RpConnectionClosed:
+            pass
+
+        if self.__pending >= self.__max_pending:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_CLIENT_OUTBOX_REJECT_TICK)
+
+            raise OutboxFullError(
+                    "Too many requests are waiting for the connection: (%d)" %
+                    (self.__pending,))
+
+        self.__pending += 1
+        started_at = time.time()
+
+        try:
+            timeout_s = None if stop_at is None else max(0, stop_at - time.time())
+
+            try:
+                return rpipe.client.connection.wait_for_connection(
+                        timeout_s=timeout_s)
+            except rpipe.exceptions.RpConnectionClosed:
+                raise rpipe.message_exchange.ResponseTimeoutError()
+        finally:
+            self.__pending -= 1
+
+            rpipe.stats.post_timing(
+                rpipe.config.statsd.EVENT_CLIENT_OUTBOX_WAIT_TIMING,
+                time.time() - started_at)
+
+    def send(self, send_cb, verb, timeout_s=None, can_replay=True):
+        """Return `send_cb(c, timeout_s)` once there's a connection, where
+        `timeout_s` is whatever's left of ours. Raise OutboxFullError if we'd
+        have to wait and too many are already waiting, and
+        ResponseTimeoutError if the connection doesn't come back in time.
+        """
+
+        stop_at = None if timeout_s is None else time.time() + timeout_s
+        can_replay = can_replay is True and verb in self.__idempotent_verbs
+
+        while 1:
+            c = self.__wait_for_connection(stop_at)
+
+            remaining_s = None if stop_at is None else stop_at - time.time()
+            if remaining_s is not None and remaining_s <= 0:
+                raise rpipe.message_exchange.ResponseTimeoutError()
+
+            try:
+                return send_cb(c, remaining_s)
+            except rpipe.exceptions.RpConnectionClosed:
+                if can_replay is False:
+                    raise
+
+            _logger.warning("Connection lost while waiting on [%s] event. "
+                            "Sending it again once reconnected.", verb)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_CLIENT_OUTBOX_REPLAY_TICK)
+
+_ob = Outbox()
+
+def get_outbox():
+    return _ob
@@ -8,6 +8,12 @@ USER_CONFIG_MODULE_NAME = os.environ.get('RP_CLIENT_USER_CONFIG_MODULE', '')
 TARGET_HOSTNAME = os.environ.get('RP_CLIENT_TARGET_HOSTNAME', 'localhost')
 TARGET_PORT = int(os.environ.get('RP_CLIENT_TARGET_PORT', '1234'))
 
+# One of "tls", "unix", or "memory" (see rpipe.transport).
+TRANSPORT = os.environ.get('RP_CLIENT_TRANSPORT', 'tls')
+
+# Only used with the "unix" transport.
+UNIX_SOCKET_PATH = os.environ.get('RP_CLIENT_UNIX_SOCKET_PATH', '/tmp/rpserver.pipe.sock')
+
 _CERT_PATH = os.environ.get('RP_CLIENT_CERT_PATH', '/var/lib/restpipe')
 
 if os.path.exists(_CERT_PATH) is False:
@@ -34,9 +40,31 @@ CONNECTION_STATE_CHANGE_EVENT_CLASS = \
         'rpipe.state_change_event.ClientStateChangeEvent')
 
 # We deal in terms of seconds, and we need to make sure to give the other side 
-# enough time to clean-up the old connection.
+# enough time to clean-up the old connection. This is also the base of the 
+# (jittered, exponential) reconnect backoff.
 MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S = 5
 
+# The most we'll ever wait between reconnect attempts.
+MAXIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S = \
+    int(os.environ.get('RP_CLIENT_MAXIMAL_REATTEMPT_WAIT_TIME_S', '120'))
+
+# Read the server's plaintext admission response before the TLS handshake. 
+# This must match the server's setting (off, by default).
+ADMISSION_PREAMBLE = bool(int(os.environ.get('RP_CLIENT_ADMISSION_PREAMBLE', '0')))
+
+# Cap the rate (bytes per second) at which we write to the server. Zero means 
+# no cap.
+BANDWIDTH_LIMIT_BPS = int(os.environ.get('RP_CLIENT_BANDWIDTH_LIMIT_BPS', '0'))
+BANDWIDTH_BURST_BYTES = 64 * 1024
+
+# While we're reconnecting, requests wait (up to their timeout) for the 
+# connection to come back. At most this many can wait at once; beyond that, 
+# they're turned away. If the connection drops while waiting on the reply, 
+# events with these verbs (which can safely be run twice) are sent again once 
+# it's back.
+OUTBOX_MAX_PENDING = int(os.environ.get('RP_CLIENT_OUTBOX_MAX_PENDING', '1000'))
+IDEMPOTENT_VERBS = ('get', 'put', 'delete')
+
 # Install attributes on this module from the optional user-config.
 if USER_CONFIG_MODULE_NAME != '':
     _MODULE = sys.modules[__name__]
@@ -0,0 +1,18 @@
+import os
+
+# The engine to benchmark: "gevent" or "asyncio".
+ENGINE = os.environ.get('RP_BENCHMARK_ENGINE', 'gevent')
+
+CLIENT_COUNT = int(os.environ.get('RP_BENCHMARK_CLIENT_COUNT', '200'))
+REQUEST_COUNT = int(os.environ.get('RP_BENCHMARK_REQUEST_COUNT', '20000'))
+CONCURRENCY = int(os.environ.get('RP_BENCHMARK_CONCURRENCY', '50'))
+REPLY_PAYLOAD_BYTES = int(os.environ.get('RP_BENCHMARK_REPLY_PAYLOAD_BYTES', '256'))
+
+# How long to just hold the connections (heartbeating) in order to measure the 
+# resting cost of a connection.
+IDLE_S = int(os.environ.get('RP_BENCHMARK_IDLE_S', '10'))
+
+BIND_IP = '127.0.0.1'
+BIND_PORT = int(os.environ.get('RP_BENCHMARK_BIND_PORT', '1235'))
+
+CONNECT_TIMEOUT_S = 120
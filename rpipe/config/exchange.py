@@ -1,4 +1,2 @@
-IDLE_TIMEOUT_S = .5
-
 UNHANDLED_EVENT_CODE = 250
 UNHANDLED_EXCEPTION_CODE = 251
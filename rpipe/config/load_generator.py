@@ -0,0 +1,30 @@
+import os
+
+import rpipe.config.heartbeat
+
+# The simulated clients need distinct source IPs since the server catalogs
+# connections by IP. Everything under 127/8 routes to the loopback interface
+# on Linux, so we allocate sequentially from here.
+SOURCE_IP_BASE = os.environ.get('RP_LOAD_SOURCE_IP_BASE', '127.1.0.1')
+
+CLIENT_COUNT = int(os.environ.get('RP_LOAD_CLIENT_COUNT', '1000'))
+
+# How quickly we bring clients up. A value of zero connects everybody at once.
+CONNECT_RATE_PER_S = int(os.environ.get('RP_LOAD_CONNECT_RATE_PER_S', '500'))
+
+HEARTBEAT_INTERVAL_S = rpipe.config.heartbeat.HEARTBEAT_INTERVAL_S
+HEARTBEAT_TIMEOUT_S = rpipe.config.heartbeat.HEARTBEAT_TIMEOUT_S
+
+THINK_TIME_S = float(os.environ.get('RP_LOAD_THINK_TIME_S', '0.0'))
+REPLY_PAYLOAD_BYTES = int(os.environ.get('RP_LOAD_REPLY_PAYLOAD_BYTES', '256'))
+
+RECONNECT_WAIT_TIME_S = 1
+
+# HTTP traffic driven at the server's web tier (e.g. "http://rpserver.local").
+HTTP_BASE_URL = os.environ.get('RP_LOAD_HTTP_BASE_URL', '')
+HTTP_CONCURRENCY = int(os.environ.get('RP_LOAD_HTTP_CONCURRENCY', '50'))
+HTTP_NOUN = os.environ.get('RP_LOAD_HTTP_NOUN', 'time')
+HTTP_TIMEOUT_S = 30
+
+DURATION_S = int(os.environ.get('RP_LOAD_DURATION_S', '60'))
+REPORT_INTERVAL_S = int(os.environ.get('RP_LOAD_REPORT_INTERVAL_S', '10'))
@@ -1,3 +1,5 @@
+import os
+
 import rpipe.config.heartbeat
 
 WATCH_LOOP_INTERVAL_S = 1
@@ -6,3 +8,39 @@ UNHANDLED_EVENT_DEFAULT_RESULT_CODE = 255
 MESSAGE_LOOP_READ_TIMEOUT_S = 1
 
 WRITE_TIMEOUT_S = rpipe.config.heartbeat.HEARTBEAT_INTERVAL_S * 2
+
+# Exchanged (along with the routes that each side handles) in the hello at the 
+# start of every connection. The optional features are only used when both 
+# sides support them.
+PROTOCOL_VERSION = 1
+
+FEATURE_STREAMING = 'streaming'
+FEATURE_BATCHING = 'batching'
+FEATURE_FRAME_V2 = 'frame_v2'
+FEATURE_CANCEL = 'cancel'
+FEATURE_CACHE_INVALIDATION = 'cache_invalidation'
+SUPPORTED_FEATURES = (FEATURE_STREAMING, FEATURE_BATCHING, FEATURE_FRAME_V2,
+                      FEATURE_CANCEL, FEATURE_CACHE_INVALIDATION)
+
+MAXIMUM_BATCH_EVENTS = int(os.environ.get('RP_MAXIMUM_BATCH_EVENTS', '100'))
+
+# Turn this off if the event-handler resolves its handlers dynamically (the 
+# other side will then send it everything).
+ADVERTISE_ROUTES = bool(int(os.environ.get('RP_ADVERTISE_ROUTES', '1')))
+
+HELLO_TIMEOUT_S = 10
+
+# A client won't say hello again, for this long, to a server that hung up on 
+# one (it's from before the hello).
+HELLO_RETRY_INTERVAL_S = int(os.environ.get('RP_HELLO_RETRY_INTERVAL_S', '3600'))
+
+# Replies to events with an idempotency-key are remembered for this long, so 
+# that a retry gets the same reply instead of running the handler again. Zero 
+# entries disables it.
+DEDUP_CACHE_MAX_ENTRIES = int(os.environ.get('RP_DEDUP_CACHE_MAX_ENTRIES', '10000'))
+DEDUP_CACHE_TTL_S = int(os.environ.get('RP_DEDUP_CACHE_TTL_S', '300'))
+
+# Record every frame to this file (see rpipe.capture). This is meant for 
+# reproducing problems, not for leaving on. "%(pid)s" is replaced with the 
+# process-ID, which is necessary if there's more than one process.
+CAPTURE_FILEPATH = os.environ.get('RP_CAPTURE_FILEPATH', '')
@@ -0,0 +1,9 @@
+import os
+
+# How much faster than it was captured to replay the traffic. Zero sends 
+# everything as fast as it can.
+SPEED = float(os.environ.get('RP_REPLAY_SPEED', '1.0'))
+
+REQUEST_TIMEOUT_S = int(os.environ.get('RP_REPLAY_REQUEST_TIMEOUT_S', '60'))
+
+CONNECT_TIMEOUT_S = 120
@@ -7,6 +7,12 @@ USER_CONFIG_MODULE_NAME = os.environ.get('RP_SERVER_USER_CONFIG_MODULE', '')
 BIND_IP = os.environ.get('RP_SERVER_BIND_INTERFACE', '0.0.0.0')
 BIND_PORT = int(os.environ.get('RP_SERVER_BIND_PORT', '1234'))
 
+# One of "tls", "unix", or "memory" (see rpipe.transport).
+TRANSPORT = os.environ.get('RP_SERVER_TRANSPORT', 'tls')
+
+# Only used with the "unix" transport.
+UNIX_SOCKET_PATH = os.environ.get('RP_SERVER_UNIX_SOCKET_PATH', '/tmp/rpserver.pipe.sock')
+
 _CERT_PATH = os.environ.get('RP_SERVER_CERT_PATH', '/var/lib/restpipe')
 
 if os.path.exists(_CERT_PATH) is False:
@@ -22,6 +28,27 @@ CA_CRT_FILEPATH = os.path.join(_CERT_PATH, _CA_CRT_FILENAME)
 
 DEFAULT_READ_CHUNK_LENGTH = 1024
 
+# Tell clients whether they're admitted before doing the TLS handshake, and 
+# turn them away with a "retry-after" when too many handshakes are already in 
+# progress. This must match the clients' setting, so it's off by default (for 
+# clients that don't know about it).
+ADMISSION_PREAMBLE = bool(int(os.environ.get('RP_SERVER_ADMISSION_PREAMBLE', '0')))
+MAX_CONCURRENT_HANDSHAKES = int(os.environ.get('RP_SERVER_MAX_CONCURRENT_HANDSHAKES', '32'))
+HANDSHAKE_RETRY_AFTER_S = int(os.environ.get('RP_SERVER_HANDSHAKE_RETRY_AFTER_S', '5'))
+HANDSHAKE_TIMEOUT_S = 10
+
+# The number of processes accepting tunnel connections (TLS transport only). 
+# Beyond the first (which runs alongside the web-tier), each is a separate 
+# process sharing the port via SO_REUSEPORT, so that handshakes and record 
+# crypto are spread over the cores. They share a view of which process owns 
+# which client under this path, and relay events for each other.
+ACCEPTOR_PROCESSES = int(os.environ.get('RP_SERVER_ACCEPTOR_PROCESSES', '1'))
+SHARED_CATALOG_PATH = os.environ.get('RP_SERVER_SHARED_CATALOG_PATH', '/tmp/rpserver.catalog')
+ACCEPTOR_RESTART_WAIT_S = 5
+
+# How long a relayed message can take (unless the event has its own timeout).
+RELAY_TIMEOUT_S = int(os.environ.get('RP_SERVER_RELAY_TIMEOUT_S', '60'))
+
 EVENT_HANDLER_FQ_CLASS = \
     os.environ.get(
         'RP_EVENT_HANDLER_FQ_CLASS',
@@ -36,6 +63,48 @@ DEFAULT_CONNECTION_WAIT_TIMEOUT_S = 20
 
 CLIENT_HOSTNAME_RESOLVER_CLS = 'rpipe.server.hostname_resolver.HostnameResolverDns'
 
+# Broadcasts can be addressed to a tag. By default, the tags are a dictionary of 
+# lists of hostnames (or IPs) set here.
+CLIENT_TAG_RESOLVER_CLS = 'rpipe.server.client_tags.ClientTagResolverConfig'
+CLIENT_TAGS = {}
+
+# Have concurrent, identical GETs for a client (the same noun and parameters) 
+# share one event rather than each sending its own.
+COALESCE_GETS = bool(int(os.environ.get('RP_SERVER_COALESCE_GETS', '0')))
+
+# Responses to GETs are cached for as long as the client's handler allows 
+# (nothing is cached unless it returns a TTL). Zero entries disables the cache.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RP_SERVER_RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('RP_SERVER_RESPONSE_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+MAXIMUM_RESPONSE_CACHE_TTL_S = 3600
+
+# Cap the rate (bytes per second) at which we write to a client, e.g. one on a 
+# metered or narrow link, so that a large transfer doesn't crowd out its 
+# heartbeats. Caps are by client IP ({ ip: bytes_per_s }), and otherwise the 
+# default. Zero means no cap. The bytes each connection has read and written 
+# are posted to statsd every interval.
+DEFAULT_BANDWIDTH_LIMIT_BPS = int(os.environ.get('RP_SERVER_DEFAULT_BANDWIDTH_LIMIT_BPS', '0'))
+BANDWIDTH_LIMITS_BPS = {}
+BANDWIDTH_BURST_BYTES = 64 * 1024
+TRAFFIC_REPORT_INTERVAL_S = int(os.environ.get('RP_SERVER_TRAFFIC_REPORT_INTERVAL_S', '60'))
+
+# Fire-and-forget events for a client that isn't connected are kept in this 
+# SQLite file (shared by the acceptors) and delivered, oldest first and in 
+# batches, when it comes back. Events older than the retention are dropped, 
+# and new ones are refused once a client has too many, or the file has too 
+# much data. An empty path turns it off.
+OUTBOX_FILEPATH = os.environ.get('RP_SERVER_OUTBOX_FILEPATH', '')
+OUTBOX_RETENTION_S = int(os.environ.get('RP_SERVER_OUTBOX_RETENTION_S', str(24 * 60 * 60)))
+OUTBOX_MAX_EVENTS_PER_CLIENT = int(os.environ.get('RP_SERVER_OUTBOX_MAX_EVENTS_PER_CLIENT', '10000'))
+OUTBOX_MAX_BYTES = int(os.environ.get('RP_SERVER_OUTBOX_MAX_BYTES', str(100 * 1024 * 1024)))
+OUTBOX_DELIVERY_BATCH_SIZE = 50
+OUTBOX_DELIVERY_TIMEOUT_S = 60
+OUTBOX_PRUNE_INTERVAL_S = 60
+
+# Events that a process has claimed for delivery are left to it for this long. 
+# After that, they're assumed to have been abandoned (e.g. the process died).
+OUTBOX_CLAIM_TIMEOUT_S = OUTBOX_DELIVERY_TIMEOUT_S * 2
+
 # Install attributes on this module from the optional user-config.
 if USER_CONFIG_MODULE_NAME != '':
     _MODULE = sys.modules[__name__]
@@ -1,3 +1,6 @@
 URLS = (
     '/client/([a-zA-Z0-9_\-\.]+)/(.*)$', 'rpipe.views.server.event.EventServer',
+    '/clients/(.*)$', 'rpipe.views.server.broadcast.BroadcastServer',
+    '/batch/([a-zA-Z0-9_\-\.]+)$', 'rpipe.views.server.batch.BatchServer',
+    '/jobs/([a-f0-9]+)$', 'rpipe.views.server.job.JobServer',
 )
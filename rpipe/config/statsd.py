@@ -10,12 +10,73 @@ EVENT_CONNECTION_CLIENT_BROKEN_TICK            = 'client.connect.broken.tick'
 EVENT_CONNECTION_CLIENT_HEARTBEAT_TIMING       = 'client.connect.heartbeat.timing'
 EVENT_CONNECTION_CLIENT_HEARTBEAT_SUCCESS_TICK = 'client.connect.heartbeat.success.tick'
 EVENT_CONNECTION_CLIENT_HEARTBEAT_FAIL_TICK    = 'client.connect.heartbeat.fail.tick'
+EVENT_CONNECTION_CLIENT_RETRY_AFTER_TICK       = 'client.connect.retry_after.tick'
+EVENT_CONNECTION_CLIENT_RECOVERY_TIMING        = 'client.connect.recovery.timing'
+EVENT_CLIENT_OUTBOX_WAIT_TIMING                = 'client.outbox.wait.timing'
+EVENT_CLIENT_OUTBOX_REPLAY_TICK                = 'client.outbox.replay.tick'
+EVENT_CLIENT_OUTBOX_REJECT_TICK                = 'client.outbox.reject.tick'
 
-EVENT_CONNECTION_SEND_TICK   = 'message.send.tick'
-EVENT_CONNECTION_SEND_TIMING = 'message.send.timing'
+EVENT_CONNECTION_SERVER_HANDSHAKE_TIMING       = 'server.connect.handshake.timing'
+EVENT_CONNECTION_SERVER_HANDSHAKE_REJECT_TICK  = 'server.connect.handshake.reject.tick'
+EVENT_CONNECTION_SERVER_HANDSHAKE_ACTIVE_GAUGE = 'server.connect.handshake.active'
+EVENT_CONNECTION_SERVER_COUNT_GAUGE            = 'server.connect.count'
+EVENT_CONNECTION_SERVER_RECOVERY_TIMING        = 'server.connect.recovery.timing'
+EVENT_CONNECTION_SERVER_BYTES_READ_TICK        = 'server.connect.bytes.read.tick'
+EVENT_CONNECTION_SERVER_BYTES_WRITTEN_TICK     = 'server.connect.bytes.written.tick'
 
-EVENT_MESSAGE_RECEIVE_TICK          = 'message.receive.tick'
-EVENT_MESSAGE_RECEIVE_HANDLE_TIMING = 'message.receive.handle.timing'
+EVENT_TLS_HANDSHAKE_RESUMED_TICK = 'tls.handshake.resumed.tick'
+EVENT_TLS_HANDSHAKE_FULL_TICK    = 'tls.handshake.full.tick'
+
+EVENT_TLS_CLIENT_SESSION_RESUMED_TICK     = 'tls.client.session.resumed.tick'
+EVENT_TLS_CLIENT_SESSION_NOT_RESUMED_TICK = 'tls.client.session.not_resumed.tick'
+
+EVENT_SERVER_WEB_BATCH_TICK             = 'server.web.batch.tick'
+EVENT_SERVER_WEB_BROADCAST_TICK         = 'server.web.broadcast.tick'
+EVENT_SERVER_WEB_BROADCAST_TIMING       = 'server.web.broadcast.timing'
+EVENT_SERVER_WEB_FORGET_TICK            = 'server.web.forget.tick'
+EVENT_SERVER_WEB_JOB_TICK               = 'server.web.job.tick'
+EVENT_SERVER_WEB_JOB_REJECT_TICK        = 'server.web.job.reject.tick'
+EVENT_SERVER_WEB_COALESCED_TICK         = 'server.web.coalesced.tick'
+EVENT_SERVER_WEB_CACHE_HIT_TICK         = 'server.web.cache.hit.tick'
+EVENT_SERVER_WEB_CACHE_MISS_TICK        = 'server.web.cache.miss.tick'
+EVENT_SERVER_WEB_CACHE_INVALIDATE_TICK  = 'server.web.cache.invalidate.tick'
+EVENT_SERVER_WEB_CACHE_REVALIDATED_TICK = 'server.web.cache.revalidated.tick'
+EVENT_SERVER_WEB_RATE_LIMITED_TICK      = 'server.web.rate_limit.rejected.tick'
+EVENT_SERVER_WEB_RATE_BUCKETS_GAUGE     = 'server.web.rate_limit.buckets'
+EVENT_SERVER_WEB_SHED_TICK              = 'server.web.admission.shed.tick'
+EVENT_SERVER_WEB_IN_FLIGHT_GAUGE        = 'server.web.admission.in_flight'
+EVENT_SERVER_WEB_DECREASE_TICK          = 'server.web.admission.decrease.tick'
+EVENT_SERVER_WEB_LIMITED_GAUGE          = 'server.web.admission.limited'
+EVENT_SERVER_WEB_FAIR_QUEUE_WAIT_TIMING = 'server.web.fair_queue.wait.timing'
+
+EVENT_SERVER_OUTBOX_QUEUED_TICK         = 'server.outbox.queued.tick'
+EVENT_SERVER_OUTBOX_DELIVERED_TICK      = 'server.outbox.delivered.tick'
+EVENT_SERVER_OUTBOX_EXPIRED_TICK        = 'server.outbox.expired.tick'
+EVENT_SERVER_OUTBOX_REJECT_TICK         = 'server.outbox.reject.tick'
+EVENT_SERVER_OUTBOX_DEPTH_GAUGE         = 'server.outbox.depth'
+EVENT_SERVER_OUTBOX_BYTES_GAUGE         = 'server.outbox.bytes'
+EVENT_SERVER_OUTBOX_CLIENTS_GAUGE       = 'server.outbox.clients'
+
+EVENT_SERVER_WEB_RATE_LEVEL_GAUGE_TEMPLATE = 'server.web.rate_limit.%(scope)s.level'
+EVENT_SERVER_WEB_FAIR_QUEUE_CLIENT_WAIT_TIMING_TEMPLATE = 'server.web.fair_queue.%(ip)s.wait.timing'
+
+EVENT_CONNECTION_SEND_TICK          = 'message.send.tick'
+EVENT_CONNECTION_SEND_TIMING        = 'message.send.timing'
+EVENT_CONNECTION_SEND_UNROUTED_TICK = 'message.send.unrouted.tick'
+
+EVENT_MESSAGE_RECEIVE_TICK            = 'message.receive.tick'
+EVENT_MESSAGE_RECEIVE_HANDLE_TIMING   = 'message.receive.handle.timing'
+EVENT_MESSAGE_RECEIVE_EXPIRED_TICK    = 'message.receive.expired.tick'
+EVENT_MESSAGE_RECEIVE_CANCEL_TICK     = 'message.receive.cancel.tick'
+EVENT_MESSAGE_RECEIVE_BATCH_TICK      = 'message.receive.batch.tick'
+EVENT_MESSAGE_RECEIVE_UNKNOWN_TICK    = 'message.receive.unknown.tick'
+EVENT_MESSAGE_REPLY_LATE_TICK         = 'message.reply.late.tick'
+EVENT_MESSAGE_REPLY_NOT_MODIFIED_TICK = 'message.reply.not_modified.tick'
+EVENT_MESSAGE_RECEIVE_DUPLICATE_TICK  = 'message.receive.duplicate.tick'
+EVENT_MESSAGE_RECEIVE_DUPLICATE_MISMATCH_TICK = 'message.receive.duplicate.mismatch.tick'
+
+EVENT_CONNECTION_SERVER_CLIENT_BYTES_READ_GAUGE_TEMPLATE    = 'server.connect.%(ip)s.bytes.read'
+EVENT_CONNECTION_SERVER_CLIENT_BYTES_WRITTEN_GAUGE_TEMPLATE = 'server.connect.%(ip)s.bytes.written'
 
 EVENT_HANDLER_TICK_TEMPLATE = 'message.received.handle.%(handler_name)s.tick'
 EVENT_HANDLER_TIMING_TEMPLATE = 'message.received.handle.%(handler_name)s.timing'
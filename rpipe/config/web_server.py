@@ -1 +1,93 @@
+import os
+
 HEADER_EVENT_RETURN_CODE = 'X-Event-Return-Code'
+
+# Set (to "hit", or "revalidated") when the response came from the server's 
+# response-cache.
+HEADER_EVENT_CACHE = 'X-Event-Cache'
+
+WSGI_HEADER_IF_NONE_MATCH = 'HTTP_IF_NONE_MATCH'
+
+# A caller that might retry a request can give each attempt the same key, and 
+# the other side of the pipe will only run it once. The client's web-server 
+# makes one up otherwise, so that its own retries are safe.
+HEADER_IDEMPOTENCY_KEY = 'Idempotency-Key'
+WSGI_HEADER_IDEMPOTENCY_KEY = 'HTTP_IDEMPOTENCY_KEY'
+
+# A caller that doesn't want to wait on the reply can ask for the event to be 
+# sent without one ("forget"), or to be run as a job whose result it can poll 
+# for ("async"). Finished jobs are kept for a while, and only so many are kept 
+# at once.
+HEADER_EVENT_MODE = 'X-Event-Mode'
+WSGI_HEADER_EVENT_MODE = 'HTTP_X_EVENT_MODE'
+EVENT_MODE_SYNC = 'sync'
+EVENT_MODE_FORGET = 'forget'
+EVENT_MODE_ASYNC = 'async'
+
+JOB_TABLE_MAX_ENTRIES = int(os.environ.get('RP_WEB_JOB_TABLE_MAX_ENTRIES', '10000'))
+JOB_RESULT_TTL_S = int(os.environ.get('RP_WEB_JOB_RESULT_TTL_S', '600'))
+MAXIMUM_JOB_WAIT_S = 60
+
+# A caller can say how long (ms) it's willing to wait for the other side of 
+# the pipe. Otherwise, we use the timeout for the handler (e.g. "get_time"), or 
+# the default. The deadline travels with the event so that the other side can 
+# skip work that nobody is waiting for anymore.
+HEADER_EVENT_TIMEOUT_MS = 'X-Event-Timeout-Ms'
+WSGI_HEADER_EVENT_TIMEOUT_MS = 'HTTP_X_EVENT_TIMEOUT_MS'
+DEFAULT_EVENT_TIMEOUT_S = int(os.environ.get('RP_WEB_DEFAULT_EVENT_TIMEOUT_S', '60'))
+EVENT_TIMEOUTS_S = {}
+MAXIMUM_EVENT_TIMEOUT_S = 300
+
+# Request bodies larger than this (or of unknown length) are forwarded in 
+# chunks as they're read, rather than being read completely first.
+STREAM_THRESHOLD_BYTES = int(os.environ.get('RP_WEB_STREAM_THRESHOLD_BYTES', str(64 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# How many clients a broadcast sends to at once (unless the caller asks for 
+# fewer).
+BROADCAST_CONCURRENCY = int(os.environ.get('RP_WEB_BROADCAST_CONCURRENCY', '50'))
+MAXIMUM_BROADCAST_CONCURRENCY = 500
+
+# The most events that can be sent to a client in one batch.
+MAXIMUM_BATCH_EVENTS = int(os.environ.get('RP_WEB_MAXIMUM_BATCH_EVENTS', '100'))
+
+# Token-bucket rate limits, enforced before an event is queued for a client. 
+# Each client, and each caller (identified by the given WSGI variable), has a 
+# bucket that refills at the rate and holds up to the burst; every event takes 
+# one token, and an event without one gets a 429. A rate of zero turns that 
+# limit off. A handler (e.g. "get_time") can be given its own limits (and 
+# buckets): { handler_name: (client_rate, client_burst, caller_rate, 
+# caller_burst) }.
+CLIENT_RATE_PER_S = float(os.environ.get('RP_WEB_CLIENT_RATE_PER_S', '0'))
+CLIENT_RATE_BURST = int(os.environ.get('RP_WEB_CLIENT_RATE_BURST', '100'))
+CALLER_RATE_PER_S = float(os.environ.get('RP_WEB_CALLER_RATE_PER_S', '0'))
+CALLER_RATE_BURST = int(os.environ.get('RP_WEB_CALLER_RATE_BURST', '100'))
+RATE_LIMITS_BY_ROUTE = {}
+CALLER_IDENTITY_WSGI_KEY = os.environ.get('RP_WEB_CALLER_IDENTITY_WSGI_KEY', 'REMOTE_ADDR')
+RATE_LIMIT_MAX_BUCKETS = 100000
+
+# Admission control. Each client's tunnel has a limit on the events that can 
+# be outstanding at once. The limit grows by one for each window of replies 
+# that come back within the target latency, and is cut by the backoff factor 
+# (at most once per interval) when they don't. Events over the limit, or for a 
+# tunnel with too many messages already queued, or over the total for this 
+# process, are turned away with a 503 and a Retry-After. Zero for the maximum 
+# turns it off.
+ADMISSION_MAX_LIMIT = int(os.environ.get('RP_WEB_ADMISSION_MAX_LIMIT', '0'))
+ADMISSION_MIN_LIMIT = 1
+ADMISSION_TARGET_LATENCY_S = float(os.environ.get('RP_WEB_ADMISSION_TARGET_LATENCY_S', '1'))
+ADMISSION_INTERVAL_S = float(os.environ.get('RP_WEB_ADMISSION_INTERVAL_S', '1'))
+ADMISSION_BACKOFF = 0.5
+ADMISSION_MAX_QUEUE_DEPTH = int(os.environ.get('RP_WEB_ADMISSION_MAX_QUEUE_DEPTH', '1000'))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('RP_WEB_ADMISSION_MAX_IN_FLIGHT', '5000'))
+
+# Fair queuing. At most this many events (or batches) are sent to clients at 
+# once, and those waiting for a turn are served by deficit round-robin across 
+# the clients, so that a burst for one client doesn't delay the others. Each 
+# turn, a client can send events worth the quantum times its weight (a batch 
+# costs one for each of its events). Weights are by client IP: { ip: weight }. 
+# Zero slots turns it off.
+FAIR_QUEUE_SLOTS = int(os.environ.get('RP_WEB_FAIR_QUEUE_SLOTS', '0'))
+FAIR_QUEUE_QUANTUM = 1
+DEFAULT_CLIENT_WEIGHT = 1
+CLIENT_WEIGHTS = {}
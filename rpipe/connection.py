@@ -1,3 +1,32 @@
+import rpipe.capabilities
+
+
 class Connection(object):
-    def initiate_message(self, message_obj):
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None):
         raise NotImplementedError()
+
+    def send_message(self, message_obj):
+        """Send a message that doesn't get a reply."""
+
+        raise NotImplementedError()
+
+    def wait_for_hello(self, timeout_s=None):
+        """Wait for the other side to tell us what it can do, if it hasn't 
+        yet. Give up after the timeout and assume the least.
+        """
+
+        pass
+
+    @property
+    def peer_capabilities(self):
+        """What the other side told us about itself in its hello."""
+
+        return rpipe.capabilities.UNKNOWN
+
+    @property
+    def queue_depth(self):
+        """The number of messages waiting to be written or replied to, or None 
+        if we can't tell from here.
+        """
+
+        return None
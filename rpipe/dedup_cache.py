@@ -0,0 +1,169 @@
+"""Remember the replies to events that carry an idempotency-key, so that a
+retry of one (after a timeout or a reconnect) doesn't run the handler again.
+The cache is shared by every connection in the process, since a retry will
+often arrive on a new one, but keys are scoped to the peer that sent them, so
+one peer can never be given another's reply.
+"""
+
+import logging
+import collections
+import hashlib
+import time
+
+import gevent.event
+
+import rpipe.config.protocol
+import rpipe.config.statsd
+
+import rpipe.exceptions
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+
+class IdempotencyKeyMismatchError(rpipe.exceptions.RpException):
+    """The key was already used for an event with a different verb, noun, or
+    body.
+    """
+
+    pass
+
+
+class _Entry(object):
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.result = gevent.event.AsyncResult()
+        self.expires_at = None
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, bytearray):
+        return bytes(value)
+
+    return value.encode('utf-8')
+
+def get_fingerprint(message_obj):
+    """Return a digest of what the event asks for, so that a key that's reused
+    for something else can be told apart from a retry. The body of a streamed
+    event isn't included, since it hasn't arrived yet.
+    """
+
+    h = hashlib.sha1()
+
+    parts = [message_obj.verb, message_obj.noun, message_obj.mimetype]
+    parts.extend(message_obj.parameters)
+
+    if message_obj.is_streamed is not True:
+        parts.append(message_obj.data)
+
+    for part in parts:
+        part = _to_bytes(part)
+        h.update(('%d:' % (len(part),)).encode('ascii'))
+        h.update(part)
+
+    return h.hexdigest()
+
+def get_scope(participant_address):
+    """Return the peer that keys are scoped to. A server sees each reconnect
+    from a new port, so only the IP is used.
+    """
+
+    if isinstance(participant_address, tuple):
+        return participant_address[0]
+
+    return participant_address
+
+
+class DedupCache(object):
+    """A bounded table of replies, by peer and idempotency-key (the oldest are
+    dropped first), each kept for the TTL after it's produced. A repeat that
+    arrives while the first is still running waits on it. If the first fails
+    (or is cancelled), nothing is remembered, and whoever was waiting runs it
+    themselves. A repeat whose fingerprint doesn't match the first's is
+    refused.
+    """
+
+    def __init__(self,
+                 max_entries=rpipe.config.protocol.DEDUP_CACHE_MAX_ENTRIES,
+                 ttl_s=rpipe.config.protocol.DEDUP_CACHE_TTL_S):
+        self.__max_entries = max_entries
+        self.__ttl_s = ttl_s
+        self.__entries = collections.OrderedDict()
+
+    def __get(self, key):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return None
+
+        if entry.expires_at is not None and entry.expires_at <= time.time():
+            del self.__entries[key]
+            return None
+
+        return entry
+
+    def __run(self, key, fingerprint, fn):
+        entry = _Entry(fingerprint)
+        self.__entries[key] = entry
+
+        while len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+
+        try:
+            reply = fn()
+        except:
+            if self.__entries.get(key) is entry:
+                del self.__entries[key]
+
+            entry.result.set_exception(
+                rpipe.exceptions.RpException(
+                    "Original event failed: [%s]" % (key,)))
+
+            raise
+
+        entry.expires_at = time.time() + self.__ttl_s
+        entry.result.set(reply)
+
+        return reply
+
+    def do(self, scope, key, fingerprint, fn):
+        """Return the reply from `fn()`, or the reply that it already returned
+        for this key from this peer. Raise IdempotencyKeyMismatchError if the
+        key was used for a different event.
+        """
+
+        if self.__max_entries <= 0:
+            return fn()
+
+        key = (scope, key)
+
+        while 1:
+            entry = self.__get(key)
+            if entry is None:
+                return self.__run(key, fingerprint, fn)
+
+            if entry.fingerprint != fingerprint:
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.\
+                        EVENT_MESSAGE_RECEIVE_DUPLICATE_MISMATCH_TICK)
+
+                raise IdempotencyKeyMismatchError(
+                        "Idempotency-key was already used for a different "
+                        "event: [%s]" % (key,))
+
+            _logger.info("Received duplicate event: [%s]", key)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_DUPLICATE_TICK)
+
+            try:
+                return entry.result.get()
+            except rpipe.exceptions.RpException:
+                # The first attempt didn't finish. Try it ourselves.
+                continue
+
+_dc = DedupCache()
+
+def get_dedup_cache():
+    return _dc
@@ -1,28 +1,323 @@
 import logging
 
+import rpipe.config.protocol
+import rpipe.config.statsd
+import rpipe.config.web_server
+
 import rpipe.protocols
 import rpipe.protocol
 import rpipe.connection
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.stats
 
 _logger = logging.getLogger(__name__)
 
-def send_message_to_remote(c, verb, noun, data, mimetype=None):
-    assert issubclass(c.__class__, rpipe.connection.Connection)
+def get_request_timeout_s(verb, noun, timeout_ms=None):
+    """Determine how long the web-tier should wait on the other side of the 
+    pipe. `timeout_ms` is the caller's own (the raw header value, if any).
+    """
+
+    if timeout_ms is not None:
+        timeout_ms = int(timeout_ms)
+        if timeout_ms <= 0:
+            raise ValueError("Timeout must be positive: (%d)" % (timeout_ms,))
+
+        return min(timeout_ms / 1000.0, 
+                   rpipe.config.web_server.MAXIMUM_EVENT_TIMEOUT_S)
+
+    (handler_name, parameters) = \
+        rpipe.event_handling.get_handler_name_and_parameters(verb, noun)
+
+    return rpipe.config.web_server.EVENT_TIMEOUTS_S.get(
+            handler_name, 
+            rpipe.config.web_server.DEFAULT_EVENT_TIMEOUT_S)
+
+def build_event(verb, noun, data, mimetype=None, timeout_s=None, 
+                if_none_match=None, parameters=None, headers=None, 
+                idempotency_key=None):
+    """If `parameters` are given, they're kept separately from the noun (see 
+    Event.parameters); they're only folded into it if the event is sent to a 
+    peer that only knows v1 frames.
+
+    Give the same `idempotency_key` to every attempt of a request that might 
+    be retried, so that the other side only runs it once.
+    """
 
     if mimetype is None:
         mimetype = ''
 
     mimetype = mimetype.split(';')[0]
 
-    _logger.info("Emitting [%s] [%s]: (%d) bytes", verb, noun, len(data))
-
     message_obj = rpipe.protocol.get_obj_from_type(rpipe.protocols.MT_EVENT)
     message_obj.version = 1
     message_obj.verb = verb
     message_obj.noun = noun
     message_obj.mimetype = mimetype
+    message_obj.data = rpipe.event_handling.encode_data(data)
+
+    if parameters:
+        message_obj.parameters.extend(parameters)
+
+    if headers:
+        rpipe.event_handling.set_headers(message_obj, headers)
+
+    if timeout_s is not None:
+        message_obj.timeout_ms = max(1, int(timeout_s * 1000))
+
+    if if_none_match:
+        message_obj.if_none_match.extend(if_none_match)
+
+    if idempotency_key:
+        message_obj.idempotency_key = idempotency_key
+
+    return message_obj
+
+def build_event_chunk(data, is_last=False):
+    message_obj = rpipe.protocol.get_obj_from_type(
+                    rpipe.protocols.MT_EVENT_CHUNK)
+
+    message_obj.version = 1
     message_obj.data = data
+    message_obj.is_last = is_last
+
+    return message_obj
+
+def build_event_chunks(chunks):
+    """Translate the pieces of a body to the messages that carry them. The 
+    last message is always empty.
+    """
+
+    for data in chunks:
+        if data:
+            yield build_event_chunk(data)
+
+    yield build_event_chunk(b'', is_last=True)
+
+def build_cache_invalidation(noun=None):
+    message_obj = rpipe.protocol.get_obj_from_type(
+                    rpipe.protocols.MT_CACHE_INVALIDATE)
+
+    message_obj.version = 1
+
+    if noun is not None:
+        message_obj.noun = noun
+
+    return message_obj
+
+def build_unrouted_reply(verb, noun):
+    """The reply for an event that the other side told us (in its hello) 
+    that it has no handler for. It's the same as what it would've sent back.
+    """
+
+    _logger.debug("Not sending event without a handler: [%s] [%s]", 
+                  verb, noun)
+
+    rpipe.stats.post_to_counter(
+        rpipe.config.statsd.EVENT_CONNECTION_SEND_UNROUTED_TICK)
+
+    return rpipe.event_handling.build_event_reply(
+            rpipe.config.protocol.UNHANDLED_EVENT_DEFAULT_RESULT_CODE)
+
+def can_invalidate_cache(c):
+    """A server that didn't say (in its hello) that it takes invalidations 
+    doesn't cache responses, and would hang up on one.
+    """
+
+    if c.peer_capabilities.supports(
+            rpipe.config.protocol.FEATURE_CACHE_INVALIDATION) is True:
+        return True
+
+    _logger.debug("Server doesn't take cache invalidations. Not sending.")
+    return False
+
+def send_cache_invalidation(c, noun=None):
+    """Have the server forget the responses that it has cached for us for the 
+    given noun (regardless of parameters), or all of them. There's no reply.
+    """
+
+    if can_invalidate_cache(c) is False:
+        return
+
+    _logger.info("Invalidating cached responses: [%s]", noun)
+
+    c.send_message(build_cache_invalidation(noun))
+
+def send_event(c, verb, noun, data, mimetype=None, timeout_s=None, 
+               chunks=None, if_none_match=None, idempotency_key=None):
+    """Send an event and return the reply message. If `timeout_s` is given, 
+    the other side is told the deadline as well, and ResponseTimeoutError is 
+    raised when it passes.
+
+    `if_none_match` are the entity-tags of any copies that we already have. 
+    If the reply's `is_not_modified` is set, the one in its `etag` is current.
+
+    To stream a large body, pass an iterable of strings as `chunks` (and None 
+    for `data`). Each is forwarded as it's produced, and the handler on the 
+    other side can read the body as it arrives.
+    """
+
+    assert issubclass(c.__class__, rpipe.connection.Connection)
+
+    peer = c.peer_capabilities
+
+    if peer.handles(verb, noun) is False:
+        return build_unrouted_reply(verb, noun)
+
+    if chunks is not None and \
+       peer.supports(rpipe.config.protocol.FEATURE_STREAMING) is False:
+        data = b''.join(chunks)
+        chunks = None
+
+    # A v2 peer gets the parameters separately.
+    if peer.supports(rpipe.config.protocol.FEATURE_FRAME_V2) is True:
+        (noun, parameters) = rpipe.event_handling.split_noun(noun)
+    else:
+        parameters = None
+
+    if chunks is None:
+        _logger.info("Emitting [%s] [%s]: (%d) bytes", verb, noun, len(data))
+
+        message_obj = build_event(
+                        verb, 
+                        noun, 
+                        data, 
+                        mimetype, 
+                        timeout_s=timeout_s,
+                        if_none_match=if_none_match,
+                        parameters=parameters,
+                        idempotency_key=idempotency_key)
+
+        r = c.initiate_message(message_obj, timeout_s=timeout_s)
+    else:
+        _logger.info("Emitting [%s] [%s]: (streamed)", verb, noun)
+
+        message_obj = build_event(
+                        verb, 
+                        noun, 
+                        '', 
+                        mimetype, 
+                        timeout_s=timeout_s,
+                        if_none_match=if_none_match,
+                        parameters=parameters,
+                        idempotency_key=idempotency_key)
+
+        message_obj.is_streamed = True
+
+        r = c.initiate_message(
+                message_obj, 
+                timeout_s=timeout_s, 
+                chunks=build_event_chunks(chunks))
+
+    return r
+
+def send_event_and_forget(c, verb, noun, data, mimetype=None, 
+                          idempotency_key=None):
+    """Send an event without waiting on (or even getting) a reply."""
+
+    assert issubclass(c.__class__, rpipe.connection.Connection)
+
+    if c.peer_capabilities.handles(verb, noun) is False:
+        build_unrouted_reply(verb, noun)
+        return
+
+    _logger.info("Emitting [%s] [%s] (no reply): (%d) bytes", 
+                 verb, noun, len(data))
+
+    message_obj = build_event(
+                    verb, 
+                    noun, 
+                    data, 
+                    mimetype, 
+                    idempotency_key=idempotency_key)
+
+    message_obj.no_reply = True
+
+    c.send_message(message_obj)
+
+def build_event_batch(events, timeout_s=None):
+    """`events` are the messages from build_event(). Their own timeouts are 
+    ignored in favor of the batch's.
+    """
+
+    message_obj = rpipe.protocol.get_obj_from_type(
+                    rpipe.protocols.MT_EVENT_BATCH)
+
+    message_obj.version = 1
+    message_obj.events.extend(events)
+
+    if timeout_s is not None:
+        message_obj.timeout_ms = max(1, int(timeout_s * 1000))
+
+    return message_obj
+
+def get_routed_events(peer, events):
+    """Return the events of a batch that actually have to be sent. Raise 
+    RpBatchTooLarge if there are more than the other side will take.
+    """
+
+    routed = [message_obj
+              for message_obj
+              in events
+              if peer.handles(message_obj.verb, message_obj.noun) is True]
+
+    if peer.max_batch_events is not None and \
+       len(routed) > peer.max_batch_events:
+        raise rpipe.exceptions.RpBatchTooLarge(
+                "Batch of (%d) events is larger than the other side takes: "
+                "(%d)" % (len(routed), peer.max_batch_events))
+
+    return routed
+
+def merge_batch_replies(peer, events, replies):
+    """Put the replies for the events that were sent (see 
+    get_routed_events()) back together with those that weren't.
+    """
+
+    replies = iter(replies)
+
+    return [next(replies)
+                if peer.handles(message_obj.verb, message_obj.noun) is True
+                else build_unrouted_reply(message_obj.verb, message_obj.noun)
+            for message_obj
+            in events]
+
+def send_event_batch(c, events, timeout_s=None):
+    """Send several events at once (see build_event_batch()). The other side 
+    handles them concurrently, and the replies are returned in the same 
+    order. The other side must support batching.
+    """
+
+    assert issubclass(c.__class__, rpipe.connection.Connection)
+
+    peer = c.peer_capabilities
+    routed = get_routed_events(peer, events)
+
+    if routed:
+        _logger.info("Emitting batch of (%d) events.", len(routed))
+
+        message_obj = build_event_batch(routed, timeout_s=timeout_s)
+        r = c.initiate_message(message_obj, timeout_s=timeout_s)
+        replies = r.replies
+    else:
+        replies = []
+
+    return merge_batch_replies(peer, events, replies)
+
+def send_message_to_remote(c, verb, noun, data, mimetype=None, timeout_s=None,
+                           chunks=None, idempotency_key=None):
+    """Send an event and return (code, mimetype, data) from the reply (see 
+    send_event()).
+    """
 
-    r = c.initiate_message(message_obj)
+    r = send_event(
+            c, 
+            verb, 
+            noun, 
+            data, 
+            mimetype=mimetype, 
+            timeout_s=timeout_s, 
+            chunks=chunks,
+            idempotency_key=idempotency_key)
 
     return (r.code, r.mimetype, r.data)
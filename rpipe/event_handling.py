@@ -0,0 +1,253 @@
+"""The parts of event-handling that don't depend on the engine. Both the gevent
+message-loop and the asyncio one (rpipe.aio) use these so that the two present
+exactly the same handler API.
+"""
+
+import logging
+import collections
+import traceback
+import json
+import types
+import time
+
+import rpipe.config.exchange
+
+import rpipe.protocol
+import rpipe.protocols
+
+_logger = logging.getLogger(__name__)
+
+CONNECTION_CONTEXT_T = collections.namedtuple(
+                        'ConnectionContext',
+                        ['participant_address'])
+
+CT_JSON = 'application/json'
+
+try:
+    _STRING_TYPES = (basestring,)
+    _TEXT_TYPE = unicode
+except NameError:
+    _STRING_TYPES = (str, bytes)
+    _TEXT_TYPE = str
+
+
+def split_noun(noun):
+    """Separate the parameters from the noun (anything after a '//')."""
+
+    url_parts = noun.split('//')
+
+    noun = url_parts[0]
+    if len(url_parts) > 1:
+        parameters = url_parts[1].split('/')
+    else:
+        parameters = []
+
+    return (noun, parameters)
+
+def get_handler_name_and_parameters(verb, noun, parameters=None):
+    """Translate the verb and noun into the name of the handler method and the
+    positional parameters for it. The parameters are either given (from a v2 
+    event) or follow the noun.
+    """
+
+    if parameters:
+        parameters = list(parameters)
+    else:
+        (noun, parameters) = split_noun(noun)
+
+    handler_parts = [
+        verb.lower(),
+        noun.replace('/', '_'),
+    ]
+
+    return ('_'.join(handler_parts), parameters)
+
+def get_remaining_s(message_info, message_obj):
+    """Return how much longer the sender of the event will wait for the reply,
+    or None if it'll wait indefinitely. This is negative once the deadline has
+    passed.
+    """
+
+    if message_obj.HasField('timeout_ms') is False:
+        return None
+
+    deadline = rpipe.protocol.get_received_at_from_info(message_info) + \
+               message_obj.timeout_ms / 1000.0
+
+    return deadline - time.time()
+
+def is_expired(message_info, message_obj):
+    """Has the sender already given up on this event?"""
+
+    remaining_s = get_remaining_s(message_info, message_obj)
+    return remaining_s is not None and remaining_s <= 0
+
+def get_etag(event_handler, handler_name, ctx, parameters):
+    """Return the current entity-tag for what the handler would return, or 
+    None. A handler can be paired with an "etag_"-prefixed method (e.g. 
+    "etag_get_time") that takes the same arguments, less the data, and 
+    returns it cheaply. Then, the handler itself needn't be called if the 
+    sender's copy is current.
+    """
+
+    etag_handler = getattr(event_handler, 'etag_' + handler_name, None)
+    if etag_handler is None:
+        return None
+
+    try:
+        etag = etag_handler(ctx, *parameters)
+    except Exception:
+        _logger.exception("Could not get entity-tag. Calling handler: [%s]", 
+                          handler_name)
+
+        return None
+
+    if etag is None:
+        return None
+
+    return str(etag)
+
+def is_etag_matched(etag, etags):
+    """Is the given entity-tag among those that the sender already has?"""
+
+    if etag is None:
+        return False
+
+    for candidate in etags:
+        if candidate == etag or candidate == '*':
+            return True
+
+    return False
+
+def decode_request_data(mimetype, data):
+    # A streamed body is handed to the handler as-is, unless it's JSON, which 
+    # can't be decoded piecemeal anyway.
+    if mimetype == CT_JSON and hasattr(data, 'read') is True:
+        data = data.read()
+
+    # We shouldn't even receive data within a GET.
+    if mimetype == CT_JSON and data:
+        _logger.debug("Decoding JSON data.")
+        return json.loads(data)
+
+    return data
+
+def encode_data(data):
+    """Payloads are bytes. Text is sent as UTF-8."""
+
+    if issubclass(data.__class__, _TEXT_TYPE) is True:
+        return data.encode('utf8')
+
+    return data
+
+def get_headers(message_obj):
+    """Return the headers of an event or a reply as a dictionary (by 
+    lowercase name).
+    """
+
+    return dict((header.name.lower(), header.value)
+                for header
+                in message_obj.headers)
+
+def set_headers(message_obj, headers):
+    for (name, value) in headers.items():
+        header = message_obj.headers.add()
+        header.name = name
+        header.value = value
+
+def build_event_reply(code, mimetype='text/plain', data='', cache_ttl_s=None,
+                      etag=None, is_not_modified=False, headers=None):
+    reply_message_obj = rpipe.protocol.get_obj_from_type(
+                            rpipe.protocols.MT_EVENT_R)
+
+    reply_message_obj.version = 1
+    reply_message_obj.mimetype = mimetype
+    reply_message_obj.code = code
+    reply_message_obj.data = encode_data(data)
+
+    if headers:
+        set_headers(reply_message_obj, headers)
+
+    if cache_ttl_s is not None:
+        reply_message_obj.cache_ttl_s = int(cache_ttl_s)
+
+    if etag is not None:
+        reply_message_obj.etag = etag
+
+    if is_not_modified is True:
+        reply_message_obj.is_not_modified = True
+
+    return reply_message_obj
+
+def get_exception_result(e):
+    for line in traceback.format_exc().split('\n'):
+        _logger.error("EXCEPTION: " + line)
+
+    _logger.error("Unhandled exception during event [%s]: [%s]",
+                      e.__class__.__name__, str(e))
+
+    result = {
+        'exception': {
+            'message': str(e),
+            'traceback': traceback.format_exc(),
+            'class': e.__class__.__name__,
+        }
+    }
+
+    return (None, rpipe.config.exchange.UNHANDLED_EXCEPTION_CODE, result)
+
+def get_reply_from_result(handler_name, noun, result):
+    """Normalize whatever the handler returned to (mimetype, code, data, 
+    cache_ttl_s). A handler can return (mimetype, code, data, cache_ttl_s) to 
+    allow the server to reuse the response for that many seconds; otherwise, 
+    `cache_ttl_s` is None.
+    """
+
+    cache_ttl_s = None
+
+    if issubclass(result.__class__, tuple) is True:
+        if len(result) == 4:
+            (mimetype, code, result_data, cache_ttl_s) = result
+        else:
+            (mimetype, code, result_data) = result
+    else:
+        mimetype = None
+        code = 0
+        result_data = result
+
+    if mimetype is None:
+        mimetype = CT_JSON
+
+    _logger.debug("Event result for handler [%s]: [%s] [%s] (%s)",
+                  handler_name, mimetype, result_data.__class__.__name__,
+                  code)
+
+    if result_data is None:
+        _logger.debug("Result data was [literally] None. Coalescing to "
+                      "empty.")
+
+        result_data = ''
+
+    if issubclass(result_data.__class__,
+                  _STRING_TYPES + (types.GeneratorType,)) is False:
+        if mimetype == CT_JSON:
+            result_data = json.dumps(result_data)
+        else:
+            raise ValueError("Response to noun [%s] was invalid type and "
+                             "we're not allowed to encode it to JSON: "
+                             "[%s]" %
+                             (noun, result_data.__class__.__name__))
+
+    return (mimetype, code, result_data, cache_ttl_s)
+
+def get_exception_reply(noun, e):
+    """Build the reply for an event that couldn't be handled at all (rather 
+    than one whose handler raised).
+    """
+
+    (mimetype, code, data, cache_ttl_s) = get_reply_from_result(
+                                            None, 
+                                            noun, 
+                                            get_exception_result(e))
+
+    return build_event_reply(code, mimetype, data)
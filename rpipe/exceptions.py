@@ -23,3 +23,23 @@ class RpConnectionFail(RpConnectionRetry):
 
 class RpConnectionClosed(RpConnectionRetry):
     pass
+
+
+class RpBatchTooLarge(RpException, ValueError):
+    """The other side won't take a batch with that many events."""
+
+    pass
+
+
+class RpConnectionRetryAfter(RpConnectionFail):
+    """The server is busy and asked us to come back later."""
+
+    def __init__(self, retry_after_s):
+        super(RpConnectionRetryAfter, self).__init__(
+            "Server is busy. Retry after (%d) seconds." % (retry_after_s,))
+
+        self.__retry_after_s = retry_after_s
+
+    @property
+    def retry_after_s(self):
+        return self.__retry_after_s
@@ -1,16 +1,38 @@
 import logging
+import itertools
+import time
 
 import gevent
 import gevent.queue
-import gevent.select
 import gevent.event
 
-import rpipe.config.exchange
+import rpipe.config.statsd
+
 import rpipe.exceptions
 import rpipe.protocol
+import rpipe.protocols
+import rpipe.stats
 
 _logger = logging.getLogger(__name__)
 
+# These are small and time-sensitive, so they're written ahead of whatever 
+# else is waiting (e.g. a large body on a bandwidth-limited connection).
+_PRIORITY_TYPES = (
+    rpipe.protocols.MT_HEARTBEAT,
+    rpipe.protocols.MT_HEARTBEAT_R,
+    rpipe.protocols.MT_CANCEL,
+)
+
+_PRIORITY_HIGH = 0
+_PRIORITY_NORMAL = 1
+
+
+def _get_priority(message_obj):
+    if rpipe.protocol.get_message_type(message_obj) in _PRIORITY_TYPES:
+        return _PRIORITY_HIGH
+
+    return _PRIORITY_NORMAL
+
 
 class ResponseTimeoutError(Exception):
     pass
@@ -24,105 +46,225 @@ class _MessageExchange(object):
         self.__address = address
 
         self.__incoming = gevent.queue.Queue()
-        self.__outgoing = gevent.queue.Queue()
+        # Ordered by priority and then by when they were queued.
+        self.__outgoing = gevent.queue.PriorityQueue()
+        self.__sequence = itertools.count()
 
         self.__replied = {}
+        self.__is_closed = False
+        self.__frame_version = rpipe.protocol.FRAME_V1
+        self.__can_cancel = False
 
     def run(self):
-        """Read incoming messages and write outgoing messages."""
+        """Read incoming messages and write outgoing messages. Reads happen in 
+        this gthread and writes in a second one so that neither side has to 
+        poll.
+        """
 
         _logger.info("Message exchange running for connection: %s", 
                      self.__address)
 
-        while 1:
-            is_active = False
-            r = gevent.select.select(
-                    [self.__ws], [], [], 
-                    0)
+        writer_g = gevent.spawn(self.__write_loop)
 
-            if r[0]:
-                _logger.debug("Reading message.")
+        try:
+            self.__read_loop()
+        finally:
+            writer_g.kill()
 
-                try:
-                    message = rpipe.protocol.read_message_from_file_object(
-                                self.__ws)
-                except rpipe.exceptions.RpConnectionClosed:
-                    break
+            self.__is_closed = True
+            self.__release_writes()
+            self.__release_replies()
 
-                (message_info, message_obj) = message
-                message_id = rpipe.protocol.get_message_id_from_info(
-                                message_info)
+        # The other gthreads can determine that we've existed by checking our 
+        # state.
 
-                message_id_str = rpipe.protocol.get_string_from_message_id(
-                                    message_id)
+        _logger.warning("Message-exchange terminating for [%s].", 
+                        self.__address)
 
-                try:
-                    r = self.__replied[message_id]
-                except KeyError:
-                    _logger.debug("This message was a general request: %s", 
-                                  message_id_str)
+    def __read_loop(self):
+        while 1:
+            _logger.debug("Reading message.")
 
-                    self.__incoming.put(message)
-                else:
-                    _logger.debug("This message was a reply: %s", 
-                                  message_id_str)
+            try:
+                message = rpipe.protocol.read_message_from_file_object(
+                            self.__ws)
+            except rpipe.exceptions.RpConnectionClosed:
+                break
 
-                    r[1] = message
-                    r[0].set()
+            (message_info, message_obj) = message
+            message_id = rpipe.protocol.get_message_id_from_info(
+                            message_info)
 
-                is_active = True
+            message_id_str = rpipe.protocol.get_string_from_message_id(
+                                message_id)
 
-            if self.__outgoing.empty() is False:
-                (message_id, message_obj) = self.__outgoing.get()
-                message_id_str = rpipe.protocol.get_string_from_message_id(
-                                    message_id)
+            try:
+                r = self.__replied[message_id]
+            except KeyError:
+                if rpipe.protocol.get_is_response_from_info(
+                        message_info) is True:
+                    # Whoever was waiting has already timed-out.
+                    _logger.warning("Dropping late reply: %s", 
+                                    message_id_str)
 
-                _logger.debug("Sending message: %s", message_id_str)
+                    rpipe.stats.post_to_counter(
+                        rpipe.config.statsd.EVENT_MESSAGE_REPLY_LATE_TICK)
 
-                try:
-                    rpipe.protocol.send_message_obj(
-                        self.__ws, 
-                        message_obj, 
-                        message_id=message_id)
-                except rpipe.exceptions.RpConnectionClosed:
-                    break
+                    continue
 
-                is_active = True
+                _logger.debug("This message was a general request: %s", 
+                              message_id_str)
 
-            if is_active is False:
-                gevent.sleep(rpipe.config.exchange.IDLE_TIMEOUT_S)
+                self.__incoming.put(message)
+            else:
+                _logger.debug("This message was a reply: %s", 
+                              message_id_str)
 
-        # The other gthreads can determine that we've existed by checking our 
-        # state.
+                r[1] = message
+                r[0].set()
 
-        _logger.warning("Message-exchange terminating for [%s].", 
-                        self.__address)
+    def __release_writes(self):
+        """Wake anybody waiting for a message to be written. It won't be."""
 
-    def send(self, message_obj, reply_to_message_id=None, expect_response=True, **kwargs):
-        if reply_to_message_id is None:
-            message_id = rpipe.protocol.id_generator()
-        else:
-            message_id = reply_to_message_id
+        while self.__outgoing.empty() is False:
+            written_e = self.__outgoing.get_nowait()[5]
+            if written_e is not None:
+                written_e.set()
 
-        self.__outgoing.put((message_id, message_obj))
+    def __release_replies(self):
+        """Wake anybody waiting for a reply. It won't come."""
+
+        for r in list(self.__replied.values()):
+            r[0].set()
+
+    def __write_loop(self):
+        while 1:
+            (_, _, message_id, message_obj, is_response, written_e) = \
+                self.__outgoing.get()
+
+            message_id_str = rpipe.protocol.get_string_from_message_id(
+                                message_id)
+
+            _logger.debug("Sending message: %s", message_id_str)
+
+            try:
+                rpipe.protocol.send_message_obj(
+                    self.__ws, 
+                    message_obj, 
+                    message_id=message_id,
+                    is_response=is_response,
+                    frame_version=self.__frame_version)
+            except rpipe.exceptions.RpConnectionClosed:
+                # Make sure the reader wakes-up and notices.
+                try:
+                    self.__ws.close()
+                except:
+                    _logger.exception("Could not close broken stream.")
+
+                break
+            finally:
+                if written_e is not None:
+                    written_e.set()
+
+    def send(self, message_obj, reply_to_message_id=None, expect_response=True, 
+             message_id=None, wait_for_write=False, **kwargs):
+        """Queue a message. With `wait_for_write`, don't return until it's 
+        actually been written (so that a large body is paced by the socket 
+        rather than piling-up in the queue).
+        """
+
+        if self.__is_closed is True:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "Message exchange is closed: [%s]" % (self.__address,))
+
+        if reply_to_message_id is not None:
+            message_id = reply_to_message_id
+        elif issubclass(message_obj.__class__, 
+                        rpipe.protocol.SerializedMessage) is True:
+            message_id = message_obj.message_id
+        elif message_id is None:
+            message_id = rpipe.protocol.id_generator()
 
         if expect_response is True:
             # Add the tracking information to track the future reply.
             self.__replied[message_id] = [gevent.event.Event(), None]
 
+        if wait_for_write is True:
+            written_e = gevent.event.Event()
+        else:
+            written_e = None
+
+        self.__outgoing.put(
+            (_get_priority(message_obj),
+             next(self.__sequence),
+             message_id, 
+             message_obj, 
+             reply_to_message_id is not None, 
+             written_e))
+
+        if written_e is not None:
+            written_e.wait()
+
+            if self.__is_closed is True:
+                raise rpipe.exceptions.RpConnectionClosed(
+                        "Message exchange closed before message was "
+                        "written: [%s]" % (self.__address,))
+
         return message_id
 
     def read(self, **kwargs):
         return self.__incoming.get(**kwargs)
 
+    def set_frame_version(self, frame_version):
+        """Only switch once the peer has said that it reads the new format.
+        """
+
+        _logger.debug("Sending frame v%d to: %s", frame_version, 
+                      self.__address)
+
+        self.__frame_version = frame_version
+
+    def set_can_cancel(self, can_cancel):
+        """Only send cancellations once the peer has said that it reads 
+        them. One that doesn't would hang up.
+        """
+
+        self.__can_cancel = can_cancel
+
+    @property
+    def can_cancel(self):
+        return self.__can_cancel
+
     def wait_on_reply(self, message_id, timeout_s=None):
         r = self.__replied[message_id]
-        if r[0].wait(timeout_s) is True:
+
+        try:
+            if r[0].wait(timeout_s) is True:
+                if r[1] is None:
+                    raise rpipe.exceptions.RpConnectionClosed(
+                            "Message exchange closed before reply was "
+                            "received: [%s]" % (self.__address,))
+
+                return r[1]
+        finally:
+            # If the reply shows up later, the reader will drop it.
             del self.__replied[message_id]
-            return r[1]
 
         raise ResponseTimeoutError()
 
+    def forget_reply(self, message_id):
+        """Stop tracking a reply that we're not going to wait on."""
+
+        self.__replied.pop(message_id, None)
+
+    @property
+    def queue_depth(self):
+        """The messages still to be written plus the replies still being 
+        waited on.
+        """
+
+        return self.__outgoing.qsize() + len(self.__replied)
+
 #    @property
 #    def incoming(self):
 #        return self.__incoming
@@ -159,15 +301,80 @@ def read(address, **kwargs):
 def send(address, message_obj, **kwargs):
     return _instances[address][1].send(message_obj, **kwargs)
 
+def set_frame_version(address, frame_version):
+    _instances[address][1].set_frame_version(frame_version)
+
+def set_can_cancel(address, can_cancel):
+    _instances[address][1].set_can_cancel(can_cancel)
+
+def get_queue_depth(address):
+    return _instances[address][1].queue_depth
+
 def wait_on_reply(address, message_id, **kwargs):
     return _instances[address][1].wait_on_reply(message_id, **kwargs)
 
-def send_and_receive(address, message_obj, timeout_s=None):
-    """A convenience function to send a message and wait on a reply."""
+def send_cancel(address, message_id):
+    """Tell the other side that we're no longer waiting on the given event."""
+
+    _logger.info("Cancelling event: [%s]", 
+                 rpipe.protocol.get_string_from_message_id(message_id))
+
+    cancel_message_obj = rpipe.protocol.get_obj_from_type(
+                            rpipe.protocols.MT_CANCEL)
+
+    cancel_message_obj.version = 1
+
+    send(address, 
+         cancel_message_obj, 
+         expect_response=False, 
+         message_id=message_id)
+
+def send_and_receive(address, message_obj, timeout_s=None, chunks=None):
+    """A convenience function to send a message and wait on a reply. If we 
+    stop waiting on an event early (a timeout, or our gthread is killed 
+    because the caller went away), the other side is told to abandon it (if
+    it said, in its hello, that it can).
+
+    `chunks` are any messages that should follow under the same message-ID 
+    (the body of a streamed event). They're sent one at a time, as each is 
+    written.
+    """
+
+    if timeout_s is not None:
+        stop_at = time.time() + timeout_s
 
     message_id = send(address, message_obj, expect_response=True)
 
-    message = wait_on_reply(address, message_id, timeout_s=timeout_s)
+    try:
+        if chunks is not None:
+            for chunk_obj in chunks:
+                send(address, 
+                     chunk_obj, 
+                     expect_response=False, 
+                     message_id=message_id,
+                     wait_for_write=True)
+
+                if timeout_s is not None and time.time() >= stop_at:
+                    raise ResponseTimeoutError()
+
+            if timeout_s is not None:
+                timeout_s = stop_at - time.time()
+
+        message = wait_on_reply(address, message_id, timeout_s=timeout_s)
+    except:
+        # Timed-out, killed, or otherwise interrupted.
+        if address in _instances:
+            me = _instances[address][1]
+            me.forget_reply(message_id)
+
+            if rpipe.protocol.get_message_type(message_obj) in \
+               (rpipe.protocols.MT_EVENT, rpipe.protocols.MT_EVENT_BATCH) and \
+               me.can_cancel is True and \
+               is_alive(address) is True:
+                send_cancel(address, message_id)
+
+        raise
+
     (message_info, message_obj) = message
 
     return message_obj
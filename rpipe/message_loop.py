@@ -1,42 +1,122 @@
 import logging
-import collections
-import traceback
-import json
-import types
 import time
 
 import web
 import gevent
+import gevent.pool
 
 import rpipe.config.protocol
 import rpipe.config.statsd
 import rpipe.config.client
 import rpipe.config.heartbeat
 
+import rpipe.dedup_cache
 import rpipe.protocol
 import rpipe.protocols
 import rpipe.exceptions
 import rpipe.message_exchange
 import rpipe.stats
+import rpipe.event_handling
 
 _logger = logging.getLogger(__name__)
 
+CONNECTION_CONTEXT_T = rpipe.event_handling.CONNECTION_CONTEXT_T
 
-CONNECTION_CONTEXT_T = collections.namedtuple(
-                        'ConnectionContext', 
-                        ['participant_address'])
+# Put in the chunk-queue of a body that will never be completed.
+_BODY_ABANDONED = object()
 
-_CT_JSON = 'application/json'
+
+class StreamedBody(object):
+    """The body of a streamed event, as handed to the event-handler. It can be 
+    read like a file (or iterated) while the chunks are still arriving.
+    """
+
+    def __init__(self):
+        self.__chunks = gevent.queue.Queue()
+        self.__buffer = b''
+        self.__is_complete = False
+        self.__is_abandoned = False
+
+    def feed(self, data):
+        self.__chunks.put(data)
+
+    def finish(self):
+        self.__chunks.put(None)
+
+    def abandon(self):
+        self.__chunks.put(_BODY_ABANDONED)
+
+    def __get_next_chunk(self):
+        """Block for the next chunk. Return None at the end of the body."""
+
+        if self.__is_abandoned is True:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "The body was abandoned by the sender.")
+
+        if self.__is_complete is True:
+            return None
+
+        chunk = self.__chunks.get()
+
+        if chunk is None:
+            self.__is_complete = True
+        elif chunk is _BODY_ABANDONED:
+            self.__is_abandoned = True
+            return self.__get_next_chunk()
+
+        return chunk
+
+    def read(self, size=-1):
+        parts = [self.__buffer]
+        length = len(self.__buffer)
+
+        while size < 0 or length < size:
+            chunk = self.__get_next_chunk()
+            if chunk is None:
+                break
+
+            parts.append(chunk)
+            length += len(chunk)
+
+        data = b''.join(parts)
+
+        if size < 0:
+            self.__buffer = b''
+            return data
+
+        self.__buffer = data[size:]
+        return data[:size]
+
+    def __iter__(self):
+        if self.__buffer:
+            (data, self.__buffer) = (self.__buffer, b'')
+            yield data
+
+        while 1:
+            chunk = self.__get_next_chunk()
+            if chunk is None:
+                break
+
+            yield chunk
 
 
 class CommonMessageLoop(object):
+    """`message_handlers` maps any additional message-types that this side 
+    handles to a callable that receives the message-ID and message.
+    """
+
     def __init__(self, wrapped_socket, event_handler, connection_context, 
-                 watch_heartbeats=False):
+                 watch_heartbeats=False, message_handlers=None):
         assert wrapped_socket is not None
 
         self.__ws = wrapped_socket
         self.__eh = event_handler
         self.__ctx = connection_context
+
+        if message_handlers is None:
+            message_handlers = {}
+
+        self.__message_handlers = message_handlers
         
         heartbeat_reply_message_obj = \
             rpipe.protocol.get_obj_from_type(
@@ -48,6 +128,14 @@ class CommonMessageLoop(object):
 
         self.__last_heartbeat_epoch = None
 
+        # The gthreads running event-handlers, by message-ID, so that they can 
+        # be cancelled.
+        self.__event_gs = {}
+
+        # The bodies of streamed events that are still arriving, by 
+        # message-ID.
+        self.__bodies = {}
+
         if watch_heartbeats is True:
             self.__heartbeat_watchdog_g = gevent.spawn(
                                             self.__watch_heartbeats,
@@ -123,7 +211,36 @@ class CommonMessageLoop(object):
             if message_type == rpipe.protocols.MT_HEARTBEAT:
                 handler = self.__handle_heartbeat
             elif message_type == rpipe.protocols.MT_EVENT:
-                handler = self.__handle_event
+                if rpipe.event_handling.is_expired(
+                        message_info, 
+                        message_obj) is True:
+                    # The sender has stopped waiting, so don't bother.
+                    self.__drop_expired_event(message_id, message_obj)
+                    continue
+
+                handler = self.__spawn_event
+            elif message_type == rpipe.protocols.MT_EVENT_BATCH:
+                if rpipe.event_handling.is_expired(
+                        message_info, 
+                        message_obj) is True:
+                    _logger.warning("Dropping batch whose deadline has "
+                                    "passed: [%s]", 
+                                    rpipe.protocol.get_string_from_message_id(
+                                        message_id))
+
+                    rpipe.stats.post_to_counter(
+                        rpipe.config.statsd.\
+                            EVENT_MESSAGE_RECEIVE_EXPIRED_TICK)
+
+                    continue
+
+                handler = self.__spawn_batch
+            elif message_type == rpipe.protocols.MT_EVENT_CHUNK:
+                handler = self.__handle_chunk
+            elif message_type == rpipe.protocols.MT_CANCEL:
+                handler = self.__handle_cancel
+            elif message_type in self.__message_handlers:
+                handler = self.__message_handlers[message_type]
             else:
                 _logger.warning("Received unhandled message (%d) [%s].", 
                                 message_type, message_obj.__class__.__name__)
@@ -137,6 +254,8 @@ class CommonMessageLoop(object):
                                     "server, the connection will "
                                     "automatically be reestablished by the "
                                     "client.")
+
+                    self.__kill_events()
                     return
                 else:
                     continue
@@ -146,8 +265,21 @@ class CommonMessageLoop(object):
                         EVENT_MESSAGE_RECEIVE_HANDLE_TIMING):
                 handler(message_id, message_obj)
 
+        self.__kill_events()
         rpipe.message_exchange.stop_exchange(self.__ctx.participant_address)
 
+    def __kill_events(self):
+        """Nobody will get the replies, so abandon whatever's still running.
+        """
+
+        gevent.killall(list(self.__event_gs.values()), block=False)
+        self.__event_gs.clear()
+
+        for body in self.__bodies.values():
+            body.abandon()
+
+        self.__bodies.clear()
+
     def __handle_heartbeat(self, message_id, message_obj):
         _logger.debug("Responding to heartbeat: %s", 
                       self.__ctx.participant_address)
@@ -160,136 +292,262 @@ class CommonMessageLoop(object):
             reply_to_message_id=message_id,
             expect_response=False)
 
-    def __handle_event(self, message_id, message_obj):
-        _logger.info("Received event from [%s]: [%s] [%s]", 
-                     self.__ctx.participant_address, message_obj.verb, 
-                     message_obj.noun)
-
-        url_parts = message_obj.noun.split('//')
+    def __spawn_event(self, message_id, message_obj):
+        """Run the handler in its own gthread so that we can keep reading 
+        (heartbeats, cancellations, and the body, in particular) while it 
+        runs.
+        """
 
-        noun = url_parts[0]
-        if len(url_parts) > 1:
-            parameters = url_parts[1].split('/')
+        if message_obj.is_streamed is True:
+            data = StreamedBody()
+            self.__bodies[message_id] = data
         else:
-            parameters = []
+            data = message_obj.data
 
-        handler_parts = [
-            message_obj.verb.lower(),
-            noun.replace('/', '_'),
-        ]
-        
-        event_handler_name = '_'.join(handler_parts)
+        g = gevent.spawn(self.__handle_event, message_id, message_obj, data)
+        self.__event_gs[message_id] = g
+
+        def event_done_cb(g):
+            if self.__event_gs.get(message_id) is g:
+                del self.__event_gs[message_id]
+
+            # The handler didn't read the whole body.
+            if self.__bodies.get(message_id) is data:
+                del self.__bodies[message_id]
 
+        g.link(event_done_cb)
+
+    def __handle_chunk(self, message_id, message_obj):
         try:
-            handler = getattr(self.__eh, event_handler_name)
-        except AttributeError:
-            _logger.warning("Event is not handled: METHOD=[%s]", 
-                            event_handler_name)
+            body = self.__bodies[message_id]
+        except KeyError:
+            # The event has already been finished, cancelled, or dropped.
+            _logger.debug("Ignoring chunk for unknown body: [%s]", 
+                          rpipe.protocol.get_string_from_message_id(
+                            message_id))
+            return
 
-            self.__send_event_response(
-                message_id, 
-                rpipe.config.protocol.UNHANDLED_EVENT_DEFAULT_RESULT_CODE)
-        else:
-            counter_name = rpipe.config.statsd.EVENT_HANDLER_TICK_TEMPLATE % \
-                           { 'handler_name': event_handler_name }
+        if message_obj.data:
+            body.feed(message_obj.data)
 
-            rpipe.stats.post_to_counter(counter_name)
+        if message_obj.is_last is True:
+            body.finish()
+            del self.__bodies[message_id]
 
-            timer_name = rpipe.config.statsd.EVENT_HANDLER_TIMING_TEMPLATE % \
-                         { 'handler_name': event_handler_name }
+    def __handle_cancel(self, message_id, message_obj):
+        g = self.__event_gs.pop(message_id, None)
+        if g is None:
+            _logger.debug("Event to cancel has already finished: [%s]", 
+                          rpipe.protocol.get_string_from_message_id(
+                            message_id))
+            return
 
-            with rpipe.stats.time_and_post(timer_name):
-                try:
-                    self.__process_event(
-                        handler,
-                        message_id,
-                        parameters,
-                        message_obj.mimetype,
-                        message_obj.data)
-                except:
-                    _logger.error("There was an exception while executing "
-                                  "handler: [%s]", event_handler_name)
-                    raise
+        _logger.info("Cancelling event: [%s]", 
+                     rpipe.protocol.get_string_from_message_id(message_id))
 
-    def __process_event(self, handler, message_id, parameters, mimetype, data):
-        """Processes event in a new gthread."""
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_CANCEL_TICK)
 
-        _logger.debug("Forwarding event to event-handler. MIMETYPE=[%s] "
-                      "PARAMS=%s", mimetype, parameters)
+        g.kill(block=False)
+
+        body = self.__bodies.pop(message_id, None)
+        if body is not None:
+            body.abandon()
+
+    def __drop_expired_event(self, message_id, message_obj):
+        _logger.warning("Dropping event whose deadline has passed: [%s] "
+                        "[%s] [%s]", 
+                        rpipe.protocol.get_string_from_message_id(message_id),
+                        message_obj.verb, message_obj.noun)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_EXPIRED_TICK)
+
+    def __handle_event(self, message_id, message_obj, data):
+        reply_message_obj = self.__get_safe_event_reply(message_obj, data)
+
+        # The message-ID is only needed for the reply, if one is wanted.
+        if message_obj.no_reply is True:
+            _logger.debug("Not responding to event (no reply wanted).")
+            return
+
+        self.__send_reply(message_id, reply_message_obj)
+
+    def __spawn_batch(self, message_id, message_obj):
+        """Run the batch in its own gthread, like any other event, so that it 
+        can be cancelled as a whole.
+        """
+
+        g = gevent.spawn(self.__handle_batch, message_id, message_obj)
+        self.__event_gs[message_id] = g
 
-        # We shouldn't even receive data within a GET.
-        if mimetype == _CT_JSON and data:
-            _logger.debug("Decoding JSON data.")
-            data = json.loads(data)
+        def batch_done_cb(g):
+            if self.__event_gs.get(message_id) is g:
+                del self.__event_gs[message_id]
 
-        code = 0
+        g.link(batch_done_cb)
+
+    def __handle_batch(self, message_id, message_obj):
+        _logger.info("Received batch of (%d) events from [%s].", 
+                     len(message_obj.events), self.__ctx.participant_address)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_BATCH_TICK)
+
+        group = gevent.pool.Group()
 
         try:
-            result = handler(self.__ctx, (mimetype, data), *parameters)
+            gs = [group.spawn(
+                    self.__get_safe_event_reply, 
+                    event_obj, 
+                    event_obj.data)
+                  for event_obj
+                  in message_obj.events]
+
+            group.join()
+        finally:
+            # If we were cancelled, so are the events.
+            group.kill(block=False)
+
+        reply_message_obj = rpipe.protocol.get_obj_from_type(
+                                rpipe.protocols.MT_EVENT_BATCH_R)
+
+        reply_message_obj.version = 1
+        reply_message_obj.replies.extend([g.value for g in gs])
+
+        self.__send_reply(message_id, reply_message_obj)
+
+    def __get_safe_event_reply(self, message_obj, data):
+        """Anything that goes wrong outside of the handler (a body that can't 
+        be decoded, or a result that can't be encoded) is still answered, so 
+        that the sender isn't left waiting, and one failed event doesn't take 
+        the rest of a batch with it.
+        """
+
+        try:
+            return self.__get_deduped_event_reply(message_obj, data)
         except Exception as e:
-            for line in traceback.format_exc().split('\n'):
-                _logger.error("EXCEPTION: " + line)
+            return rpipe.event_handling.get_exception_reply(
+                    message_obj.noun, 
+                    e)
+
+    def __get_deduped_event_reply(self, message_obj, data):
+        """If the event is a retry of one that we've already handled (or are 
+        handling), return that reply instead.
+        """
 
-            _logger.error("Unhandled exception during event [%s]: [%s]", 
-                              e.__class__.__name__, str(e))
+        if not message_obj.idempotency_key:
+            return self.__get_event_reply(message_obj, data)
 
-            result = { 
-                'exception': {
-                    'message': str(e),
-                    'traceback': traceback.format_exc(),
-                    'class': e.__class__.__name__,
-                }
-            }
+        try:
+            return rpipe.dedup_cache.get_dedup_cache().do(
+                    rpipe.dedup_cache.get_scope(
+                        self.__ctx.participant_address),
+                    message_obj.idempotency_key,
+                    rpipe.dedup_cache.get_fingerprint(message_obj),
+                    lambda: self.__get_event_reply(message_obj, data))
+        except rpipe.dedup_cache.IdempotencyKeyMismatchError as e:
+            _logger.warning("Refusing event from [%s]: [%s] [%s] [%s]",
+                            self.__ctx.participant_address, 
+                            message_obj.verb, message_obj.noun, str(e))
 
-            code = rpipe.config.exchange.UNHANDLED_EXCEPTION_CODE
+            return rpipe.event_handling.get_exception_reply(
+                    message_obj.noun, 
+                    e)
 
-        if issubclass(result.__class__, tuple) is True:
-            (mimetype, code, result_data) = result
-        else:
-            mimetype = None
-            result_data = result
+    def __get_event_reply(self, message_obj, data):
+        _logger.info("Received event from [%s]: [%s] [%s]", 
+                     self.__ctx.participant_address, message_obj.verb, 
+                     message_obj.noun)
 
-        if mimetype is None:
-            mimetype = _CT_JSON
+        (event_handler_name, parameters) = \
+            rpipe.event_handling.get_handler_name_and_parameters(
+                message_obj.verb,
+                message_obj.noun,
+                message_obj.parameters)
 
-        _logger.debug("Event result for handler [%s]: [%s] [%s] (%s)", 
-                      handler.func_name, mimetype, 
-                      result_data.__class__.__name__, code)
+        try:
+            handler = getattr(self.__eh, event_handler_name)
+        except AttributeError:
+            _logger.warning("Event is not handled: METHOD=[%s]", 
+                            event_handler_name)
 
-        if result_data is None:
-            _logger.debug("Result data was [literally] None. Coalescing to "
-                          "empty.")
+            return rpipe.event_handling.build_event_reply(
+                    rpipe.config.protocol.UNHANDLED_EVENT_DEFAULT_RESULT_CODE)
 
-            result_data = ''
+        counter_name = rpipe.config.statsd.EVENT_HANDLER_TICK_TEMPLATE % \
+                       { 'handler_name': event_handler_name }
 
-        if issubclass(result_data.__class__, 
-                      (basestring, types.GeneratorType)) is False:
-            if mimetype == _CT_JSON:
-                result_data = json.dumps(result_data)
-            else:
-                raise ValueError("Response to noun [%s] was invalid type and "
-                                 "we're not allowed to encode it to JSON: "
-                                 "[%s]" %
-                                 (noun, result_data.__class__.__name__))
+        rpipe.stats.post_to_counter(counter_name)
+
+        timer_name = rpipe.config.statsd.EVENT_HANDLER_TIMING_TEMPLATE % \
+                     { 'handler_name': event_handler_name }
 
-        self.__send_event_response(message_id, code, mimetype, result_data)
+        with rpipe.stats.time_and_post(timer_name):
+            try:
+                return self.__process_event(
+                        handler,
+                        event_handler_name,
+                        message_obj.noun,
+                        parameters,
+                        message_obj.mimetype,
+                        data,
+                        message_obj.if_none_match)
+            except Exception:
+                _logger.error("There was an exception while executing "
+                              "handler: [%s]", event_handler_name)
+                raise
+
+    def __process_event(self, handler, handler_name, noun, parameters, 
+                        mimetype, data, if_none_match):
+        etag = rpipe.event_handling.get_etag(
+                self.__eh, 
+                handler_name, 
+                self.__ctx, 
+                parameters)
+
+        if rpipe.event_handling.is_etag_matched(
+                etag, 
+                if_none_match) is True:
+            _logger.debug("Sender's copy is current: [%s] [%s]", 
+                          handler_name, etag)
 
-    def __send_event_response(self, reply_to_message_id, code, 
-                              mimetype='text/plain', data=''):
-        reply_to_message_id_str = rpipe.protocol.get_string_from_message_id(
-                                    reply_to_message_id)
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_MESSAGE_REPLY_NOT_MODIFIED_TICK)
 
-        _logger.debug("Responding to message [%s] with code [%s] (with data? "
-                      "[%s])", 
-                      reply_to_message_id_str, code, bool(data))
+            return rpipe.event_handling.build_event_reply(
+                    0, 
+                    etag=etag, 
+                    is_not_modified=True)
 
-        reply_message_obj = rpipe.protocol.get_obj_from_type(
-                                rpipe.protocols.MT_EVENT_R)
+        _logger.debug("Forwarding event to event-handler. MIMETYPE=[%s] "
+                      "PARAMS=%s", mimetype, parameters)
 
-        reply_message_obj.version = 1
-        reply_message_obj.mimetype = mimetype
-        reply_message_obj.code = code
-        reply_message_obj.data = data
+        data = rpipe.event_handling.decode_request_data(mimetype, data)
+
+        try:
+            result = handler(self.__ctx, (mimetype, data), *parameters)
+        except Exception as e:
+            result = rpipe.event_handling.get_exception_result(e)
+
+        (mimetype, code, result_data, cache_ttl_s) = \
+            rpipe.event_handling.get_reply_from_result(
+                handler_name, 
+                noun, 
+                result)
+
+        return rpipe.event_handling.build_event_reply(
+                code, 
+                mimetype, 
+                result_data, 
+                cache_ttl_s=cache_ttl_s,
+                etag=etag)
+
+    def __send_reply(self, reply_to_message_id, reply_message_obj):
+        _logger.debug("Responding to message [%s] with [%s]", 
+                      rpipe.protocol.get_string_from_message_id(
+                        reply_to_message_id),
+                      reply_message_obj.__class__.__name__)
 
         rpipe.message_exchange.send(
             self.__ctx.participant_address, 
@@ -2,66 +2,52 @@ import struct
 import random
 import logging
 import math
+import time
 
-import gevent.ssl
-import gevent.socket
+import rpipe.config.statsd
 
+import rpipe.capture
 import rpipe.exceptions
 import rpipe.protocols
+import rpipe.stats
 import rpipe.utility
 
 # Message flags.
 MF_IS_REPLY = 0x01
 
+# v2 only: the header carries a stream-ID and/or a fragment-ID.
+MF_HAS_STREAM_ID = 0x02
+MF_HAS_FRAGMENT_ID = 0x04
+
+# A v1 frame has a fixed header (type, flags, length, message-ID). A v2 frame 
+# starts with a marker (which is never a message-type) followed by the type, 
+# flags, message-ID, optional stream- and fragment-IDs, and length as varints. 
+# Either can arrive on any connection, but v2 is only sent to a peer that said 
+# that it supports it.
+FRAME_V1 = 1
+FRAME_V2 = 2
+
+_FRAME_V1_HEADER_FORMAT = '!BBII'
+_FRAME_V2_MARKER = 0xF2
+
+# When the admission preamble is enabled, the server sends one of these in the 
+# clear right after accepting, before any TLS happens. A retry is followed by 
+# the number of seconds to wait.
+ADMISSION_ACCEPT = b'A'
+ADMISSION_RETRY = b'R'
+ADMISSION_RETRY_AFTER_FORMAT = '!H'
+
+# Returned in place of a message that we didn't know the type of.
+_SKIPPED = object()
+
 _MESSAGE_ID_MAXIMUM = 2**32
 _MESSAGE_ID_MAX_ZEROES = int(math.ceil(math.log(_MESSAGE_ID_MAXIMUM, 10))) - 1
 _MESSAGE_ID_MINIMUM = int('1' + '0' * _MESSAGE_ID_MAX_ZEROES)
 
 _logger = logging.getLogger(__name__)
 
+_capture = rpipe.capture.get_capture_writer()
 
-class SocketWrapper(object):
-    """A thin wrapper that throws the right exceptions when the pipe is broken.
-    """
-
-    def __init__(self, socket, file_):
-        assert socket is not None
-        assert file_ is not None
-
-        self.__socket = socket
-        self.__file = file_
-
-    def __getattr__(self, name):
-        return getattr(self.__file, name)
-
-    def read(self, *args, **kwargs):
-        try:
-            data = self.__file.read(*args, **kwargs)
-        except gevent.socket.error as e:
-            message = ("There was a socket error (read). Closing stream: %s" % (str(e)))
-            _logger.exception(message)
-            raise rpipe.exceptions.RpConnectionClosed(message)
-
-        if data == '':
-            raise rpipe.exceptions.RpConnectionClosed()
-
-        return data
-
-    def write(self, *args, **kwargs):
-        try:
-            self.__file.write(*args, **kwargs)
-            self.__file.flush()
-        except gevent.ssl.SSLError as e:
-            message = ("There was an SSL error (read). Closing stream: %s" % (str(e)))
-            _logger.exception(message)
-            raise rpipe.exceptions.RpConnectionClosed(message)
-        except gevent.socket.error as e:
-            message = ("There was a socket error (write). Closing stream: %s" % (str(e)))
-            _logger.exception(message)
-            raise rpipe.exceptions.RpConnectionClosed(message)
-
-    def __str__(self):
-        return str(self.__socket.getpeername())
 
 def id_generator():
     """Generate IDs for composed messages. They will all the the same length.
@@ -69,13 +55,72 @@ def id_generator():
 
     return random.randrange(_MESSAGE_ID_MINIMUM, _MESSAGE_ID_MAXIMUM)
 
+class SerializedMessage(object):
+    """A message that has already been framed, so that it can be sent over 
+    any number of connections without serializing it each time. Every copy 
+    carries the same message-ID, which is fine since they only have to be 
+    unique per connection.
+    """
+
+    def __init__(self, message_obj, frame_version=FRAME_V1):
+        self.message_type = rpipe.protocols.get_type_from_obj(message_obj)
+
+        (self.frame, self.message_id) = _serialize(
+                                            message_obj, 
+                                            frame_version=frame_version)
+
+
+def set_capture_writer(capture_writer):
+    """Record frames with the given rpipe.capture.CaptureWriter (or stop, if 
+    None).
+    """
+
+    global _capture
+    _capture = capture_writer
+
+def capture_frame(stream, direction, frame):
+    """Record a frame, if we're capturing. For engines that do their own 
+    writing.
+    """
+
+    if _capture is not None:
+        _capture.record(stream, direction, frame)
+
 def get_obj_from_type(message_type):
     fq_module_name = rpipe.protocols.get_fq_module_name_for_type(message_type)
     message_cls = rpipe.utility.load_cls_from_string(fq_module_name)
 
     return message_cls()
 
-def _serialize(message_obj, message_id=None, is_response=False, flags=0):
+def _encode_varint(value):
+    encoded = bytearray()
+
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+
+    encoded.append(value)
+
+    return encoded
+
+def _get_v1_compatible(message_obj):
+    """A v1 peer only knows the parameters as part of the noun."""
+
+    if rpipe.protocols.get_type_from_obj(message_obj) != \
+       rpipe.protocols.MT_EVENT or \
+       not message_obj.parameters:
+        return message_obj
+
+    folded_obj = message_obj.__class__()
+    folded_obj.CopyFrom(message_obj)
+
+    folded_obj.noun = folded_obj.noun + '//' + '/'.join(folded_obj.parameters)
+    del folded_obj.parameters[:]
+
+    return folded_obj
+
+def _serialize(message_obj, message_id=None, is_response=False, flags=0, 
+               frame_version=FRAME_V1, stream_id=None, fragment_id=None):
     if message_id is None:
         message_id = id_generator()
 
@@ -83,14 +128,38 @@ def _serialize(message_obj, message_id=None, is_response=False, flags=0):
         flags |= MF_IS_REPLY
 
     message_type = rpipe.protocols.get_type_from_obj(message_obj)
-    serialized = message_obj.SerializeToString()
 
-    header = struct.pack(
-                '!BBII', 
-                message_type, 
-                flags, 
-                len(serialized), 
-                message_id)
+    if frame_version == FRAME_V1:
+        serialized = _get_v1_compatible(message_obj).SerializeToString()
+
+        header = struct.pack(
+                    _FRAME_V1_HEADER_FORMAT, 
+                    message_type, 
+                    flags, 
+                    len(serialized), 
+                    message_id)
+    else:
+        serialized = message_obj.SerializeToString()
+
+        if stream_id is not None:
+            flags |= MF_HAS_STREAM_ID
+
+        if fragment_id is not None:
+            flags |= MF_HAS_FRAGMENT_ID
+
+        header = bytearray([_FRAME_V2_MARKER])
+        header += _encode_varint(message_type)
+        header += _encode_varint(flags)
+        header += _encode_varint(message_id)
+
+        if stream_id is not None:
+            header += _encode_varint(stream_id)
+
+        if fragment_id is not None:
+            header += _encode_varint(fragment_id)
+
+        header += _encode_varint(len(serialized))
+        header = bytes(header)
 
     whole_message = header + serialized
     _logger.debug("Serializing [%s]: (%d) + (%d)", 
@@ -103,17 +172,87 @@ def get_standard_header_length():
     # (Message_Type + Flags + Data_Length) + Message_ID
     return (1 + 1 + 4 + 4)
 
-def get_message_info_from_header(header):
-    parts = struct.unpack('!BBII', header)
-    (message_type, flags, data_length, message_id) = parts
-
+def _build_message_info(frame_version, message_type, flags, data_length, 
+                        message_id, stream_id=None, fragment_id=None):
     return {
+        'frame_version': frame_version,
         'type': message_type,
         'length': data_length,
         'message_id': message_id,
+        'stream_id': stream_id,
+        'fragment_id': fragment_id,
         'is_response': bool(flags & MF_IS_REPLY),
+        # Deadlines are measured from here, since the clocks on the two ends 
+        # might not agree.
+        'received_at': time.time(),
     }
 
+def get_message_info_from_header(header):
+    """Parse a v1 header."""
+
+    parts = struct.unpack(_FRAME_V1_HEADER_FORMAT, header)
+    (message_type, flags, data_length, message_id) = parts
+
+    return _build_message_info(
+            FRAME_V1, 
+            message_type, 
+            flags, 
+            data_length, 
+            message_id)
+
+def _read_v2_header(read_byte):
+    """Parse the rest of a v2 header (after the marker). `read_byte` returns 
+    the next byte as an integer, or None if there's no more data yet (in 
+    which case we return None).
+    """
+
+    def read_varint():
+        value = 0
+        shift = 0
+
+        while 1:
+            b = read_byte()
+            if b is None:
+                return None
+
+            value |= (b & 0x7f) << shift
+            if b & 0x80 == 0:
+                return value
+
+            shift += 7
+
+    message_type = read_varint()
+    flags = read_varint()
+    message_id = read_varint()
+
+    if None in (message_type, flags, message_id):
+        return None
+
+    stream_id = None
+    if flags & MF_HAS_STREAM_ID:
+        stream_id = read_varint()
+        if stream_id is None:
+            return None
+
+    fragment_id = None
+    if flags & MF_HAS_FRAGMENT_ID:
+        fragment_id = read_varint()
+        if fragment_id is None:
+            return None
+
+    data_length = read_varint()
+    if data_length is None:
+        return None
+
+    return _build_message_info(
+            FRAME_V2, 
+            message_type, 
+            flags, 
+            data_length, 
+            message_id, 
+            stream_id=stream_id, 
+            fragment_id=fragment_id)
+
 def get_message_length_from_info(message_info):
     return message_info['length']
 
@@ -123,6 +262,15 @@ def get_message_id_from_info(message_info):
 def get_message_type_from_info(message_info):
     return message_info['type']
 
+def get_is_response_from_info(message_info):
+    return message_info['is_response']
+
+def get_received_at_from_info(message_info):
+    return message_info['received_at']
+
+def get_frame_version_from_info(message_info):
+    return message_info['frame_version']
+
 def _unserialize(message_info, data):
     message_obj = get_obj_from_type(message_info['type'])
     message_obj.ParseFromString(data)
@@ -132,17 +280,64 @@ def _unserialize(message_info, data):
 def get_string_from_message_id(message_id):
     return ('%010d' % (message_id,))
 
+def _skip_unknown(message_info):
+    """A newer peer may send types that we don't know. Their frames can still 
+    be skipped (the length is in the header), and anything waiting on a reply 
+    to one will time-out, which is how the peer finds out that we don't 
+    support it.
+    """
+
+    message_type = get_message_type_from_info(message_info)
+    if rpipe.protocols.is_known_type(message_type) is True:
+        return False
+
+    _logger.warning("Skipping message of unknown type (%d): [%s]", 
+                    message_type, 
+                    get_string_from_message_id(
+                        get_message_id_from_info(message_info)))
+
+    rpipe.stats.post_to_counter(
+        rpipe.config.statsd.EVENT_MESSAGE_RECEIVE_UNKNOWN_TICK)
+
+    return True
+
 def read_message_from_file_object(file_):
-    header_length = get_standard_header_length()
+    while 1:
+        message = _read_one_message_from_file_object(file_)
+        if message is not None:
+            return message
+
+def _read_one_message_from_file_object(file_):
+    """Return None if the message was skipped."""
+
+    first = bytearray(file_.read(1))[0]
+
+    # The header as read, in case we're capturing.
+    header = bytearray([first])
+
+    if first == _FRAME_V2_MARKER:
+        def read_byte():
+            b = bytearray(file_.read(1))[0]
+            header.append(b)
+
+            return b
+
+        message_info = _read_v2_header(read_byte)
+    else:
+        header += file_.read(get_standard_header_length() - 1)
 
-    header = file_.read(header_length)
-    _logger.debug("Received header (%d bytes).", header_length)
+        message_info = get_message_info_from_header(bytes(header))
 
-    message_info = get_message_info_from_header(header)
     _logger.debug("Message info: %s", message_info)
 
     message_length = get_message_length_from_info(message_info)
 
+    if _skip_unknown(message_info) is True:
+        if message_length > 0:
+            file_.read(message_length)
+
+        return None
+
     message_type_name = rpipe.protocols.get_fq_cls_name_for_type(
                             message_info['type'])
 
@@ -154,18 +349,109 @@ def read_message_from_file_object(file_):
     if message_length > 0:
         serialized = file_.read(message_length)
     else:
-        serialized = ''
+        serialized = b''
 
     _logger.debug("Received data.")
 
+    if _capture is not None:
+        _capture.record(
+            file_, 
+            rpipe.capture.DIRECTION_RECEIVED, 
+            bytes(header) + serialized)
+
     message_obj = _unserialize(message_info, serialized)
 
     return (message_info, message_obj)
 
+def read_message_from_buffer(buffer_, stream=None):
+    """Parse one message from the front of a bytearray, if it's all there. 
+    Return (message_info, message_obj), or None if more data is needed. The 
+    message is removed from the buffer. This is for engines that receive data 
+    as it arrives rather than blocking on a file-object. `stream` identifies 
+    the connection, if we're capturing.
+    """
+
+    while 1:
+        message = _read_one_message_from_buffer(buffer_, stream)
+        if message is not _SKIPPED:
+            return message
+
+def _read_one_message_from_buffer(buffer_, stream):
+    """Return _SKIPPED if a message was skipped."""
+
+    if not buffer_:
+        return None
+
+    if buffer_[0] == _FRAME_V2_MARKER:
+        position = [1]
+
+        def read_byte():
+            if position[0] >= len(buffer_):
+                return None
+
+            b = buffer_[position[0]]
+            position[0] += 1
+
+            return b
+
+        message_info = _read_v2_header(read_byte)
+        if message_info is None:
+            return None
+
+        header_length = position[0]
+    else:
+        header_length = get_standard_header_length()
+        if len(buffer_) < header_length:
+            return None
+
+        message_info = get_message_info_from_header(
+                        bytes(buffer_[:header_length]))
+
+    message_length = get_message_length_from_info(message_info)
+    if len(buffer_) < header_length + message_length:
+        return None
+
+    serialized = bytes(buffer_[header_length:header_length + message_length])
+
+    if _capture is not None:
+        _capture.record(
+            stream, 
+            rpipe.capture.DIRECTION_RECEIVED, 
+            bytes(buffer_[:header_length + message_length]))
+
+    del buffer_[:header_length + message_length]
+
+    if _skip_unknown(message_info) is True:
+        return _SKIPPED
+
+    message_obj = _unserialize(message_info, serialized)
+
+    return (message_info, message_obj)
+
+def get_message_type(message_obj):
+    """Return the type of a message object or of a SerializedMessage."""
+
+    if issubclass(message_obj.__class__, SerializedMessage) is True:
+        return message_obj.message_type
+
+    return rpipe.protocols.get_type_from_obj(message_obj)
+
+def serialize_message_obj(message_obj, **kwargs):
+    """Return the complete frame for the message and its message-ID."""
+
+    return _serialize(message_obj, **kwargs)
+
 def send_message_obj(ws, message_obj, **kwargs):
-    (data, message_id) = _serialize(message_obj, **kwargs)
+    if issubclass(message_obj.__class__, SerializedMessage) is True:
+        (data, message_id) = (message_obj.frame, message_obj.message_id)
+    else:
+        (data, message_id) = _serialize(message_obj, **kwargs)
+
     _logger.debug("Sending [%s].", get_string_from_message_id(message_id))
 
+    if _capture is not None:
+        _capture.record(ws, rpipe.capture.DIRECTION_SENT, data)
+
     ws.write(data)
 
     _logger.debug("Message sent.")
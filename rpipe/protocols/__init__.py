@@ -1,20 +1,37 @@
 _MESSAGE_PACKAGE = 'rpipe.protocols'
 
-MT_HEARTBEAT = 0x01
-MT_EVENT     = 0x02
+MT_HEARTBEAT        = 0x01
+MT_EVENT            = 0x02
+MT_CANCEL           = 0x03
+MT_EVENT_CHUNK      = 0x04
+MT_CACHE_INVALIDATE = 0x05
+MT_EVENT_BATCH      = 0x06
+MT_HELLO            = 0x07
 
-MT_HEARTBEAT_R = 0x80
-MT_EVENT_R     = 0x81
+MT_HEARTBEAT_R   = 0x80
+MT_EVENT_R       = 0x81
+MT_EVENT_BATCH_R = 0x82
+MT_HELLO_R       = 0x83
 
 _MESSAGE_MAP = {
     MT_HEARTBEAT: 'heartbeat_pb2.Heartbeat',
     MT_HEARTBEAT_R: 'heartbeat_pb2.HeartbeatReply',
     MT_EVENT: 'event_pb2.Event',
     MT_EVENT_R: 'event_pb2.EventReply',
+    MT_CANCEL: 'event_pb2.Cancel',
+    MT_EVENT_CHUNK: 'event_pb2.EventChunk',
+    MT_CACHE_INVALIDATE: 'event_pb2.CacheInvalidate',
+    MT_EVENT_BATCH: 'event_pb2.EventBatch',
+    MT_EVENT_BATCH_R: 'event_pb2.EventBatchReply',
+    MT_HELLO: 'hello_pb2.Hello',
+    MT_HELLO_R: 'hello_pb2.HelloReply',
 }
 
 _MESSAGE_MAP_R = dict([(v, k) for (k, v) in _MESSAGE_MAP.items()])
 
+def is_known_type(message_type):
+    return message_type in _MESSAGE_MAP
+
 def get_fq_cls_name_for_type(message_type):
     return _MESSAGE_MAP[message_type]
 
@@ -1,21 +1,65 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: event.proto
 
+import sys
+_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
 from google.protobuf import descriptor_pb2
 # @@protoc_insertion_point(imports)
 
+_sym_db = _symbol_database.Default()
+
 
 
 
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='event.proto',
   package='rpipe.event',
-  serialized_pb='\n\x0b\x65vent.proto\x12\x0brpipe.event\"T\n\x05\x45vent\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x0c\n\x04verb\x18\x02 \x02(\t\x12\x0c\n\x04noun\x18\x03 \x02(\t\x12\x10\n\x08mimetype\x18\x04 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\t\"K\n\nEventReply\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x10\n\x08mimetype\x18\x02 \x01(\t\x12\x0c\n\x04\x63ode\x18\x03 \x02(\r\x12\x0c\n\x04\x64\x61ta\x18\x04 \x02(\t')
+  serialized_pb=_b('\n\x0b\x65vent.proto\x12\x0brpipe.event\"%\n\x06Header\x12\x0c\n\x04name\x18\x01 \x02(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\xf9\x01\n\x05\x45vent\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x0c\n\x04verb\x18\x02 \x02(\t\x12\x0c\n\x04noun\x18\x03 \x02(\t\x12\x10\n\x08mimetype\x18\x04 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x12\n\ntimeout_ms\x18\x06 \x01(\r\x12\x13\n\x0bis_streamed\x18\x07 \x01(\x08\x12\x15\n\rif_none_match\x18\x08 \x03(\t\x12\x10\n\x08no_reply\x18\t \x01(\x08\x12\x12\n\nparameters\x18\n \x03(\t\x12$\n\x07headers\x18\x0b \x03(\x0b\x32\x13.rpipe.event.Header\x12\x17\n\x0fidempotency_key\x18\x0c \x01(\t\"<\n\nEventChunk\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x0c\n\x04\x64\x61ta\x18\x02 \x01(\x0c\x12\x0f\n\x07is_last\x18\x03 \x01(\x08\"\xad\x01\n\nEventReply\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x10\n\x08mimetype\x18\x02 \x01(\t\x12\x0c\n\x04\x63ode\x18\x03 \x02(\r\x12\x0c\n\x04\x64\x61ta\x18\x04 \x02(\x0c\x12\x13\n\x0b\x63\x61\x63he_ttl_s\x18\x05 \x01(\r\x12\x0c\n\x04\x65tag\x18\x06 \x01(\t\x12\x17\n\x0fis_not_modified\x18\x07 \x01(\x08\x12$\n\x07headers\x18\x08 \x03(\x0b\x32\x13.rpipe.event.Header\"\x19\n\x06\x43\x61ncel\x12\x0f\n\x07version\x18\x01 \x02(\r\"0\n\x0f\x43\x61\x63heInvalidate\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x0c\n\x04noun\x18\x02 \x01(\t\"U\n\nEventBatch\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\"\n\x06\x65vents\x18\x02 \x03(\x0b\x32\x12.rpipe.event.Event\x12\x12\n\ntimeout_ms\x18\x03 \x01(\r\"L\n\x0f\x45ventBatchReply\x12\x0f\n\x07version\x18\x01 \x02(\r\x12(\n\x07replies\x18\x02 \x03(\x0b\x32\x17.rpipe.event.EventReply')
+)
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+
 
 
+_HEADER = _descriptor.Descriptor(
+  name='Header',
+  full_name='rpipe.event.Header',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='name', full_name='rpipe.event.Header.name', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='value', full_name='rpipe.event.Header.value', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=28,
+  serialized_end=65,
+)
 
 
 _EVENT = _descriptor.Descriptor(
@@ -35,28 +79,77 @@ _EVENT = _descriptor.Descriptor(
     _descriptor.FieldDescriptor(
       name='verb', full_name='rpipe.event.Event.verb', index=1,
       number=2, type=9, cpp_type=9, label=2,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=_b("").decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
     _descriptor.FieldDescriptor(
       name='noun', full_name='rpipe.event.Event.noun', index=2,
       number=3, type=9, cpp_type=9, label=2,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=_b("").decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
     _descriptor.FieldDescriptor(
       name='mimetype', full_name='rpipe.event.Event.mimetype', index=3,
       number=4, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=_b("").decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
     _descriptor.FieldDescriptor(
       name='data', full_name='rpipe.event.Event.data', index=4,
-      number=5, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      number=5, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='timeout_ms', full_name='rpipe.event.Event.timeout_ms', index=5,
+      number=6, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='is_streamed', full_name='rpipe.event.Event.is_streamed', index=6,
+      number=7, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='if_none_match', full_name='rpipe.event.Event.if_none_match', index=7,
+      number=8, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='no_reply', full_name='rpipe.event.Event.no_reply', index=8,
+      number=9, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='parameters', full_name='rpipe.event.Event.parameters', index=9,
+      number=10, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='headers', full_name='rpipe.event.Event.headers', index=10,
+      number=11, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='idempotency_key', full_name='rpipe.event.Event.idempotency_key', index=11,
+      number=12, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
@@ -69,8 +162,54 @@ _EVENT = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=28,
-  serialized_end=112,
+  oneofs=[
+  ],
+  serialized_start=68,
+  serialized_end=317,
+)
+
+
+_EVENTCHUNK = _descriptor.Descriptor(
+  name='EventChunk',
+  full_name='rpipe.event.EventChunk',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.event.EventChunk.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='data', full_name='rpipe.event.EventChunk.data', index=1,
+      number=2, type=12, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='is_last', full_name='rpipe.event.EventChunk.is_last', index=2,
+      number=3, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=319,
+  serialized_end=379,
 )
 
 
@@ -91,7 +230,7 @@ _EVENTREPLY = _descriptor.Descriptor(
     _descriptor.FieldDescriptor(
       name='mimetype', full_name='rpipe.event.EventReply.mimetype', index=1,
       number=2, type=9, cpp_type=9, label=1,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      has_default_value=False, default_value=_b("").decode('utf-8'),
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
@@ -104,8 +243,36 @@ _EVENTREPLY = _descriptor.Descriptor(
       options=None),
     _descriptor.FieldDescriptor(
       name='data', full_name='rpipe.event.EventReply.data', index=3,
-      number=4, type=9, cpp_type=9, label=2,
-      has_default_value=False, default_value=unicode("", "utf-8"),
+      number=4, type=12, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='cache_ttl_s', full_name='rpipe.event.EventReply.cache_ttl_s', index=4,
+      number=5, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='etag', full_name='rpipe.event.EventReply.etag', index=5,
+      number=6, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='is_not_modified', full_name='rpipe.event.EventReply.is_not_modified', index=6,
+      number=7, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='headers', full_name='rpipe.event.EventReply.headers', index=7,
+      number=8, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
@@ -118,24 +285,228 @@ _EVENTREPLY = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
-  serialized_start=114,
-  serialized_end=189,
+  oneofs=[
+  ],
+  serialized_start=382,
+  serialized_end=555,
 )
 
+
+_CANCEL = _descriptor.Descriptor(
+  name='Cancel',
+  full_name='rpipe.event.Cancel',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.event.Cancel.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=557,
+  serialized_end=582,
+)
+
+
+_CACHEINVALIDATE = _descriptor.Descriptor(
+  name='CacheInvalidate',
+  full_name='rpipe.event.CacheInvalidate',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.event.CacheInvalidate.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='noun', full_name='rpipe.event.CacheInvalidate.noun', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=584,
+  serialized_end=632,
+)
+
+
+_EVENTBATCH = _descriptor.Descriptor(
+  name='EventBatch',
+  full_name='rpipe.event.EventBatch',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.event.EventBatch.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='events', full_name='rpipe.event.EventBatch.events', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='timeout_ms', full_name='rpipe.event.EventBatch.timeout_ms', index=2,
+      number=3, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=634,
+  serialized_end=719,
+)
+
+
+_EVENTBATCHREPLY = _descriptor.Descriptor(
+  name='EventBatchReply',
+  full_name='rpipe.event.EventBatchReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.event.EventBatchReply.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='replies', full_name='rpipe.event.EventBatchReply.replies', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=721,
+  serialized_end=797,
+)
+
+_EVENT.fields_by_name['headers'].message_type = _HEADER
+_EVENTREPLY.fields_by_name['headers'].message_type = _HEADER
+_EVENTBATCH.fields_by_name['events'].message_type = _EVENT
+_EVENTBATCHREPLY.fields_by_name['replies'].message_type = _EVENTREPLY
+DESCRIPTOR.message_types_by_name['Header'] = _HEADER
 DESCRIPTOR.message_types_by_name['Event'] = _EVENT
+DESCRIPTOR.message_types_by_name['EventChunk'] = _EVENTCHUNK
 DESCRIPTOR.message_types_by_name['EventReply'] = _EVENTREPLY
+DESCRIPTOR.message_types_by_name['Cancel'] = _CANCEL
+DESCRIPTOR.message_types_by_name['CacheInvalidate'] = _CACHEINVALIDATE
+DESCRIPTOR.message_types_by_name['EventBatch'] = _EVENTBATCH
+DESCRIPTOR.message_types_by_name['EventBatchReply'] = _EVENTBATCHREPLY
 
-class Event(_message.Message):
-  __metaclass__ = _reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _EVENT
+Header = _reflection.GeneratedProtocolMessageType('Header', (_message.Message,), dict(
+  DESCRIPTOR = _HEADER,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.Header)
+  ))
+_sym_db.RegisterMessage(Header)
 
+Event = _reflection.GeneratedProtocolMessageType('Event', (_message.Message,), dict(
+  DESCRIPTOR = _EVENT,
+  __module__ = 'event_pb2'
   # @@protoc_insertion_point(class_scope:rpipe.event.Event)
+  ))
+_sym_db.RegisterMessage(Event)
 
-class EventReply(_message.Message):
-  __metaclass__ = _reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _EVENTREPLY
+EventChunk = _reflection.GeneratedProtocolMessageType('EventChunk', (_message.Message,), dict(
+  DESCRIPTOR = _EVENTCHUNK,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.EventChunk)
+  ))
+_sym_db.RegisterMessage(EventChunk)
 
+EventReply = _reflection.GeneratedProtocolMessageType('EventReply', (_message.Message,), dict(
+  DESCRIPTOR = _EVENTREPLY,
+  __module__ = 'event_pb2'
   # @@protoc_insertion_point(class_scope:rpipe.event.EventReply)
+  ))
+_sym_db.RegisterMessage(EventReply)
+
+Cancel = _reflection.GeneratedProtocolMessageType('Cancel', (_message.Message,), dict(
+  DESCRIPTOR = _CANCEL,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.Cancel)
+  ))
+_sym_db.RegisterMessage(Cancel)
+
+CacheInvalidate = _reflection.GeneratedProtocolMessageType('CacheInvalidate', (_message.Message,), dict(
+  DESCRIPTOR = _CACHEINVALIDATE,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.CacheInvalidate)
+  ))
+_sym_db.RegisterMessage(CacheInvalidate)
+
+EventBatch = _reflection.GeneratedProtocolMessageType('EventBatch', (_message.Message,), dict(
+  DESCRIPTOR = _EVENTBATCH,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.EventBatch)
+  ))
+_sym_db.RegisterMessage(EventBatch)
+
+EventBatchReply = _reflection.GeneratedProtocolMessageType('EventBatchReply', (_message.Message,), dict(
+  DESCRIPTOR = _EVENTBATCHREPLY,
+  __module__ = 'event_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.event.EventBatchReply)
+  ))
+_sym_db.RegisterMessage(EventBatchReply)
 
 
 # @@protoc_insertion_point(module_scope)
@@ -1,19 +1,26 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: heartbeat.proto
 
+import sys
+_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
 from google.protobuf import descriptor_pb2
 # @@protoc_insertion_point(imports)
 
+_sym_db = _symbol_database.Default()
+
 
 
 
 DESCRIPTOR = _descriptor.FileDescriptor(
   name='heartbeat.proto',
   package='rpipe.support',
-  serialized_pb='\n\x0fheartbeat.proto\x12\rrpipe.support\"\x1c\n\tHeartbeat\x12\x0f\n\x07version\x18\x01 \x02(\r\"!\n\x0eHeartbeatReply\x12\x0f\n\x07version\x18\x01 \x02(\r')
+  serialized_pb=_b('\n\x0fheartbeat.proto\x12\rrpipe.support\"\x1c\n\tHeartbeat\x12\x0f\n\x07version\x18\x01 \x02(\r\"!\n\x0eHeartbeatReply\x12\x0f\n\x07version\x18\x01 \x02(\r')
+)
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
 
 
@@ -41,6 +48,8 @@ _HEARTBEAT = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
+  oneofs=[
+  ],
   serialized_start=34,
   serialized_end=62,
 )
@@ -69,6 +78,8 @@ _HEARTBEATREPLY = _descriptor.Descriptor(
   options=None,
   is_extendable=False,
   extension_ranges=[],
+  oneofs=[
+  ],
   serialized_start=64,
   serialized_end=97,
 )
@@ -76,17 +87,19 @@ _HEARTBEATREPLY = _descriptor.Descriptor(
 DESCRIPTOR.message_types_by_name['Heartbeat'] = _HEARTBEAT
 DESCRIPTOR.message_types_by_name['HeartbeatReply'] = _HEARTBEATREPLY
 
-class Heartbeat(_message.Message):
-  __metaclass__ = _reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _HEARTBEAT
-
+Heartbeat = _reflection.GeneratedProtocolMessageType('Heartbeat', (_message.Message,), dict(
+  DESCRIPTOR = _HEARTBEAT,
+  __module__ = 'heartbeat_pb2'
   # @@protoc_insertion_point(class_scope:rpipe.support.Heartbeat)
+  ))
+_sym_db.RegisterMessage(Heartbeat)
 
-class HeartbeatReply(_message.Message):
-  __metaclass__ = _reflection.GeneratedProtocolMessageType
-  DESCRIPTOR = _HEARTBEATREPLY
-
+HeartbeatReply = _reflection.GeneratedProtocolMessageType('HeartbeatReply', (_message.Message,), dict(
+  DESCRIPTOR = _HEARTBEATREPLY,
+  __module__ = 'heartbeat_pb2'
   # @@protoc_insertion_point(class_scope:rpipe.support.HeartbeatReply)
+  ))
+_sym_db.RegisterMessage(HeartbeatReply)
 
 
 # @@protoc_insertion_point(module_scope)
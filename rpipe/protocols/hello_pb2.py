@@ -0,0 +1,187 @@
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# source: hello.proto
+
+import sys
+_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import message as _message
+from google.protobuf import reflection as _reflection
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf import descriptor_pb2
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor.FileDescriptor(
+  name='hello.proto',
+  package='rpipe.support',
+  serialized_pb=_b('\n\x0bhello.proto\x12\rrpipe.support\"x\n\x0c\x43\x61pabilities\x12\x18\n\x10protocol_version\x18\x01 \x02(\r\x12\x10\n\x08\x66\x65\x61tures\x18\x02 \x03(\t\x12\x18\n\x10max_batch_events\x18\x03 \x01(\r\x12\x12\n\nhas_routes\x18\x04 \x01(\x08\x12\x0e\n\x06routes\x18\x05 \x03(\t\"K\n\x05Hello\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x31\n\x0c\x63\x61pabilities\x18\x02 \x02(\x0b\x32\x1b.rpipe.support.Capabilities\"P\n\nHelloReply\x12\x0f\n\x07version\x18\x01 \x02(\r\x12\x31\n\x0c\x63\x61pabilities\x18\x02 \x02(\x0b\x32\x1b.rpipe.support.Capabilities')
+)
+_sym_db.RegisterFileDescriptor(DESCRIPTOR)
+
+
+
+
+_CAPABILITIES = _descriptor.Descriptor(
+  name='Capabilities',
+  full_name='rpipe.support.Capabilities',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='protocol_version', full_name='rpipe.support.Capabilities.protocol_version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='features', full_name='rpipe.support.Capabilities.features', index=1,
+      number=2, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='max_batch_events', full_name='rpipe.support.Capabilities.max_batch_events', index=2,
+      number=3, type=13, cpp_type=3, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='has_routes', full_name='rpipe.support.Capabilities.has_routes', index=3,
+      number=4, type=8, cpp_type=7, label=1,
+      has_default_value=False, default_value=False,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='routes', full_name='rpipe.support.Capabilities.routes', index=4,
+      number=5, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=30,
+  serialized_end=150,
+)
+
+
+_HELLO = _descriptor.Descriptor(
+  name='Hello',
+  full_name='rpipe.support.Hello',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.support.Hello.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='capabilities', full_name='rpipe.support.Hello.capabilities', index=1,
+      number=2, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=152,
+  serialized_end=227,
+)
+
+
+_HELLOREPLY = _descriptor.Descriptor(
+  name='HelloReply',
+  full_name='rpipe.support.HelloReply',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='version', full_name='rpipe.support.HelloReply.version', index=0,
+      number=1, type=13, cpp_type=3, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='capabilities', full_name='rpipe.support.HelloReply.capabilities', index=1,
+      number=2, type=11, cpp_type=10, label=2,
+      has_default_value=False, default_value=None,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=229,
+  serialized_end=309,
+)
+
+_HELLO.fields_by_name['capabilities'].message_type = _CAPABILITIES
+_HELLOREPLY.fields_by_name['capabilities'].message_type = _CAPABILITIES
+DESCRIPTOR.message_types_by_name['Capabilities'] = _CAPABILITIES
+DESCRIPTOR.message_types_by_name['Hello'] = _HELLO
+DESCRIPTOR.message_types_by_name['HelloReply'] = _HELLOREPLY
+
+Capabilities = _reflection.GeneratedProtocolMessageType('Capabilities', (_message.Message,), dict(
+  DESCRIPTOR = _CAPABILITIES,
+  __module__ = 'hello_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.support.Capabilities)
+  ))
+_sym_db.RegisterMessage(Capabilities)
+
+Hello = _reflection.GeneratedProtocolMessageType('Hello', (_message.Message,), dict(
+  DESCRIPTOR = _HELLO,
+  __module__ = 'hello_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.support.Hello)
+  ))
+_sym_db.RegisterMessage(Hello)
+
+HelloReply = _reflection.GeneratedProtocolMessageType('HelloReply', (_message.Message,), dict(
+  DESCRIPTOR = _HELLOREPLY,
+  __module__ = 'hello_pb2'
+  # @@protoc_insertion_point(class_scope:rpipe.support.HelloReply)
+  ))
+_sym_db.RegisterMessage(HelloReply)
+
+
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,43 @@
+"""The entry-point for the additional tunnel acceptor processes. These are 
+launched by the primary server (see rpipe.server.connection.Server) and only 
+accept and serve tunnel connections; the web-tier reaches their clients 
+through their relays.
+"""
+
+import gevent.monkey
+gevent.monkey.patch_all()
+
+import sys
+import os
+import logging
+
+import gevent
+
+import rpipe.config.log
+import rpipe.server.connection
+
+_logger = logging.getLogger(__name__)
+
+_PARENT_CHECK_INTERVAL_S = 5
+
+def _watch_parent(parent_pid):
+    """Don't outlive the primary server. We'll be reparented if it dies."""
+
+    while os.getppid() == parent_pid:
+        gevent.sleep(_PARENT_CHECK_INTERVAL_S)
+
+    _logger.warning("Primary server has gone away. Terminating.")
+    os._exit(1)
+
+def main():
+    acceptor_index = int(sys.argv[1])
+
+    _logger.info("Acceptor process (%d) running.", acceptor_index)
+
+    gevent.spawn(_watch_parent, os.getppid())
+
+    s = rpipe.server.connection.Server(acceptor_index=acceptor_index)
+    s.process_requests()
+
+if __name__ == '__main__':
+    main()
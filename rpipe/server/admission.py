@@ -0,0 +1,200 @@
+"""Turn events away early, while the server is overloaded, so that the ones
+that are let in still get answered in good time. See rpipe.config.web_server
+for the limits.
+"""
+
+import logging
+import contextlib
+import math
+import time
+
+import rpipe.config.statsd
+import rpipe.config.web_server
+
+import rpipe.message_exchange
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+
+class LoadSheddingError(Exception):
+    def __init__(self, ip, reason, retry_after_s):
+        super(LoadSheddingError, self).__init__(
+            "Shedding event for client [%s]: %s" % (ip, reason))
+
+        self.ip = ip
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+class _TunnelState(object):
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.decreased_at = 0
+
+
+class AdmissionController(object):
+    """AIMD on the number of events outstanding for each client: replies that
+    arrive within the target latency raise the limit by about one for each
+    window's worth, and slow replies (or timeouts) cut it, at most once per
+    interval so that one burst of slow replies only counts once.
+    """
+
+    def __init__(self,
+                 max_limit=rpipe.config.web_server.ADMISSION_MAX_LIMIT,
+                 min_limit=rpipe.config.web_server.ADMISSION_MIN_LIMIT,
+                 target_latency_s=\
+                    rpipe.config.web_server.ADMISSION_TARGET_LATENCY_S,
+                 interval_s=rpipe.config.web_server.ADMISSION_INTERVAL_S,
+                 backoff=rpipe.config.web_server.ADMISSION_BACKOFF,
+                 max_queue_depth=\
+                    rpipe.config.web_server.ADMISSION_MAX_QUEUE_DEPTH,
+                 max_in_flight=rpipe.config.web_server.ADMISSION_MAX_IN_FLIGHT):
+        self.__max_limit = max_limit
+        self.__min_limit = min_limit
+        self.__target_latency_s = target_latency_s
+        self.__interval_s = interval_s
+        self.__backoff = backoff
+        self.__max_queue_depth = max_queue_depth
+        self.__max_in_flight = max_in_flight
+
+        self.__tunnels = {}
+        self.__in_flight = 0
+
+        # The clients whose limit is below the maximum.
+        self.__limited = 0
+
+    def __shed(self, ip, reason):
+        _logger.warning("Shedding event for client [%s]: %s", ip, reason)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_SHED_TICK)
+
+        raise LoadSheddingError(
+                ip,
+                reason,
+                max(1, int(math.ceil(self.__interval_s))))
+
+    def __get_tunnel(self, ip):
+        try:
+            return self.__tunnels[ip]
+        except KeyError:
+            ts = _TunnelState(self.__max_limit)
+            self.__tunnels[ip] = ts
+
+            return ts
+
+    def __check(self, ip, ts, queue_depth):
+        if self.__in_flight >= self.__max_in_flight:
+            self.__shed(ip, "too many events in flight (%d)" %
+                            (self.__in_flight,))
+
+        if ts.in_flight >= int(ts.limit):
+            self.__shed(ip, "limit reached (%d)" % (int(ts.limit),))
+
+        if queue_depth is not None and queue_depth >= self.__max_queue_depth:
+            self.__shed(ip, "queue too deep (%d)" % (queue_depth,))
+
+    def __set_limited(self, count):
+        self.__limited = count
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_WEB_LIMITED_GAUGE,
+            count)
+
+    def __adjust(self, ip, ts, latency_s):
+        was_limited = ts.limit < self.__max_limit
+
+        if latency_s is not None and latency_s <= self.__target_latency_s:
+            ts.limit = min(self.__max_limit, ts.limit + 1.0 / ts.limit)
+
+            if was_limited is True and ts.limit >= self.__max_limit:
+                self.__set_limited(self.__limited - 1)
+
+            return
+
+        now = time.time()
+        if now - ts.decreased_at < self.__interval_s:
+            return
+
+        ts.limit = max(self.__min_limit, ts.limit * self.__backoff)
+        ts.decreased_at = now
+
+        _logger.info("Reduced admission limit for client [%s]: (%d)",
+                     ip, int(ts.limit))
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_DECREASE_TICK)
+
+        if was_limited is False and ts.limit < self.__max_limit:
+            self.__set_limited(self.__limited + 1)
+
+    def check(self, ip, queue_depth=None):
+        """Raise LoadSheddingError if an event for the client would be shed,
+        without admitting one. This is for events that don't get a reply, so
+        there's nothing to wait on or measure.
+        """
+
+        if self.__max_limit <= 0:
+            return
+
+        ts = self.__tunnels.get(ip)
+        if ts is None:
+            ts = _TunnelState(self.__max_limit)
+
+        self.__check(ip, ts, queue_depth)
+
+    @contextlib.contextmanager
+    def admit(self, ip, queue_depth=None):
+        """Let the event through, or raise LoadSheddingError. How long the
+        body takes is the latency. A ResponseTimeoutError counts as being too
+        slow, and any other exception isn't counted.
+        """
+
+        if self.__max_limit <= 0:
+            yield
+            return
+
+        ts = self.__get_tunnel(ip)
+        self.__check(ip, ts, queue_depth)
+
+        ts.in_flight += 1
+        self.__in_flight += 1
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_WEB_IN_FLIGHT_GAUGE,
+            self.__in_flight)
+
+        start_at = time.time()
+
+        try:
+            yield
+        except rpipe.message_exchange.ResponseTimeoutError:
+            self.__adjust(ip, ts, None)
+            raise
+        else:
+            self.__adjust(ip, ts, time.time() - start_at)
+        finally:
+            ts.in_flight -= 1
+            self.__in_flight -= 1
+
+            # There's nothing to remember about a tunnel that's idle and at
+            # the full limit.
+            if ts.in_flight == 0 and ts.limit >= self.__max_limit and \
+               self.__tunnels.get(ip) is ts:
+                del self.__tunnels[ip]
+
+    def get_limits(self):
+        """Return the current limit and the events in flight for each client
+        that has any.
+        """
+
+        return dict((ip, (int(ts.limit), ts.in_flight))
+                    for (ip, ts)
+                    in self.__tunnels.items())
+
+_ac = AdmissionController()
+
+def get_admission_controller():
+    return _ac
@@ -0,0 +1,116 @@
+"""Send one event to many clients and gather the replies as they arrive."""
+
+import logging
+import collections
+import time
+
+import gevent
+import gevent.pool
+import gevent.queue
+
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.server.admission
+import rpipe.server.fair_queue
+
+_logger = logging.getLogger(__name__)
+
+ERROR_UNAVAILABLE = 'unavailable'
+ERROR_TIMEOUT = 'timeout'
+ERROR_FAILED = 'failed'
+ERROR_OVERLOADED = 'overloaded'
+
+RESULT_T = collections.namedtuple(
+            'BroadcastResult',
+            ['names', 'ip', 'reply', 'error'])
+
+
+def broadcast(catalog, targets, message_obj, timeout_s, concurrency):
+    """Send the event to each of the (names, IP) targets, no more than
+    `concurrency` at a time, and yield a RESULT_T for each as it finishes. The
+    event is only serialized once. Whatever hasn't finished in `timeout_s` is
+    abandoned and yielded with ERROR_TIMEOUT. Clients whose tunnels are
+    overloaded are skipped with ERROR_OVERLOADED (see rpipe.server.admission).
+    Each send waits its turn with the client's other events (see
+    rpipe.server.fair_queue).
+
+    The IPs must be unique: every copy of the event has the same message-ID,
+    so two sends on the same connection would take each other's reply. The
+    names that resolve to the same IP share its result.
+    """
+
+    assert len(set(ip for (names, ip) in targets)) == len(targets), \
+           "Broadcast targets must have unique IPs."
+
+    stop_at = time.time() + timeout_s
+    serialized = rpipe.protocol.SerializedMessage(message_obj)
+
+    results = gevent.queue.Queue()
+    pool = gevent.pool.Pool(concurrency)
+
+    ac = rpipe.server.admission.get_admission_controller()
+    scheduler = rpipe.server.fair_queue.get_fair_scheduler()
+
+    def send(names, ip):
+        remaining_s = stop_at - time.time()
+        if remaining_s <= 0:
+            results.put(RESULT_T(names, ip, None, ERROR_TIMEOUT))
+            return
+
+        try:
+            c = catalog.find_connection(ip)
+        except KeyError:
+            results.put(RESULT_T(names, ip, None, ERROR_UNAVAILABLE))
+            return
+
+        try:
+            with ac.admit(ip, queue_depth=c.queue_depth), \
+                 scheduler.dispatch(ip, timeout_s=remaining_s):
+                # Waiting for our turn came out of the deadline.
+                remaining_s = stop_at - time.time()
+                if remaining_s <= 0:
+                    raise rpipe.message_exchange.ResponseTimeoutError()
+
+                reply_obj = c.initiate_message(
+                                serialized,
+                                timeout_s=remaining_s)
+        except rpipe.server.admission.LoadSheddingError:
+            results.put(RESULT_T(names, ip, None, ERROR_OVERLOADED))
+        except rpipe.message_exchange.ResponseTimeoutError:
+            results.put(RESULT_T(names, ip, None, ERROR_TIMEOUT))
+        except rpipe.exceptions.RpConnectionClosed:
+            results.put(RESULT_T(names, ip, None, ERROR_UNAVAILABLE))
+        except Exception:
+            _logger.exception("Broadcast to [%s] failed.", ip)
+            results.put(RESULT_T(names, ip, None, ERROR_FAILED))
+        else:
+            results.put(RESULT_T(names, ip, reply_obj, None))
+
+    def spawn_all():
+        # This blocks whenever the pool is full.
+        for (names, ip) in targets:
+            pool.spawn(send, names, ip)
+
+    spawner_g = gevent.spawn(spawn_all)
+    finished = set()
+
+    try:
+        while len(finished) < len(targets):
+            remaining_s = stop_at - time.time()
+
+            try:
+                result = results.get(timeout=max(0, remaining_s))
+            except gevent.queue.Empty:
+                break
+
+            finished.add(result.ip)
+            yield result
+    finally:
+        # Anything still waiting is told to stop.
+        spawner_g.kill()
+        pool.kill()
+
+    for (names, ip) in targets:
+        if ip not in finished:
+            yield RESULT_T(names, ip, None, ERROR_TIMEOUT)
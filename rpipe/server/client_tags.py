@@ -0,0 +1,22 @@
+import rpipe.config.server
+
+
+class ClientTagResolver(object):
+    def lookup(self, tag):
+        """Return the hostnames (or IPs) of the clients with the given tag. 
+        Raise LookupError if the tag isn't known.
+        """
+
+        raise NotImplementedError()
+
+
+class ClientTagResolverConfig(ClientTagResolver):
+    """Tags are configured as a dictionary of lists of hostnames (CLIENT_TAGS, 
+    usually set from the user-config module).
+    """
+
+    def lookup(self, tag):
+        try:
+            return rpipe.config.server.CLIENT_TAGS[tag]
+        except KeyError:
+            raise LookupError("Tag [%s] not known." % (tag,))
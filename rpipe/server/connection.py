@@ -5,18 +5,29 @@ import os.path
 import time
 import socket
 import datetime
+import sys
 
 import gevent
-import gevent.server
-import gevent.ssl
+import gevent.event
+import gevent.subprocess
 
+import rpipe.config.protocol
 import rpipe.config.server
+import rpipe.config.statsd
 import rpipe.server.exceptions
 import rpipe.utility
+import rpipe.capabilities
 import rpipe.protocol
+import rpipe.protocols
 import rpipe.connection
 import rpipe.request_server
 import rpipe.message_loop
+import rpipe.message_exchange
+import rpipe.transport
+import rpipe.server.shared_catalog
+import rpipe.server.outbox
+import rpipe.server.response_cache
+import rpipe.stats
 
 _logger = logging.getLogger(__name__)
 
@@ -68,8 +79,24 @@ class _ConnectionCatalog(object):
         self.__monitor_running = False
         self.__monitor_g = None
 
+        # Used to measure how long it takes for the clients to come back after 
+        # a mass disconnect.
+        self.__peak_count = 0
+        self.__recovering_since = None
+
+        # Set when we're one of several acceptor processes.
+        self.__shared_view = None
+
+        # The traffic of each connection, as of when we last posted it.
+        self.__reported_traffic = {}
+
         self.__start_monitor()
 
+        gevent.spawn(self.__traffic_monitor)
+
+    def set_shared_view(self, shared_view):
+        self.__shared_view = shared_view
+
     def __start_monitor(self):
         assert self.__monitor_running is False, \
                "The monitor is already running."
@@ -104,6 +131,74 @@ class _ConnectionCatalog(object):
 
             gevent.sleep(60)
 
+    def __post_traffic(self, c):
+        (last_read, last_written) = self.__reported_traffic.get(c, (0, 0))
+        (bytes_read, bytes_written) = (c.bytes_read, c.bytes_written)
+
+        self.__reported_traffic[c] = (bytes_read, bytes_written)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_BYTES_READ_TICK,
+            bytes_read - last_read)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_BYTES_WRITTEN_TICK,
+            bytes_written - last_written)
+
+        replacements = { 'ip': c.ip.replace('.', '_') }
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.\
+                EVENT_CONNECTION_SERVER_CLIENT_BYTES_READ_GAUGE_TEMPLATE % 
+                    replacements,
+            bytes_read)
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.\
+                EVENT_CONNECTION_SERVER_CLIENT_BYTES_WRITTEN_GAUGE_TEMPLATE % 
+                    replacements,
+            bytes_written)
+
+    def __traffic_monitor(self):
+        while 1:
+            gevent.sleep(rpipe.config.server.TRAFFIC_REPORT_INTERVAL_S)
+
+            for c in list(self.__connections):
+                self.__post_traffic(c)
+
+    def get_traffic(self):
+        """Return the bytes read from and written to each client that this 
+        process holds, as (read, written), by IP.
+        """
+
+        return dict((c.ip, (c.bytes_read, c.bytes_written))
+                    for c
+                    in self.__connections)
+
+    def __post_count(self):
+        count = len(self.__connections)
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_COUNT_GAUGE,
+            count)
+
+        if count >= self.__peak_count:
+            if self.__recovering_since is not None:
+                recovery_s = time.time() - self.__recovering_since
+                _logger.info("Connections recovered to (%d) after (%.1f) "
+                             "seconds.", count, recovery_s)
+
+                rpipe.stats.post_timing(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_SERVER_RECOVERY_TIMING,
+                    recovery_s)
+
+                self.__recovering_since = None
+
+            self.__peak_count = count
+        elif self.__recovering_since is None:
+            self.__recovering_since = time.time()
+
     def register(self, c):
         # A client might've disconnected and reconnected, and we'll very likely 
         # not notice the broken connection before receiving the new one. 
@@ -133,6 +228,16 @@ class _ConnectionCatalog(object):
                              "not've been deregistered [properly]: %s" % 
                              (c.ip))
 
+        if self.__shared_view is not None:
+            try:
+                self.__shared_view.claim(c.ip)
+            except ValueError:
+                _logger.error("The incoming connection is held by another "
+                              "acceptor and will be closed: [%s]", c)
+
+                c.close()
+                raise
+
         _logger.debug("Registering client: [%s]", c.ip)
 
         # These are actually indexed by address (so we can find it either 
@@ -141,8 +246,13 @@ class _ConnectionCatalog(object):
 
         self.__stop_monitor()
 
+        self.__post_count()
         self.__server_events.connection_added(c.ip, len(self.__connections))
 
+        ob = rpipe.server.outbox.get_outbox()
+        if ob.is_enabled is True:
+            gevent.spawn(ob.deliver, c)
+
     def deregister(self, c):
         if c not in self.__connections:
             raise ValueError("Can not deregister unregistered connection: %s" %
@@ -151,14 +261,54 @@ class _ConnectionCatalog(object):
         _logger.debug("Deregistering client: [%s]", c.ip)
         del self.__connections[c]
 
+        _logger.info("Client [%s] disconnected after reading (%d) and "
+                     "writing (%d) bytes.", c.ip, c.bytes_read, 
+                     c.bytes_written)
+
+        self.__post_traffic(c)
+        del self.__reported_traffic[c]
+
+        if self.__shared_view is not None:
+            self.__shared_view.release(c.ip)
+
+        self.__post_count()
         self.__server_events.connection_removed(c.ip, len(self.__connections))
 
         if not self.__connections:
             self.__start_monitor()
 
     def get_connection_by_ip(self, ip):
+        """Return a connection that this process holds."""
+
         return self.__connections[ip]
 
+    def find_connection(self, ip):
+        """Return the connection for the client, whichever acceptor holds it. 
+        Raise KeyError if it's not connected.
+        """
+
+        try:
+            return self.__connections[ip]
+        except KeyError:
+            pass
+
+        if self.__shared_view is not None:
+            c = self.__shared_view.lookup(ip)
+            if c is not None:
+                return c
+
+        raise KeyError(ip)
+
+    def get_ips(self):
+        """Return the IPs of all connected clients."""
+
+        ips = set(c.ip for c in self.__connections)
+
+        if self.__shared_view is not None:
+            ips.update(self.__shared_view.list_ips())
+
+        return sorted(ips)
+
     def wait_for_connection(
             self, 
             ip, 
@@ -172,7 +322,7 @@ class _ConnectionCatalog(object):
         stop_at = time.time() + timeout_s
         while time.time() <= stop_at:
             try:
-                return self.__connections[ip]
+                return self.find_connection(ip)
             except KeyError:
                 pass
 
@@ -180,6 +330,26 @@ class _ConnectionCatalog(object):
 
         raise rpipe.server.exceptions.RpNoConnectionException(ip)
 
+    def invalidate_cached_responses(self, ip, message_obj):
+        """The client has told us that its data has changed. The 
+        response-cache is kept by the web-tier, which runs alongside the first 
+        acceptor.
+        """
+
+        if self.__shared_view is not None and \
+           self.__shared_view.acceptor_index != 0:
+            self.__shared_view.notify(0, ip, message_obj)
+            return
+
+        rc = rpipe.server.response_cache.get_response_cache()
+        rc.invalidate(ip, noun=message_obj.noun or None)
+
+    def publish_capabilities(self, ip, capabilities_obj):
+        """Let the other acceptors know what the client can do."""
+
+        if self.__shared_view is not None:
+            self.__shared_view.publish_capabilities(ip, capabilities_obj)
+
 
 class _ServerConnectionHandler(rpipe.connection.Connection):
     """Represents a single client connection."""
@@ -189,6 +359,9 @@ class _ServerConnectionHandler(rpipe.connection.Connection):
 
         self.__ws = None
         self.__address = None
+        self.__eh = None
+        self.__peer = rpipe.capabilities.UNKNOWN
+        self.__hello_e = gevent.event.Event()
 
     def __hash__(self):
         if self.ip is None:
@@ -205,13 +378,26 @@ class _ServerConnectionHandler(rpipe.connection.Connection):
     def close(self):
         self.__ws.close()
 
-    def handle_new_connection(self, socket, address):
+    def handle_new_connection(self, ws, address):
         """We've received a new connection."""
 
-        self.__ws = rpipe.protocol.SocketWrapper(socket, socket.makefile())
+        self.__ws = ws
         self.__address = address
         self.__ctx = rpipe.message_loop.CONNECTION_CONTEXT_T(self.__address)
 
+        rate_bps = rpipe.config.server.BANDWIDTH_LIMITS_BPS.get(
+                    self.ip, 
+                    rpipe.config.server.DEFAULT_BANDWIDTH_LIMIT_BPS)
+
+        if rate_bps > 0:
+            _logger.info("Capping writes to [%s] at (%d) B/s.", self.ip, 
+                         rate_bps)
+
+            ws.set_shaper(
+                rpipe.transport.BandwidthShaper(
+                    rate_bps, 
+                    rpipe.config.server.BANDWIDTH_BURST_BYTES))
+
         get_connection_catalog().register(self)
 
         event_handler_cls = rpipe.utility.load_cls_from_string(
@@ -233,16 +419,26 @@ class _ServerConnectionHandler(rpipe.connection.Connection):
         get_connection_catalog().deregister(self)
 
     def handle(self, event_handler):
+        self.__eh = event_handler
+
+        message_handlers = {
+            rpipe.protocols.MT_CACHE_INVALIDATE: 
+                self.__handle_cache_invalidate,
+            rpipe.protocols.MT_HELLO: 
+                self.__handle_hello,
+        }
+
         cml = rpipe.message_loop.CommonMessageLoop(
                 self.__ws, 
                 event_handler, 
                 self.__ctx, 
-                watch_heartbeats=True)
+                watch_heartbeats=True,
+                message_handlers=message_handlers)
 
         _logger.debug("Common message-loop running.")
 
         try:
-            cml.handle(exit_on_unknown=True)
+            cml.handle()
         except:
             _logger.exception("There was a problem while handling a request.")
             raise
@@ -251,15 +447,87 @@ class _ServerConnectionHandler(rpipe.connection.Connection):
 
             _logger.warning("Common message-loop ended.")
 
-    def initiate_message(self, message_obj, **kwargs):
+    def __handle_cache_invalidate(self, message_id, message_obj):
+        get_connection_catalog().invalidate_cached_responses(
+            self.ip, 
+            message_obj)
+
+    def __handle_hello(self, message_id, message_obj):
+        self.__peer = rpipe.capabilities.get_peer_capabilities(
+                        message_obj.capabilities)
+
+        _logger.info("Client [%s] said hello: %s", self.ip, self.__peer)
+
+        rpipe.message_exchange.set_frame_version(
+            self.__address, 
+            self.__peer.frame_version)
+
+        rpipe.message_exchange.set_can_cancel(
+            self.__address, 
+            self.__peer.supports(rpipe.config.protocol.FEATURE_CANCEL))
+
+        get_connection_catalog().publish_capabilities(
+            self.ip, 
+            message_obj.capabilities)
+
+        reply_message_obj = rpipe.capabilities.build_hello(
+                                rpipe.protocols.MT_HELLO_R, 
+                                self.__eh)
+
+        rpipe.message_exchange.send(
+            self.__address, 
+            reply_message_obj, 
+            reply_to_message_id=message_id,
+            expect_response=False)
+
+        self.__hello_e.set()
+
+    def wait_for_hello(self, timeout_s=None):
+        """Wait for the client to tell us what it can do. Older clients never 
+        do, so give up after the timeout and assume the least.
+        """
+
+        self.__hello_e.wait(timeout_s)
+
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None, 
+                         **kwargs):
         # This only works because the CommonMessageLoop has already registered 
         # the other participant with the MessageExchange.
-        return rpipe.message_exchange.send_and_receive(self.__address, message_obj)
+        return rpipe.message_exchange.send_and_receive(
+                self.__address, 
+                message_obj, 
+                timeout_s=timeout_s,
+                chunks=chunks)
+
+    def send_message(self, message_obj):
+        rpipe.message_exchange.send(
+            self.__address, 
+            message_obj, 
+            expect_response=False)
 
     @property
     def socket(self):
         return self.__ws
 
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
+    @property
+    def bytes_read(self):
+        return self.__ws.bytes_read
+
+    @property
+    def bytes_written(self):
+        return self.__ws.bytes_written
+
+    @property
+    def queue_depth(self):
+        try:
+            return rpipe.message_exchange.get_queue_depth(self.__address)
+        except KeyError:
+            return None
+
     @property
     def address(self):
         return self.__address
@@ -274,36 +542,144 @@ def get_connection_catalog():
     return _cc
 
 
+def get_transport_and_binding():
+    """Build the configured transport and the binding to listen on with it.
+    """
+
+    name = rpipe.config.server.TRANSPORT
+
+    if name == rpipe.transport.TRANSPORT_TLS:
+        transport = rpipe.transport.TlsTcpTransport(
+                        rpipe.config.server.KEY_FILEPATH,
+                        rpipe.config.server.CRT_FILEPATH,
+                        ca_certs=rpipe.config.server.CA_CRT_FILEPATH,
+                        admission_preamble=\
+                            rpipe.config.server.ADMISSION_PREAMBLE,
+                        max_concurrent_handshakes=\
+                            rpipe.config.server.MAX_CONCURRENT_HANDSHAKES,
+                        handshake_retry_after_s=\
+                            rpipe.config.server.HANDSHAKE_RETRY_AFTER_S,
+                        handshake_timeout_s=\
+                            rpipe.config.server.HANDSHAKE_TIMEOUT_S,
+                        reuse_port=\
+                            rpipe.config.server.ACCEPTOR_PROCESSES > 1)
+
+        binding = (rpipe.config.server.BIND_IP, 
+                   rpipe.config.server.BIND_PORT)
+    elif name == rpipe.transport.TRANSPORT_UNIX:
+        transport = rpipe.transport.UnixTransport()
+        binding = rpipe.config.server.UNIX_SOCKET_PATH
+    elif name == rpipe.transport.TRANSPORT_MEMORY:
+        transport = rpipe.transport.get_memory_transport()
+        binding = rpipe.transport.DEFAULT_MEMORY_BINDING
+    else:
+        raise ValueError("Transport not valid: [%s]" % (name,))
+
+    return (transport, binding)
+
+
 class Server(rpipe.request_server.RequestServer):
     """Wait for incoming client-connections. This is forked at the top of the 
     application.
+
+    If more than one acceptor process is configured, the first one (index 
+    zero) launches and supervises the others.
     """
 
-    def __init__(self):
+    def __init__(self, transport=None, binding=None, acceptor_index=0, 
+                 acceptor_count=rpipe.config.server.ACCEPTOR_PROCESSES):
         self.__g = None
+        self.__acceptor_gs = []
+        self.__relay = None
+
+        if transport is None:
+            (transport, binding) = get_transport_and_binding()
+        elif acceptor_count > 1:
+            raise ValueError("Multiple acceptors are only supported with the "
+                             "configured transport.")
+
+        if acceptor_count > 1 and \
+           rpipe.config.server.TRANSPORT != rpipe.transport.TRANSPORT_TLS:
+            raise ValueError("Multiple acceptors are only supported with the "
+                             "TLS transport.")
+
+        self.__transport = transport
+        self.__binding = binding
+        self.__acceptor_index = acceptor_index
+        self.__acceptor_count = acceptor_count
 
     def start(self):
+        if self.__acceptor_index == 0:
+            for i in range(1, self.__acceptor_count):
+                g = gevent.spawn(self.__supervise_acceptor, i)
+                self.__acceptor_gs.append(g)
+
         self.__g = gevent.spawn(self.process_requests)
 
     def stop(self):
+        for g in self.__acceptor_gs:
+            g.kill()
+
+        if self.__relay is not None:
+            self.__relay.stop()
+
         self.__g.kill()
         self.__g.join()
 
-    def process_requests(self):
-        binding = (rpipe.config.server.BIND_IP, 
-                   rpipe.config.server.BIND_PORT)
+    def __supervise_acceptor(self, acceptor_index):
+        """Run another acceptor process, and restart it if it dies."""
+
+        cmd = [sys.executable, '-m', 'rpipe.server.acceptor', 
+               str(acceptor_index)]
 
-        _logger.info("Running server: %s", binding)
+        while 1:
+            _logger.info("Starting acceptor process (%d).", acceptor_index)
 
+            p = gevent.subprocess.Popen(cmd)
+
+            try:
+                r = p.wait()
+            except gevent.GreenletExit:
+                p.terminate()
+                raise
+
+            _logger.error("Acceptor process (%d) exited with (%d). "
+                          "Restarting.", acceptor_index, r)
+
+            gevent.sleep(rpipe.config.server.ACCEPTOR_RESTART_WAIT_S)
+
+    def __handle_new_connection(self, ws, address):
+        # Every connection needs its own handler since the handler carries the 
+        # state for that connection.
         handler = _ServerConnectionHandler()
+        handler.handle_new_connection(ws, address)
+
+    def process_requests(self):
+        _logger.info("Running server: %s", self.__binding)
+
+        if self.__acceptor_count > 1:
+            cc = get_connection_catalog()
+
+            view = rpipe.server.shared_catalog.SharedCatalogView(
+                    self.__acceptor_index)
+
+            cc.set_shared_view(view)
+
+            message_handlers = {
+                rpipe.protocols.MT_CACHE_INVALIDATE: 
+                    cc.invalidate_cached_responses,
+            }
+
+            self.__relay = rpipe.server.shared_catalog.Relay(
+                            cc, 
+                            view.relay_path,
+                            message_handlers=message_handlers)
+
+            gevent.spawn(self.__relay.serve_forever)
 
-        server = gevent.server.StreamServer(
-                    binding, 
-                    handler.handle_new_connection, 
-                    cert_reqs=gevent.ssl.CERT_REQUIRED,
-                    keyfile=rpipe.config.server.KEY_FILEPATH,
-                    certfile=rpipe.config.server.CRT_FILEPATH,
-                    ca_certs=rpipe.config.server.CA_CRT_FILEPATH)
+        server = self.__transport.create_server(
+                    self.__binding, 
+                    self.__handle_new_connection)
 
         # Wait until termination. Generally, we should already be running in 
         # its own gthread. 
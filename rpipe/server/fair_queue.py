@@ -0,0 +1,174 @@
+"""Share the events that we can have in flight fairly between clients, so that
+a burst for one client doesn't hold up everyone else's. See
+rpipe.config.web_server for the weights.
+"""
+
+import logging
+import collections
+import contextlib
+import time
+
+import gevent.event
+
+import rpipe.config.statsd
+import rpipe.config.web_server
+
+import rpipe.message_exchange
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+
+class _Waiter(object):
+    def __init__(self, cost):
+        self.cost = cost
+        self.e = gevent.event.Event()
+        self.queued_at = time.time()
+        self.is_granted = False
+
+
+class FairScheduler(object):
+    """Deficit round-robin over a queue for each client. Whenever a slot is
+    free, the client at the head of the rotation is credited with the quantum
+    (scaled by its weight) and is served for as long as its credit covers the
+    cost of its next event. Then it goes to the back. A client that has
+    nothing queued keeps no credit.
+
+    Waits are posted for each client only if it has its own weight, so that
+    there's a bounded number of series.
+    """
+
+    def __init__(self,
+                 slots=rpipe.config.web_server.FAIR_QUEUE_SLOTS,
+                 quantum=rpipe.config.web_server.FAIR_QUEUE_QUANTUM,
+                 weights=rpipe.config.web_server.CLIENT_WEIGHTS):
+        self.__slots = slots
+        self.__free = slots
+        self.__quantum = quantum
+        self.__weights = weights
+
+        # The rotation: the client at the front is served next.
+        self.__queues = collections.OrderedDict()
+        self.__deficits = {}
+        self.__credited = set()
+
+    def __get_weight(self, ip):
+        weight = self.__weights.get(
+                    ip,
+                    rpipe.config.web_server.DEFAULT_CLIENT_WEIGHT)
+
+        assert weight > 0, "Weight for client [%s] must be positive." % (ip,)
+
+        return weight
+
+    def __forget(self, ip):
+        del self.__queues[ip]
+        del self.__deficits[ip]
+        self.__credited.discard(ip)
+
+    def __grant(self, ip, w):
+        self.__free -= 1
+        w.is_granted = True
+        w.e.set()
+
+        wait_s = time.time() - w.queued_at
+
+        rpipe.stats.post_timing(
+            rpipe.config.statsd.EVENT_SERVER_WEB_FAIR_QUEUE_WAIT_TIMING,
+            wait_s)
+
+        if ip in self.__weights:
+            rpipe.stats.post_timing(
+                rpipe.config.statsd.EVENT_SERVER_WEB_FAIR_QUEUE_CLIENT_WAIT_TIMING_TEMPLATE % {
+                    'ip': ip.replace('.', '_'),
+                },
+                wait_s)
+
+    def __dispatch(self):
+        while self.__free > 0 and self.__queues:
+            (ip, q) = next(iter(self.__queues.items()))
+
+            if ip not in self.__credited:
+                self.__deficits[ip] += self.__quantum * self.__get_weight(ip)
+                self.__credited.add(ip)
+
+            if self.__deficits[ip] < q[0].cost:
+                # Its turn is over. Move it to the back.
+                self.__queues[ip] = self.__queues.pop(ip)
+                self.__credited.discard(ip)
+                continue
+
+            w = q.popleft()
+            self.__deficits[ip] -= w.cost
+            self.__grant(ip, w)
+
+            if not q:
+                self.__forget(ip)
+
+    def __release(self):
+        self.__free += 1
+        self.__dispatch()
+
+    def __wait(self, ip, cost, timeout_s):
+        w = _Waiter(cost)
+
+        try:
+            q = self.__queues[ip]
+        except KeyError:
+            q = collections.deque()
+            self.__queues[ip] = q
+            self.__deficits[ip] = 0
+
+        q.append(w)
+
+        try:
+            w.e.wait(timeout_s)
+        except:
+            # Killed (e.g. the caller went away), maybe just after our turn 
+            # came.
+            if w.is_granted is True:
+                self.__release()
+            else:
+                self.__withdraw(ip, q, w)
+
+            raise
+
+        if w.is_granted is False:
+            self.__withdraw(ip, q, w)
+            raise rpipe.message_exchange.ResponseTimeoutError()
+
+    def __withdraw(self, ip, q, w):
+        q.remove(w)
+        if not q and self.__queues.get(ip) is q:
+            self.__forget(ip)
+
+    @contextlib.contextmanager
+    def dispatch(self, ip, cost=1, timeout_s=None):
+        """Wait for our turn to send `cost` events to the client, and hold a
+        slot until we're done. Raise ResponseTimeoutError if our turn doesn't
+        come in `timeout_s`.
+        """
+
+        if self.__slots <= 0:
+            yield
+            return
+
+        if self.__free > 0 and not self.__queues:
+            self.__free -= 1
+        else:
+            self.__wait(ip, cost, timeout_s)
+
+        try:
+            yield
+        finally:
+            self.__release()
+
+    def get_queue_lengths(self):
+        """Return the number of events waiting for each client."""
+
+        return dict((ip, len(q)) for (ip, q) in self.__queues.items())
+
+_fs = FairScheduler()
+
+def get_fair_scheduler():
+    return _fs
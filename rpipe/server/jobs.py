@@ -0,0 +1,109 @@
+"""Run events in the background for callers that would rather poll for the
+result than wait on it.
+"""
+
+import logging
+import collections
+import time
+import uuid
+
+import gevent
+import gevent.event
+
+import rpipe.config.web_server
+
+_logger = logging.getLogger(__name__)
+
+
+class JobTableFullError(Exception):
+    pass
+
+
+class _Job(object):
+    def __init__(self):
+        self.result = gevent.event.AsyncResult()
+        self.finished_at = None
+
+
+class JobTable(object):
+    """A bounded table of jobs. Finished jobs are kept for `result_ttl_s`, or
+    until the room is needed for new ones. Jobs that are still running are
+    never dropped (the events have deadlines, so they'll finish).
+    """
+
+    def __init__(self,
+                 max_entries=rpipe.config.web_server.JOB_TABLE_MAX_ENTRIES,
+                 result_ttl_s=rpipe.config.web_server.JOB_RESULT_TTL_S):
+        self.__max_entries = max_entries
+        self.__result_ttl_s = result_ttl_s
+        self.__jobs = collections.OrderedDict()
+
+    def __prune(self):
+        expired_at = time.time() - self.__result_ttl_s
+
+        # The oldest jobs are first, so we can stop at the first one that's
+        # still of use.
+        for (job_id, job) in list(self.__jobs.items()):
+            if job.finished_at is None or job.finished_at > expired_at:
+                break
+
+            del self.__jobs[job_id]
+
+        if len(self.__jobs) < self.__max_entries:
+            return
+
+        for (job_id, job) in list(self.__jobs.items()):
+            if job.finished_at is not None:
+                _logger.warning("Job table is full. Dropping unclaimed "
+                                "result: [%s]", job_id)
+
+                del self.__jobs[job_id]
+                return
+
+    def start(self, fn):
+        """Run `fn()` in the background and return the ID of the job. Raise
+        JobTableFullError if there are already too many jobs running.
+        """
+
+        self.__prune()
+
+        if len(self.__jobs) >= self.__max_entries:
+            raise JobTableFullError()
+
+        job_id = uuid.uuid4().hex
+        job = _Job()
+
+        def run():
+            try:
+                job.result.set(fn())
+            except Exception as e:
+                job.result.set_exception(e)
+            finally:
+                job.finished_at = time.time()
+
+        self.__jobs[job_id] = job
+        gevent.spawn(run)
+
+        _logger.debug("Job started: [%s]", job_id)
+
+        return job_id
+
+    def wait(self, job_id, timeout_s=0):
+        """Wait up to `timeout_s` for the job to finish, and return its
+        AsyncResult (which might not be ready yet). Raise KeyError if the job
+        isn't known (or has been forgotten).
+        """
+
+        result = self.__jobs[job_id].result
+        result.wait(timeout_s)
+
+        return result
+
+    @property
+    def count(self):
+        return len(self.__jobs)
+
+_jt = JobTable()
+
+def get_job_table():
+    return _jt
@@ -0,0 +1,428 @@
+"""Keep fire-and-forget events for clients that aren't connected, on disk, and
+deliver them when the client comes back. See rpipe.config.server for the
+limits.
+
+The file can be shared by several acceptor processes. Running totals (the
+number of events and bytes for each client) are kept in their own table so
+that the limits can be checked without scanning the events, and a delivery
+claims a client's events in the database so that no two processes send them
+at once. SQLite blocks, so every call runs on a worker thread rather than on
+the hub.
+"""
+
+import logging
+import sqlite3
+import time
+import uuid
+
+import gevent.threadpool
+
+import rpipe.config.protocol
+import rpipe.config.server
+import rpipe.config.statsd
+
+import rpipe.event
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.server.exceptions
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ip TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    verb TEXT NOT NULL,
+    noun TEXT NOT NULL,
+    mimetype TEXT,
+    data BLOB NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+
+CREATE INDEX IF NOT EXISTS events_ip ON events (ip, event_id);
+CREATE INDEX IF NOT EXISTS events_queued_at ON events (queued_at);
+CREATE INDEX IF NOT EXISTS events_claimed_by ON events (claimed_by);
+
+CREATE TABLE IF NOT EXISTS clients (
+    ip TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+"""
+
+
+class OutboxFullError(rpipe.server.exceptions.RpServerException):
+    pass
+
+
+class DurableOutbox(object):
+    """An SQLite table of events, by client IP. Every event gets an
+    idempotency-key when it's queued, so if a delivery is interrupted after
+    the client has handled some of it, sending it again does no harm.
+    """
+
+    def __init__(self,
+                 filepath=rpipe.config.server.OUTBOX_FILEPATH,
+                 retention_s=rpipe.config.server.OUTBOX_RETENTION_S,
+                 max_events_per_client=\
+                    rpipe.config.server.OUTBOX_MAX_EVENTS_PER_CLIENT,
+                 max_bytes=rpipe.config.server.OUTBOX_MAX_BYTES,
+                 batch_size=rpipe.config.server.OUTBOX_DELIVERY_BATCH_SIZE,
+                 claim_timeout_s=rpipe.config.server.OUTBOX_CLAIM_TIMEOUT_S,
+                 prune_interval_s=\
+                    rpipe.config.server.OUTBOX_PRUNE_INTERVAL_S):
+        self.__filepath = filepath
+        self.__retention_s = retention_s
+        self.__max_events_per_client = max_events_per_client
+        self.__max_bytes = max_bytes
+        self.__batch_size = batch_size
+        self.__claim_timeout_s = claim_timeout_s
+        self.__prune_interval_s = prune_interval_s
+
+        self.__db = None
+        self.__pruned_at = 0
+
+        # One thread, so that the connection is only ever used by one at a
+        # time.
+        self.__pool = None
+
+    @property
+    def is_enabled(self):
+        return self.__filepath != ''
+
+    def __run(self, fn, *args):
+        if self.__pool is None:
+            self.__pool = gevent.threadpool.ThreadPool(1)
+
+        return self.__pool.apply(fn, args)
+
+    def __get_db(self):
+        if self.__db is None:
+            _logger.info("Opening outbox: [%s]", self.__filepath)
+
+            # Autocommit. Each statement is its own transaction, unless we
+            # start one. We only use it from our thread, but not the one that
+            # opened it.
+            self.__db = sqlite3.connect(
+                            self.__filepath,
+                            isolation_level=None,
+                            check_same_thread=False)
+
+            self.__db.executescript(_SCHEMA)
+
+        return self.__db
+
+    def __transact(self, fn, *args):
+        """Run `fn(db, *args)` in a transaction (on our thread). Other
+        processes wait for it to finish.
+        """
+
+        def run():
+            db = self.__get_db()
+            db.execute("BEGIN IMMEDIATE")
+
+            try:
+                result = fn(db, *args)
+            except:
+                db.execute("ROLLBACK")
+                raise
+
+            db.execute("COMMIT")
+            return result
+
+        return self.__run(run)
+
+    def __subtract(self, db, ip, depth, bytes_):
+        db.execute(
+            "UPDATE clients SET depth = depth - ?, bytes = bytes - ? "
+            "WHERE ip = ?",
+            (depth, bytes_, ip))
+
+        db.execute("DELETE FROM clients WHERE ip = ? AND depth <= 0", (ip,))
+
+    def __prune(self, db, now):
+        """Drop the events that have been waiting too long. Return how many
+        there were.
+        """
+
+        expires_at = now - self.__retention_s
+
+        rows = db.execute(
+                "SELECT ip, COUNT(*), SUM(LENGTH(data)) FROM events "
+                "WHERE queued_at < ? GROUP BY ip",
+                (expires_at,)).fetchall()
+
+        if not rows:
+            return 0
+
+        db.execute("DELETE FROM events WHERE queued_at < ?", (expires_at,))
+
+        for (ip, depth, bytes_) in rows:
+            self.__subtract(db, ip, depth, bytes_)
+
+        return sum(depth for (ip, depth, bytes_) in rows)
+
+    def __maybe_prune(self):
+        now = time.time()
+        if now - self.__pruned_at < self.__prune_interval_s:
+            return
+
+        self.__pruned_at = now
+
+        count = self.__transact(self.__prune, now)
+        if count > 0:
+            _logger.warning("Dropped (%d) outbox events that were never "
+                            "delivered.", count)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_OUTBOX_EXPIRED_TICK,
+                count)
+
+    def __get_totals(self, db):
+        """Return (clients, events, bytes) for the whole outbox."""
+
+        return db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(depth), 0), "
+                "COALESCE(SUM(bytes), 0) FROM clients").fetchone()
+
+    def __post_totals(self, totals):
+        (clients, depth, bytes_) = totals
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_OUTBOX_CLIENTS_GAUGE,
+            clients)
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_OUTBOX_DEPTH_GAUGE,
+            depth)
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_OUTBOX_BYTES_GAUGE,
+            bytes_)
+
+    def __insert(self, db, ip, verb, noun, data, mimetype, idempotency_key):
+        """Return the new totals, or None if there's no room."""
+
+        row = db.execute(
+                "SELECT depth FROM clients WHERE ip = ?",
+                (ip,)).fetchone()
+
+        client_depth = row[0] if row is not None else 0
+
+        (clients, depth, bytes_) = self.__get_totals(db)
+
+        if client_depth >= self.__max_events_per_client or \
+           bytes_ + len(data) > self.__max_bytes:
+            return None
+
+        db.execute(
+            "INSERT INTO events "
+            "(ip, queued_at, verb, noun, mimetype, data, idempotency_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (ip, time.time(), verb, noun, mimetype, sqlite3.Binary(data),
+             idempotency_key))
+
+        if row is None:
+            db.execute(
+                "INSERT INTO clients (ip, depth, bytes) VALUES (?, 1, ?)",
+                (ip, len(data)))
+
+            clients += 1
+        else:
+            db.execute(
+                "UPDATE clients SET depth = depth + 1, bytes = bytes + ? "
+                "WHERE ip = ?",
+                (len(data), ip))
+
+        return (clients, depth + 1, bytes_ + len(data))
+
+    def put(self, ip, verb, noun, data, mimetype=None, idempotency_key=None):
+        """Queue the event for the client. Raise OutboxFullError if it's over
+        either limit.
+        """
+
+        self.__maybe_prune()
+
+        data = rpipe.event_handling.encode_data(data)
+
+        if idempotency_key is None:
+            idempotency_key = uuid.uuid4().hex
+
+        totals = self.__transact(
+                    self.__insert,
+                    ip,
+                    verb,
+                    noun,
+                    data,
+                    mimetype,
+                    idempotency_key)
+
+        if totals is None:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_OUTBOX_REJECT_TICK)
+
+            raise OutboxFullError("Outbox is full for client: [%s]" % (ip,))
+
+        _logger.info("Queued event for client [%s]: [%s] [%s]",
+                     ip, verb, noun)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_OUTBOX_QUEUED_TICK)
+
+        self.__post_totals(totals)
+
+    def get_depth(self, ip):
+        """Return the number of events waiting for the client."""
+
+        def get(db):
+            row = db.execute(
+                    "SELECT depth FROM clients WHERE ip = ?",
+                    (ip,)).fetchone()
+
+            return row[0] if row is not None else 0
+
+        return self.__run(lambda: get(self.__get_db()))
+
+    def __claim(self, db, ip, claim_id, batch_size):
+        """Claim the client's oldest events, and return them. Return nothing
+        if another delivery still holds a claim on any of them (they have to
+        go in order).
+        """
+
+        now = time.time()
+
+        row = db.execute(
+                "SELECT 1 FROM events WHERE ip = ? AND claimed_by IS NOT NULL "
+                "AND claimed_by != ? AND claimed_at >= ? LIMIT 1",
+                (ip, claim_id, now - self.__claim_timeout_s)).fetchone()
+
+        if row is not None:
+            return []
+
+        db.execute(
+            "UPDATE events SET claimed_by = ?, claimed_at = ? "
+            "WHERE event_id IN (SELECT event_id FROM events WHERE ip = ? "
+            "ORDER BY event_id LIMIT ?)",
+            (claim_id, now, ip, batch_size))
+
+        return db.execute(
+                "SELECT event_id, verb, noun, mimetype, data, "
+                "idempotency_key FROM events WHERE claimed_by = ? "
+                "ORDER BY event_id",
+                (claim_id,)).fetchall()
+
+    def __remove_claimed(self, db, ip, claim_id):
+        (depth, bytes_) = db.execute(
+                            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) "
+                            "FROM events WHERE claimed_by = ?",
+                            (claim_id,)).fetchone()
+
+        db.execute("DELETE FROM events WHERE claimed_by = ?", (claim_id,))
+        self.__subtract(db, ip, depth, bytes_)
+
+        return self.__get_totals(db)
+
+    def __release_claimed(self, db, claim_id):
+        db.execute(
+            "UPDATE events SET claimed_by = NULL, claimed_at = NULL "
+            "WHERE claimed_by = ?",
+            (claim_id,))
+
+    def __send(self, c, message_objs):
+        """Send the events, and return once the client has handled them."""
+
+        timeout_s = rpipe.config.server.OUTBOX_DELIVERY_TIMEOUT_S
+        peer = c.peer_capabilities
+
+        if len(message_objs) > 1 and \
+           peer.supports(rpipe.config.protocol.FEATURE_BATCHING) is True:
+            rpipe.event.send_event_batch(c, message_objs, timeout_s=timeout_s)
+            return
+
+        # One at a time, in order. Those that it has no handler for are
+        # dropped, just as they would've been if it had been connected.
+        for message_obj in message_objs:
+            if peer.handles(message_obj.verb, message_obj.noun) is True:
+                c.initiate_message(message_obj, timeout_s=timeout_s)
+
+    def deliver(self, c):
+        """Send the client everything that's waiting for it, oldest first. If
+        the connection breaks, the rest waits for the next one. If another
+        delivery (in any process) is already under way, we leave it to that
+        one.
+        """
+
+        claim_id = uuid.uuid4().hex
+
+        try:
+            # Let it tell us what it can do (e.g. batches) first.
+            c.wait_for_hello(timeout_s=rpipe.config.protocol.HELLO_TIMEOUT_S)
+
+            self.__maybe_prune()
+
+            batch_size = self.__batch_size
+            max_batch_events = c.peer_capabilities.max_batch_events
+            if max_batch_events is not None:
+                batch_size = max(1, min(batch_size, max_batch_events))
+
+            while 1:
+                rows = self.__transact(
+                        self.__claim,
+                        c.ip,
+                        claim_id,
+                        batch_size)
+
+                if not rows:
+                    break
+
+                _logger.info("Delivering (%d) queued events to client [%s].",
+                             len(rows), c.ip)
+
+                message_objs = [
+                    rpipe.event.build_event(
+                        verb,
+                        noun,
+                        bytes(data),
+                        mimetype,
+                        idempotency_key=idempotency_key)
+                    for (event_id, verb, noun, mimetype, data, idempotency_key)
+                    in rows]
+
+                self.__send(c, message_objs)
+
+                totals = self.__transact(
+                            self.__remove_claimed,
+                            c.ip,
+                            claim_id)
+
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.EVENT_SERVER_OUTBOX_DELIVERED_TICK,
+                    len(rows))
+
+                self.__post_totals(totals)
+        except (rpipe.exceptions.RpConnectionClosed,
+                rpipe.message_exchange.ResponseTimeoutError):
+            _logger.warning("Delivery of queued events to client [%s] was "
+                            "interrupted.", c.ip)
+        except:
+            _logger.exception("Delivery of queued events to client [%s] "
+                              "failed.", c.ip)
+        finally:
+            # Whatever we didn't finish goes back for the next delivery.
+            try:
+                self.__transact(self.__release_claimed, claim_id)
+            except:
+                _logger.exception("Could not release the outbox events "
+                                  "claimed for client [%s]. They'll be "
+                                  "released after (%d) seconds.",
+                                  c.ip, self.__claim_timeout_s)
+
+_ob = DurableOutbox()
+
+def get_outbox():
+    return _ob
@@ -0,0 +1,201 @@
+"""Token-bucket rate limits for the events that callers send to clients, so
+that one busy caller (or one busy client) can't take the whole server. See
+rpipe.config.web_server for the limits.
+"""
+
+import logging
+import collections
+import time
+
+import rpipe.config.statsd
+import rpipe.config.web_server
+
+import rpipe.stats
+
+SCOPE_CLIENT = 'client'
+SCOPE_CALLER = 'caller'
+
+_logger = logging.getLogger(__name__)
+
+
+class RateLimitedError(Exception):
+    def __init__(self, scope, identity, retry_after_s):
+        super(RateLimitedError, self).__init__(
+            "Rate limit reached for %s [%s]. Retry after (%.3f) seconds." %
+            (scope, identity, retry_after_s))
+
+        self.scope = scope
+        self.identity = identity
+        self.retry_after_s = retry_after_s
+
+
+class TokenBucket(object):
+    def __init__(self, rate_per_s, burst):
+        self.__rate_per_s = float(rate_per_s)
+        self.__burst = float(burst)
+        self.__tokens = self.__burst
+        self.__updated_at = time.time()
+
+    def __refill(self):
+        now = time.time()
+
+        self.__tokens = min(
+                            self.__burst,
+                            self.__tokens +
+                                (now - self.__updated_at) * self.__rate_per_s)
+
+        self.__updated_at = now
+
+    def get_wait_s(self, count=1):
+        """Return how long it'll be until there are enough tokens (zero if
+        there already are). We never ask for more than the bucket can hold.
+        """
+
+        count = min(count, self.__burst)
+
+        self.__refill()
+
+        if self.__tokens >= count:
+            return 0.0
+
+        return (count - self.__tokens) / self.__rate_per_s
+
+    def take(self, count=1):
+        """Take the tokens and return zero, or, if there aren't enough, take
+        nothing and return how long it'll be until there are.
+        """
+
+        retry_after_s = self.get_wait_s(count)
+        if retry_after_s == 0:
+            self.__tokens -= min(count, self.__burst)
+
+        return retry_after_s
+
+    @property
+    def level(self):
+        self.__refill()
+        return self.__tokens
+
+
+class RateLimiter(object):
+    """A bounded LRU of buckets, keyed by scope, identity, and (if it has its
+    own limits) handler. Forgetting a bucket only ever gives its owner a full
+    one.
+    """
+
+    def __init__(self,
+                 max_buckets=rpipe.config.web_server.RATE_LIMIT_MAX_BUCKETS):
+        self.__max_buckets = max_buckets
+        self.__buckets = collections.OrderedDict()
+
+    def __get_limit(self, scope, handler_name):
+        """Return (rate, burst, route), where `route` is the handler name if
+        the handler has its own limits, or else None.
+        """
+
+        try:
+            limits = rpipe.config.web_server.RATE_LIMITS_BY_ROUTE[handler_name]
+        except KeyError:
+            route = None
+
+            if scope == SCOPE_CLIENT:
+                limits = (rpipe.config.web_server.CLIENT_RATE_PER_S,
+                          rpipe.config.web_server.CLIENT_RATE_BURST)
+            else:
+                limits = (rpipe.config.web_server.CALLER_RATE_PER_S,
+                          rpipe.config.web_server.CALLER_RATE_BURST)
+        else:
+            route = handler_name
+
+            if scope == SCOPE_CLIENT:
+                limits = limits[0:2]
+            else:
+                limits = limits[2:4]
+
+        (rate_per_s, burst) = limits
+
+        return (rate_per_s, burst, route)
+
+    def __get_bucket(self, key, rate_per_s, burst):
+        try:
+            bucket = self.__buckets.pop(key)
+        except KeyError:
+            bucket = TokenBucket(rate_per_s, burst)
+
+            if len(self.__buckets) >= self.__max_buckets:
+                self.__buckets.popitem(last=False)
+
+        # Move it to the most-recently-used end.
+        self.__buckets[key] = bucket
+
+        return bucket
+
+    def take(self, scope, identity, handler_name, count=1):
+        """Take `count` tokens from the bucket, or raise RateLimitedError."""
+
+        self.take_all(scope, identity, { handler_name: count })
+
+    def take_all(self, scope, identity, counts):
+        """Take the given number of tokens for each handler (a dictionary),
+        from whichever buckets they come from. Either all of them are taken or,
+        if any bucket is short, none are and RateLimitedError is raised.
+        """
+
+        # Handlers without their own limits share a bucket.
+        needed = collections.OrderedDict()
+        for (handler_name, count) in counts.items():
+            (rate_per_s, burst, route) = self.__get_limit(scope, handler_name)
+            if rate_per_s <= 0:
+                continue
+
+            key = (scope, identity, route)
+
+            try:
+                (bucket, total) = needed[key]
+            except KeyError:
+                bucket = self.__get_bucket(key, rate_per_s, burst)
+                total = 0
+
+            needed[key] = (bucket, total + count)
+
+        if not needed:
+            return
+
+        retry_after_s = max(bucket.get_wait_s(total)
+                            for (bucket, total)
+                            in needed.values())
+
+        if retry_after_s > 0:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_RATE_LIMITED_TICK)
+
+            raise RateLimitedError(scope, identity, retry_after_s)
+
+        for (bucket, total) in needed.values():
+            bucket.take(total)
+
+        # There'd be a series for every client and caller otherwise, so this 
+        # is just a sample: the level of the last bucket taken from.
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_WEB_RATE_LEVEL_GAUGE_TEMPLATE % {
+                'scope': scope,
+            },
+            bucket.level)
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_SERVER_WEB_RATE_BUCKETS_GAUGE,
+            len(self.__buckets))
+
+    def get_levels(self):
+        """Return the level of every bucket, keyed by (scope, identity,
+        route).
+        """
+
+        return dict((key, bucket.level)
+                    for (key, bucket)
+                    in self.__buckets.items())
+
+_rl = RateLimiter()
+
+def get_rate_limiter():
+    return _rl
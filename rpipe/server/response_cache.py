@@ -0,0 +1,153 @@
+"""Remember the responses to client GETs for as long as the client's handler 
+said they could be reused (see the cache directive in 
+rpipe.event_handling.get_reply_from_result). The client can also tell us to 
+forget them early. Responses with an entity-tag are kept after they expire so 
+that they can be revalidated rather than downloaded again.
+"""
+
+import logging
+import collections
+import time
+
+import rpipe.config.server
+import rpipe.config.statsd
+
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+_ENTRY_T = collections.namedtuple(
+            '_ENTRY_T', 
+            ['expires_at', 'value', 'etag'])
+
+CACHED_T = collections.namedtuple(
+            'CACHED_T', 
+            ['value', 'etag', 'is_fresh'])
+
+
+def _get_base_noun(noun):
+    """Strip the parameters from the noun."""
+
+    return noun.split('//')[0]
+
+
+class ResponseCache(object):
+    """A bounded LRU where every entry also has its own TTL. Entries are keyed 
+    by client IP, verb, and noun.
+    """
+
+    def __init__(self, 
+                 max_entries=rpipe.config.server.RESPONSE_CACHE_MAX_ENTRIES):
+        self.__max_entries = max_entries
+        self.__entries = collections.OrderedDict()
+
+        # The keys of each client's entries, for invalidation.
+        self.__keys_by_ip = {}
+
+    def __unindex(self, key):
+        ip = key[0]
+        keys = self.__keys_by_ip[ip]
+        keys.discard(key)
+
+        if not keys:
+            del self.__keys_by_ip[ip]
+
+    def get(self, ip, verb, noun):
+        """Return a CACHED_T, or None. If it's not fresh, it can only be used 
+        once its entity-tag has been revalidated.
+        """
+
+        key = (ip, verb, noun)
+
+        try:
+            entry = self.__entries.pop(key)
+        except KeyError:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_MISS_TICK)
+
+            return None
+
+        is_fresh = entry.expires_at > time.time()
+
+        if is_fresh is False and entry.etag is None:
+            self.__unindex(key)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_MISS_TICK)
+
+            return None
+
+        # Move it to the most-recently-used end.
+        self.__entries[key] = entry
+
+        if is_fresh is True:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_HIT_TICK)
+        else:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_MISS_TICK)
+
+        return CACHED_T(entry.value, entry.etag, is_fresh)
+
+    def put(self, ip, verb, noun, value, ttl_s, etag=None):
+        """Keep the value for `ttl_s` seconds. If there's an entity-tag, it's 
+        kept (for revalidation) even if there's no TTL.
+        """
+
+        key = (ip, verb, noun)
+
+        if self.__entries.pop(key, None) is not None:
+            self.__unindex(key)
+
+        if self.__max_entries <= 0 or (ttl_s <= 0 and etag is None):
+            return
+
+        ttl_s = min(ttl_s, rpipe.config.server.MAXIMUM_RESPONSE_CACHE_TTL_S)
+
+        _logger.debug("Caching response for (%d)s: %s [%s]", 
+                      ttl_s, key, etag)
+
+        self.__entries[key] = _ENTRY_T(time.time() + ttl_s, value, etag)
+        self.__keys_by_ip.setdefault(ip, set()).add(key)
+
+        while len(self.__entries) > self.__max_entries:
+            (oldest_key, entry) = self.__entries.popitem(last=False)
+            self.__unindex(oldest_key)
+
+    def invalidate(self, ip, noun=None):
+        """Forget the client's responses for the given noun (with any 
+        parameters), or all of them.
+        """
+
+        keys = self.__keys_by_ip.get(ip)
+        if keys is None:
+            return
+
+        if noun is not None:
+            base_noun = _get_base_noun(noun)
+
+            keys = [key 
+                    for key 
+                    in keys 
+                    if _get_base_noun(key[2]) == base_noun]
+        else:
+            keys = list(keys)
+
+        _logger.debug("Invalidating (%d) cached responses for [%s]: [%s]", 
+                      len(keys), ip, noun)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_INVALIDATE_TICK)
+
+        for key in keys:
+            del self.__entries[key]
+            self.__unindex(key)
+
+    @property
+    def count(self):
+        return len(self.__entries)
+
+_rc = ResponseCache()
+
+def get_response_cache():
+    return _rc
@@ -0,0 +1,429 @@
+"""When the tunnel listener runs in several acceptor processes, every process
+only holds the connections that it accepted. This gives them a shared view of
+which process owns which client, and a relay so that any process (notably the
+one running the web-tier) can send an event over a connection that another
+process owns.
+
+The view is a directory with one file per connected client (named by IP) whose
+content is the relay socket-path of the owning acceptor. Once the client has
+said hello, its capabilities are kept alongside.
+"""
+
+import logging
+import os
+import os.path
+import struct
+import errno
+import time
+
+import google.protobuf.message
+
+import rpipe.config.server
+import rpipe.capabilities
+import rpipe.connection
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.protocols.hello_pb2
+import rpipe.transport
+
+_logger = logging.getLogger(__name__)
+
+_IP_LENGTH_FORMAT = '!B'
+_CAPABILITIES_SUFFIX = '.capabilities'
+
+
+# What can come out of a relay that's gone away partway, or that sent us 
+# something that doesn't parse.
+_RELAY_READ_ERRORS = (
+    struct.error, 
+    ValueError, 
+    google.protobuf.message.DecodeError,
+)
+
+
+def get_relay_socket_path(acceptor_index):
+    return os.path.join(
+            rpipe.config.server.SHARED_CATALOG_PATH,
+            'acceptor.%d.sock' % (acceptor_index,))
+
+def _connect_to_relay(relay_path, ip, timeout_s):
+    transport = rpipe.transport.UnixTransport(write_timeout_s=timeout_s)
+
+    try:
+        return transport.connect(relay_path)
+    except rpipe.exceptions.RpConnectionFail:
+        raise rpipe.exceptions.RpConnectionClosed(
+                "Relay for [%s] is unavailable: [%s]" % (ip, relay_path))
+
+def _is_relay_alive(relay_path):
+    """A relay that died can leave its socket-file behind. Only a live one 
+    accepts connections.
+    """
+
+    try:
+        ws = _connect_to_relay(relay_path, None, 1)
+    except rpipe.exceptions.RpConnectionClosed:
+        return False
+
+    ws.close()
+    return True
+
+
+class SharedCatalogView(object):
+    def __init__(self, acceptor_index,
+                 path=rpipe.config.server.SHARED_CATALOG_PATH):
+        self.__acceptor_index = acceptor_index
+        self.__path = path
+        self.__relay_path = get_relay_socket_path(acceptor_index)
+
+        if os.path.exists(self.__path) is False:
+            try:
+                os.makedirs(self.__path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        self.__purge_own_entries()
+
+    def __get_entry_filepath(self, ip):
+        return os.path.join(self.__path, ip)
+
+    def __get_capabilities_filepath(self, ip):
+        return self.__get_entry_filepath(ip) + _CAPABILITIES_SUFFIX
+
+    def __is_entry_filename(self, filename):
+        return filename.endswith('.sock') is False and \
+               filename.endswith('.tmp') is False and \
+               filename.endswith(_CAPABILITIES_SUFFIX) is False
+
+    def __write_atomically(self, filepath, data):
+        temp_filepath = filepath + '.%d.tmp' % (os.getpid(),)
+
+        with open(temp_filepath, 'wb') as f:
+            f.write(data)
+
+        os.rename(temp_filepath, filepath)
+
+    def __purge_own_entries(self):
+        """Forget any clients that a previous incarnation of this acceptor
+        had.
+        """
+
+        for filename in os.listdir(self.__path):
+            if self.__is_entry_filename(filename) is False:
+                continue
+
+            if self.__read_owner(filename) == self.__relay_path:
+                self.__remove_entry(filename)
+
+    def __read_owner(self, ip):
+        try:
+            with open(self.__get_entry_filepath(ip), 'rb') as f:
+                return f.read().decode('utf-8')
+        except IOError:
+            return None
+
+    def __remove_entry(self, ip):
+        for filepath in (self.__get_entry_filepath(ip),
+                         self.__get_capabilities_filepath(ip)):
+            try:
+                os.unlink(filepath)
+            except OSError:
+                pass
+
+    def claim(self, ip):
+        """Record that we own the connection for the given client. Fail if
+        another acceptor still does.
+        """
+
+        owner = self.__read_owner(ip)
+        if owner is not None and owner != self.__relay_path and \
+           _is_relay_alive(owner) is True:
+            raise ValueError("Client [%s] is still registered with another "
+                             "acceptor: [%s]" % (ip, owner))
+
+        self.__write_atomically(
+            self.__get_entry_filepath(ip), 
+            self.__relay_path.encode('utf-8'))
+
+    def publish_capabilities(self, ip, capabilities_obj):
+        """Record what the client told us in its hello."""
+
+        self.__write_atomically(
+            self.__get_capabilities_filepath(ip), 
+            capabilities_obj.SerializeToString())
+
+    def release(self, ip):
+        if self.__read_owner(ip) == self.__relay_path:
+            self.__remove_entry(ip)
+
+    def list_ips(self):
+        """Return the IPs of the clients held by any acceptor."""
+
+        return [filename
+                for filename
+                in os.listdir(self.__path)
+                if self.__is_entry_filename(filename) is True]
+
+    def lookup(self, ip):
+        """Return a proxy for a connection that's owned by another acceptor,
+        or None.
+        """
+
+        owner = self.__read_owner(ip)
+        if owner is None or owner == self.__relay_path:
+            return None
+
+        return RemoteConnection(
+                ip, 
+                owner, 
+                self.__get_capabilities_filepath(ip))
+
+    def notify(self, acceptor_index, ip, message_obj):
+        """Hand a message that doesn't get a reply (on behalf of the given 
+        client) to another acceptor.
+        """
+
+        relay_path = get_relay_socket_path(acceptor_index)
+
+        try:
+            _relay_message(relay_path, ip, message_obj)
+        except rpipe.exceptions.RpConnectionClosed:
+            _logger.warning("Relay is unavailable. Dropping notification "
+                            "from [%s]: [%s]", ip, relay_path)
+
+    @property
+    def acceptor_index(self):
+        return self.__acceptor_index
+
+    @property
+    def relay_path(self):
+        return self.__relay_path
+
+
+def _write_ip(ws, ip):
+    ip = ip.encode('ascii')
+    ws.write(struct.pack(_IP_LENGTH_FORMAT, len(ip)) + ip)
+
+def _read_ip(ws):
+    length = struct.unpack(
+                _IP_LENGTH_FORMAT,
+                ws.read(struct.calcsize(_IP_LENGTH_FORMAT)))[0]
+
+    return ws.read(length).decode('ascii')
+
+def _relay_message(relay_path, ip, message_obj):
+    """Hand a message that doesn't get a reply to the given relay."""
+
+    ws = _connect_to_relay(
+            relay_path, 
+            ip, 
+            rpipe.config.server.RELAY_TIMEOUT_S)
+
+    try:
+        _write_ip(ws, ip)
+        rpipe.protocol.send_message_obj(ws, message_obj)
+    finally:
+        ws.close()
+
+
+class RemoteConnection(rpipe.connection.Connection):
+    """A connection that's owned by another acceptor process. Messages are
+    forwarded through that process' relay.
+    """
+
+    def __init__(self, ip, relay_path, capabilities_filepath=None):
+        self.__ip = ip
+        self.__relay_path = relay_path
+        self.__capabilities_filepath = capabilities_filepath
+
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None,
+                         **kwargs):
+        """Any failure of the relay (it's gone, it hung up partway, or it 
+        sent something that we can't read) looks like a lost connection.
+        """
+
+        if timeout_s is None:
+            timeout_s = rpipe.config.server.RELAY_TIMEOUT_S
+
+        stop_at = time.time() + timeout_s
+
+        ws = _connect_to_relay(self.__relay_path, self.__ip, timeout_s)
+
+        try:
+            _write_ip(ws, self.__ip)
+
+            message_id = rpipe.protocol.send_message_obj(ws, message_obj)
+
+            if chunks is not None:
+                for chunk_obj in chunks:
+                    rpipe.protocol.send_message_obj(
+                        ws,
+                        chunk_obj,
+                        message_id=message_id)
+
+            (message_info, reply_obj) = \
+                rpipe.protocol.read_message_from_file_object(ws)
+        except rpipe.exceptions.RpConnectionClosed:
+            if time.time() >= stop_at:
+                raise rpipe.message_exchange.ResponseTimeoutError()
+
+            raise
+        except _RELAY_READ_ERRORS as e:
+            raise rpipe.exceptions.RpConnectionClosed(
+                    "Relay for [%s] sent a reply that's not valid: [%s] %s" %
+                    (self.__ip, self.__relay_path, str(e)))
+        finally:
+            ws.close()
+
+        return reply_obj
+
+    def send_message(self, message_obj):
+        _relay_message(self.__relay_path, self.__ip, message_obj)
+
+    @property
+    def peer_capabilities(self):
+        if self.__capabilities_filepath is None:
+            return rpipe.capabilities.UNKNOWN
+
+        try:
+            with open(self.__capabilities_filepath, 'rb') as f:
+                data = f.read()
+        except IOError:
+            # The client hasn't said hello (yet).
+            return rpipe.capabilities.UNKNOWN
+
+        capabilities_obj = rpipe.protocols.hello_pb2.Capabilities()
+        capabilities_obj.ParseFromString(data)
+
+        return rpipe.capabilities.get_peer_capabilities(capabilities_obj)
+
+    @property
+    def ip(self):
+        return self.__ip
+
+    def __str__(self):
+        return ('RemoteConnection<%s via %s>' %
+                (self.__ip, self.__relay_path))
+
+
+def _read_chunks(ws):
+    """Yield the chunks of a streamed body as they're relayed to us."""
+
+    while 1:
+        (message_info, chunk_obj) = \
+            rpipe.protocol.read_message_from_file_object(ws)
+
+        yield chunk_obj
+
+        if chunk_obj.is_last is True:
+            break
+
+
+class Relay(object):
+    """Accept messages from the other processes and send them over the local
+    connections. `message_handlers` maps the types of any messages that are 
+    meant for this process, rather than for a client, to a callable that 
+    receives the IP of the client on whose behalf it was sent and the message.
+    """
+
+    def __init__(self, catalog, relay_path, message_handlers=None):
+        if message_handlers is None:
+            message_handlers = {}
+
+        self.__catalog = catalog
+        self.__relay_path = relay_path
+        self.__message_handlers = message_handlers
+        self.__server = None
+
+    def __handle(self, ws, address):
+        try:
+            ip = _read_ip(ws)
+
+            (message_info, message_obj) = \
+                rpipe.protocol.read_message_from_file_object(ws)
+        except rpipe.exceptions.RpConnectionClosed:
+            return
+        except _RELAY_READ_ERRORS:
+            _logger.exception("Relayed message is not valid.")
+            return
+
+        message_type = rpipe.protocol.get_message_type_from_info(message_info)
+
+        handler = self.__message_handlers.get(message_type)
+        if handler is not None:
+            handler(ip, message_obj)
+            return
+
+        try:
+            c = self.__catalog.get_connection_by_ip(ip)
+        except KeyError:
+            # Closing without a reply tells the sender that we don't have it.
+            _logger.warning("Relayed message for client that we don't own: "
+                            "[%s]", ip)
+            return
+
+        is_event = message_type == rpipe.protocols.MT_EVENT
+
+        if is_event is True and message_obj.no_reply is True:
+            c.send_message(message_obj)
+            return
+
+        # Pass along whatever is left of the caller's deadline.
+        if is_event is True or \
+           message_type == rpipe.protocols.MT_EVENT_BATCH:
+            timeout_s = rpipe.event_handling.get_remaining_s(
+                            message_info, 
+                            message_obj)
+        else:
+            timeout_s = None
+
+        if timeout_s is not None and timeout_s <= 0:
+            _logger.warning("Relayed message for [%s] has already expired.", 
+                            ip)
+            return
+
+        if timeout_s is not None:
+            message_obj.timeout_ms = max(1, int(timeout_s * 1000))
+
+        # Forward the body as it arrives.
+        if is_event is True and message_obj.is_streamed is True:
+            chunks = _read_chunks(ws)
+        else:
+            chunks = None
+
+        try:
+            reply_obj = c.initiate_message(
+                            message_obj, 
+                            timeout_s=timeout_s, 
+                            chunks=chunks)
+        except rpipe.message_exchange.ResponseTimeoutError:
+            _logger.warning("Relayed message for [%s] timed-out.", ip)
+            return
+        except rpipe.exceptions.RpConnectionClosed:
+            _logger.warning("Relayed message for [%s] was abandoned.", ip)
+            return
+
+        rpipe.protocol.send_message_obj(
+            ws,
+            reply_obj,
+            message_id=rpipe.protocol.get_message_id_from_info(message_info),
+            is_response=True)
+
+    def serve_forever(self):
+        transport = rpipe.transport.UnixTransport()
+
+        _logger.info("Running relay: [%s]", self.__relay_path)
+
+        self.__server = transport.create_server(
+                            self.__relay_path,
+                            self.__handle)
+
+        self.__server.serve_forever()
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.stop()
@@ -0,0 +1,75 @@
+"""Share one call between concurrent callers that ask for the same thing."""
+
+import logging
+
+import gevent
+
+import rpipe.config.statsd
+
+import rpipe.message_exchange
+import rpipe.stats
+
+_logger = logging.getLogger(__name__)
+
+
+class _Flight(object):
+    def __init__(self, g):
+        self.g = g
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """The call runs in its own gthread so that it isn't tied to whichever 
+    caller started it. If every caller stops waiting (times-out or is 
+    killed), the call is killed too.
+    """
+
+    def __init__(self):
+        self.__flights = {}
+
+    def __start(self, key, fn):
+        flight = _Flight(gevent.spawn(fn))
+        self.__flights[key] = flight
+
+        def flight_done_cb(g):
+            if self.__flights.get(key) is flight:
+                del self.__flights[key]
+
+        flight.g.link(flight_done_cb)
+
+        return flight
+
+    def do(self, key, fn, timeout_s=None):
+        """Return the result of `fn()`, or join a call already in progress 
+        for the same key. Raise ResponseTimeoutError if it doesn't finish in 
+        `timeout_s`.
+        """
+
+        flight = self.__flights.get(key)
+        if flight is None:
+            flight = self.__start(key, fn)
+        else:
+            _logger.debug("Coalescing request: %s", key)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_COALESCED_TICK)
+
+        flight.waiters += 1
+
+        try:
+            return flight.g.get(timeout=timeout_s)
+        except gevent.Timeout:
+            raise rpipe.message_exchange.ResponseTimeoutError()
+        finally:
+            flight.waiters -= 1
+
+            if flight.waiters == 0 and flight.g.ready() is False:
+                _logger.debug("Nobody is waiting anymore. Abandoning: %s", 
+                              key)
+
+                # The kill isn't immediate, and nobody else should join the 
+                # call in the meantime.
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+
+                flight.g.kill(block=False)
@@ -21,16 +21,31 @@ if rpipe.config.statsd.STATSD_HOSTNAME or \
 else:
     _SC = None
 
-def post_to_counter(event):
+def post_to_counter(event, count=1):
     if _SC is None:
         return
 
-    _logger.debug("Incrementing: [%s]", event)
-    _SC.incr(event)
+    _logger.debug("Incrementing: [%s] (%d)", event, count)
+    _SC.incr(event, count)
+
+def post_to_gauge(event, value):
+    if _SC is None:
+        return
+
+    _logger.debug("Setting gauge: [%s] (%s)", event, value)
+    _SC.gauge(event, value)
+
+def post_timing(event, duration_s):
+    if _SC is None:
+        return
+
+    _logger.debug("Posting timing: [%s] (%.3f)s", event, duration_s)
+    _SC.timing(event, duration_s * 1000.0)
 
 @contextlib.contextmanager
 def time_and_post(timing_event, success_event=None, fail_event=None):
     if _SC is None:
+        yield
         return
 
     t = _SC.timer(timing_event)
@@ -0,0 +1,234 @@
+"""Measure an engine (gevent or asyncio) on a single core: what it costs to
+establish and to hold connections, and the latency and throughput of
+server-initiated events.
+
+The server and (by default) the clients run in this process, so the CPU
+figures cover both ends. The gevent engine can only have one real client per
+process, so its clients are the load-generator's simulated ones. To measure
+the server alone, pass `external_clients` and run rp_load_generator (with the
+same number of clients) in another process.
+
+Handshake admission is left unlimited so that neither engine is held back by
+retry-afters.
+"""
+
+import logging
+import platform
+import time
+
+import rpipe.config.engine_benchmark
+import rpipe.config.server
+
+import rpipe.tools.measure
+
+ENGINE_GEVENT = 'gevent'
+ENGINE_ASYNCIO = 'asyncio'
+
+_EVENT_NOUN = 'time'
+
+_logger = logging.getLogger(__name__)
+
+
+class BenchmarkResult(object):
+    def __init__(self, engine, client_count, concurrency):
+        self.engine = engine
+        self.client_count = client_count
+        self.concurrency = concurrency
+
+        self.connect_wall_s = 0.0
+        self.connect_cpu_s = 0.0
+
+        self.idle_wall_s = 0.0
+        self.idle_cpu_s = 0.0
+
+        self.request_count = 0
+        self.request_failures = 0
+        self.request_wall_s = 0.0
+        self.request_cpu_s = 0.0
+
+        self.latency = rpipe.tools.measure.LatencyHistogram()
+
+    def render(self):
+        def ratio(a, b):
+            return a / b if b > 0 else 0.0
+
+        idle_core_fraction = ratio(self.idle_cpu_s, self.idle_wall_s)
+
+        lines = [
+            "Engine: %s (%s %s)" %
+            (self.engine, platform.python_implementation(),
+             platform.python_version()),
+            "Connect: (%d) clients in (%.2f)s using (%.2f) CPU-s -> (%.0f) "
+            "connections per CPU-second" %
+            (self.client_count, self.connect_wall_s, self.connect_cpu_s,
+             ratio(self.client_count, self.connect_cpu_s)),
+            "Idle: (%.1f)s holding (%d) connections used (%.2f) CPU-s "
+            "(%.2f%% of a core) -> (%.0f) resting connections per core" %
+            (self.idle_wall_s, self.client_count, self.idle_cpu_s,
+             idle_core_fraction * 100.0,
+             ratio(self.client_count, idle_core_fraction)),
+            "Requests: (%d) at concurrency (%d) with (%d) failures in (%.2f)s "
+            "-> (%.0f)/s, (%.0f) per CPU-second" %
+            (self.request_count, self.concurrency, self.request_failures,
+             self.request_wall_s,
+             ratio(self.request_count, self.request_wall_s),
+             ratio(self.request_count, self.request_cpu_s)),
+            "Latency: N=(%d) MEAN=(%.3f)ms P50=(%s)ms P99=(%s)ms "
+            "MAX=(%.3f)ms" %
+            (self.latency.count, self.latency.mean_ms,
+             self.latency.get_percentile_ms(50),
+             self.latency.get_percentile_ms(99),
+             self.latency.max_ms),
+            self.latency.render(),
+        ]
+
+        return '\n'.join(lines)
+
+
+def get_binding():
+    return (rpipe.config.engine_benchmark.BIND_IP,
+            rpipe.config.engine_benchmark.BIND_PORT)
+
+def _run_gevent(result, request_count, payload_bytes, idle_s,
+                external_clients):
+    import gevent
+    import gevent.pool
+
+    import rpipe.event
+    import rpipe.server.connection
+    import rpipe.transport
+    import rpipe.tools.load_generator
+
+    binding = get_binding()
+
+    transport = rpipe.transport.TlsTcpTransport(
+                    rpipe.config.server.KEY_FILEPATH,
+                    rpipe.config.server.CRT_FILEPATH,
+                    ca_certs=rpipe.config.server.CA_CRT_FILEPATH,
+                    admission_preamble=rpipe.config.server.ADMISSION_PREAMBLE)
+
+    server = rpipe.server.connection.Server(
+                transport=transport,
+                binding=binding)
+
+    server.start()
+
+    catalog = rpipe.server.connection.get_connection_catalog()
+    source_ips = rpipe.tools.measure.get_source_ips(result.client_count)
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    clients = gevent.pool.Group()
+    if external_clients is False:
+        stats = rpipe.tools.load_generator.LoadStats()
+
+        for source_ip in source_ips:
+            c = rpipe.tools.load_generator.SimulatedClient(
+                    source_ip,
+                    binding,
+                    stats,
+                    0,
+                    payload_bytes)
+
+            clients.spawn(c.run)
+
+        # The catalog only polls once a second.
+        while stats.connects < result.client_count:
+            gevent.sleep(.01)
+
+    connections = [
+        catalog.wait_for_connection(
+            source_ip,
+            timeout_s=rpipe.config.engine_benchmark.CONNECT_TIMEOUT_S)
+        for source_ip
+        in source_ips]
+
+    result.connect_wall_s = time.time() - started_at
+    result.connect_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    gevent.sleep(idle_s)
+
+    result.idle_wall_s = time.time() - started_at
+    result.idle_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    remaining = [request_count]
+
+    def send_requests(offset):
+        i = offset
+        while remaining[0] > 0:
+            remaining[0] -= 1
+
+            c = connections[i % len(connections)]
+            i += result.concurrency
+
+            request_started_at = time.time()
+
+            try:
+                rpipe.event.send_message_to_remote(c, 'get', _EVENT_NOUN, '')
+            except Exception:
+                _logger.exception("Request failed.")
+                result.request_failures += 1
+            else:
+                result.latency.add(time.time() - request_started_at)
+
+    started_at = time.time()
+    started_cpu_s = rpipe.tools.measure.get_cpu_s()
+
+    senders = gevent.pool.Group()
+    for i in range(result.concurrency):
+        senders.spawn(send_requests, i)
+
+    senders.join()
+
+    result.request_count = request_count
+    result.request_wall_s = time.time() - started_at
+    result.request_cpu_s = rpipe.tools.measure.get_cpu_s() - started_cpu_s
+
+    clients.kill()
+    server.stop()
+
+def run(engine=rpipe.config.engine_benchmark.ENGINE,
+        client_count=rpipe.config.engine_benchmark.CLIENT_COUNT,
+        request_count=rpipe.config.engine_benchmark.REQUEST_COUNT,
+        concurrency=rpipe.config.engine_benchmark.CONCURRENCY,
+        payload_bytes=rpipe.config.engine_benchmark.REPLY_PAYLOAD_BYTES,
+        idle_s=rpipe.config.engine_benchmark.IDLE_S,
+        external_clients=False,
+        use_uvloop=False):
+    """Run the benchmark, log the report, and return the result. The gevent
+    engine expects the process to already be monkey-patched.
+    """
+
+    result = BenchmarkResult(engine, client_count, concurrency)
+
+    _logger.info("Benchmarking the (%s) engine: CLIENTS=(%d) REQUESTS=(%d) "
+                 "CONCURRENCY=(%d)", engine, client_count, request_count,
+                 concurrency)
+
+    if engine == ENGINE_GEVENT:
+        _run_gevent(
+            result,
+            request_count,
+            payload_bytes,
+            idle_s,
+            external_clients)
+    elif engine == ENGINE_ASYNCIO:
+        import rpipe.aio.benchmark
+
+        rpipe.aio.benchmark.run(
+            result,
+            request_count,
+            payload_bytes,
+            idle_s,
+            external_clients,
+            use_uvloop=use_uvloop)
+    else:
+        raise ValueError("Engine not valid: [%s]" % (engine,))
+
+    _logger.info("Benchmark report:\n%s", result.render())
+
+    return result
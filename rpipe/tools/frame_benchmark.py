@@ -0,0 +1,126 @@
+"""Compare the cost of the v1 and v2 frame formats: how long it takes to
+serialize an event and to parse it back (from a file-object, as the gevent
+engine does, and from a buffer, as the asyncio engine does), and how big the
+frames are. Nothing is sent; this only measures rpipe.protocol.
+"""
+
+import logging
+import io
+import platform
+import time
+
+import rpipe.event
+import rpipe.protocol
+
+_logger = logging.getLogger(__name__)
+
+_FRAME_VERSIONS = (rpipe.protocol.FRAME_V1, rpipe.protocol.FRAME_V2)
+
+_EVENT_VERB = 'get'
+_EVENT_NOUN = 'inventory'
+_EVENT_PARAMETERS = ['warehouse', '12', 'bin', '7']
+_EVENT_HEADERS = {'X-Trace-Id': 'ab12cd34', 'Accept-Language': 'en'}
+
+
+class FrameBenchmarkResult(object):
+    def __init__(self, frame_version, iterations):
+        self.frame_version = frame_version
+        self.iterations = iterations
+
+        self.frame_bytes = 0
+        self.header_bytes = 0
+
+        self.serialize_s = 0.0
+        self.parse_file_s = 0.0
+        self.parse_buffer_s = 0.0
+
+    def render(self):
+        def per_op_us(duration_s):
+            return duration_s * 1000000.0 / self.iterations
+
+        return ("Frame v%d: SIZE=(%d)B HEADER=(%d)B SERIALIZE=(%.2f)us "
+                "PARSE_FILE=(%.2f)us PARSE_BUFFER=(%.2f)us" %
+                (self.frame_version, self.frame_bytes, self.header_bytes,
+                 per_op_us(self.serialize_s),
+                 per_op_us(self.parse_file_s),
+                 per_op_us(self.parse_buffer_s)))
+
+
+def build_sample_event(payload_bytes):
+    return rpipe.event.build_event(
+            _EVENT_VERB,
+            _EVENT_NOUN,
+            b'x' * payload_bytes,
+            mimetype='application/octet-stream',
+            timeout_s=10,
+            parameters=_EVENT_PARAMETERS,
+            headers=_EVENT_HEADERS)
+
+def _measure(frame_version, message_obj, iterations):
+    result = FrameBenchmarkResult(frame_version, iterations)
+
+    (frame, message_id) = rpipe.protocol._serialize(
+                            message_obj,
+                            frame_version=frame_version)
+
+    (message_info, parsed_obj) = \
+        rpipe.protocol.read_message_from_buffer(bytearray(frame))
+
+    result.frame_bytes = len(frame)
+    result.header_bytes = len(frame) - \
+        rpipe.protocol.get_message_length_from_info(message_info)
+
+    started_at = time.time()
+
+    for i in range(iterations):
+        rpipe.protocol._serialize(
+            message_obj,
+            message_id=message_id,
+            frame_version=frame_version)
+
+    result.serialize_s = time.time() - started_at
+
+    started_at = time.time()
+
+    for i in range(iterations):
+        rpipe.protocol.read_message_from_file_object(io.BytesIO(frame))
+
+    result.parse_file_s = time.time() - started_at
+
+    started_at = time.time()
+
+    for i in range(iterations):
+        rpipe.protocol.read_message_from_buffer(bytearray(frame))
+
+    result.parse_buffer_s = time.time() - started_at
+
+    return result
+
+def run(iterations=100000, payload_bytes=64):
+    """Run the benchmark for each frame format, log the report, and return
+    the results (in the order of the frame versions).
+    """
+
+    _logger.info("Benchmarking frame formats: ITERATIONS=(%d) "
+                 "PAYLOAD=(%d)B (%s %s)", iterations, payload_bytes,
+                 platform.python_implementation(), platform.python_version())
+
+    message_obj = build_sample_event(payload_bytes)
+
+    # The serializer logs every message at the debug level, which would
+    # dominate the timings.
+    protocol_logger = logging.getLogger(rpipe.protocol.__name__)
+    original_level = protocol_logger.level
+    protocol_logger.setLevel(logging.INFO)
+
+    try:
+        results = [_measure(frame_version, message_obj, iterations)
+                   for frame_version
+                   in _FRAME_VERSIONS]
+    finally:
+        protocol_logger.setLevel(original_level)
+
+    _logger.info("Benchmark report:\n%s",
+                 '\n'.join(result.render() for result in results))
+
+    return results
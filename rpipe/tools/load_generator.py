@@ -0,0 +1,374 @@
+"""Simulate many protocol-correct clients from a single gevent process in order
+to load the server's connection catalog, heartbeat watchdogs, and web tier.
+"""
+
+import logging
+import time
+
+try:
+    import urllib2 as _urllib
+except ImportError:
+    import urllib.request as _urllib
+
+import gevent
+import gevent.pool
+import gevent.lock
+
+import rpipe.config.client
+import rpipe.config.load_generator
+
+import rpipe.client.backoff
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.transport
+import rpipe.tools.measure
+
+_logger = logging.getLogger(__name__)
+
+class LoadStats(object):
+    def __init__(self):
+        self.started_at = time.time()
+
+        self.connected = 0
+        self.connects = 0
+        self.connect_failures = 0
+        self.retry_afters = 0
+        self.disconnects = 0
+
+        self.events_handled = 0
+        self.heartbeats_sent = 0
+        self.heartbeat_failures = 0
+
+        self.http_success = 0
+        self.http_failures = 0
+
+        self.handshake_latency = rpipe.tools.measure.LatencyHistogram()
+        self.heartbeat_latency = rpipe.tools.measure.LatencyHistogram()
+        self.reconnect_latency = rpipe.tools.measure.LatencyHistogram()
+        self.http_latency = rpipe.tools.measure.LatencyHistogram()
+
+    def render(self):
+        elapsed_s = time.time() - self.started_at
+        http_total = self.http_success + self.http_failures
+
+        lines = [
+            "Elapsed: (%.1f)s" % (elapsed_s,),
+            "Clients: CONNECTED=(%d) CONNECTS=(%d) CONNECT_FAILURES=(%d) "
+            "RETRY_AFTERS=(%d) DISCONNECTS=(%d)" %
+            (self.connected, self.connects, self.connect_failures,
+             self.retry_afters, self.disconnects),
+            "Heartbeats: SENT=(%d) FAILURES=(%d)" %
+            (self.heartbeats_sent, self.heartbeat_failures),
+            "Events handled: (%d)" % (self.events_handled,),
+            "HTTP: SUCCESS=(%d) FAILURES=(%d) THROUGHPUT=(%.1f)/s" %
+            (self.http_success, self.http_failures,
+             http_total / elapsed_s if elapsed_s > 0 else 0.0),
+        ]
+
+        for (name, histogram) in (('Handshake', self.handshake_latency),
+                                  ('Heartbeat', self.heartbeat_latency),
+                                  ('Reconnect', self.reconnect_latency),
+                                  ('HTTP', self.http_latency)):
+            if histogram.count == 0:
+                continue
+
+            lines.append("%s latency: N=(%d) MEAN=(%.1f)ms P50=(%s)ms "
+                         "P99=(%s)ms MAX=(%.1f)ms" %
+                         (name, histogram.count, histogram.mean_ms,
+                          histogram.get_percentile_ms(50),
+                          histogram.get_percentile_ms(99),
+                          histogram.max_ms))
+
+            lines.append(histogram.render())
+
+        return '\n'.join(lines)
+
+
+class SimulatedClient(object):
+    """A single client connection. It heartbeats like the real client and
+    answers every event with a fixed-size payload after the configured think-
+    time.
+    """
+
+    def __init__(self, source_ip, binding, stats, think_time_s,
+                 payload_bytes):
+        self.__source_ip = source_ip
+        self.__binding = binding
+        self.__stats = stats
+        self.__think_time_s = think_time_s
+
+        self.__transport = rpipe.transport.TlsTcpTransport(
+                            rpipe.config.client.KEY_FILEPATH,
+                            rpipe.config.client.CRT_FILEPATH,
+                            source_ip=source_ip,
+                            admission_preamble=\
+                                rpipe.config.client.ADMISSION_PREAMBLE)
+
+        reply = rpipe.protocol.get_obj_from_type(rpipe.protocols.MT_EVENT_R)
+        reply.version = 1
+        reply.mimetype = 'text/plain'
+        reply.code = 0
+        reply.data = b'x' * payload_bytes
+
+        self.__event_reply = reply
+
+        heartbeat = rpipe.protocol.get_obj_from_type(
+                        rpipe.protocols.MT_HEARTBEAT)
+
+        heartbeat.version = 1
+
+        self.__heartbeat = heartbeat
+
+        self.__ws = None
+        self.__write_lock = gevent.lock.Semaphore()
+        self.__pending_heartbeats = {}
+
+    def run(self):
+        disconnected_at = None
+
+        # Reconnect the same way that the real client does.
+        backoff = rpipe.client.backoff.DecorrelatedJitterBackoff(
+                    rpipe.config.load_generator.RECONNECT_WAIT_TIME_S,
+                    rpipe.config.client.\
+                        MAXIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S)
+
+        while 1:
+            try:
+                self.__connect()
+            except rpipe.exceptions.RpConnectionFail as e:
+                _logger.debug("Simulated client [%s] could not connect: %s",
+                              self.__source_ip, str(e))
+
+                self.__stats.connect_failures += 1
+                if disconnected_at is None:
+                    disconnected_at = time.time()
+
+                if isinstance(e, rpipe.exceptions.RpConnectionRetryAfter) \
+                        is True:
+                    self.__stats.retry_afters += 1
+                    wait_time_s = backoff.next_wait_s(
+                                    retry_after_s=e.retry_after_s)
+                else:
+                    wait_time_s = backoff.next_wait_s()
+
+                gevent.sleep(wait_time_s)
+                continue
+
+            backoff.reset()
+
+            self.__stats.connects += 1
+            self.__stats.connected += 1
+
+            if disconnected_at is not None:
+                self.__stats.reconnect_latency.add(
+                    time.time() - disconnected_at)
+
+            heartbeat_g = gevent.spawn(self.__heartbeat_loop, self.__ws)
+
+            try:
+                self.__read_loop(self.__ws)
+            except rpipe.exceptions.RpConnectionClosed:
+                pass
+            except Exception:
+                _logger.exception("Simulated client [%s] failed.",
+                                  self.__source_ip)
+            finally:
+                heartbeat_g.kill()
+
+                self.__stats.connected -= 1
+                self.__stats.disconnects += 1
+                disconnected_at = time.time()
+
+                self.__close()
+
+            gevent.sleep(backoff.next_wait_s())
+
+    def __connect(self):
+        start_at = time.time()
+
+        self.__ws = self.__transport.connect(self.__binding)
+        self.__stats.handshake_latency.add(time.time() - start_at)
+
+        self.__pending_heartbeats = {}
+
+    def __close(self):
+        try:
+            self.__ws.close()
+        except:
+            pass
+
+        self.__ws = None
+
+    def __send(self, ws, message_obj, **kwargs):
+        """Write to the given connection, unless it's since been closed (and
+        maybe replaced).
+        """
+
+        with self.__write_lock:
+            if ws is None or ws is not self.__ws:
+                raise rpipe.exceptions.RpConnectionClosed(
+                        "Simulated client [%s] connection is closed." %
+                        (self.__source_ip,))
+
+            return rpipe.protocol.send_message_obj(
+                    ws,
+                    message_obj,
+                    **kwargs)
+
+    def __heartbeat_loop(self, ws):
+        while 1:
+            gevent.sleep(rpipe.config.load_generator.HEARTBEAT_INTERVAL_S)
+
+            now = time.time()
+            for sent_at in self.__pending_heartbeats.values():
+                if now - sent_at > \
+                        rpipe.config.load_generator.HEARTBEAT_TIMEOUT_S:
+                    self.__stats.heartbeat_failures += 1
+                    self.__close()
+                    return
+
+            try:
+                message_id = self.__send(ws, self.__heartbeat)
+            except rpipe.exceptions.RpConnectionClosed:
+                return
+
+            self.__pending_heartbeats[message_id] = now
+            self.__stats.heartbeats_sent += 1
+
+    def __read_loop(self, ws):
+        while 1:
+            (message_info, message_obj) = \
+                rpipe.protocol.read_message_from_file_object(ws)
+
+            message_type = rpipe.protocol.get_message_type_from_info(
+                            message_info)
+
+            message_id = rpipe.protocol.get_message_id_from_info(message_info)
+
+            if message_type == rpipe.protocols.MT_HEARTBEAT_R:
+                sent_at = self.__pending_heartbeats.pop(message_id, None)
+                if sent_at is not None:
+                    self.__stats.heartbeat_latency.add(time.time() - sent_at)
+            elif message_type == rpipe.protocols.MT_EVENT:
+                gevent.spawn(self.__reply_to_event, ws, message_id)
+            else:
+                _logger.warning("Simulated client [%s] received unexpected "
+                                "message (%d).", self.__source_ip,
+                                message_type)
+
+    def __reply_to_event(self, ws, message_id):
+        if self.__think_time_s > 0:
+            gevent.sleep(self.__think_time_s)
+
+        try:
+            self.__send(
+                ws,
+                self.__event_reply,
+                message_id=message_id,
+                is_response=True)
+        except rpipe.exceptions.RpConnectionClosed:
+            return
+
+        self.__stats.events_handled += 1
+
+    @property
+    def source_ip(self):
+        return self.__source_ip
+
+
+def _drive_http(base_url, source_ips, noun, stats, stop_at, offset=0):
+    """Continuously request the given noun from the clients via the server's
+    web-tier.
+    """
+
+    i = offset
+    while time.time() < stop_at:
+        # Stride through the clients so that concurrent drivers don't collide.
+        ip = source_ips[i % len(source_ips)]
+        i += 7919
+
+        url = '%s/client/%s/%s' % (base_url.rstrip('/'), ip, noun)
+
+        start_at = time.time()
+
+        try:
+            r = _urllib.urlopen(
+                    url,
+                    timeout=rpipe.config.load_generator.HTTP_TIMEOUT_S)
+
+            r.read()
+        except Exception as e:
+            _logger.debug("HTTP request failed [%s]: %s", url, str(e))
+            stats.http_failures += 1
+        else:
+            stats.http_success += 1
+            stats.http_latency.add(time.time() - start_at)
+
+def _report(stats, interval_s):
+    while 1:
+        gevent.sleep(interval_s)
+        _logger.info("Load report:\n%s", stats.render())
+
+def run(server_hostname=rpipe.config.client.TARGET_HOSTNAME,
+        server_port=rpipe.config.client.TARGET_PORT,
+        client_count=rpipe.config.load_generator.CLIENT_COUNT,
+        connect_rate_per_s=rpipe.config.load_generator.CONNECT_RATE_PER_S,
+        think_time_s=rpipe.config.load_generator.THINK_TIME_S,
+        payload_bytes=rpipe.config.load_generator.REPLY_PAYLOAD_BYTES,
+        http_base_url=rpipe.config.load_generator.HTTP_BASE_URL,
+        http_concurrency=rpipe.config.load_generator.HTTP_CONCURRENCY,
+        http_noun=rpipe.config.load_generator.HTTP_NOUN,
+        duration_s=rpipe.config.load_generator.DURATION_S,
+        report_interval_s=rpipe.config.load_generator.REPORT_INTERVAL_S):
+    """Run the simulation, log the final report, and return the statistics."""
+
+    binding = (server_hostname, server_port)
+    stats = LoadStats()
+    source_ips = rpipe.tools.measure.get_source_ips(client_count)
+
+    _logger.info("Simulating (%d) clients against %s: SOURCE_IPS=[%s]-[%s]",
+                 client_count, binding, source_ips[0], source_ips[-1])
+
+    clients = gevent.pool.Group()
+    for i, source_ip in enumerate(source_ips):
+        c = SimulatedClient(
+                source_ip,
+                binding,
+                stats,
+                think_time_s,
+                payload_bytes)
+
+        clients.spawn(c.run)
+
+        if connect_rate_per_s > 0 and (i + 1) % connect_rate_per_s == 0:
+            gevent.sleep(1)
+
+    stop_at = time.time() + duration_s
+
+    reporter_g = gevent.spawn(_report, stats, report_interval_s)
+
+    drivers = gevent.pool.Group()
+    if http_base_url:
+        for i in range(http_concurrency):
+            drivers.spawn(
+                _drive_http,
+                http_base_url,
+                source_ips,
+                http_noun,
+                stats,
+                stop_at,
+                offset=i)
+
+    gevent.sleep(max(0, stop_at - time.time()))
+
+    drivers.join()
+    reporter_g.kill()
+
+    # Report before we tear the clients down so that the connection counts 
+    # reflect the steady-state.
+    _logger.info("Final load report:\n%s", stats.render())
+
+    clients.kill()
+
+    return stats
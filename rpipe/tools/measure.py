@@ -0,0 +1,96 @@
+"""Measurement helpers shared by the load-generator and the engine benchmark.
+These don't depend on either engine.
+"""
+
+import os
+import socket
+import struct
+import bisect
+
+import rpipe.config.load_generator
+
+# Upper bounds (in milliseconds) for the latency buckets.
+_HISTOGRAM_BUCKETS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500,
+                         1000, 2000, 5000, 10000)
+
+
+class LatencyHistogram(object):
+    def __init__(self):
+        self.__counts = [0] * (len(_HISTOGRAM_BUCKETS_MS) + 1)
+        self.__count = 0
+        self.__total_ms = 0.0
+        self.__max_ms = 0.0
+
+    def add(self, duration_s):
+        duration_ms = duration_s * 1000.0
+
+        i = bisect.bisect_left(_HISTOGRAM_BUCKETS_MS, duration_ms)
+        self.__counts[i] += 1
+
+        self.__count += 1
+        self.__total_ms += duration_ms
+        self.__max_ms = max(self.__max_ms, duration_ms)
+
+    def get_percentile_ms(self, percentile):
+        """Return the upper-bound of the bucket that the given percentile falls
+        into.
+        """
+
+        if self.__count == 0:
+            return 0
+
+        threshold = self.__count * percentile / 100.0
+        running = 0
+        for i, count in enumerate(self.__counts):
+            running += count
+            if running >= threshold:
+                if i < len(_HISTOGRAM_BUCKETS_MS):
+                    return _HISTOGRAM_BUCKETS_MS[i]
+
+                return self.__max_ms
+
+        return self.__max_ms
+
+    def render(self):
+        lines = []
+        lower_ms = 0
+        for i, count in enumerate(self.__counts):
+            if i < len(_HISTOGRAM_BUCKETS_MS):
+                upper = '%g' % (_HISTOGRAM_BUCKETS_MS[i],)
+            else:
+                upper = 'inf'
+
+            if count > 0:
+                lines.append("  %6s - %6s ms: %d" % (lower_ms, upper, count))
+
+            lower_ms = upper
+
+        return '\n'.join(lines)
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def mean_ms(self):
+        if self.__count == 0:
+            return 0.0
+
+        return self.__total_ms / self.__count
+
+    @property
+    def max_ms(self):
+        return self.__max_ms
+
+
+def get_source_ips(count, base_ip=rpipe.config.load_generator.SOURCE_IP_BASE):
+    base = struct.unpack('!I', socket.inet_aton(base_ip))[0]
+
+    return [socket.inet_ntoa(struct.pack('!I', base + i))
+            for i in range(count)]
+
+def get_cpu_s():
+    """Return the CPU time (user and system) that this process has used."""
+
+    t = os.times()
+    return t[0] + t[1]
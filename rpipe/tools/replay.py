@@ -0,0 +1,434 @@
+"""Replay the events in a capture (see rpipe.capture) at their original timing,
+or faster, and measure how long the replies take.
+
+Either the events that the captured side sent or those that it received are
+replayed (replies and heartbeats are never replayed; the other side produces
+its own). They can be sent to clients, from a server that we start here, or
+to a server, from clients that we connect here. Each connection in the
+capture is played by its own connection. The simulated clients (as in
+rp_load_generator) answer every event, and clients that connect to a server
+each need their own source IP.
+
+Streamed bodies are sent whole, and idempotency-keys are dropped so that the
+same capture can be replayed again right away.
+"""
+
+import logging
+import collections
+import time
+
+import gevent
+import gevent.event
+import gevent.lock
+import gevent.pool
+
+import rpipe.config.client
+import rpipe.config.load_generator
+import rpipe.config.replay
+import rpipe.config.server
+
+import rpipe.capture
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.transport
+import rpipe.tools.measure
+
+TARGET_CLIENTS = 'clients'
+TARGET_SERVER = 'server'
+
+_REPLAYED_TYPES = (rpipe.protocols.MT_EVENT, rpipe.protocols.MT_EVENT_BATCH)
+
+_logger = logging.getLogger(__name__)
+
+_REQUEST_T = collections.namedtuple(
+                '_REQUEST_T',
+                ['offset_s', 'connection_id', 'message_obj'])
+
+
+class ReplayResult(object):
+    def __init__(self, target, speed):
+        self.target = target
+        self.speed = speed
+
+        self.connection_count = 0
+        self.request_count = 0
+        self.request_failures = 0
+        self.capture_s = 0.0
+        self.replay_s = 0.0
+
+        self.latency = rpipe.tools.measure.LatencyHistogram()
+
+        # How far behind the schedule each request was sent.
+        self.lag = rpipe.tools.measure.LatencyHistogram()
+
+    def render(self):
+        lines = [
+            "Replay: (%d) requests over (%d) connections to the %s at "
+            "(%s)x" %
+            (self.request_count, self.connection_count, self.target,
+             self.speed or 'unlimited'),
+            "Duration: captured=(%.2f)s replayed=(%.2f)s with (%d) failures" %
+            (self.capture_s, self.replay_s, self.request_failures),
+            "Lag: MEAN=(%.3f)ms P99=(%s)ms MAX=(%.3f)ms" %
+            (self.lag.mean_ms, self.lag.get_percentile_ms(99),
+             self.lag.max_ms),
+            "Latency: N=(%d) MEAN=(%.3f)ms P50=(%s)ms P99=(%s)ms "
+            "MAX=(%.3f)ms" %
+            (self.latency.count, self.latency.mean_ms,
+             self.latency.get_percentile_ms(50),
+             self.latency.get_percentile_ms(99),
+             self.latency.max_ms),
+            self.latency.render(),
+        ]
+
+        return '\n'.join(lines)
+
+
+def _prepare(message_obj, chunks):
+    if chunks is not None:
+        message_obj.data = b''.join(chunks)
+        message_obj.is_streamed = False
+
+    message_obj.ClearField('idempotency_key')
+
+def load_requests(file_, direction=rpipe.capture.DIRECTION_SENT):
+    """Return the events (and batches) in the capture that went in the given
+    direction, in order, with their offsets from the first one.
+    """
+
+    requests = []
+
+    # The bodies of streamed events, by connection and message-ID.
+    streaming = {}
+
+    first_at = None
+    for record in rpipe.capture.read_capture(file_):
+        if record.direction != direction:
+            continue
+
+        (message_info, message_obj) = \
+            rpipe.protocol.read_message_from_buffer(bytearray(record.frame))
+
+        message_type = rpipe.protocol.get_message_type_from_info(message_info)
+        message_id = rpipe.protocol.get_message_id_from_info(message_info)
+        key = (record.connection_id, message_id)
+
+        if message_type == rpipe.protocols.MT_EVENT_CHUNK:
+            try:
+                (message_obj_, chunks) = streaming[key]
+            except KeyError:
+                continue
+
+            chunks.append(message_obj.data)
+            if message_obj.is_last is True:
+                _prepare(message_obj_, chunks)
+                del streaming[key]
+
+            continue
+
+        if message_type not in _REPLAYED_TYPES or \
+           rpipe.protocol.get_is_response_from_info(message_info) is True:
+            continue
+
+        if first_at is None:
+            first_at = record.timestamp
+
+        if message_type == rpipe.protocols.MT_EVENT:
+            if message_obj.is_streamed is True:
+                streaming[key] = (message_obj, [message_obj.data])
+            else:
+                _prepare(message_obj, None)
+        else:
+            for event_obj in message_obj.events:
+                _prepare(event_obj, None)
+
+        requests.append(
+            _REQUEST_T(
+                record.timestamp - first_at,
+                record.connection_id,
+                message_obj))
+
+    # Streams that the capture didn't see the end of can't be replayed.
+    incomplete = set(id(message_obj)
+                     for (message_obj, chunks)
+                     in streaming.values())
+
+    return [request
+            for request
+            in requests
+            if id(request.message_obj) not in incomplete]
+
+
+class ReplayClient(object):
+    """A client connection that sends the events of one captured connection
+    to the server. It heartbeats like the real client and answers whatever
+    the server sends it with an empty reply.
+    """
+
+    def __init__(self, source_ip, binding):
+        self.__source_ip = source_ip
+        self.__binding = binding
+
+        self.__transport = rpipe.transport.TlsTcpTransport(
+                            rpipe.config.client.KEY_FILEPATH,
+                            rpipe.config.client.CRT_FILEPATH,
+                            source_ip=source_ip,
+                            admission_preamble=\
+                                rpipe.config.client.ADMISSION_PREAMBLE)
+
+        reply = rpipe.protocol.get_obj_from_type(rpipe.protocols.MT_EVENT_R)
+        reply.version = 1
+        reply.code = 0
+        reply.data = b''
+
+        self.__event_reply = reply
+
+        heartbeat = rpipe.protocol.get_obj_from_type(
+                        rpipe.protocols.MT_HEARTBEAT)
+
+        heartbeat.version = 1
+
+        self.__heartbeat = heartbeat
+
+        self.__ws = None
+        self.__write_lock = gevent.lock.Semaphore()
+        self.__replied = {}
+        self.__gs = gevent.pool.Group()
+
+    def connect(self):
+        self.__ws = self.__transport.connect(self.__binding)
+
+        self.__gs.spawn(self.__heartbeat_loop)
+        self.__gs.spawn(self.__read_loop)
+
+    def close(self):
+        self.__gs.kill()
+
+        try:
+            self.__ws.close()
+        except:
+            pass
+
+    def __send(self, message_obj, **kwargs):
+        with self.__write_lock:
+            return rpipe.protocol.send_message_obj(
+                    self.__ws,
+                    message_obj,
+                    **kwargs)
+
+    def __heartbeat_loop(self):
+        while 1:
+            gevent.sleep(rpipe.config.load_generator.HEARTBEAT_INTERVAL_S)
+            self.__send(self.__heartbeat)
+
+    def __read_loop(self):
+        while 1:
+            try:
+                (message_info, message_obj) = \
+                    rpipe.protocol.read_message_from_file_object(self.__ws)
+            except rpipe.exceptions.RpConnectionClosed:
+                break
+
+            message_type = rpipe.protocol.get_message_type_from_info(
+                            message_info)
+
+            message_id = rpipe.protocol.get_message_id_from_info(message_info)
+
+            if message_type == rpipe.protocols.MT_EVENT:
+                self.__send(
+                    self.__event_reply,
+                    message_id=message_id,
+                    is_response=True)
+            elif rpipe.protocol.get_is_response_from_info(message_info) \
+                    is True:
+                r = self.__replied.pop(message_id, None)
+                if r is not None:
+                    r.set(message_obj)
+
+        for r in list(self.__replied.values()):
+            r.set_exception(rpipe.exceptions.RpConnectionClosed())
+
+    def initiate_message(self, message_obj, timeout_s=None):
+        # Register before sending, since the reply can arrive before the
+        # write returns.
+        message_id = rpipe.protocol.id_generator()
+        r = gevent.event.AsyncResult()
+        self.__replied[message_id] = r
+
+        try:
+            self.__send(message_obj, message_id=message_id)
+            return r.get(timeout=timeout_s)
+        finally:
+            self.__replied.pop(message_id, None)
+
+    def send_message(self, message_obj):
+        self.__send(message_obj)
+
+
+def _replay(result, requests, connections, speed, timeout_s):
+    """Send each request over the connection that plays its captured one, at
+    its (scaled) offset.
+    """
+
+    def send(request, scheduled_at):
+        result.lag.add(max(0, time.time() - scheduled_at))
+
+        c = connections[request.connection_id]
+        message_obj = request.message_obj
+
+        started_at = time.time()
+
+        try:
+            if rpipe.protocols.get_type_from_obj(message_obj) == \
+                    rpipe.protocols.MT_EVENT and \
+               message_obj.no_reply is True:
+                c.send_message(message_obj)
+                return
+
+            c.initiate_message(message_obj, timeout_s=timeout_s)
+        except Exception:
+            _logger.exception("Request failed.")
+            result.request_failures += 1
+        else:
+            result.latency.add(time.time() - started_at)
+
+    senders = gevent.pool.Group()
+    started_at = time.time()
+
+    for request in requests:
+        if speed > 0:
+            scheduled_at = started_at + request.offset_s / speed
+
+            wait_s = scheduled_at - time.time()
+            if wait_s > 0:
+                gevent.sleep(wait_s)
+        else:
+            scheduled_at = time.time()
+
+        senders.spawn(send, request, scheduled_at)
+
+    senders.join()
+
+    result.replay_s = time.time() - started_at
+
+def _get_clients(connection_ids, binding, external_clients):
+    """Start a server and return its connections, by captured connection."""
+
+    import rpipe.server.connection
+    import rpipe.tools.load_generator
+
+    transport = rpipe.transport.TlsTcpTransport(
+                    rpipe.config.server.KEY_FILEPATH,
+                    rpipe.config.server.CRT_FILEPATH,
+                    ca_certs=rpipe.config.server.CA_CRT_FILEPATH,
+                    admission_preamble=rpipe.config.server.ADMISSION_PREAMBLE)
+
+    server = rpipe.server.connection.Server(
+                transport=transport,
+                binding=binding)
+
+    server.start()
+
+    catalog = rpipe.server.connection.get_connection_catalog()
+    source_ips = rpipe.tools.measure.get_source_ips(len(connection_ids))
+
+    clients = gevent.pool.Group()
+    if external_clients is False:
+        stats = rpipe.tools.load_generator.LoadStats()
+
+        for source_ip in source_ips:
+            c = rpipe.tools.load_generator.SimulatedClient(
+                    source_ip,
+                    binding,
+                    stats,
+                    0,
+                    0)
+
+            clients.spawn(c.run)
+
+    connections = dict(
+        (connection_id,
+         catalog.wait_for_connection(
+            source_ip,
+            timeout_s=rpipe.config.replay.CONNECT_TIMEOUT_S))
+        for (connection_id, source_ip)
+        in zip(connection_ids, source_ips))
+
+    def stop():
+        clients.kill()
+        server.stop()
+
+    return (connections, stop)
+
+def _get_server(connection_ids, binding):
+    """Connect a client for each captured connection."""
+
+    source_ips = rpipe.tools.measure.get_source_ips(len(connection_ids))
+
+    connections = {}
+    for (connection_id, source_ip) in zip(connection_ids, source_ips):
+        c = ReplayClient(source_ip, binding)
+        c.connect()
+
+        connections[connection_id] = c
+
+    def stop():
+        for c in connections.values():
+            c.close()
+
+    return (connections, stop)
+
+def run(capture_filepath, target, binding,
+        direction=rpipe.capture.DIRECTION_SENT,
+        speed=rpipe.config.replay.SPEED,
+        timeout_s=rpipe.config.replay.REQUEST_TIMEOUT_S,
+        external_clients=False):
+    """Replay the capture, log the report, and return the result. With the
+    clients as the target, we listen on `binding` (and, if
+    `external_clients`, wait for real clients to connect from the simulated
+    clients' source IPs). Otherwise, we connect to the server there. Expects
+    the process to already be monkey-patched.
+    """
+
+    with open(capture_filepath, 'rb') as f:
+        requests = load_requests(f, direction=direction)
+
+    result = ReplayResult(target, speed)
+
+    if not requests:
+        _logger.warning("There's nothing to replay in: [%s]",
+                        capture_filepath)
+
+        return result
+
+    connection_ids = sorted(set(request.connection_id
+                                for request
+                                in requests))
+
+    result.connection_count = len(connection_ids)
+    result.request_count = len(requests)
+    result.capture_s = requests[-1].offset_s
+
+    _logger.info("Replaying (%d) requests over (%d) connections to the %s: "
+                 "SPEED=(%s)", result.request_count, result.connection_count,
+                 target, speed)
+
+    if target == TARGET_CLIENTS:
+        (connections, stop) = _get_clients(
+                                connection_ids,
+                                binding,
+                                external_clients)
+    elif target == TARGET_SERVER:
+        (connections, stop) = _get_server(connection_ids, binding)
+    else:
+        raise ValueError("Target not valid: [%s]" % (target,))
+
+    try:
+        _replay(result, requests, connections, speed, timeout_s)
+    finally:
+        stop()
+
+    _logger.info("Replay report:\n%s", result.render())
+
+    return result
@@ -0,0 +1,698 @@
+"""Transports carry the framed protocol between the two participants. They all
+produce stream objects with the same small interface (read, write, close) so
+that the message-exchange doesn't care what's underneath.
+"""
+
+import logging
+import os
+import socket
+import struct
+import time
+
+import gevent
+import gevent.event
+import gevent.server
+import gevent.socket
+import gevent.ssl
+
+import rpipe.config.statsd
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.stats
+
+TRANSPORT_TLS = 'tls'
+TRANSPORT_UNIX = 'unix'
+TRANSPORT_MEMORY = 'memory'
+
+DEFAULT_MEMORY_BINDING = 'rpipe'
+
+# Client-side session resumption needs `SSLSocket.session` (Python 3.6+), so 
+# a client on Python 2 always does a full handshake. The server resumes 
+# sessions (IDs and tickets) regardless since its context is shared.
+_CAN_RESUME_CLIENT_SESSIONS = hasattr(gevent.ssl.SSLSocket, 'session')
+
+_contexts = {}
+
+
+_logger = logging.getLogger(__name__)
+
+
+class BandwidthShaper(object):
+    """A token-bucket for bytes. The writer waits for the bucket to cover a 
+    write before it's made, and writes are split so that none is larger than 
+    the burst, so the line is never used faster than the rate (beyond the 
+    burst) and a large frame can't hold the connection for longer than one 
+    burst at a time.
+    """
+
+    def __init__(self, rate_bps, burst_bytes):
+        self.__rate_bps = float(rate_bps)
+        self.__burst_bytes = int(burst_bytes)
+        self.__tokens = float(self.__burst_bytes)
+        self.__updated_at = time.time()
+
+    def __refill(self):
+        now = time.time()
+
+        self.__tokens = min(
+                            self.__burst_bytes,
+                            self.__tokens + 
+                                (now - self.__updated_at) * self.__rate_bps)
+
+        self.__updated_at = now
+
+    def wait(self, length):
+        """Block until `length` bytes (no more than the burst) can be 
+        written.
+        """
+
+        assert length <= self.__burst_bytes
+
+        self.__refill()
+
+        if self.__tokens < length:
+            gevent.sleep((length - self.__tokens) / self.__rate_bps)
+            self.__refill()
+
+        self.__tokens -= length
+
+    def get_chunks(self, data):
+        """Split the data into pieces that can each be paid for in one go."""
+
+        if len(data) <= self.__burst_bytes:
+            return [data]
+
+        view = memoryview(data)
+        return [view[i:i + self.__burst_bytes]
+                for i 
+                in range(0, len(data), self.__burst_bytes)]
+
+
+class SocketWrapper(object):
+    """A thin wrapper that throws the right exceptions when the pipe is broken.
+    It also counts the bytes in each direction, and can pace writes. 
+    `first_read_cb`, if given, is called once the first read has succeeded.
+    """
+
+    def __init__(self, socket, file_, first_read_cb=None):
+        assert socket is not None
+        assert file_ is not None
+
+        self.__socket = socket
+        self.__file = file_
+        self.__shaper = None
+        self.__first_read_cb = first_read_cb
+
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__file, name)
+
+    def set_shaper(self, shaper):
+        self.__shaper = shaper
+
+    def read(self, *args, **kwargs):
+        try:
+            data = self.__file.read(*args, **kwargs)
+        except gevent.socket.error as e:
+            message = ("There was a socket error (read). Closing stream: %s" % (str(e)))
+            _logger.exception(message)
+            raise rpipe.exceptions.RpConnectionClosed(message)
+
+        if not data:
+            raise rpipe.exceptions.RpConnectionClosed()
+
+        self.bytes_read += len(data)
+
+        if self.__first_read_cb is not None:
+            first_read_cb = self.__first_read_cb
+            self.__first_read_cb = None
+
+            first_read_cb()
+
+        return data
+
+    def write(self, data):
+        if self.__shaper is None:
+            chunks = [data]
+        else:
+            chunks = self.__shaper.get_chunks(data)
+
+        try:
+            for chunk in chunks:
+                if self.__shaper is not None:
+                    self.__shaper.wait(len(chunk))
+
+                self.__file.write(chunk)
+                self.__file.flush()
+        except gevent.ssl.SSLError as e:
+            message = ("There was an SSL error (read). Closing stream: %s" % (str(e)))
+            _logger.exception(message)
+            raise rpipe.exceptions.RpConnectionClosed(message)
+        except gevent.socket.error as e:
+            message = ("There was a socket error (write). Closing stream: %s" % (str(e)))
+            _logger.exception(message)
+            raise rpipe.exceptions.RpConnectionClosed(message)
+
+        self.bytes_written += len(data)
+
+    def close(self):
+        try:
+            self.__file.close()
+        finally:
+            self.__socket.close()
+
+    @property
+    def socket(self):
+        return self.__socket
+
+    def __str__(self):
+        try:
+            return str(self.__socket.getpeername())
+        except socket.error:
+            return '<disconnected>'
+
+
+class MemoryStream(object):
+    """One end of an in-memory pipe. Bytes written to it are read from its
+    peer.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__buffer = bytearray()
+        self.__readable = gevent.event.Event()
+        self.__closed = False
+        self.__peer = None
+        self.__shaper = None
+
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def set_peer(self, peer):
+        self.__peer = peer
+
+    def set_shaper(self, shaper):
+        self.__shaper = shaper
+
+    def _receive(self, data):
+        self.__buffer += data
+        self.__readable.set()
+
+    def _peer_closed(self):
+        self.__closed = True
+        self.__readable.set()
+
+    def read(self, length):
+        while len(self.__buffer) < length:
+            if self.__closed is True:
+                raise rpipe.exceptions.RpConnectionClosed()
+
+            self.__readable.clear()
+            self.__readable.wait()
+
+        data = bytes(self.__buffer[:length])
+        del self.__buffer[:length]
+
+        self.bytes_read += length
+
+        return data
+
+    def write(self, data):
+        if self.__closed is True:
+            raise rpipe.exceptions.RpConnectionClosed()
+
+        if self.__shaper is None:
+            self.__peer._receive(data)
+        else:
+            for chunk in self.__shaper.get_chunks(data):
+                self.__shaper.wait(len(chunk))
+
+                if self.__closed is True:
+                    raise rpipe.exceptions.RpConnectionClosed()
+
+                self.__peer._receive(chunk)
+
+        self.bytes_written += len(data)
+
+        # Let the reader run, like a socket write would.
+        gevent.sleep(0)
+
+    def close(self):
+        if self.__closed is True:
+            return
+
+        self.__closed = True
+        self.__readable.set()
+        self.__peer._peer_closed()
+
+    def __str__(self):
+        return self.__name
+
+
+def create_memory_pipe(name='memory'):
+    """Create two connected in-memory streams."""
+
+    a = MemoryStream(name + '-a')
+    b = MemoryStream(name + '-b')
+
+    a.set_peer(b)
+    b.set_peer(a)
+
+    return (a, b)
+
+
+def _recv_exactly(s, length):
+    parts = []
+    while length > 0:
+        data = s.recv(length)
+        if not data:
+            raise rpipe.exceptions.RpConnectionFail(
+                    "Connection closed during admission.")
+
+        parts.append(data)
+        length -= len(data)
+
+    return b''.join(parts)
+
+def _get_ssl_context(keyfile, certfile, ca_certs=None, server_side=False):
+    """Return the process-wide SSL context for the given identity. The PEMs 
+    are read once, and the server's session cache (and ticket key) lives on 
+    the context, so it has to be shared for resumption to work.
+    """
+
+    key = (keyfile, certfile, ca_certs, server_side)
+
+    try:
+        return _contexts[key]
+    except KeyError:
+        pass
+
+    context = gevent.ssl.SSLContext(gevent.ssl.PROTOCOL_SSLv23)
+    context.load_cert_chain(certfile, keyfile=keyfile)
+
+    if server_side is True:
+        context.verify_mode = gevent.ssl.CERT_REQUIRED
+        context.load_verify_locations(ca_certs)
+    else:
+        # As before, the client authenticates itself but doesn't verify the 
+        # server.
+        context.check_hostname = False
+        context.verify_mode = gevent.ssl.CERT_NONE
+
+    _contexts[key] = context
+    return context
+
+def _post_handshake(ss):
+    session_reused = getattr(ss, 'session_reused', None)
+    if session_reused is None:
+        return
+
+    if session_reused is True:
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_TLS_HANDSHAKE_RESUMED_TICK)
+    else:
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_TLS_HANDSHAKE_FULL_TICK)
+
+def _get_unix_peer_address(s):
+    """Unix sockets have no peer address, so we make one up from the peer's 
+    PID (or, where the kernel won't tell us that, the descriptor, which is 
+    unique among the open connections). It's a loopback address (PIDs fit in 
+    24 bits) so that every peer is cataloged under its own IP.
+    """
+
+    try:
+        creds = s.getsockopt(
+                    socket.SOL_SOCKET,
+                    socket.SO_PEERCRED,
+                    struct.calcsize('3i'))
+    except (AttributeError, socket.error):
+        n = s.fileno()
+    else:
+        (n, uid, gid) = struct.unpack('3i', creds)
+
+    ip = '127.%d.%d.%d' % ((n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff)
+    return (ip, n)
+
+def _set_nodelay(s):
+    """Messages are small and latency-sensitive, and every one is flushed in 
+    a single write. Nagle would only hold them back waiting on delayed ACKs.
+    """
+
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class Transport(object):
+    def connect(self, binding):
+        """Connect to the given binding and return a stream."""
+
+        raise NotImplementedError()
+
+    def create_server(self, binding, handle_cb):
+        """Return a server that will call `handle_cb` with a stream and a
+        peer-address for every new connection. The result must implement
+        `serve_forever()` and `stop()`.
+        """
+
+        raise NotImplementedError()
+
+
+class TlsTcpTransport(Transport):
+    """TLS over TCP. This is the default and the only choice when the peers
+    aren't on the same host.
+
+    With the admission preamble enabled (both sides must agree), the server 
+    will only run so many TLS handshakes at once. Anybody beyond that gets a 
+    cheap, plaintext "retry-after" instead of a handshake, which keeps a 
+    fleet-wide reconnect from saturating the accept path.
+    """
+
+    def __init__(self, keyfile, certfile, ca_certs=None, write_timeout_s=None, 
+                 source_ip=None, admission_preamble=False, 
+                 max_concurrent_handshakes=None, handshake_retry_after_s=5,
+                 handshake_timeout_s=None, reuse_port=False):
+        self.__keyfile = keyfile
+        self.__certfile = certfile
+        self.__ca_certs = ca_certs
+        self.__write_timeout_s = write_timeout_s
+        self.__source_ip = source_ip
+        self.__admission_preamble = admission_preamble
+        self.__max_concurrent_handshakes = max_concurrent_handshakes
+        self.__handshake_retry_after_s = handshake_retry_after_s
+        self.__handshake_timeout_s = handshake_timeout_s
+        self.__reuse_port = reuse_port
+
+        self.__active_handshakes = 0
+
+        # The last session we had with the server, to resume on reconnect.
+        self.__session = None
+
+    def __get_client_context(self):
+        return _get_ssl_context(self.__keyfile, self.__certfile)
+
+    def __get_server_context(self):
+        return _get_ssl_context(
+                self.__keyfile, 
+                self.__certfile, 
+                ca_certs=self.__ca_certs, 
+                server_side=True)
+
+    def __wrap_client(self, s):
+        context = self.__get_client_context()
+
+        if _CAN_RESUME_CLIENT_SESSIONS is False:
+            ss = context.wrap_socket(s)
+            _post_handshake(ss)
+
+            return ss
+
+        ss = context.wrap_socket(s, session=self.__session)
+        _post_handshake(ss)
+
+        if self.__session is not None:
+            if ss.session_reused is True:
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.EVENT_TLS_CLIENT_SESSION_RESUMED_TICK)
+            else:
+                rpipe.stats.post_to_counter(
+                    rpipe.config.statsd.\
+                        EVENT_TLS_CLIENT_SESSION_NOT_RESUMED_TICK)
+
+        return ss
+
+    def __save_session(self, ss):
+        """Under TLS 1.3, the server sends its session ticket after the 
+        handshake, so the session isn't worth keeping until we've read 
+        something from the server.
+        """
+
+        if _CAN_RESUME_CLIENT_SESSIONS is False:
+            return
+
+        try:
+            self.__session = ss.session
+        except (gevent.socket.error, gevent.ssl.SSLError, ValueError):
+            _logger.exception("Could not save the TLS session.")
+
+    def __read_admission(self, s):
+        response = _recv_exactly(s, len(rpipe.protocol.ADMISSION_ACCEPT))
+        if response == rpipe.protocol.ADMISSION_ACCEPT:
+            return
+
+        if response != rpipe.protocol.ADMISSION_RETRY:
+            raise rpipe.exceptions.RpConnectionFail(
+                    "Admission response not valid: [%r]" % (response,))
+
+        length = struct.calcsize(rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT)
+        (retry_after_s,) = struct.unpack(
+                            rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT, 
+                            _recv_exactly(s, length))
+
+        raise rpipe.exceptions.RpConnectionRetryAfter(retry_after_s)
+
+    def connect(self, binding):
+        s = gevent.socket.socket(
+                gevent.socket.AF_INET,
+                gevent.socket.SOCK_STREAM)
+
+        _set_nodelay(s)
+
+        if self.__source_ip is not None:
+            s.bind((self.__source_ip, 0))
+
+        try:
+            s.connect(binding)
+
+            if self.__admission_preamble is True:
+                self.__read_admission(s)
+
+            ss = self.__wrap_client(s)
+        except (gevent.socket.error, gevent.ssl.SSLError) as e:
+            s.close()
+            raise rpipe.exceptions.RpConnectionFail(str(e))
+        except rpipe.exceptions.RpConnectionFail:
+            s.close()
+            raise
+
+        ss.settimeout(self.__write_timeout_s)
+
+        return SocketWrapper(
+                ss, 
+                ss.makefile('rwb'), 
+                first_read_cb=lambda: self.__save_session(ss))
+
+    def __set_active_handshakes(self, count):
+        self.__active_handshakes = count
+
+        rpipe.stats.post_to_gauge(
+            rpipe.config.statsd.EVENT_CONNECTION_SERVER_HANDSHAKE_ACTIVE_GAUGE,
+            count)
+
+    def __admit_and_wrap(self, s, address):
+        """Return a wrapped SSL socket, or None if the connection was turned
+        away or failed its handshake.
+        """
+
+        if self.__max_concurrent_handshakes is not None and \
+           self.__active_handshakes >= self.__max_concurrent_handshakes:
+            _logger.debug("Too many concurrent handshakes (%d). Asking [%s] "
+                          "to retry after (%d) seconds.", 
+                          self.__active_handshakes, address, 
+                          self.__handshake_retry_after_s)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.\
+                    EVENT_CONNECTION_SERVER_HANDSHAKE_REJECT_TICK)
+
+            try:
+                s.sendall(rpipe.protocol.ADMISSION_RETRY + 
+                          struct.pack(
+                            rpipe.protocol.ADMISSION_RETRY_AFTER_FORMAT, 
+                            self.__handshake_retry_after_s))
+            except gevent.socket.error:
+                pass
+
+            return None
+
+        self.__set_active_handshakes(self.__active_handshakes + 1)
+
+        try:
+            s.settimeout(self.__handshake_timeout_s)
+            s.sendall(rpipe.protocol.ADMISSION_ACCEPT)
+
+            with rpipe.stats.time_and_post(
+                    rpipe.config.statsd.\
+                        EVENT_CONNECTION_SERVER_HANDSHAKE_TIMING):
+                ss = self.__get_server_context().wrap_socket(
+                        s, 
+                        server_side=True)
+
+            ss.settimeout(None)
+            _post_handshake(ss)
+        except (gevent.socket.error, gevent.ssl.SSLError) as e:
+            _logger.warning("Handshake with [%s] failed: %s", address, str(e))
+            return None
+        finally:
+            self.__set_active_handshakes(self.__active_handshakes - 1)
+
+        return ss
+
+    def __create_listener(self, binding):
+        """Several acceptor processes can listen on the same port if they all 
+        set SO_REUSEPORT. The kernel then balances new connections between 
+        them.
+        """
+
+        if self.__reuse_port is False:
+            return binding
+
+        listener = gevent.socket.socket(
+                    gevent.socket.AF_INET,
+                    gevent.socket.SOCK_STREAM)
+
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        listener.bind(binding)
+        listener.listen(socket.SOMAXCONN)
+
+        return listener
+
+    def create_server(self, binding, handle_cb):
+        listener = self.__create_listener(binding)
+
+        if self.__admission_preamble is False:
+            def handle(socket, address):
+                _set_nodelay(socket)
+                _post_handshake(socket)
+                handle_cb(SocketWrapper(socket, socket.makefile('rwb')), address)
+
+            return gevent.server.StreamServer(
+                    listener,
+                    handle,
+                    ssl_context=self.__get_server_context())
+
+        # We do the TLS ourselves so that we can decide whether to do it at 
+        # all.
+        def handle_with_admission(socket, address):
+            _set_nodelay(socket)
+
+            ss = self.__admit_and_wrap(socket, address)
+            if ss is None:
+                return
+
+            handle_cb(SocketWrapper(ss, ss.makefile('rwb')), address)
+
+        return gevent.server.StreamServer(listener, handle_with_admission)
+
+
+class UnixTransport(Transport):
+    """Plaintext Unix-domain sockets for co-located, trusted peers. There is
+    no encryption or authentication beyond the filesystem permissions on the
+    socket. The binding is the socket path.
+    """
+
+    def __init__(self, write_timeout_s=None):
+        self.__write_timeout_s = write_timeout_s
+
+    def connect(self, binding):
+        s = gevent.socket.socket(
+                gevent.socket.AF_UNIX,
+                gevent.socket.SOCK_STREAM)
+
+        try:
+            s.connect(binding)
+        except gevent.socket.error as e:
+            raise rpipe.exceptions.RpConnectionFail(str(e))
+
+        s.settimeout(self.__write_timeout_s)
+
+        return SocketWrapper(s, s.makefile('rwb'))
+
+    def create_server(self, binding, handle_cb):
+        if os.path.exists(binding) is True:
+            os.unlink(binding)
+
+        listener = gevent.socket.socket(
+                    gevent.socket.AF_UNIX,
+                    gevent.socket.SOCK_STREAM)
+
+        listener.bind(binding)
+        listener.listen(socket.SOMAXCONN)
+
+        def handle(s, address):
+            handle_cb(SocketWrapper(s, s.makefile('rwb')),
+                      _get_unix_peer_address(s))
+
+        return gevent.server.StreamServer(listener, handle)
+
+
+class _MemoryServer(object):
+    def __init__(self, transport, binding, handle_cb):
+        self.__transport = transport
+        self.__binding = binding
+        self.__handle_cb = handle_cb
+        self.__stopped = gevent.event.Event()
+
+    def handle(self, stream, address):
+        gevent.spawn(self.__handle_cb, stream, address)
+
+    def serve_forever(self):
+        self.__transport.register_server(self.__binding, self)
+        self.__stopped.wait()
+
+    def stop(self):
+        self.__transport.deregister_server(self.__binding)
+        self.__stopped.set()
+
+
+class MemoryTransport(Transport):
+    """Connect peers within the same process via in-memory pipes. There's no
+    kernel or crypto involvement, which makes it useful for tests and for
+    profiling the protocol stack on its own. The binding is an arbitrary
+    name.
+    """
+
+    def __init__(self):
+        self.__servers = {}
+        self.__counter = 0
+
+    def register_server(self, binding, server):
+        self.__servers[binding] = server
+
+    def deregister_server(self, binding):
+        del self.__servers[binding]
+
+    def connect(self, binding):
+        try:
+            server = self.__servers[binding]
+        except KeyError:
+            raise rpipe.exceptions.RpConnectionFail(
+                    "No in-memory server listening on [%s]." % (binding,))
+
+        self.__counter += 1
+
+        (client_stream, server_stream) = create_memory_pipe(str(binding))
+
+        # Every in-memory client gets a distinct loopback address so that the
+        # connection catalog can tell them apart.
+        address = ('127.0.%d.%d' % ((self.__counter >> 8) & 0xff,
+                                    self.__counter & 0xff),
+                   self.__counter)
+
+        server.handle(server_stream, address)
+
+        return client_stream
+
+    def create_server(self, binding, handle_cb):
+        return _MemoryServer(self, binding, handle_cb)
+
+_memory_transport = MemoryTransport()
+
+def get_memory_transport():
+    """The in-memory transport is only meaningful if both sides share the same
+    instance.
+    """
+
+    return _memory_transport
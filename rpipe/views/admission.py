@@ -0,0 +1,48 @@
+"""Apply admission control (see rpipe.server.admission) to the current
+request, turning it away with a 503 while the client's tunnel is overloaded.
+"""
+
+import logging
+import contextlib
+
+import web
+
+import rpipe.server.admission
+
+_logger = logging.getLogger(__name__)
+
+
+def get_overloaded_error(e):
+    """Return the 503 for a LoadSheddingError."""
+
+    return web.HTTPError(
+            '503 Server overloaded',
+            headers={
+                'Retry-After': str(e.retry_after_s),
+            })
+
+def check(c):
+    """Respond with a 503 if an event for the connection would be shed. This 
+    is for events that aren't waited on (see admitted()).
+    """
+
+    ac = rpipe.server.admission.get_admission_controller()
+
+    try:
+        ac.check(c.ip, queue_depth=c.queue_depth)
+    except rpipe.server.admission.LoadSheddingError as e:
+        raise get_overloaded_error(e)
+
+@contextlib.contextmanager
+def admitted(c):
+    """Run the body as an admitted event for the connection, or respond with
+    a 503.
+    """
+
+    ac = rpipe.server.admission.get_admission_controller()
+
+    try:
+        with ac.admit(c.ip, queue_depth=c.queue_depth):
+            yield
+    except rpipe.server.admission.LoadSheddingError as e:
+        raise get_overloaded_error(e)
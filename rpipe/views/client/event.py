@@ -1,10 +1,17 @@
 import logging
 import json
+import uuid
+
 import web
 
+import rpipe.config.client
 import rpipe.config.web_server
 import rpipe.event
-import rpipe.client.connection
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.client.outbox
+import rpipe.views.disconnect
+import rpipe.views.request_body
 
 _logger = logging.getLogger(__name__)
 
@@ -16,15 +23,72 @@ class EventClient(object):
         _logger.info("Client received request, to be sent to server: [%s] "
                      "[%s]", verb, noun)
 
-        c = rpipe.client.connection.get_connection()
+        try:
+            timeout_s = rpipe.event.get_request_timeout_s(
+                            verb,
+                            noun,
+                            web.ctx.env.get(
+                                rpipe.config.web_server.\
+                                    WSGI_HEADER_EVENT_TIMEOUT_MS))
+        except ValueError:
+            raise web.HTTPError('400 Timeout not valid')
+
         mimetype = web.ctx.env.get('CONTENT_TYPE')
 
-        r = rpipe.event.send_message_to_remote(
-                c, 
-                verb, 
-                noun, 
-                web.data(), 
-                mimetype)
+        (data, chunks) = rpipe.views.request_body.get_request_body()
+
+        # Any attempt that the outbox replays will only be run once. The 
+        # caller's key only has to be unique to the caller.
+        idempotency_key = web.ctx.env.get(
+                            rpipe.config.web_server.\
+                                WSGI_HEADER_IDEMPOTENCY_KEY)
+
+        if idempotency_key is None:
+            idempotency_key = uuid.uuid4().hex
+        else:
+            idempotency_key = '%s:%s' % (
+                web.ctx.env.get(
+                    rpipe.config.web_server.CALLER_IDENTITY_WSGI_KEY, 
+                    'unknown'), 
+                idempotency_key)
+
+        def send_cb(c, timeout_s):
+            return rpipe.event.send_message_to_remote(
+                    c, 
+                    verb, 
+                    noun, 
+                    data, 
+                    mimetype,
+                    timeout_s=timeout_s,
+                    chunks=chunks,
+                    idempotency_key=idempotency_key)
+
+        # If the connection is down, wait for it to come back.
+        ob = rpipe.client.outbox.get_outbox()
+
+        try:
+            with rpipe.views.disconnect.cancel_on_disconnect():
+                r = ob.send(
+                        send_cb, 
+                        verb, 
+                        timeout_s=timeout_s, 
+                        can_replay=chunks is None)
+        except rpipe.client.outbox.OutboxFullError:
+            raise web.HTTPError(
+                    '503 Server connection unavailable',
+                    headers={
+                        'Retry-After': str(rpipe.config.client.\
+                                MINIMAL_CONNECTION_FAIL_REATTEMPT_WAIT_TIME_S),
+                    })
+        except rpipe.exceptions.RpConnectionClosed:
+            raise web.HTTPError('503 Server connection lost')
+        except rpipe.message_exchange.ResponseTimeoutError:
+            raise web.HTTPError('504 Server did not respond in time')
+        except rpipe.views.disconnect.CallerDisconnectedError:
+            _logger.warning("Caller disconnected before server responded: "
+                            "[%s] [%s]", verb, noun)
+
+            raise web.HTTPError('499 Caller disconnected')
 
         (code, mimetype, data) = r
 
@@ -0,0 +1,62 @@
+"""Notice when the HTTP caller hangs-up while we're waiting on the other side 
+of the pipe, so that we can stop waiting (which also gets the event cancelled 
+on the other side).
+"""
+
+import logging
+import contextlib
+import socket
+
+import gevent
+import gevent.socket
+
+import web
+
+# How often to look again while the caller still has data for us (a body 
+# that's still being streamed, or the next request on a keep-alive 
+# connection).
+_RECHECK_INTERVAL_S = 1
+
+_logger = logging.getLogger(__name__)
+
+
+class CallerDisconnectedError(Exception):
+    pass
+
+
+def _watch_caller(s, parent_g):
+    while 1:
+        try:
+            gevent.socket.wait_read(s.fileno())
+
+            if not s.recv(1, socket.MSG_PEEK):
+                break
+        except ValueError:
+            # SSL sockets can't peek. We can't tell.
+            return
+        except socket.error:
+            break
+
+        # The caller has sent something more, so it's still there.
+        gevent.sleep(_RECHECK_INTERVAL_S)
+
+    parent_g.kill(CallerDisconnectedError, block=False)
+
+@contextlib.contextmanager
+def cancel_on_disconnect():
+    """Raise CallerDisconnectedError in the current gthread if the caller 
+    disconnects before we're done. This requires the socket from the 
+    server (gunicorn provides it), and otherwise does nothing.
+    """
+
+    s = web.ctx.env.get('gunicorn.socket')
+    if s is None:
+        yield
+        return
+
+    watch_g = gevent.spawn(_watch_caller, s, gevent.getcurrent())
+
+    try:
+        yield
+    finally:
+        watch_g.kill()
@@ -0,0 +1,30 @@
+"""Translate between the entity-tags that handlers give us and the HTTP 
+headers.
+"""
+
+
+def parse_if_none_match(value):
+    """Return the entity-tags in an If-None-Match header. Weak tags are 
+    treated like strong ones, since we only compare them for GETs.
+    """
+
+    if not value:
+        return []
+
+    etags = []
+    for part in value.split(','):
+        part = part.strip()
+
+        if part.startswith('W/') is True:
+            part = part[2:]
+
+        if len(part) >= 2 and part[0] == '"' and part[-1] == '"':
+            part = part[1:-1]
+
+        if part:
+            etags.append(part)
+
+    return etags
+
+def format_etag(etag):
+    return '"%s"' % (etag,)
@@ -0,0 +1,49 @@
+"""Enforce the rate limits (see rpipe.server.rate_limit) for the current
+request, turning them away with a 429 before any work is done for them.
+"""
+
+import logging
+import collections
+import math
+
+import web
+
+import rpipe.config.web_server
+import rpipe.event_handling
+import rpipe.server.rate_limit
+
+_logger = logging.getLogger(__name__)
+
+
+def get_caller_identity():
+    return web.ctx.env.get(
+            rpipe.config.web_server.CALLER_IDENTITY_WSGI_KEY,
+            'unknown')
+
+def enforce(scope, identity, events):
+    """Take one token for each (verb, noun) in `events`, or respond with a
+    429. A batch is let through whole or not at all, so a rejected one costs
+    nothing.
+    """
+
+    counts = collections.defaultdict(int)
+    for (verb, noun) in events:
+        (handler_name, parameters) = \
+            rpipe.event_handling.get_handler_name_and_parameters(
+                verb,
+                noun)
+
+        counts[handler_name] += 1
+
+    rl = rpipe.server.rate_limit.get_rate_limiter()
+
+    try:
+        rl.take_all(scope, identity, counts)
+    except rpipe.server.rate_limit.RateLimitedError as e:
+        _logger.warning("Rate limited: %s", e)
+
+        raise web.HTTPError(
+                '429 Too many requests',
+                headers={
+                    'Retry-After': str(int(math.ceil(e.retry_after_s))),
+                })
@@ -0,0 +1,53 @@
+import logging
+
+import web
+
+import rpipe.config.web_server
+
+_logger = logging.getLogger(__name__)
+
+
+def _read_chunks(f, length):
+    remaining = length
+
+    while remaining is None or remaining > 0:
+        if remaining is None:
+            size = rpipe.config.web_server.STREAM_CHUNK_BYTES
+        else:
+            size = min(rpipe.config.web_server.STREAM_CHUNK_BYTES, remaining)
+
+        chunk = f.read(size)
+        if not chunk:
+            break
+
+        if remaining is not None:
+            remaining -= len(chunk)
+
+        yield chunk
+
+    if remaining is not None and remaining > 0:
+        # Don't let a truncated body pass for a complete one.
+        raise IOError("Request body ended (%d) bytes early." % (remaining,))
+
+def get_request_body():
+    """Return (data, chunks) for the current request, exactly one of which is 
+    None. Small bodies are read outright. Large ones (and those of unknown 
+    length) are returned as a generator that reads them as they're forwarded.
+    """
+
+    env = web.ctx.env
+
+    length = env.get('CONTENT_LENGTH')
+    length = int(length) if length else None
+
+    is_chunked = env.get('HTTP_TRANSFER_ENCODING', '').lower() == 'chunked'
+
+    if length is not None and \
+       length <= rpipe.config.web_server.STREAM_THRESHOLD_BYTES:
+        return (web.data(), None)
+    elif length is None and is_chunked is False:
+        return (web.data(), None)
+
+    _logger.debug("Streaming request body: LENGTH=(%s)", length)
+
+    return (None, _read_chunks(env['wsgi.input'], length))
@@ -0,0 +1,244 @@
+import logging
+import json
+import re
+import time
+
+import web
+import gevent.pool
+
+import rpipe.config.general
+import rpipe.config.protocol
+import rpipe.config.server
+import rpipe.config.statsd
+import rpipe.config.web_server
+import rpipe.event
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.server.connection
+import rpipe.server.exceptions
+import rpipe.server.fair_queue
+import rpipe.server.hostname_resolver
+import rpipe.server.rate_limit
+import rpipe.server.response_cache
+import rpipe.stats
+import rpipe.utility
+import rpipe.views.admission
+import rpipe.views.disconnect
+import rpipe.views.rate_limit
+
+_logger = logging.getLogger(__name__)
+
+_CT_JSON = 'application/json'
+
+
+class BatchServer(object):
+    """Send several events to one client in a single round-trip. The body is
+    a JSON object with a list of "events", each with a "verb", "noun", and
+    optionally "data" and "mimetype" (data that isn't a string is sent as
+    JSON). The client handles them concurrently, and the "results" are
+    returned in the same order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BatchServer, self).__init__(*args, **kwargs)
+
+        self.__cc = rpipe.server.connection.get_connection_catalog()
+
+        hostname_resolver_cls = rpipe.utility.load_cls_from_string(
+                                   rpipe.config.server.\
+                                        CLIENT_HOSTNAME_RESOLVER_CLS)
+
+        assert issubclass(
+                hostname_resolver_cls,
+                rpipe.server.hostname_resolver.HostnameResolver)
+
+        self.__resolver = hostname_resolver_cls()
+
+    def __get_events(self):
+        try:
+            events = json.loads(web.data())['events']
+        except (ValueError, TypeError, KeyError):
+            raise web.HTTPError('400 Batch not valid')
+
+        if issubclass(events.__class__, list) is False or not events:
+            raise web.HTTPError('400 Batch not valid')
+
+        if len(events) > rpipe.config.web_server.MAXIMUM_BATCH_EVENTS:
+            raise web.HTTPError('413 Too many events in batch')
+
+        built = []
+        for event in events:
+            try:
+                verb = event['verb'].lower()
+                noun = event['noun']
+            except (KeyError, TypeError, AttributeError):
+                raise web.HTTPError('400 Event not valid')
+
+            data = event.get('data')
+            mimetype = event.get('mimetype')
+
+            if data is None:
+                data = b''
+            else:
+                # Strings (text, once decoded) are sent as they are.
+                data = rpipe.event_handling.encode_data(data)
+
+                if issubclass(data.__class__, bytes) is False:
+                    data = json.dumps(data)
+                    mimetype = _CT_JSON
+
+            built.append((verb, noun, data, mimetype))
+
+        return built
+
+    def __get_timeout_s(self, events):
+        timeout_ms = web.ctx.env.get(
+                        rpipe.config.web_server.WSGI_HEADER_EVENT_TIMEOUT_MS)
+
+        # Otherwise, we wait as long as we would for the slowest of them.
+        try:
+            return max(rpipe.event.get_request_timeout_s(
+                        verb,
+                        noun,
+                        timeout_ms)
+                       for (verb, noun, data, mimetype)
+                       in events)
+        except ValueError:
+            raise web.HTTPError('400 Timeout not valid')
+
+    def __render_reply(self, r):
+        if r.mimetype == _CT_JSON and r.data:
+            data = json.loads(r.data)
+        else:
+            # Anything else has to be text to be put in the JSON.
+            data = r.data.decode('utf8', 'replace')
+
+        return {
+            'code': r.code,
+            'mimetype': r.mimetype,
+            'data': data,
+        }
+
+    def __send_separately(self, c, message_objs, timeout_s):
+        """For clients that don't support batches. The events are still sent 
+        concurrently.
+        """
+
+        pool = gevent.pool.Pool(len(message_objs))
+
+        gs = [pool.spawn(
+                rpipe.event.send_event,
+                c,
+                message_obj.verb,
+                message_obj.noun,
+                message_obj.data,
+                message_obj.mimetype,
+                timeout_s=timeout_s)
+              for message_obj
+              in message_objs]
+
+        try:
+            pool.join(raise_error=True)
+        finally:
+            pool.kill(block=False)
+
+        return [g.value for g in gs]
+
+    def POST(self, hostname):
+        events = self.__get_events()
+
+        routes = [(verb, noun) for (verb, noun, data, mimetype) in events]
+
+        rpipe.views.rate_limit.enforce(
+            rpipe.server.rate_limit.SCOPE_CALLER,
+            rpipe.views.rate_limit.get_caller_identity(),
+            routes)
+
+        timeout_s = self.__get_timeout_s(events)
+
+        _logger.info("Server received batch of (%d) events, to be sent to "
+                     "client [%s]", len(events), hostname)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_BATCH_TICK)
+
+        if re.match(rpipe.config.general.IP_RX, hostname) is not None:
+            ip = hostname
+        else:
+            try:
+                ip = self.__resolver.lookup(hostname)
+            except LookupError:
+                raise web.HTTPError('404 Hostname not resolvable')
+            except:
+                _logger.exception("Could not resolve hostname: [%s]",
+                                  hostname)
+                raise web.HTTPError('500 Hostname resolution error')
+
+        rpipe.views.rate_limit.enforce(
+            rpipe.server.rate_limit.SCOPE_CLIENT,
+            ip,
+            routes)
+
+        try:
+            c = self.__cc.wait_for_connection(
+                    ip,
+                    timeout_s=min(
+                        rpipe.config.server.DEFAULT_CONNECTION_WAIT_TIMEOUT_S,
+                        timeout_s))
+        except rpipe.server.exceptions.RpNoConnectionException:
+            raise web.HTTPError('503 Client connection unavailable')
+
+        # Whatever the writes do will probably change what a GET returns.
+        rc = rpipe.server.response_cache.get_response_cache()
+        for (verb, noun, data, mimetype) in events:
+            if verb != 'get':
+                rc.invalidate(ip, noun)
+
+        message_objs = [rpipe.event.build_event(*event) for event in events]
+
+        is_batched = c.peer_capabilities.supports(
+                        rpipe.config.protocol.FEATURE_BATCHING)
+
+        scheduler = rpipe.server.fair_queue.get_fair_scheduler()
+        queued_at = time.time()
+
+        try:
+            with rpipe.views.admission.admitted(c), \
+                 rpipe.views.disconnect.cancel_on_disconnect(), \
+                 scheduler.dispatch(
+                    ip,
+                    cost=len(message_objs),
+                    timeout_s=timeout_s):
+                # Waiting for our turn came out of the deadline.
+                timeout_s -= time.time() - queued_at
+                if timeout_s <= 0:
+                    raise rpipe.message_exchange.ResponseTimeoutError()
+
+                if is_batched is True:
+                    replies = rpipe.event.send_event_batch(
+                                c,
+                                message_objs,
+                                timeout_s=timeout_s)
+                else:
+                    replies = self.__send_separately(
+                                c,
+                                message_objs,
+                                timeout_s)
+        except rpipe.exceptions.RpBatchTooLarge:
+            raise web.HTTPError('413 Too many events in batch for client')
+        except rpipe.message_exchange.ResponseTimeoutError:
+            raise web.HTTPError('504 Client did not respond in time')
+        except rpipe.exceptions.RpConnectionClosed:
+            raise web.HTTPError('503 Client connection lost')
+        except rpipe.views.disconnect.CallerDisconnectedError:
+            _logger.warning("Caller disconnected before client [%s] "
+                            "responded to batch.", hostname)
+
+            raise web.HTTPError('499 Caller disconnected')
+
+        web.header('Content-Type', _CT_JSON)
+
+        return json.dumps({
+            'results': [self.__render_reply(r) for r in replies],
+        })
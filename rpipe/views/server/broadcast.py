@@ -0,0 +1,276 @@
+import logging
+import collections
+import json
+import re
+
+import web
+
+import rpipe.config.general
+import rpipe.config.server
+import rpipe.config.statsd
+import rpipe.config.web_server
+import rpipe.event
+import rpipe.event_handling
+import rpipe.server.broadcast
+import rpipe.server.client_tags
+import rpipe.server.connection
+import rpipe.server.hostname_resolver
+import rpipe.server.rate_limit
+import rpipe.stats
+import rpipe.utility
+import rpipe.views.rate_limit
+
+_logger = logging.getLogger(__name__)
+
+_CT_JSON = 'application/json'
+_CT_NDJSON = 'application/x-ndjson'
+
+_ERROR_UNRESOLVABLE = 'unresolvable'
+_ERROR_RATE_LIMITED = 'rate_limited'
+
+
+class BroadcastServer(object):
+    """Send one event to many clients. The clients are selected with exactly
+    one of the query parameters: "clients" (a comma-separated list of
+    hostnames or IPs), "tag", or "all". The results are streamed back as they
+    arrive, one JSON object per line, followed by a summary.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BroadcastServer, self).__init__(*args, **kwargs)
+
+        self.__cc = rpipe.server.connection.get_connection_catalog()
+
+        hostname_resolver_cls = rpipe.utility.load_cls_from_string(
+                                   rpipe.config.server.\
+                                        CLIENT_HOSTNAME_RESOLVER_CLS)
+
+        assert issubclass(
+                hostname_resolver_cls,
+                rpipe.server.hostname_resolver.HostnameResolver)
+
+        self.__resolver = hostname_resolver_cls()
+
+        tag_resolver_cls = rpipe.utility.load_cls_from_string(
+                                rpipe.config.server.CLIENT_TAG_RESOLVER_CLS)
+
+        assert issubclass(
+                tag_resolver_cls,
+                rpipe.server.client_tags.ClientTagResolver)
+
+        self.__tag_resolver = tag_resolver_cls()
+
+    def __get_names(self, parameters):
+        selectors = [name
+                     for name
+                     in ('clients', 'tag', 'all')
+                     if parameters.get(name)]
+
+        if len(selectors) != 1:
+            raise web.HTTPError('400 Exactly one of "clients", "tag", or '
+                                '"all" is required')
+
+        if parameters.clients:
+            names = parameters.clients.split(',')
+        elif parameters.tag:
+            try:
+                names = self.__tag_resolver.lookup(parameters.tag)
+            except LookupError:
+                raise web.HTTPError('404 Tag not known')
+        else:
+            names = self.__cc.get_ips()
+
+        # Keep the order, but lose the duplicates.
+        unique_names = []
+        for name in names:
+            name = name.strip()
+            if name and name not in unique_names:
+                unique_names.append(name)
+
+        return unique_names
+
+    def __resolve(self, hostname):
+        if re.match(rpipe.config.general.IP_RX, hostname) is not None:
+            return hostname
+
+        try:
+            return self.__resolver.lookup(hostname)
+        except LookupError:
+            return None
+        except:
+            _logger.exception("Could not resolve hostname: [%s]", hostname)
+            return None
+
+    def __get_concurrency(self, parameters):
+        if not parameters.concurrency:
+            return rpipe.config.web_server.BROADCAST_CONCURRENCY
+
+        try:
+            concurrency = int(parameters.concurrency)
+        except ValueError:
+            concurrency = 0
+
+        if concurrency <= 0:
+            raise web.HTTPError('400 Concurrency not valid')
+
+        return min(concurrency,
+                   rpipe.config.web_server.MAXIMUM_BROADCAST_CONCURRENCY)
+
+    def __render_result(self, result):
+        line = {
+            'client': result.names[0],
+            'ip': result.ip,
+        }
+
+        # The other names that resolved to the same client.
+        if len(result.names) > 1:
+            line['aliases'] = list(result.names[1:])
+
+        if result.error is not None:
+            line['error'] = result.error
+        else:
+            r = result.reply
+
+            if r.mimetype == _CT_JSON and r.data:
+                data = json.loads(r.data)
+            else:
+                # Anything else has to be text to be put in the JSON.
+                data = r.data.decode('utf8', 'replace')
+
+            line['code'] = r.code
+            line['mimetype'] = r.mimetype
+            line['data'] = data
+
+        return json.dumps(line) + '\n'
+
+    def __stream(self, verb, noun, rejected, targets, message_obj,
+                 timeout_s, concurrency):
+        counts = {}
+
+        def count(result):
+            key = result.error or 'succeeded'
+            counts[key] = counts.get(key, 0) + 1
+
+        for (names, ip, error) in rejected:
+            result = rpipe.server.broadcast.RESULT_T(
+                        names,
+                        ip,
+                        None,
+                        error)
+
+            count(result)
+            yield self.__render_result(result)
+
+        with rpipe.stats.time_and_post(
+                rpipe.config.statsd.EVENT_SERVER_WEB_BROADCAST_TIMING):
+            results = rpipe.server.broadcast.broadcast(
+                        self.__cc,
+                        targets,
+                        message_obj,
+                        timeout_s,
+                        concurrency)
+
+            for result in results:
+                count(result)
+                yield self.__render_result(result)
+
+        _logger.info("Broadcast [%s] [%s] finished: %s", verb, noun, counts)
+
+        yield json.dumps({ 'summary': counts }) + '\n'
+
+    def handle(self, verb, noun):
+        parameters = web.input(
+                        _method='get',
+                        clients=None,
+                        tag=None,
+                        all=None,
+                        concurrency=None)
+
+        rpipe.views.rate_limit.enforce(
+            rpipe.server.rate_limit.SCOPE_CALLER,
+            rpipe.views.rate_limit.get_caller_identity(),
+            [(verb, noun)])
+
+        names = self.__get_names(parameters)
+        concurrency = self.__get_concurrency(parameters)
+
+        try:
+            timeout_s = rpipe.event.get_request_timeout_s(
+                            verb,
+                            noun,
+                            web.ctx.env.get(
+                                rpipe.config.web_server.\
+                                    WSGI_HEADER_EVENT_TIMEOUT_MS))
+        except ValueError:
+            raise web.HTTPError('400 Timeout not valid')
+
+        _logger.info("Broadcasting to (%d) clients: [%s] [%s]",
+                     len(names), verb, noun)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_BROADCAST_TICK)
+
+        (handler_name, handler_parameters) = \
+            rpipe.event_handling.get_handler_name_and_parameters(verb, noun)
+
+        rl = rpipe.server.rate_limit.get_rate_limiter()
+
+        rejected = []
+
+        # Different names (a hostname and its IP, or aliases in a tag) can
+        # resolve to the same client, which only gets the event once.
+        names_by_ip = collections.OrderedDict()
+        for name in names:
+            ip = self.__resolve(name)
+            if ip is None:
+                rejected.append(((name,), None, _ERROR_UNRESOLVABLE))
+                continue
+
+            names_by_ip.setdefault(ip, []).append(name)
+
+        targets = []
+        for (ip, ip_names) in names_by_ip.items():
+            ip_names = tuple(ip_names)
+
+            try:
+                rl.take(
+                    rpipe.server.rate_limit.SCOPE_CLIENT,
+                    ip,
+                    handler_name)
+            except rpipe.server.rate_limit.RateLimitedError:
+                rejected.append((ip_names, ip, _ERROR_RATE_LIMITED))
+            else:
+                targets.append((ip_names, ip))
+
+        message_obj = rpipe.event.build_event(
+                        verb,
+                        noun,
+                        web.data(),
+                        web.ctx.env.get('CONTENT_TYPE'),
+                        timeout_s=timeout_s)
+
+        web.header('Content-Type', _CT_NDJSON)
+
+        return self.__stream(
+                verb,
+                noun,
+                rejected,
+                targets,
+                message_obj,
+                timeout_s,
+                concurrency)
+
+    def GET(self, *args):
+        return self.handle('get', *args)
+
+    def POST(self, *args):
+        return self.handle('post', *args)
+
+    def PUT(self, *args):
+        return self.handle('put', *args)
+
+    def DELETE(self, *args):
+        return self.handle('delete', *args)
+
+    def PATCH(self, *args):
+        return self.handle('patch', *args)
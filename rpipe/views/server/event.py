@@ -1,21 +1,46 @@
 import logging
 import functools
+import json
 import re
+import time
 
+import gevent
 import web
 
 import rpipe.config.web_server
+import rpipe.config.server
 import rpipe.config.general
+import rpipe.config.statsd
 import rpipe.server.exceptions
 import rpipe.event
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.server.admission
 import rpipe.server.connection
+import rpipe.server.fair_queue
+import rpipe.server.jobs
+import rpipe.server.outbox
+import rpipe.server.rate_limit
+import rpipe.server.response_cache
+import rpipe.server.singleflight
 import rpipe.utility
 import rpipe.server.hostname_resolver
+import rpipe.stats
+import rpipe.views.admission
+import rpipe.views.disconnect
+import rpipe.views.etag
+import rpipe.views.rate_limit
+import rpipe.views.request_body
 
 _logger = logging.getLogger(__name__)
 
 _CT_JSON = 'application/json'
 
+_coalescer = rpipe.server.singleflight.SingleFlight()
+_scheduler = rpipe.server.fair_queue.get_fair_scheduler()
+_outbox = rpipe.server.outbox.get_outbox()
+
 
 class EventServer(object):
     def __init__(self, *args, **kwargs):
@@ -37,6 +62,23 @@ class EventServer(object):
         _logger.info("Server received request, to be sent to client [%s]: "
                      "[%s] [%s]", hostname, verb, noun)
 
+        rpipe.views.rate_limit.enforce(
+            rpipe.server.rate_limit.SCOPE_CALLER,
+            rpipe.views.rate_limit.get_caller_identity(),
+            [(verb, noun)])
+
+        try:
+            timeout_s = rpipe.event.get_request_timeout_s(
+                            verb,
+                            noun,
+                            web.ctx.env.get(
+                                rpipe.config.web_server.\
+                                    WSGI_HEADER_EVENT_TIMEOUT_MS))
+        except ValueError:
+            raise web.HTTPError('400 Timeout not valid')
+
+        stop_at = time.time() + timeout_s
+
         if re.match(rpipe.config.general.IP_RX, hostname) is not None:
             ip = hostname
             _logger.debug("The client hostname is actually an IP: [%s]", ip)
@@ -52,21 +94,311 @@ class EventServer(object):
             else:
                 _logger.debug("Resolved client hostname [%s]: [%s]", hostname, ip)
 
+        rpipe.views.rate_limit.enforce(
+            rpipe.server.rate_limit.SCOPE_CLIENT,
+            ip,
+            [(verb, noun)])
+
+        mode = web.ctx.env.get(
+                rpipe.config.web_server.WSGI_HEADER_EVENT_MODE,
+                rpipe.config.web_server.EVENT_MODE_SYNC)
+
+        # The caller's key only has to be unique to the caller.
+        idempotency_key = web.ctx.env.get(
+                            rpipe.config.web_server.\
+                                WSGI_HEADER_IDEMPOTENCY_KEY)
+
+        if idempotency_key is not None:
+            idempotency_key = '%s:%s' % (
+                rpipe.views.rate_limit.get_caller_identity(), 
+                idempotency_key)
+
+        # A notification for a client that's away (or that still has older 
+        # ones waiting) is kept until it's back, and in order.
+        if mode == rpipe.config.web_server.EVENT_MODE_FORGET and \
+           _outbox.is_enabled is True:
+            try:
+                c = self.__cc.find_connection(ip)
+            except KeyError:
+                c = None
+
+            if c is None or _outbox.get_depth(ip) > 0:
+                return self.__queue(ip, c, verb, noun, idempotency_key)
+
         try:
-            c = self.__cc.wait_for_connection(ip)
+            c = self.__cc.wait_for_connection(
+                    ip,
+                    timeout_s=min(
+                        rpipe.config.server.DEFAULT_CONNECTION_WAIT_TIMEOUT_S,
+                        timeout_s))
         except rpipe.server.exceptions.RpNoConnectionException:
             raise web.HTTPError('503 Client connection unavailable')            
 
         mimetype = web.ctx.env.get('CONTENT_TYPE')
 
-        r = rpipe.event.send_message_to_remote(
+        remaining_s = stop_at - time.time()
+        if remaining_s <= 0:
+            raise web.HTTPError('504 Client did not respond in time')
+
+        (data, chunks) = rpipe.views.request_body.get_request_body()
+
+        if mode == rpipe.config.web_server.EVENT_MODE_FORGET:
+            return self.__forget(
+                    c, 
+                    verb, 
+                    noun, 
+                    data, 
+                    chunks, 
+                    mimetype, 
+                    remaining_s,
+                    idempotency_key)
+        elif mode == rpipe.config.web_server.EVENT_MODE_ASYNC:
+            return self.__start_job(
+                    c, 
+                    verb, 
+                    noun, 
+                    data, 
+                    chunks, 
+                    mimetype, 
+                    remaining_s,
+                    idempotency_key)
+        elif mode != rpipe.config.web_server.EVENT_MODE_SYNC:
+            raise web.HTTPError('400 Event mode not valid')
+
+        rc = rpipe.server.response_cache.get_response_cache()
+        is_plain_get = verb == 'get' and not data and chunks is None
+
+        cached = None
+        if is_plain_get is True:
+            caller_etags = rpipe.views.etag.parse_if_none_match(
+                            web.ctx.env.get(
+                                rpipe.config.web_server.\
+                                    WSGI_HEADER_IF_NONE_MATCH))
+
+            cached = rc.get(ip, verb, noun)
+            if cached is not None and cached.is_fresh is True:
+                _logger.debug("Responding from cache: [%s] [%s]", ip, noun)
+
+                web.header(rpipe.config.web_server.HEADER_EVENT_CACHE, 'hit')
+
+                return self.__respond(
+                        *cached.value, 
+                        etag=cached.etag, 
+                        caller_etags=caller_etags)
+
+            # Let the client tell us if the caller's copy, or our stale one, 
+            # is still current rather than sending it again.
+            if_none_match = list(caller_etags)
+            if cached is not None and cached.etag not in if_none_match:
+                if_none_match.append(cached.etag)
+        else:
+            # Whatever this does will probably change what a GET returns.
+            rc.invalidate(ip, noun)
+
+            caller_etags = []
+            if_none_match = []
+
+        send = functools.partial(
+                rpipe.event.send_event,
                 c, 
                 verb, 
                 noun, 
-                web.data(), 
-                mimetype)
+                data, 
+                mimetype,
+                chunks=chunks,
+                if_none_match=if_none_match,
+                idempotency_key=idempotency_key)
+
+        # Identical GETs that are already in flight for this client can 
+        # share the result.
+        is_coalescable = rpipe.config.server.COALESCE_GETS is True and \
+                         is_plain_get is True
+
+        try:
+            with rpipe.views.admission.admitted(c), \
+                 rpipe.views.disconnect.cancel_on_disconnect(), \
+                 _scheduler.dispatch(ip, timeout_s=remaining_s):
+                # Waiting for our turn came out of the deadline.
+                remaining_s = stop_at - time.time()
+                if remaining_s <= 0:
+                    raise rpipe.message_exchange.ResponseTimeoutError()
+
+                send = functools.partial(send, timeout_s=remaining_s)
+
+                if is_coalescable is True:
+                    r = _coalescer.do(
+                            (ip, noun, tuple(if_none_match)), 
+                            send, 
+                            timeout_s=remaining_s)
+                else:
+                    r = send()
+        except rpipe.message_exchange.ResponseTimeoutError:
+            raise web.HTTPError('504 Client did not respond in time')
+        except rpipe.exceptions.RpConnectionClosed:
+            raise web.HTTPError('503 Client connection lost')
+        except rpipe.views.disconnect.CallerDisconnectedError:
+            _logger.warning("Caller disconnected before client [%s] "
+                            "responded: [%s] [%s]", hostname, verb, noun)
+
+            raise web.HTTPError('499 Caller disconnected')
+
+        if r.is_not_modified is True:
+            if rpipe.event_handling.is_etag_matched(
+                    r.etag, 
+                    caller_etags) is True:
+                web.header('ETag', rpipe.views.etag.format_etag(r.etag))
+                raise web.notmodified()
+
+            if cached is None or cached.etag != r.etag:
+                _logger.error("Client [%s] said that a copy we don't have "
+                              "is current: [%s] [%s]", hostname, noun, r.etag)
+
+                raise web.HTTPError('502 Client response not valid')
+
+            _logger.debug("Cached response revalidated: [%s] [%s]", ip, noun)
+
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_CACHE_REVALIDATED_TICK)
+
+            rc.put(ip, verb, noun, cached.value, r.cache_ttl_s, etag=r.etag)
+
+            web.header(
+                rpipe.config.web_server.HEADER_EVENT_CACHE, 
+                'revalidated')
+
+            return self.__respond(*cached.value, etag=r.etag)
+
+        etag = r.etag or None
+
+        if is_plain_get is True and \
+           len(r.data) <= rpipe.config.server.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+            rc.put(
+                ip, 
+                verb, 
+                noun, 
+                (r.code, r.mimetype, r.data), 
+                r.cache_ttl_s,
+                etag=etag)
+
+        return self.__respond(
+                r.code, 
+                r.mimetype, 
+                r.data, 
+                etag=etag, 
+                caller_etags=caller_etags)
+
+    def __forget(self, c, verb, noun, data, chunks, mimetype, timeout_s, 
+                 idempotency_key):
+        if chunks is not None:
+            data = b''.join(chunks)
+
+        # There's no reply to wait on, but a tunnel that's overloaded 
+        # shouldn't be given more to send.
+        rpipe.views.admission.check(c)
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_FORGET_TICK)
+
+        # It still waits its turn with the client's other events.
+        try:
+            with _scheduler.dispatch(c.ip, timeout_s=timeout_s):
+                rpipe.event.send_event_and_forget(
+                    c, 
+                    verb, 
+                    noun, 
+                    data, 
+                    mimetype, 
+                    idempotency_key=idempotency_key)
+        except rpipe.message_exchange.ResponseTimeoutError:
+            raise web.HTTPError('504 Client did not respond in time')
+        except rpipe.exceptions.RpConnectionClosed:
+            raise web.HTTPError('503 Client connection unavailable')
+
+        web.ctx.status = '202 Accepted'
+        return ''
+
+    def __queue(self, ip, c, verb, noun, idempotency_key):
+        (data, chunks) = rpipe.views.request_body.get_request_body()
+        if chunks is not None:
+            data = b''.join(chunks)
+
+        try:
+            _outbox.put(
+                ip, 
+                verb, 
+                noun, 
+                data, 
+                mimetype=web.ctx.env.get('CONTENT_TYPE'), 
+                idempotency_key=idempotency_key)
+        except rpipe.server.outbox.OutboxFullError:
+            raise web.HTTPError('503 Client outbox full')
+
+        # If it's connected (to any acceptor), the backlog is left over from 
+        # a delivery that was interrupted, or one is still under way. Try 
+        # again (it's a no-op if another delivery has it).
+        if c is not None:
+            gevent.spawn(_outbox.deliver, c)
+
+        web.ctx.status = '202 Accepted'
+        return ''
+
+    def __start_job(self, c, verb, noun, data, chunks, mimetype, timeout_s, 
+                    idempotency_key):
+        if chunks is not None:
+            # The body has to be read before we respond.
+            data = b''.join(chunks)
+
+        # Turn it away now, while we still can. The job is admitted (and 
+        # measured), and waits its turn, like any other event once it runs.
+        rpipe.views.admission.check(c)
+
+        ac = rpipe.server.admission.get_admission_controller()
+        stop_at = time.time() + timeout_s
+
+        def send():
+            with ac.admit(c.ip, queue_depth=c.queue_depth), \
+                 _scheduler.dispatch(c.ip, timeout_s=timeout_s):
+                remaining_s = stop_at - time.time()
+                if remaining_s <= 0:
+                    raise rpipe.message_exchange.ResponseTimeoutError()
+
+                return rpipe.event.send_event(
+                        c, 
+                        verb, 
+                        noun, 
+                        data, 
+                        mimetype,
+                        timeout_s=remaining_s,
+                        idempotency_key=idempotency_key)
+
+        try:
+            job_id = rpipe.server.jobs.get_job_table().start(send)
+        except rpipe.server.jobs.JobTableFullError:
+            rpipe.stats.post_to_counter(
+                rpipe.config.statsd.EVENT_SERVER_WEB_JOB_REJECT_TICK)
+
+            raise web.HTTPError('503 Too many jobs')
+
+        rpipe.stats.post_to_counter(
+            rpipe.config.statsd.EVENT_SERVER_WEB_JOB_TICK)
+
+        _logger.info("Started job for client [%s]: [%s] [%s] [%s]", 
+                     c.ip, verb, noun, job_id)
+
+        web.ctx.status = '202 Accepted'
+        web.header('Location', '%s/jobs/%s' % (web.ctx.homepath, job_id))
+        web.header('Content-Type', _CT_JSON)
+
+        return json.dumps({ 'job_id': job_id })
+
+    def __respond(self, code, mimetype, data, etag=None, caller_etags=()):
+        if etag is not None:
+            web.header('ETag', rpipe.views.etag.format_etag(etag))
 
-        (code, mimetype, data) = r
+            if rpipe.event_handling.is_etag_matched(
+                    etag, 
+                    caller_etags) is True:
+                raise web.notmodified()
 
         web.header(rpipe.config.web_server.HEADER_EVENT_RETURN_CODE, code)
 
@@ -0,0 +1,69 @@
+import logging
+import json
+
+import web
+
+import rpipe.config.web_server
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.server.admission
+import rpipe.server.jobs
+import rpipe.views.admission
+
+_logger = logging.getLogger(__name__)
+
+_CT_JSON = 'application/json'
+
+
+class JobServer(object):
+    """Report the result of an event that was sent in the "async" mode. Pass 
+    "wait" (seconds) to wait for it to finish rather than polling.
+    """
+
+    def GET(self, job_id):
+        parameters = web.input(_method='get', wait='0')
+
+        try:
+            wait_s = min(float(parameters.wait), 
+                         rpipe.config.web_server.MAXIMUM_JOB_WAIT_S)
+        except ValueError:
+            raise web.HTTPError('400 Wait not valid')
+
+        jt = rpipe.server.jobs.get_job_table()
+
+        try:
+            result = jt.wait(job_id, timeout_s=max(0, wait_s))
+        except KeyError:
+            raise web.HTTPError('404 Job not known')
+
+        if result.ready() is False:
+            web.ctx.status = '202 Accepted'
+            web.header('Content-Type', _CT_JSON)
+
+            return json.dumps({ 'job_id': job_id, 'status': 'pending' })
+
+        if result.successful() is False:
+            e = result.exception
+
+            if issubclass(e.__class__, 
+                          rpipe.message_exchange.ResponseTimeoutError):
+                raise web.HTTPError('504 Client did not respond in time')
+            elif issubclass(e.__class__, rpipe.exceptions.RpConnectionClosed):
+                raise web.HTTPError('503 Client connection lost')
+            elif issubclass(e.__class__, 
+                            rpipe.server.admission.LoadSheddingError):
+                raise rpipe.views.admission.get_overloaded_error(e)
+
+            _logger.error("Job [%s] failed: [%s] [%s]", 
+                          job_id, e.__class__.__name__, str(e))
+
+            raise web.HTTPError('500 Job failed')
+
+        r = result.value
+
+        web.header(rpipe.config.web_server.HEADER_EVENT_RETURN_CODE, r.code)
+
+        if r.mimetype:
+            web.header('Content-Type', r.mimetype)
+
+        return r.data
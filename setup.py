@@ -1,3 +1,4 @@
+import sys
 import os.path
 import setuptools
 
@@ -11,6 +12,12 @@ with open(os.path.join(app_path, 'resources', 'README.rst')) as f:
 with open(os.path.join(app_path, 'resources', 'requirements.txt')) as f:
       install_requires = list(map(lambda s: s.strip(), f))
 
+# The asyncio engine requires Python 3.
+if sys.version_info[0] < 3:
+      exclude_packages = ['dev', 'rpipe.aio', 'rpipe.aio.*']
+else:
+      exclude_packages = ['dev']
+
 # TODO(dustin): Create the certificate directory, automatically.
 
 setuptools.setup(
@@ -24,7 +31,7 @@ setuptools.setup(
       author_email='myselfasunder@gmail.com',
       url='https://github.com/dsoprea/RestPipe',
       license='GPL 2',
-      packages=setuptools.find_packages(exclude=['dev']),
+      packages=setuptools.find_packages(exclude=exclude_packages),
       include_package_data=True,
       zip_safe=False,
       install_requires=install_requires,
@@ -40,6 +47,10 @@ setuptools.setup(
             'rpipe/resources/scripts/rp_client_set_identity',
             'rpipe/resources/scripts/rp_client_start_gunicorn_dev',
             'rpipe/resources/scripts/rp_client_start_gunicorn_prod',
+            'rpipe/resources/scripts/rp_engine_benchmark',
+            'rpipe/resources/scripts/rp_frame_benchmark',
+            'rpipe/resources/scripts/rp_load_generator',
+            'rpipe/resources/scripts/rp_replay',
             'rpipe/resources/scripts/rp_server_set_identity',
             'rpipe/resources/scripts/rp_server_start_gunicorn_dev',
             'rpipe/resources/scripts/rp_server_start_gunicorn_prod',
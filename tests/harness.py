@@ -0,0 +1,124 @@
+"""Run a message-loop over an in-memory pipe, so that a test can send it
+events as the other side of a tunnel would.
+"""
+
+import itertools
+
+import gevent
+
+import rpipe.capabilities
+import rpipe.connection
+import rpipe.event_handling
+import rpipe.message_exchange
+import rpipe.message_loop
+import rpipe.transport
+
+_counter = itertools.count(1)
+
+
+class LoopHarness(object):
+    """The loop answers as `participant_address` sees it (the server, by
+    default, with the caller as a client at that address). Use as a
+    context-manager.
+    """
+
+    def __init__(self, event_handler, participant_address=None, 
+                 message_handlers=None):
+        n = next(_counter)
+
+        if participant_address is None:
+            participant_address = ('127.0.1.%d' % (n % 250 + 1,), 40000 + n)
+
+        self.participant_address = participant_address
+        self.caller_address = 'test-caller-%d' % (n,)
+
+        (self.__loop_stream, self.__caller_stream) = \
+            rpipe.transport.create_memory_pipe('harness-%d' % (n,))
+
+        ctx = rpipe.event_handling.CONNECTION_CONTEXT_T(participant_address)
+
+        self.__loop = rpipe.message_loop.CommonMessageLoop(
+                        self.__loop_stream,
+                        event_handler,
+                        ctx,
+                        message_handlers=message_handlers)
+
+        self.__loop_g = None
+
+    def __enter__(self):
+        self.__loop_g = gevent.spawn(self.__loop.handle)
+
+        rpipe.message_exchange.start_exchange(
+            self.__caller_stream, 
+            self.caller_address)
+
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.__caller_stream.close()
+        self.__loop_g.join(timeout=5)
+        self.__loop_g.kill()
+
+        if self.caller_address in rpipe.message_exchange._instances:
+            rpipe.message_exchange.stop_exchange(self.caller_address)
+
+    def send_and_receive(self, message_obj, timeout_s=5):
+        return rpipe.message_exchange.send_and_receive(
+                self.caller_address, 
+                message_obj, 
+                timeout_s=timeout_s)
+
+
+class HarnessConnection(rpipe.connection.Connection):
+    """A connection to a client, as the server's catalog would have it, whose 
+    events go to the loop of a harness.
+    """
+
+    def __init__(self, h, ip='1.2.3.4', features=(), queue_depth=0):
+        self.ip = ip
+        self.sent = 0
+        self.depth = queue_depth
+
+        self.__h = h
+        self.__peer = rpipe.capabilities.PeerCapabilities(features=features)
+
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None):
+        self.sent += 1
+
+        return rpipe.message_exchange.send_and_receive(
+                self.__h.caller_address,
+                message_obj,
+                timeout_s=timeout_s,
+                chunks=chunks)
+
+    def send_message(self, message_obj):
+        self.sent += 1
+
+        rpipe.message_exchange.send(
+            self.__h.caller_address,
+            message_obj,
+            expect_response=False)
+
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
+    @property
+    def queue_depth(self):
+        return self.depth
+
+
+class HarnessCatalog(object):
+    """Stands in for the server's connection-catalog."""
+
+    def __init__(self, connections):
+        self.__connections = dict((c.ip, c) for c in connections)
+
+    def find_connection(self, ip):
+        return self.__connections[ip]
+
+    def wait_for_connection(self, ip, timeout_s=None):
+        return self.__connections[ip]
+
+    def get_ips(self):
+        return list(self.__connections.keys())
@@ -0,0 +1,214 @@
+import contextlib
+import json
+import unittest
+import unittest.mock
+
+import web
+
+import rpipe.config.server_web
+import rpipe.config.statsd
+import rpipe.config.web_server
+import rpipe.message_exchange
+import rpipe.server.admission
+import rpipe.server.broadcast
+import rpipe.server.connection
+import rpipe.stats
+
+import tests.harness
+
+
+class _Handler(object):
+    def post_thing(self, ctx, post_data):
+        return 'ok'
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.__ac = rpipe.server.admission.AdmissionController(
+                        max_limit=4,
+                        min_limit=1,
+                        target_latency_s=10,
+                        interval_s=60,
+                        backoff=0.5,
+                        max_queue_depth=10,
+                        max_in_flight=100)
+
+        self.__gauges = []
+
+        p = unittest.mock.patch.object(
+                rpipe.stats,
+                'post_to_gauge',
+                side_effect=lambda name, value: \
+                    self.__gauges.append((name, value)))
+
+        p.start()
+        self.addCleanup(p.stop)
+
+    def __time_out(self, ip):
+        with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+            with self.__ac.admit(ip):
+                raise rpipe.message_exchange.ResponseTimeoutError()
+
+    def test_timeout_halves_the_limit_once_per_interval(self):
+        self.__time_out('1.1.1.1')
+        self.assertEqual(self.__ac.get_limits()['1.1.1.1'], (2, 0))
+
+        # The same burst of slow replies only counts once.
+        self.__time_out('1.1.1.1')
+        self.assertEqual(self.__ac.get_limits()['1.1.1.1'], (2, 0))
+
+    def test_sheds_over_the_limit(self):
+        self.__time_out('1.1.1.1')
+
+        with contextlib.ExitStack() as stack:
+            for _ in range(2):
+                stack.enter_context(self.__ac.admit('1.1.1.1'))
+
+            with self.assertRaises(
+                    rpipe.server.admission.LoadSheddingError) as cm:
+                with self.__ac.admit('1.1.1.1'):
+                    pass
+
+            self.assertGreaterEqual(cm.exception.retry_after_s, 1)
+
+            # Other clients have their own limit.
+            with self.__ac.admit('2.2.2.2'):
+                pass
+
+    def test_sheds_deep_queues(self):
+        with self.assertRaises(rpipe.server.admission.LoadSheddingError):
+            with self.__ac.admit('1.1.1.1', queue_depth=10):
+                pass
+
+    def test_check(self):
+        self.__ac.check('1.1.1.1')
+
+        with self.assertRaises(rpipe.server.admission.LoadSheddingError):
+            self.__ac.check('1.1.1.1', queue_depth=10)
+
+        self.__time_out('1.1.1.1')
+
+        with self.__ac.admit('1.1.1.1'):
+            self.__ac.check('1.1.1.1')
+
+            with self.__ac.admit('1.1.1.1'):
+                with self.assertRaises(
+                        rpipe.server.admission.LoadSheddingError):
+                    self.__ac.check('1.1.1.1')
+
+        # Nothing is admitted or remembered for a check.
+        self.__ac.check('2.2.2.2')
+        self.assertNotIn('2.2.2.2', self.__ac.get_limits())
+
+    def test_quick_replies_restore_the_limit(self):
+        self.__time_out('1.1.1.1')
+
+        limited = [value
+                   for (name, value)
+                   in self.__gauges
+                   if name == rpipe.config.statsd.EVENT_SERVER_WEB_LIMITED_GAUGE]
+
+        self.assertEqual(limited, [1])
+
+        # From two, each reply adds 1/limit.
+        for _ in range(10):
+            with self.__ac.admit('1.1.1.1'):
+                pass
+
+            if '1.1.1.1' not in self.__ac.get_limits():
+                break
+
+        # It's forgotten once it's idle and back at the maximum.
+        self.assertNotIn('1.1.1.1', self.__ac.get_limits())
+
+        limited = [value
+                   for (name, value)
+                   in self.__gauges
+                   if name == rpipe.config.statsd.EVENT_SERVER_WEB_LIMITED_GAUGE]
+
+        self.assertEqual(limited, [1, 0])
+
+    def test_no_gauge_per_client(self):
+        for i in range(5):
+            self.__time_out('1.1.1.%d' % (i,))
+
+        names = set(name for (name, value) in self.__gauges)
+
+        self.assertEqual(
+            names,
+            set([rpipe.config.statsd.EVENT_SERVER_WEB_IN_FLIGHT_GAUGE,
+                 rpipe.config.statsd.EVENT_SERVER_WEB_LIMITED_GAUGE]))
+
+
+class TestUnwaitedEvents(unittest.TestCase):
+    """Events that aren't waited on are still turned away from an overloaded 
+    tunnel.
+    """
+
+    def setUp(self):
+        ac = rpipe.server.admission.AdmissionController(
+                max_limit=4,
+                max_queue_depth=10)
+
+        p = unittest.mock.patch.object(rpipe.server.admission, '_ac', ac)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def __request(self, path, queue_depth, mode=None):
+        app = web.application(rpipe.config.server_web.URLS, {})
+
+        headers = {}
+        if mode is not None:
+            headers['X-Event-Mode'] = mode
+
+        with tests.harness.LoopHarness(_Handler()) as h:
+            c = tests.harness.HarnessConnection(h, queue_depth=queue_depth)
+
+            with unittest.mock.patch.object(
+                    rpipe.server.connection,
+                    'get_connection_catalog',
+                    return_value=tests.harness.HarnessCatalog([c])):
+                r = app.request(
+                        path, 
+                        method='POST', 
+                        data='', 
+                        headers=headers)
+
+                if r.status.startswith('202') and \
+                   mode == rpipe.config.web_server.EVENT_MODE_ASYNC:
+                    job_id = json.loads(r.data)['job_id']
+                    r = app.request('/jobs/%s?wait=5' % (job_id,))
+
+        return (c, r)
+
+    def test_forget(self):
+        for (queue_depth, status) in ((0, '202'), (10, '503')):
+            (c, r) = self.__request(
+                        '/client/1.2.3.4/thing',
+                        queue_depth,
+                        rpipe.config.web_server.EVENT_MODE_FORGET)
+
+            self.assertEqual(r.status[:3], status)
+            self.assertEqual(c.sent, 1 if status == '202' else 0)
+
+        self.assertEqual(r.headers['Retry-After'], '1')
+
+    def test_async(self):
+        for (queue_depth, status) in ((0, '200'), (10, '503')):
+            (c, r) = self.__request(
+                        '/client/1.2.3.4/thing',
+                        queue_depth,
+                        rpipe.config.web_server.EVENT_MODE_ASYNC)
+
+            self.assertEqual(r.status[:3], status)
+            self.assertEqual(c.sent, 1 if status == '200' else 0)
+
+        self.assertEqual(r.headers['Retry-After'], '1')
+
+    def test_broadcast(self):
+        (c, r) = self.__request('/clients/thing?clients=1.2.3.4', 10)
+
+        self.assertEqual(c.sent, 0)
+        self.assertEqual(
+            json.loads(r.data.splitlines()[0])['error'],
+            rpipe.server.broadcast.ERROR_OVERLOADED)
@@ -0,0 +1,153 @@
+import json
+import socket
+import sys
+import unittest
+import unittest.mock
+
+import rpipe.config.exchange
+import rpipe.event
+import rpipe.event_handling
+
+if sys.version_info >= (3, 7):
+    import asyncio
+
+    import rpipe.aio.message_exchange
+    import rpipe.aio.message_loop
+
+
+class _Handler(object):
+    def post_echo(self, ctx, post_data):
+        (mimetype, data) = post_data
+        return data
+
+    def get_unencodable(self, ctx, post_data):
+        return object()
+
+    async def get_unencodable_async(self, ctx, post_data):
+        return object()
+
+    async def get_slow(self, ctx, post_data):
+        await asyncio.sleep(5)
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "The asyncio engine needs 3.7+.")
+class TestAioEventErrors(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    async def __connect(self):
+        (a, b) = socket.socketpair()
+
+        (_, serving) = await self.loop.create_connection(
+                        rpipe.aio.message_exchange.MessageExchange,
+                        sock=a)
+
+        (_, calling) = await self.loop.create_connection(
+                        rpipe.aio.message_exchange.MessageExchange,
+                        sock=b)
+
+        ctx = rpipe.event_handling.CONNECTION_CONTEXT_T(('127.0.0.1', 1))
+
+        ml = rpipe.aio.message_loop.CommonMessageLoop(
+                serving, 
+                _Handler(), 
+                ctx)
+
+        loop_task = asyncio.ensure_future(ml.handle())
+
+        return (calling, serving, loop_task)
+
+    def __run(self, message_objs):
+        async def run():
+            (calling, serving, loop_task) = await self.__connect()
+
+            try:
+                return [await calling.send_and_receive(
+                            message_obj, 
+                            timeout_s=5)
+                        for message_obj
+                        in message_objs]
+            finally:
+                calling.close()
+                serving.close()
+                await loop_task
+
+        return self.loop.run_until_complete(run())
+
+    def __assert_exception_reply(self, reply, *class_names):
+        self.assertEqual(
+            reply.code, 
+            rpipe.config.exchange.UNHANDLED_EXCEPTION_CODE)
+
+        self.assertIn(
+            json.loads(reply.data)['exception']['class'], 
+            class_names)
+
+    def test_errors_are_answered_and_connection_survives(self):
+        replies = self.__run([
+            rpipe.event.build_event(
+                'post', 'echo', '{not json', 'application/json'),
+            rpipe.event.build_event('get', 'unencodable', ''),
+            rpipe.event.build_event('get', 'unencodable_async', ''),
+            rpipe.event.build_event(
+                'post', 'echo', '{"a": 1}', 'application/json'),
+        ])
+
+        self.__assert_exception_reply(
+            replies[0], 
+            'ValueError', 
+            'JSONDecodeError')
+
+        self.__assert_exception_reply(replies[1], 'TypeError')
+        self.__assert_exception_reply(replies[2], 'TypeError')
+
+        self.assertEqual(replies[3].code, 0)
+        self.assertEqual(json.loads(replies[3].data), { 'a': 1 })
+
+    def test_batch_keeps_order_and_isolates_failures(self):
+        (reply,) = self.__run([
+            rpipe.event.build_event_batch([
+                rpipe.event.build_event(
+                    'post', 'echo', '1', 'application/json'),
+                rpipe.event.build_event('get', 'unencodable_async', ''),
+                rpipe.event.build_event(
+                    'post', 'echo', '3', 'application/json'),
+            ])
+        ])
+
+        self.assertEqual(json.loads(reply.replies[0].data), 1)
+        self.__assert_exception_reply(reply.replies[1], 'TypeError')
+        self.assertEqual(json.loads(reply.replies[2].data), 3)
+
+    def __time_out(self, can_cancel):
+        async def run():
+            (calling, serving, loop_task) = await self.__connect()
+
+            calling.set_can_cancel(can_cancel)
+
+            try:
+                with unittest.mock.patch.object(
+                        calling,
+                        'send_cancel') as send_cancel:
+                    with self.assertRaises(
+                            rpipe.aio.message_exchange.ResponseTimeoutError):
+                        await calling.send_and_receive(
+                                rpipe.event.build_event('get', 'slow', ''),
+                                timeout_s=.05)
+
+                return send_cancel.called
+            finally:
+                calling.close()
+                serving.close()
+                await loop_task
+
+        return self.loop.run_until_complete(run())
+
+    def test_cancel_only_if_the_peer_reads_them(self):
+        self.assertFalse(self.__time_out(False))
+        self.assertTrue(self.__time_out(True))
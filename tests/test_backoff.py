@@ -0,0 +1,47 @@
+import random
+import unittest
+
+import rpipe.client.backoff
+
+
+class TestDecorrelatedJitterBackoff(unittest.TestCase):
+    def setUp(self):
+        random.seed(1234)
+
+    def test_bounds(self):
+        b = rpipe.client.backoff.DecorrelatedJitterBackoff(1, 30)
+
+        last_s = 1
+        for _ in range(100):
+            wait_s = b.next_wait_s()
+
+            self.assertGreaterEqual(wait_s, 1)
+            self.assertLessEqual(wait_s, min(30, last_s * 3))
+
+            last_s = wait_s
+
+    def test_grows_and_resets(self):
+        b = rpipe.client.backoff.DecorrelatedJitterBackoff(1, 1000)
+
+        waits = [b.next_wait_s() for _ in range(20)]
+        self.assertGreater(max(waits), 10)
+
+        b.reset()
+        self.assertLessEqual(b.next_wait_s(), 3)
+
+    def test_retry_after(self):
+        b = rpipe.client.backoff.DecorrelatedJitterBackoff(1, 30)
+
+        for _ in range(20):
+            b.reset()
+            wait_s = b.next_wait_s(retry_after_s=5)
+
+            self.assertGreaterEqual(wait_s, 5)
+            self.assertLessEqual(wait_s, 10)
+
+    def test_clients_drift_apart(self):
+        bs = [rpipe.client.backoff.DecorrelatedJitterBackoff(1, 30)
+              for _ in range(50)]
+
+        waits = [b.next_wait_s() for b in bs]
+        self.assertGreater(len(set(waits)), 40)
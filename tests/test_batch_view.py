@@ -0,0 +1,77 @@
+import json
+import unittest
+import unittest.mock
+
+import web
+
+import rpipe.config.protocol
+import rpipe.server.connection
+
+import tests.harness
+
+
+class _Handler(object):
+    def post_echo(self, ctx, post_data):
+        (mimetype, data) = post_data
+
+        # JSON arrives already decoded.
+        if issubclass(data.__class__, bytes) is True:
+            data = data.decode('utf8')
+
+        return { 'mimetype': mimetype, 'data': data }
+
+    def get_text(self, ctx, post_data):
+        return ('text/plain', 0, 'text')
+
+
+class TestBatchView(unittest.TestCase):
+    def __post(self, features):
+        app = web.application(
+                ('/batch/(.+)$', 'rpipe.views.server.batch.BatchServer'),
+                {})
+
+        body = json.dumps({
+            'events': [
+                { 'verb': 'post', 'noun': 'echo', 'data': u'café' },
+                { 'verb': 'post', 'noun': 'echo', 'data': { 'a': 1 } },
+                { 'verb': 'post', 'noun': 'echo' },
+                { 'verb': 'get', 'noun': 'text' },
+            ],
+        })
+
+        with tests.harness.LoopHarness(_Handler()) as h:
+            c = tests.harness.HarnessConnection(h, features=features)
+
+            with unittest.mock.patch.object(
+                    rpipe.server.connection,
+                    'get_connection_catalog',
+                    return_value=tests.harness.HarnessCatalog([c])):
+                r = app.request('/batch/1.2.3.4', method='POST', data=body)
+
+        self.assertEqual(r.status, '200 OK')
+
+        return [result['data'] for result in json.loads(r.data)['results']]
+
+    def test_text_json_and_empty_data(self):
+        expected = [
+            { 'mimetype': '', 'data': u'café' },
+            { 'mimetype': 'application/json', 'data': { 'a': 1 } },
+            { 'mimetype': '', 'data': '' },
+            'text',
+        ]
+
+        # Whether or not the client can take them in one frame.
+        self.assertEqual(
+            self.__post([rpipe.config.protocol.FEATURE_BATCHING]),
+            expected)
+
+        self.assertEqual(self.__post([]), expected)
+
+    def test_not_valid(self):
+        app = web.application(
+                ('/batch/(.+)$', 'rpipe.views.server.batch.BatchServer'),
+                {})
+
+        for body in ('', '{}', '{"events": []}', '{"events": [{}]}'):
+            r = app.request('/batch/1.2.3.4', method='POST', data=body)
+            self.assertEqual(r.status[:3], '400')
@@ -0,0 +1,209 @@
+import json
+import unittest
+import unittest.mock
+
+import gevent
+import web
+
+import rpipe.config.server
+import rpipe.event
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.server.broadcast
+import rpipe.server.connection
+import rpipe.server.hostname_resolver
+
+import tests.harness
+
+
+class _Handler(object):
+    def get_name(self, ctx, post_data):
+        return ctx.participant_address[0]
+
+    def post_name(self, ctx, post_data):
+        return ('text/plain', 0, 'posted')
+
+
+class _Resolver(rpipe.server.hostname_resolver.HostnameResolver):
+    def lookup(self, hostname):
+        try:
+            return { 'host1': '10.0.0.5', 'host2': '10.0.0.6' }[hostname]
+        except KeyError:
+            raise LookupError(hostname)
+
+
+class _FakeConnection(object):
+    queue_depth = None
+
+    def __init__(self, catalog, ip):
+        self.__catalog = catalog
+        self.__ip = ip
+
+    def initiate_message(self, message_obj, timeout_s=None):
+        self.__catalog.active += 1
+        self.__catalog.max_active = \
+            max(self.__catalog.active, self.__catalog.max_active)
+
+        try:
+            if self.__ip == 'slow':
+                gevent.sleep(timeout_s)
+                raise rpipe.message_exchange.ResponseTimeoutError()
+            elif self.__ip == 'hung':
+                gevent.sleep(10)
+            elif self.__ip == 'closed':
+                raise rpipe.exceptions.RpConnectionClosed()
+            elif self.__ip == 'broken':
+                raise RuntimeError("failed")
+
+            gevent.sleep(.01)
+            return self.__ip
+        finally:
+            self.__catalog.active -= 1
+
+
+class _FakeCatalog(object):
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    def find_connection(self, ip):
+        if ip == 'missing':
+            raise KeyError(ip)
+
+        return _FakeConnection(self, ip)
+
+
+class TestBroadcast(unittest.TestCase):
+    def __broadcast(self, ips, timeout_s=1, concurrency=10):
+        catalog = _FakeCatalog()
+        targets = [((ip + '-name',), ip) for ip in ips]
+
+        results = rpipe.server.broadcast.broadcast(
+                    catalog,
+                    targets,
+                    rpipe.event.build_event('get', 'name', ''),
+                    timeout_s,
+                    concurrency)
+
+        return (catalog, { r.ip: (r.reply, r.error) for r in results })
+
+    def test_results(self):
+        (_, results) = self.__broadcast(
+                        ['ok', 'missing', 'closed', 'broken', 'slow'],
+                        timeout_s=.1)
+
+        self.assertEqual(results, {
+            'ok': ('ok', None),
+            'missing': (None, rpipe.server.broadcast.ERROR_UNAVAILABLE),
+            'closed': (None, rpipe.server.broadcast.ERROR_UNAVAILABLE),
+            'broken': (None, rpipe.server.broadcast.ERROR_FAILED),
+            'slow': (None, rpipe.server.broadcast.ERROR_TIMEOUT),
+        })
+
+    def test_unfinished_are_timed_out(self):
+        (catalog, results) = self.__broadcast(['ok', 'hung'], timeout_s=.1)
+
+        self.assertEqual(
+            results['hung'],
+            (None, rpipe.server.broadcast.ERROR_TIMEOUT))
+
+        # The abandoned send was killed.
+        self.assertEqual(catalog.active, 0)
+
+    def test_concurrency(self):
+        ips = ['ok%d' % (i,) for i in range(10)]
+        (catalog, results) = self.__broadcast(ips, concurrency=3)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(catalog.max_active, 3)
+
+
+class TestSerializedMessage(unittest.TestCase):
+    def test_same_frame_to_many_connections(self):
+        serialized = rpipe.protocol.SerializedMessage(
+                        rpipe.event.build_event('get', 'name', ''))
+
+        self.assertEqual(
+            rpipe.protocol.get_message_type(serialized),
+            rpipe.protocol.get_message_type(
+                rpipe.event.build_event('get', 'name', '')))
+
+        with tests.harness.LoopHarness(_Handler()) as h1, \
+             tests.harness.LoopHarness(_Handler()) as h2:
+            replies = [
+                rpipe.message_exchange.send_and_receive(
+                    h.caller_address,
+                    serialized,
+                    timeout_s=5)
+                for h
+                in (h1, h2)]
+
+        self.assertEqual(
+            [r.data.decode('ascii') for r in replies],
+            [h1.participant_address[0], h2.participant_address[0]])
+
+
+class TestBroadcastView(unittest.TestCase):
+    def __broadcast(self, query):
+        app = web.application(
+                ('/clients/(.*)$', 'rpipe.views.server.broadcast.BroadcastServer'),
+                {})
+
+        with tests.harness.LoopHarness(_Handler()) as h1, \
+             tests.harness.LoopHarness(_Handler()) as h2:
+            cs = [
+                tests.harness.HarnessConnection(h1, ip='10.0.0.5'),
+                tests.harness.HarnessConnection(h2, ip='10.0.0.6'),
+            ]
+
+            with unittest.mock.patch.object(
+                    rpipe.server.connection,
+                    'get_connection_catalog',
+                    return_value=tests.harness.HarnessCatalog(cs)), \
+                 unittest.mock.patch.object(
+                    rpipe.config.server,
+                    'CLIENT_HOSTNAME_RESOLVER_CLS',
+                    'tests.test_broadcast._Resolver'), \
+                 unittest.mock.patch.object(
+                    rpipe.config.server,
+                    'CLIENT_TAGS',
+                    { 'web': ['host1', 'host2', '10.0.0.5', 'host3'] }):
+                r = app.request('/clients/name?' + query, method='POST', data='')
+
+        self.assertEqual(r.status, '200 OK')
+
+        lines = [json.loads(line) for line in r.data.splitlines()]
+        return (cs, lines)
+
+    def test_aliases_get_one_event(self):
+        (cs, lines) = self.__broadcast('clients=host1,10.0.0.5')
+
+        self.assertEqual([c.sent for c in cs], [1, 0])
+
+        self.assertEqual(lines, [
+            {
+                'client': 'host1',
+                'aliases': ['10.0.0.5'],
+                'ip': '10.0.0.5',
+                'code': 0,
+                'mimetype': 'text/plain',
+                'data': 'posted',
+            },
+            { 'summary': { 'succeeded': 1 } },
+        ])
+
+    def test_tag(self):
+        (cs, lines) = self.__broadcast('tag=web')
+
+        self.assertEqual([c.sent for c in cs], [1, 1])
+
+        by_client = { line.get('client'): line for line in lines }
+
+        self.assertEqual(by_client['host3']['error'], 'unresolvable')
+        self.assertEqual(by_client['host1']['aliases'], ['10.0.0.5'])
+        self.assertNotIn('aliases', by_client['host2'])
+
+        self.assertEqual(
+            by_client[None]['summary'],
+            { 'succeeded': 2, 'unresolvable': 1 })
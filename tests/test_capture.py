@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import rpipe.capture
+import rpipe.event
+import rpipe.event_handling
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.tools.replay
+import rpipe.transport
+
+
+class TestCaptureAndReplay(unittest.TestCase):
+    def setUp(self):
+        self.__path = tempfile.mkdtemp()
+        self.__filepath = os.path.join(self.__path, 'test.rpcap')
+
+    def tearDown(self):
+        rpipe.protocol.set_capture_writer(None)
+        shutil.rmtree(self.__path)
+
+    def __capture(self):
+        """Send a little of everything from one end of a pipe to the other."""
+
+        cw = rpipe.capture.CaptureWriter(self.__filepath)
+        rpipe.protocol.set_capture_writer(cw)
+
+        (a, b) = rpipe.transport.create_memory_pipe('test-capture')
+
+        heartbeat = rpipe.protocol.get_obj_from_type(
+                        rpipe.protocols.MT_HEARTBEAT)
+
+        heartbeat.version = 1
+
+        streamed = rpipe.event.build_event('post', 'upload', b'abc')
+        streamed.is_streamed = True
+
+        unfinished = rpipe.event.build_event('post', 'upload', b'uvw')
+        unfinished.is_streamed = True
+
+        reply = rpipe.event_handling.build_event_reply(0, data=b'ok')
+
+        frames = [
+            (heartbeat, {}),
+            (rpipe.event.build_event(
+                'get', 'thing', '', idempotency_key='key1'), {}),
+            (streamed, { 'message_id': 1000000001 }),
+            (unfinished, { 'message_id': 1000000002 }),
+            (rpipe.event.build_event_chunk(b'def'),
+                { 'message_id': 1000000001 }),
+            (reply, { 'is_response': True }),
+            (rpipe.event.build_event_chunk(b'', is_last=True),
+                { 'message_id': 1000000001 }),
+        ]
+
+        for (message_obj, kwargs) in frames:
+            rpipe.protocol.send_message_obj(a, message_obj, **kwargs)
+            rpipe.protocol.read_message_from_file_object(b)
+
+        rpipe.protocol.set_capture_writer(None)
+        cw.close()
+
+        return len(frames)
+
+    def test_every_frame_is_recorded_both_ways(self):
+        count = self.__capture()
+
+        with open(self.__filepath, 'rb') as f:
+            records = list(rpipe.capture.read_capture(f))
+
+        self.assertEqual(len(records), count * 2)
+
+        sent = [r
+                for r
+                in records
+                if r.direction == rpipe.capture.DIRECTION_SENT]
+
+        received = [r
+                    for r
+                    in records
+                    if r.direction == rpipe.capture.DIRECTION_RECEIVED]
+
+        self.assertEqual([r.frame for r in sent], [r.frame for r in received])
+
+        # Each end of the pipe is its own connection.
+        self.assertEqual(set(r.connection_id for r in sent), set([1]))
+        self.assertEqual(set(r.connection_id for r in received), set([2]))
+
+    def test_truncated_capture(self):
+        self.__capture()
+
+        with open(self.__filepath, 'rb') as f:
+            data = f.read()
+
+        with open(self.__filepath, 'wb') as f:
+            f.write(data[:-3])
+
+        with open(self.__filepath, 'rb') as f:
+            records = list(rpipe.capture.read_capture(f))
+
+        self.assertEqual(len(records), 13)
+
+    def test_load_requests(self):
+        self.__capture()
+
+        with open(self.__filepath, 'rb') as f:
+            requests = rpipe.tools.replay.load_requests(f)
+
+        # No heartbeats, replies, or streams that didn't finish.
+        self.assertEqual(
+            [(r.message_obj.verb, r.message_obj.noun) for r in requests],
+            [('get', 'thing'), ('post', 'upload')])
+
+        self.assertEqual(requests[0].offset_s, 0)
+
+        # Replaying mustn't look like a retry.
+        self.assertFalse(requests[0].message_obj.idempotency_key)
+
+        # The stream is sent whole.
+        self.assertFalse(requests[1].message_obj.is_streamed)
+        self.assertEqual(requests[1].message_obj.data, b'abcdef')
+
+    def test_replay(self):
+        self.__capture()
+
+        with open(self.__filepath, 'rb') as f:
+            requests = rpipe.tools.replay.load_requests(f)
+
+        sent = []
+
+        class _Connection(object):
+            def initiate_message(self, message_obj, timeout_s=None):
+                sent.append(message_obj.noun)
+
+        result = rpipe.tools.replay.ReplayResult(
+                    rpipe.tools.replay.TARGET_SERVER,
+                    0)
+
+        rpipe.tools.replay._replay(
+            result,
+            requests,
+            { 1: _Connection() },
+            0,
+            1)
+
+        self.assertEqual(sent, ['thing', 'upload'])
+        self.assertEqual(result.request_failures, 0)
+        self.assertEqual(result.latency.count, 2)
@@ -0,0 +1,147 @@
+import unittest
+import unittest.mock
+
+import gevent
+import gevent.event
+
+import rpipe.client.connection
+import rpipe.client.outbox
+import rpipe.event
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.transport
+
+
+class _FakeConnectionCycle(object):
+    """Stands in for the client's connection manager."""
+
+    def __init__(self):
+        self.c = None
+        self.__ready_e = gevent.event.Event()
+
+    def connect(self, c):
+        self.c = c
+        self.__ready_e.set()
+
+    def disconnect(self):
+        self.c = None
+        self.__ready_e.clear()
+
+    def wait_for_connection(self, timeout_s=None):
+        if self.c is None and self.__ready_e.wait(timeout_s) is False:
+            raise rpipe.exceptions.RpConnectionClosed()
+
+        return self.c
+
+
+class TestClientOutbox(unittest.TestCase):
+    def setUp(self):
+        self.__cycle = _FakeConnectionCycle()
+
+        patcher = unittest.mock.patch.object(
+                    rpipe.client.connection,
+                    'wait_for_connection',
+                    self.__cycle.wait_for_connection)
+
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.__ob = rpipe.client.outbox.Outbox(
+                        max_pending=1,
+                        idempotent_verbs=('get',))
+
+    def test_waits_for_the_connection(self):
+        g = gevent.spawn(
+                self.__ob.send,
+                lambda c, timeout_s: c,
+                'get',
+                timeout_s=1)
+
+        gevent.sleep(0)
+        self.assertFalse(g.ready())
+
+        self.__cycle.connect('c1')
+        self.assertEqual(g.get(timeout=1), 'c1')
+
+    def test_connection_doesnt_come_back(self):
+        with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+            self.__ob.send(lambda c, timeout_s: c, 'get', timeout_s=.01)
+
+    def test_too_many_waiting(self):
+        g = gevent.spawn(
+                self.__ob.send,
+                lambda c, timeout_s: c,
+                'get',
+                timeout_s=1)
+
+        gevent.sleep(0)
+
+        with self.assertRaises(rpipe.client.outbox.OutboxFullError):
+            self.__ob.send(lambda c, timeout_s: c, 'get', timeout_s=1)
+
+        self.__cycle.connect('c1')
+        g.get(timeout=1)
+
+    def __get_send_cb(self):
+        sent = []
+
+        def send_cb(c, timeout_s):
+            sent.append(c)
+
+            # The first connection breaks while we wait on the reply.
+            if c == 'c1':
+                self.__cycle.disconnect()
+                gevent.spawn_later(.01, self.__cycle.connect, 'c2')
+
+                raise rpipe.exceptions.RpConnectionClosed()
+
+            return c
+
+        return (sent, send_cb)
+
+    def test_idempotent_event_is_replayed(self):
+        (sent, send_cb) = self.__get_send_cb()
+        self.__cycle.connect('c1')
+
+        self.assertEqual(self.__ob.send(send_cb, 'get', timeout_s=1), 'c2')
+        self.assertEqual(sent, ['c1', 'c2'])
+
+    def test_other_events_arent_replayed(self):
+        for (verb, can_replay) in (('post', True), ('get', False)):
+            (sent, send_cb) = self.__get_send_cb()
+            self.__cycle.connect('c1')
+
+            with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+                self.__ob.send(
+                    send_cb,
+                    verb,
+                    timeout_s=1,
+                    can_replay=can_replay)
+
+            self.assertEqual(sent, ['c1'])
+            gevent.sleep(.02)
+
+
+class TestBrokenConnection(unittest.TestCase):
+    def test_waiter_is_woken(self):
+        (a, b) = rpipe.transport.create_memory_pipe('test-broken')
+        rpipe.message_exchange.start_exchange(a, 'test-broken')
+
+        try:
+            g = gevent.spawn(
+                    rpipe.message_exchange.send_and_receive,
+                    'test-broken',
+                    rpipe.event.build_event('get', 'x', ''),
+                    timeout_s=5)
+
+            gevent.sleep(.01)
+            b.close()
+
+            # It doesn't have to wait out its timeout to find out.
+            g.join(timeout=1)
+            self.assertIsInstance(
+                g.exception,
+                rpipe.exceptions.RpConnectionClosed)
+        finally:
+            if 'test-broken' in rpipe.message_exchange._instances:
+                rpipe.message_exchange.stop_exchange('test-broken')
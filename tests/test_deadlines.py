@@ -0,0 +1,151 @@
+import time
+import unittest
+import unittest.mock
+
+import gevent
+
+import rpipe.config.web_server
+import rpipe.event
+import rpipe.event_handling
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.transport
+
+import tests.harness
+
+
+class _Handler(object):
+    def __init__(self):
+        self.calls = 0
+
+    def get_slow(self, ctx, post_data):
+        self.calls += 1
+        gevent.sleep(.2)
+
+        return 'slow'
+
+    def get_quick(self, ctx, post_data):
+        self.calls += 1
+        return 'quick'
+
+
+class TestRequestTimeout(unittest.TestCase):
+    def test_header(self):
+        self.assertEqual(
+            rpipe.event.get_request_timeout_s('get', 'x', '1500'),
+            1.5)
+
+        self.assertEqual(
+            rpipe.event.get_request_timeout_s('get', 'x', '999999999'),
+            rpipe.config.web_server.MAXIMUM_EVENT_TIMEOUT_S)
+
+        for timeout_ms in ('0', '-1', 'abc'):
+            with self.assertRaises(ValueError):
+                rpipe.event.get_request_timeout_s('get', 'x', timeout_ms)
+
+    def test_handler_default(self):
+        with unittest.mock.patch.object(
+                rpipe.config.web_server,
+                'EVENT_TIMEOUTS_S',
+                { 'get_thing': 7 }):
+            self.assertEqual(
+                rpipe.event.get_request_timeout_s('get', 'thing//1'),
+                7)
+
+            self.assertEqual(
+                rpipe.event.get_request_timeout_s('get', 'other'),
+                rpipe.config.web_server.DEFAULT_EVENT_TIMEOUT_S)
+
+
+class TestDeadlines(unittest.TestCase):
+    def test_remaining_is_measured_from_arrival(self):
+        (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                rpipe.event.build_event(
+                                    'get',
+                                    'x',
+                                    '',
+                                    timeout_s=1))
+
+        (message_info, message_obj) = \
+            rpipe.protocol.read_message_from_buffer(bytearray(frame))
+
+        remaining_s = rpipe.event_handling.get_remaining_s(
+                        message_info,
+                        message_obj)
+
+        self.assertGreater(remaining_s, .9)
+        self.assertLessEqual(remaining_s, 1)
+        self.assertFalse(
+            rpipe.event_handling.is_expired(message_info, message_obj))
+
+        message_info['received_at'] = time.time() - 2
+
+        self.assertTrue(
+            rpipe.event_handling.is_expired(message_info, message_obj))
+
+    def test_no_deadline(self):
+        (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                rpipe.event.build_event('get', 'x', ''))
+
+        (message_info, message_obj) = \
+            rpipe.protocol.read_message_from_buffer(bytearray(frame))
+
+        self.assertIsNone(
+            rpipe.event_handling.get_remaining_s(message_info, message_obj))
+
+    def test_late_reply_is_dropped(self):
+        (a, b) = rpipe.transport.create_memory_pipe('test-late')
+        me = rpipe.message_exchange.start_exchange(a, 'test-late')
+
+        try:
+            rpipe.protocol.send_message_obj(
+                b,
+                rpipe.event_handling.build_event_reply(0, data=b'late'),
+                message_id=1234567890,
+                is_response=True)
+
+            rpipe.protocol.send_message_obj(
+                b,
+                rpipe.event.build_event('get', 'x', ''))
+
+            # The reply isn't mistaken for a request.
+            (message_info, message_obj) = me.read(timeout=1)
+            self.assertEqual(message_obj.noun, 'x')
+        finally:
+            b.close()
+            rpipe.message_exchange.stop_exchange('test-late')
+
+    def test_connection_survives_a_timeout(self):
+        handler = _Handler()
+
+        with tests.harness.LoopHarness(handler) as h:
+            with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+                h.send_and_receive(
+                    rpipe.event.build_event('get', 'slow', '', timeout_s=5),
+                    timeout_s=.05)
+
+            gevent.sleep(.3)
+
+            reply = h.send_and_receive(
+                        rpipe.event.build_event('get', 'quick', ''))
+
+            self.assertEqual(reply.data, b'quick')
+
+    def test_expired_event_is_not_handled(self):
+        handler = _Handler()
+
+        message_obj = rpipe.event.build_event('get', 'quick', '')
+
+        message_obj.timeout_ms = 1
+
+        # However quickly it arrives, it's already too late.
+        with tests.harness.LoopHarness(handler) as h:
+            with unittest.mock.patch.object(
+                    rpipe.event_handling,
+                    'is_expired',
+                    return_value=True):
+                with self.assertRaises(
+                        rpipe.message_exchange.ResponseTimeoutError):
+                    h.send_and_receive(message_obj, timeout_s=.2)
+
+        self.assertEqual(handler.calls, 0)
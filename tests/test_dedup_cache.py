@@ -0,0 +1,121 @@
+import json
+import unittest
+import uuid
+
+import rpipe.dedup_cache
+import rpipe.event
+
+import tests.harness
+
+
+class _CountingHandler(object):
+    def __init__(self):
+        self.calls = []
+
+    def post_counter(self, ctx, post_data):
+        self.calls.append(ctx.participant_address)
+        return { 'count': len(self.calls) }
+
+    def post_other(self, ctx, post_data):
+        self.calls.append(ctx.participant_address)
+        return { 'other': True }
+
+
+class TestDedupCache(unittest.TestCase):
+    def setUp(self):
+        self.dc = rpipe.dedup_cache.DedupCache(max_entries=10, ttl_s=60)
+
+    def test_repeat_returns_first_reply(self):
+        calls = []
+        fn = lambda: calls.append(1) or len(calls)
+
+        self.assertEqual(self.dc.do('10.0.0.1', 'k', 'f', fn), 1)
+        self.assertEqual(self.dc.do('10.0.0.1', 'k', 'f', fn), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_key_is_scoped_by_peer(self):
+        self.assertEqual(self.dc.do('10.0.0.1', 'k', 'f', lambda: 'a'), 'a')
+        self.assertEqual(self.dc.do('10.0.0.2', 'k', 'f', lambda: 'b'), 'b')
+
+    def test_fingerprint_mismatch_is_refused(self):
+        self.dc.do('10.0.0.1', 'k', 'f1', lambda: 'a')
+
+        with self.assertRaises(
+                rpipe.dedup_cache.IdempotencyKeyMismatchError):
+            self.dc.do('10.0.0.1', 'k', 'f2', lambda: 'b')
+
+    def test_failure_is_not_remembered(self):
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            self.dc.do('10.0.0.1', 'k', 'f', fail)
+
+        self.assertEqual(self.dc.do('10.0.0.1', 'k', 'f', lambda: 'a'), 'a')
+
+    def test_oldest_are_dropped(self):
+        for i in range(11):
+            self.dc.do('10.0.0.1', i, 'f', lambda: i)
+
+        self.assertEqual(self.dc.do('10.0.0.1', 0, 'f', lambda: 'new'), 'new')
+
+    def test_scope_ignores_port(self):
+        self.assertEqual(
+            rpipe.dedup_cache.get_scope(('10.0.0.1', 1234)), 
+            rpipe.dedup_cache.get_scope(('10.0.0.1', 5678)))
+
+    def test_fingerprint_covers_verb_noun_and_data(self):
+        fp = lambda *args: rpipe.dedup_cache.get_fingerprint(
+                            rpipe.event.build_event(*args))
+
+        base = fp('post', 'counter', '{"a": 1}')
+
+        self.assertEqual(base, fp('post', 'counter', '{"a": 1}'))
+        self.assertNotEqual(base, fp('put', 'counter', '{"a": 1}'))
+        self.assertNotEqual(base, fp('post', 'other', '{"a": 1}'))
+        self.assertNotEqual(base, fp('post', 'counter', '{"a": 2}'))
+
+
+class TestDedupOverTunnel(unittest.TestCase):
+    def test_retry_is_answered_once_per_peer(self):
+        eh = _CountingHandler()
+        key = uuid.uuid4().hex
+
+        with tests.harness.LoopHarness(eh) as h:
+            for _ in range(2):
+                reply = h.send_and_receive(
+                            rpipe.event.build_event(
+                                'post', 'counter', '', 
+                                idempotency_key=key))
+
+                self.assertEqual(reply.code, 0)
+                self.assertEqual(json.loads(reply.data), { 'count': 1 })
+
+        # The same key from another peer is a different request.
+        with tests.harness.LoopHarness(eh) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'post', 'counter', '', 
+                            idempotency_key=key))
+
+            self.assertEqual(json.loads(reply.data), { 'count': 2 })
+
+    def test_reused_key_for_other_event_is_refused(self):
+        eh = _CountingHandler()
+        key = uuid.uuid4().hex
+
+        with tests.harness.LoopHarness(eh) as h:
+            h.send_and_receive(
+                rpipe.event.build_event(
+                    'post', 'counter', '', idempotency_key=key))
+
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'post', 'other', '', idempotency_key=key))
+
+            self.assertNotEqual(reply.code, 0)
+            self.assertEqual(
+                json.loads(reply.data)['exception']['class'],
+                'IdempotencyKeyMismatchError')
+
+        self.assertEqual(len(eh.calls), 1)
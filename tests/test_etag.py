@@ -0,0 +1,84 @@
+import time
+import unittest
+import unittest.mock
+
+import rpipe.event
+import rpipe.server.response_cache
+import rpipe.views.etag
+
+import tests.harness
+
+
+class _Handler(object):
+    def __init__(self):
+        self.calls = 0
+
+    def etag_get_thing(self, ctx, thing_id):
+        return 'v' + thing_id
+
+    def get_thing(self, ctx, post_data, thing_id):
+        self.calls += 1
+        return { 'id': thing_id }
+
+
+class TestEtagHeaders(unittest.TestCase):
+    def test_parse_if_none_match(self):
+        self.assertEqual(rpipe.views.etag.parse_if_none_match(None), [])
+
+        self.assertEqual(
+            rpipe.views.etag.parse_if_none_match('"a", W/"b" ,c, *'),
+            ['a', 'b', 'c', '*'])
+
+    def test_format(self):
+        self.assertEqual(rpipe.views.etag.format_etag('a'), '"a"')
+
+
+class TestRevalidation(unittest.TestCase):
+    def test_current_copy_isnt_sent_again(self):
+        handler = _Handler()
+
+        with tests.harness.LoopHarness(handler) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event('get', 'thing//1', ''))
+
+            self.assertEqual(reply.etag, 'v1')
+            self.assertFalse(reply.is_not_modified)
+
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'get',
+                            'thing//1',
+                            '',
+                            if_none_match=['v0', 'v1']))
+
+            self.assertTrue(reply.is_not_modified)
+            self.assertEqual(reply.etag, 'v1')
+            self.assertEqual(reply.data, b'')
+
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'get',
+                            'thing//2',
+                            '',
+                            if_none_match=['v1']))
+
+            self.assertFalse(reply.is_not_modified)
+            self.assertEqual(reply.etag, 'v2')
+
+        self.assertEqual(handler.calls, 2)
+
+    def test_stale_entry_with_etag_is_kept(self):
+        rc = rpipe.server.response_cache.ResponseCache()
+        rc.put('1.1.1.1', 'get', 'thing', 'value', 0, etag='v1')
+
+        cached = rc.get('1.1.1.1', 'get', 'thing')
+        self.assertFalse(cached.is_fresh)
+        self.assertEqual(cached.etag, 'v1')
+
+        rc.put('1.1.1.1', 'get', 'other', 'value', 10)
+
+        with unittest.mock.patch.object(
+                time,
+                'time',
+                return_value=time.time() + 20):
+            self.assertIsNone(rc.get('1.1.1.1', 'get', 'other'))
@@ -0,0 +1,36 @@
+import unittest
+
+import rpipe.capabilities
+import rpipe.event
+import rpipe.exceptions
+
+
+class TestBatchRouting(unittest.TestCase):
+    def __build_events(self, *nouns):
+        return [rpipe.event.build_event('get', noun, '') for noun in nouns]
+
+    def test_too_large(self):
+        peer = rpipe.capabilities.PeerCapabilities(max_batch_events=2)
+        events = self.__build_events('a', 'b', 'c')
+
+        with self.assertRaises(rpipe.exceptions.RpBatchTooLarge):
+            rpipe.event.get_routed_events(peer, events)
+
+    def test_only_routed_events_count(self):
+        peer = rpipe.capabilities.PeerCapabilities(
+                max_batch_events=2,
+                routes=['get_a', 'get_b'])
+
+        events = self.__build_events('a', 'b', 'c', 'd')
+        routed = rpipe.event.get_routed_events(peer, events)
+
+        self.assertEqual([e.noun for e in routed], ['a', 'b'])
+
+        reply = rpipe.event.build_unrouted_reply('get', 'x')
+        replies = rpipe.event.merge_batch_replies(
+                    peer,
+                    events,
+                    [reply, reply])
+
+        self.assertEqual(len(replies), 4)
+        self.assertNotEqual(replies[2].code, 0)
@@ -0,0 +1,188 @@
+import json
+import unittest
+import unittest.mock
+
+import gevent
+import gevent.event
+import web
+
+import rpipe.config.server_web
+import rpipe.config.statsd
+import rpipe.config.web_server
+import rpipe.message_exchange
+import rpipe.server.broadcast
+import rpipe.server.connection
+import rpipe.server.fair_queue
+import rpipe.stats
+import rpipe.views.server.event
+
+import tests.harness
+
+
+class _Handler(object):
+    def post_thing(self, ctx, post_data):
+        return 'ok'
+
+
+class TestFairScheduler(unittest.TestCase):
+    def setUp(self):
+        self.__fs = rpipe.server.fair_queue.FairScheduler(
+                        slots=1,
+                        quantum=1,
+                        weights={ '1.1.1.1': 2 })
+
+        self.__timings = []
+
+        p = unittest.mock.patch.object(
+                rpipe.stats,
+                'post_timing',
+                side_effect=lambda name, duration_s: \
+                    self.__timings.append(name))
+
+        p.start()
+        self.addCleanup(p.stop)
+
+    def __hold(self, released_e):
+        with self.__fs.dispatch('0.0.0.0'):
+            released_e.wait()
+
+    def test_turns_follow_the_weights(self):
+        released_e = gevent.event.Event()
+        holder_g = gevent.spawn(self.__hold, released_e)
+        gevent.sleep(0)
+
+        served = []
+        def send(ip):
+            with self.__fs.dispatch(ip, timeout_s=5):
+                served.append(ip)
+
+        gs = [gevent.spawn(send, '1.1.1.1') for _ in range(4)] + \
+             [gevent.spawn(send, '2.2.2.2') for _ in range(2)]
+
+        gevent.sleep(0)
+        self.assertEqual(
+            self.__fs.get_queue_lengths(),
+            { '1.1.1.1': 4, '2.2.2.2': 2 })
+
+        released_e.set()
+        gevent.joinall([holder_g] + gs, timeout=5)
+
+        self.assertEqual(
+            served,
+            ['1.1.1.1', '1.1.1.1', '2.2.2.2',
+             '1.1.1.1', '1.1.1.1', '2.2.2.2'])
+
+        self.assertEqual(self.__fs.get_queue_lengths(), {})
+
+        # Only the client with its own weight gets its own series.
+        client_timing = \
+            rpipe.config.statsd.\
+                EVENT_SERVER_WEB_FAIR_QUEUE_CLIENT_WAIT_TIMING_TEMPLATE
+
+        self.assertEqual(
+            set(self.__timings),
+            set([rpipe.config.statsd.EVENT_SERVER_WEB_FAIR_QUEUE_WAIT_TIMING,
+                 client_timing % { 'ip': '1_1_1_1' }]))
+
+    def test_wait_times_out(self):
+        released_e = gevent.event.Event()
+        holder_g = gevent.spawn(self.__hold, released_e)
+        gevent.sleep(0)
+
+        try:
+            with self.assertRaises(
+                    rpipe.message_exchange.ResponseTimeoutError):
+                with self.__fs.dispatch('2.2.2.2', timeout_s=.01):
+                    pass
+
+            self.assertEqual(self.__fs.get_queue_lengths(), {})
+        finally:
+            released_e.set()
+            holder_g.join()
+
+        # The slot is free again.
+        with self.__fs.dispatch('2.2.2.2', timeout_s=0):
+            pass
+
+
+class TestUnwaitedEvents(unittest.TestCase):
+    """Events that aren't waited on still wait their turn."""
+
+    def setUp(self):
+        fs = rpipe.server.fair_queue.FairScheduler(slots=1)
+
+        for p in (unittest.mock.patch.object(
+                    rpipe.server.fair_queue, 
+                    '_fs', 
+                    fs),
+                  unittest.mock.patch.object(
+                    rpipe.views.server.event, 
+                    '_scheduler', 
+                    fs)):
+            p.start()
+            self.addCleanup(p.stop)
+
+        # Another client has the only slot.
+        self.__released_e = gevent.event.Event()
+
+        def hold():
+            with fs.dispatch('0.0.0.0'):
+                self.__released_e.wait()
+
+        self.__holder_g = gevent.spawn(hold)
+        gevent.sleep(0)
+
+        self.addCleanup(self.__holder_g.join)
+        self.addCleanup(self.__released_e.set)
+
+    def __request(self, path, mode=None):
+        app = web.application(rpipe.config.server_web.URLS, {})
+
+        headers = { rpipe.config.web_server.HEADER_EVENT_TIMEOUT_MS: '100' }
+        if mode is not None:
+            headers['X-Event-Mode'] = mode
+
+        with tests.harness.LoopHarness(_Handler()) as h:
+            c = tests.harness.HarnessConnection(h)
+
+            with unittest.mock.patch.object(
+                    rpipe.server.connection,
+                    'get_connection_catalog',
+                    return_value=tests.harness.HarnessCatalog([c])):
+                r = app.request(
+                        path, 
+                        method='POST', 
+                        data='', 
+                        headers=headers)
+
+                if mode == rpipe.config.web_server.EVENT_MODE_ASYNC:
+                    self.assertEqual(r.status[:3], '202')
+
+                    job_id = json.loads(r.data)['job_id']
+                    r = app.request('/jobs/%s?wait=5' % (job_id,))
+
+        return (c, r)
+
+    def test_forget(self):
+        (c, r) = self.__request(
+                    '/client/1.2.3.4/thing',
+                    rpipe.config.web_server.EVENT_MODE_FORGET)
+
+        self.assertEqual(r.status[:3], '504')
+        self.assertEqual(c.sent, 0)
+
+    def test_async(self):
+        (c, r) = self.__request(
+                    '/client/1.2.3.4/thing',
+                    rpipe.config.web_server.EVENT_MODE_ASYNC)
+
+        self.assertEqual(r.status[:3], '504')
+        self.assertEqual(c.sent, 0)
+
+    def test_broadcast(self):
+        (c, r) = self.__request('/clients/thing?clients=1.2.3.4')
+
+        self.assertEqual(c.sent, 0)
+        self.assertEqual(
+            json.loads(r.data.splitlines()[0])['error'],
+            rpipe.server.broadcast.ERROR_TIMEOUT)
@@ -0,0 +1,167 @@
+import io
+import struct
+import unittest
+
+import gevent
+
+import rpipe.capabilities
+import rpipe.client.connection
+import rpipe.config.protocol
+import rpipe.event
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.server.connection
+import rpipe.transport
+
+
+def _build_unknown_frame(message_type=0x7e, body=b'future'):
+    return struct.pack('!BBII', message_type, 0, len(body), 1234567890) + body
+
+
+class TestUnknownMessageTypes(unittest.TestCase):
+    def test_file_object_skips_unknown(self):
+        heartbeat = rpipe.protocol.get_obj_from_type(
+                        rpipe.protocols.MT_HEARTBEAT)
+
+        heartbeat.version = 1
+
+        (heartbeat_frame, _) = rpipe.protocol.serialize_message_obj(heartbeat)
+
+        f = io.BytesIO(_build_unknown_frame() + heartbeat_frame)
+
+        (message_info, message_obj) = \
+            rpipe.protocol.read_message_from_file_object(f)
+
+        self.assertEqual(
+            rpipe.protocol.get_message_type_from_info(message_info),
+            rpipe.protocols.MT_HEARTBEAT)
+
+    def test_buffer_skips_unknown(self):
+        buffer_ = bytearray(_build_unknown_frame())
+        self.assertIsNone(rpipe.protocol.read_message_from_buffer(buffer_))
+        self.assertEqual(len(buffer_), 0)
+
+
+class TestHelloRefusals(unittest.TestCase):
+    def test_retry_after_interval(self):
+        hr = rpipe.capabilities.HelloRefusals(retry_interval_s=0)
+        hr.refused('server')
+        self.assertTrue(hr.should_say_hello('server'))
+
+        hr = rpipe.capabilities.HelloRefusals(retry_interval_s=3600)
+        self.assertTrue(hr.should_say_hello('server'))
+
+        hr.refused('server')
+        self.assertFalse(hr.should_say_hello('server'))
+        self.assertTrue(hr.should_say_hello('other'))
+
+        hr.accepted('server')
+        self.assertTrue(hr.should_say_hello('server'))
+
+
+class _OldServer(object):
+    """Like a server from before the hello: it hangs up on one (and answers 
+    nothing else).
+    """
+
+    def __init__(self):
+        self.connections = 0
+
+    def handle(self, stream, address):
+        self.connections += 1
+
+        while 1:
+            try:
+                (message_info, message_obj) = \
+                    rpipe.protocol.read_message_from_file_object(stream)
+            except rpipe.exceptions.RpConnectionClosed:
+                return
+
+            if rpipe.protocol.get_message_type_from_info(message_info) == \
+                    rpipe.protocols.MT_HELLO:
+                stream.close()
+                return
+
+
+def _run_client(transport, binding):
+    c = rpipe.client.connection._ClientConnectionHandler(
+            transport=transport, 
+            binding=binding)
+
+    c.open()
+    g = gevent.spawn(c.process_requests)
+
+    return (c, g)
+
+
+class TestHelloNegotiation(unittest.TestCase):
+    def setUp(self):
+        self.transport = rpipe.transport.get_memory_transport()
+
+    def __wait_ready(self, c, timeout_s=5):
+        with gevent.Timeout(timeout_s):
+            while c.is_ready is False:
+                gevent.sleep(.01)
+
+    def test_hello_with_current_server(self):
+        binding = 'test-hello-current'
+
+        server = rpipe.server.connection.Server(
+                    transport=self.transport, 
+                    binding=binding)
+
+        server.start()
+        gevent.sleep(0)
+
+        try:
+            (c, g) = _run_client(self.transport, binding)
+
+            try:
+                self.__wait_ready(c)
+
+                peer = c.peer_capabilities
+                self.assertEqual(
+                    peer.protocol_version, 
+                    rpipe.config.protocol.PROTOCOL_VERSION)
+
+                self.assertTrue(
+                    peer.supports(rpipe.config.protocol.FEATURE_BATCHING))
+            finally:
+                g.kill()
+        finally:
+            server.stop()
+
+    def test_falls_back_with_old_server(self):
+        binding = 'test-hello-old'
+
+        old = _OldServer()
+        server = self.transport.create_server(binding, old.handle)
+        server_g = gevent.spawn(server.serve_forever)
+        gevent.sleep(0)
+
+        try:
+            # The first connection is hung up on.
+            (c, g) = _run_client(self.transport, binding)
+            g.join(timeout=5)
+
+            self.assertFalse(c.connected)
+            self.assertFalse(
+                rpipe.capabilities.get_hello_refusals().should_say_hello(
+                    binding))
+
+            # The next one doesn't say hello, and is ready right away.
+            (c, g) = _run_client(self.transport, binding)
+
+            try:
+                self.__wait_ready(c)
+                self.assertIs(c.peer_capabilities, rpipe.capabilities.UNKNOWN)
+                self.assertTrue(c.connected)
+            finally:
+                g.kill()
+
+            self.assertEqual(old.connections, 2)
+        finally:
+            rpipe.capabilities.get_hello_refusals().accepted(binding)
+            server.stop()
+            server_g.kill()
@@ -0,0 +1,118 @@
+import time
+import unittest
+import unittest.mock
+
+import gevent
+import gevent.event
+
+import rpipe.config.statsd
+import rpipe.event
+import rpipe.message_exchange
+import rpipe.server.jobs
+import rpipe.stats
+
+import tests.harness
+
+
+class _Handler(object):
+    def __init__(self):
+        self.calls = []
+
+    def post_thing(self, ctx, post_data):
+        self.calls.append(post_data)
+        return 'ok'
+
+
+class TestJobTable(unittest.TestCase):
+    def setUp(self):
+        self.__jt = rpipe.server.jobs.JobTable(max_entries=2, result_ttl_s=60)
+        self.__release_e = gevent.event.Event()
+
+    def __fn(self):
+        self.__release_e.wait()
+        return 'done'
+
+    def test_result_can_be_polled(self):
+        job_id = self.__jt.start(self.__fn)
+
+        result = self.__jt.wait(job_id)
+        self.assertFalse(result.ready())
+
+        self.__release_e.set()
+
+        result = self.__jt.wait(job_id, timeout_s=1)
+        self.assertEqual(result.get(block=False), 'done')
+
+    def test_exception_is_kept(self):
+        def fn():
+            raise RuntimeError("failed")
+
+        job_id = self.__jt.start(fn)
+
+        result = self.__jt.wait(job_id, timeout_s=1)
+        self.assertIsInstance(result.exception, RuntimeError)
+
+    def test_unknown_job(self):
+        with self.assertRaises(KeyError):
+            self.__jt.wait('missing')
+
+    def test_full_of_running_jobs(self):
+        self.__jt.start(self.__fn)
+        self.__jt.start(self.__fn)
+
+        with self.assertRaises(rpipe.server.jobs.JobTableFullError):
+            self.__jt.start(self.__fn)
+
+        self.__release_e.set()
+        gevent.sleep(0)
+
+        # An unclaimed result makes room for a new job.
+        self.__jt.start(self.__fn)
+        self.assertEqual(self.__jt.count, 2)
+
+    def test_finished_results_expire(self):
+        self.__release_e.set()
+
+        job_id = self.__jt.start(self.__fn)
+        self.__jt.wait(job_id, timeout_s=1)
+        gevent.sleep(0)
+
+        with unittest.mock.patch.object(
+                time,
+                'time',
+                return_value=time.time() + 61):
+            self.__jt.start(self.__fn)
+
+        with self.assertRaises(KeyError):
+            self.__jt.wait(job_id)
+
+
+class TestNoReply(unittest.TestCase):
+    def test_event_is_handled_without_a_reply(self):
+        handler = _Handler()
+
+        with unittest.mock.patch.object(
+                rpipe.stats,
+                'post_to_counter') as post_to_counter, \
+             tests.harness.LoopHarness(handler) as h:
+            message_obj = rpipe.event.build_event('post', 'thing', b'one')
+            message_obj.no_reply = True
+
+            rpipe.message_exchange.send(
+                h.caller_address,
+                message_obj,
+                expect_response=False)
+
+            # A reply would have arrived ahead of this one's, and been
+            # dropped as late.
+            reply = h.send_and_receive(
+                        rpipe.event.build_event('post', 'thing', b'two'))
+
+            self.assertEqual(reply.data, b'ok')
+
+        self.assertEqual(len(handler.calls), 2)
+
+        self.assertNotIn(
+            unittest.mock.call(
+                rpipe.config.statsd.EVENT_MESSAGE_REPLY_LATE_TICK),
+            post_to_counter.call_args_list)
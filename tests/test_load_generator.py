@@ -0,0 +1,139 @@
+import http.server
+import threading
+import time
+import unittest
+import unittest.mock
+
+import gevent
+
+import rpipe.event
+import rpipe.exceptions
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.transport
+
+import rpipe.tools.load_generator
+
+
+class _MemoryTransport(object):
+    def __init__(self):
+        self.streams = []
+
+    def connect(self, binding):
+        (client_stream, server_stream) = \
+            rpipe.transport.create_memory_pipe('load-generator')
+
+        self.streams.append(server_stream)
+        return client_stream
+
+
+class TestSimulatedClient(unittest.TestCase):
+    def test_reply_after_close_is_dropped(self):
+        stats = rpipe.tools.load_generator.LoadStats()
+        c = rpipe.tools.load_generator.SimulatedClient(
+                '127.0.0.1', 
+                'test', 
+                stats, 
+                .05, 
+                1)
+
+        transport = _MemoryTransport()
+        c._SimulatedClient__transport = transport
+
+        hub = gevent.get_hub()
+
+        with unittest.mock.patch.object(hub, 'handle_error') as handle_error:
+            g = gevent.spawn(c.run)
+
+            try:
+                gevent.sleep(0)
+                (server_stream,) = transport.streams
+
+                rpipe.protocol.send_message_obj(
+                    server_stream,
+                    rpipe.event.build_event('get', 'x', ''))
+
+                gevent.sleep(0)
+
+                # The client is still thinking about its reply.
+                server_stream.close()
+                gevent.sleep(.2)
+            finally:
+                g.kill()
+
+        self.assertEqual(stats.events_handled, 0)
+        self.assertEqual(stats.disconnects, 1)
+        handle_error.assert_not_called()
+
+    def test_send_when_closed(self):
+        c = rpipe.tools.load_generator.SimulatedClient(
+                '127.0.0.1',
+                'test',
+                rpipe.tools.load_generator.LoadStats(),
+                0,
+                1)
+
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            c._SimulatedClient__send(None, c._SimulatedClient__heartbeat)
+
+
+class _WebTierHandler(http.server.BaseHTTPRequestHandler):
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+
+        if self.path.endswith('/ok'):
+            self.send_response(200)
+        else:
+            self.send_response(500)
+
+        self.end_headers()
+        self.wfile.write(b'data')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDriveHttp(unittest.TestCase):
+    def setUp(self):
+        _WebTierHandler.paths = []
+
+        server = http.server.HTTPServer(('127.0.0.1', 0), _WebTierHandler)
+
+        t = threading.Thread(target=server.serve_forever)
+        t.daemon = True
+        t.start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.__base_url = 'http://127.0.0.1:%d/' % (server.server_address[1],)
+
+    def __drive(self, noun):
+        stats = rpipe.tools.load_generator.LoadStats()
+
+        rpipe.tools.load_generator._drive_http(
+            self.__base_url,
+            ['10.0.0.1', '10.0.0.2'],
+            noun,
+            stats,
+            time.time() + .1)
+
+        return stats
+
+    def test_requests_go_to_the_clients(self):
+        stats = self.__drive('ok')
+
+        self.assertGreater(stats.http_success, 0)
+        self.assertEqual(stats.http_failures, 0)
+
+        self.assertEqual(
+            set(_WebTierHandler.paths),
+            set(['/client/10.0.0.1/ok', '/client/10.0.0.2/ok']))
+
+    def test_failures_are_counted(self):
+        stats = self.__drive('bad')
+
+        self.assertEqual(stats.http_success, 0)
+        self.assertGreater(stats.http_failures, 0)
@@ -0,0 +1,174 @@
+import json
+import unittest
+import unittest.mock
+
+import gevent
+import gevent.event
+
+import rpipe.config.exchange
+import rpipe.event
+import rpipe.message_exchange
+
+import tests.harness
+
+
+class _Handler(object):
+    def post_echo(self, ctx, post_data):
+        (mimetype, data) = post_data
+        return data
+
+    def get_unencodable(self, ctx, post_data):
+        return object()
+
+    def get_raises(self, ctx, post_data):
+        raise RuntimeError("handler failed")
+
+
+class TestEventErrors(unittest.TestCase):
+    def __assert_exception_reply(self, reply, *class_names):
+        self.assertEqual(
+            reply.code, 
+            rpipe.config.exchange.UNHANDLED_EXCEPTION_CODE)
+
+        self.assertIn(
+            json.loads(reply.data)['exception']['class'], 
+            class_names)
+
+    def test_ok(self):
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'post', 'echo', '{"a": 1}', 'application/json'))
+
+        self.assertEqual(reply.code, 0)
+        self.assertEqual(json.loads(reply.data), { 'a': 1 })
+
+    def test_bad_json_is_answered(self):
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'post', 'echo', '{not json', 'application/json'))
+
+            # (A JSONDecodeError, under Python 3.)
+            self.__assert_exception_reply(
+                reply, 
+                'ValueError', 
+                'JSONDecodeError')
+
+            # The loop is still serving.
+            reply = h.send_and_receive(
+                        rpipe.event.build_event(
+                            'post', 'echo', '"ok"', 'application/json'))
+
+            self.assertEqual(reply.code, 0)
+            self.assertEqual(reply.data, b'ok')
+
+    def test_unencodable_result_is_answered(self):
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event('get', 'unencodable', ''))
+
+        self.__assert_exception_reply(reply, 'TypeError')
+
+    def test_handler_exception_is_answered(self):
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event('get', 'raises', ''))
+
+        self.__assert_exception_reply(reply, 'RuntimeError')
+
+    def test_batch_keeps_order_and_isolates_failures(self):
+        events = [
+            rpipe.event.build_event('post', 'echo', '1', 'application/json'),
+            rpipe.event.build_event('get', 'unencodable', ''),
+            rpipe.event.build_event('post', 'echo', '3', 'application/json'),
+        ]
+
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = h.send_and_receive(
+                        rpipe.event.build_event_batch(events))
+
+        self.assertEqual(len(reply.replies), 3)
+        self.assertEqual(json.loads(reply.replies[0].data), 1)
+        self.__assert_exception_reply(reply.replies[1], 'TypeError')
+        self.assertEqual(json.loads(reply.replies[2].data), 3)
+
+
+class _SlowHandler(object):
+    def __init__(self):
+        self.started_e = gevent.event.Event()
+        self.was_cancelled = False
+        self.finished = False
+
+    def get_slow(self, ctx, post_data):
+        self.started_e.set()
+
+        try:
+            gevent.sleep(5)
+        except gevent.GreenletExit:
+            self.was_cancelled = True
+            raise
+
+        self.finished = True
+
+
+class TestCancellation(unittest.TestCase):
+    def __wait_for_cancel(self, handler):
+        for _ in range(50):
+            if handler.was_cancelled is True:
+                break
+
+            gevent.sleep(.01)
+
+    def test_timeout_cancels_the_handler(self):
+        handler = _SlowHandler()
+
+        with tests.harness.LoopHarness(handler) as h:
+            rpipe.message_exchange.set_can_cancel(h.caller_address, True)
+
+            with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+                h.send_and_receive(
+                    rpipe.event.build_event('get', 'slow', ''),
+                    timeout_s=.1)
+
+            self.assertTrue(handler.started_e.is_set())
+
+            # Give the cancel time to arrive.
+            self.__wait_for_cancel(handler)
+
+            self.assertTrue(handler.was_cancelled)
+            self.assertFalse(handler.finished)
+
+    def test_killed_caller_cancels_the_handler(self):
+        handler = _SlowHandler()
+
+        with tests.harness.LoopHarness(handler) as h:
+            rpipe.message_exchange.set_can_cancel(h.caller_address, True)
+
+            g = gevent.spawn(
+                    h.send_and_receive,
+                    rpipe.event.build_event('get', 'slow', ''))
+
+            handler.started_e.wait(timeout=1)
+            g.kill()
+
+            self.__wait_for_cancel(handler)
+            self.assertTrue(handler.was_cancelled)
+
+    def test_no_cancel_unless_the_peer_reads_them(self):
+        handler = _SlowHandler()
+
+        with tests.harness.LoopHarness(handler) as h:
+            with unittest.mock.patch.object(
+                    rpipe.message_exchange,
+                    'send_cancel') as send_cancel:
+                with self.assertRaises(
+                        rpipe.message_exchange.ResponseTimeoutError):
+                    h.send_and_receive(
+                        rpipe.event.build_event('get', 'slow', ''),
+                        timeout_s=.1)
+
+            self.assertFalse(send_cancel.called)
+
+            self.__wait_for_cancel(handler)
+            self.assertFalse(handler.was_cancelled)
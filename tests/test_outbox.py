@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import rpipe.capabilities
+import rpipe.connection
+import rpipe.exceptions
+import rpipe.server.outbox
+
+
+class _FakeConnection(rpipe.connection.Connection):
+    def __init__(self, ip, fail_after=None):
+        self.ip = ip
+        self.sent = []
+        self.__fail_after = fail_after
+
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None):
+        if self.__fail_after is not None and \
+           len(self.sent) >= self.__fail_after:
+            raise rpipe.exceptions.RpConnectionClosed()
+
+        self.sent.append(message_obj)
+
+
+class TestDurableOutbox(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.path, 'outbox.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def __get_outbox(self, **kwargs):
+        return rpipe.server.outbox.DurableOutbox(
+                filepath=self.filepath, 
+                **kwargs)
+
+    def test_deliver_in_order_and_persist(self):
+        ob = self.__get_outbox()
+        for i in range(3):
+            ob.put('10.0.0.1', 'post', 'n%d' % (i,), 'data')
+
+        ob.put('10.0.0.2', 'post', 'other', 'data')
+
+        # Another process (or a restart) sees the same events.
+        ob = self.__get_outbox()
+        self.assertEqual(ob.get_depth('10.0.0.1'), 3)
+
+        c = _FakeConnection('10.0.0.1')
+        ob.deliver(c)
+
+        self.assertEqual([m.noun for m in c.sent], ['n0', 'n1', 'n2'])
+        self.assertEqual(ob.get_depth('10.0.0.1'), 0)
+        self.assertEqual(ob.get_depth('10.0.0.2'), 1)
+
+    def test_interrupted_delivery_is_resent_with_same_keys(self):
+        ob = self.__get_outbox(batch_size=10)
+        for i in range(3):
+            ob.put('10.0.0.1', 'post', 'n%d' % (i,), 'data')
+
+        c = _FakeConnection('10.0.0.1', fail_after=2)
+        ob.deliver(c)
+
+        self.assertEqual(len(c.sent), 2)
+        self.assertEqual(ob.get_depth('10.0.0.1'), 3)
+
+        c2 = _FakeConnection('10.0.0.1')
+        ob.deliver(c2)
+
+        self.assertEqual(
+            [m.idempotency_key for m in c2.sent[:2]],
+            [m.idempotency_key for m in c.sent])
+
+        self.assertEqual(ob.get_depth('10.0.0.1'), 0)
+
+    def test_limits(self):
+        ob = self.__get_outbox(max_events_per_client=2, max_bytes=10)
+
+        ob.put('10.0.0.1', 'post', 'n', '1234')
+        ob.put('10.0.0.1', 'post', 'n', '1234')
+
+        with self.assertRaises(rpipe.server.outbox.OutboxFullError):
+            ob.put('10.0.0.1', 'post', 'n', '1')
+
+        with self.assertRaises(rpipe.server.outbox.OutboxFullError):
+            ob.put('10.0.0.2', 'post', 'n', '12345')
+
+        # Delivering makes room again.
+        ob.deliver(_FakeConnection('10.0.0.1'))
+        ob.put('10.0.0.2', 'post', 'n', '12345')
+
+    def test_claimed_events_are_left_to_their_delivery(self):
+        ob = self.__get_outbox(claim_timeout_s=60)
+        ob.put('10.0.0.1', 'post', 'n', 'data')
+
+        # Another process tries to deliver while ours is under way.
+        other = self.__get_outbox()
+        other_c = _FakeConnection('10.0.0.1')
+
+        class _Stalled(_FakeConnection):
+            def initiate_message(self_, message_obj, **kwargs):
+                other.deliver(other_c)
+
+                _FakeConnection.initiate_message(self_, message_obj, **kwargs)
+
+        c = _Stalled('10.0.0.1')
+        ob.deliver(c)
+
+        self.assertEqual(len(c.sent), 1)
+        self.assertEqual(other_c.sent, [])
+        self.assertEqual(ob.get_depth('10.0.0.1'), 0)
+
+    def test_expired_events_are_pruned(self):
+        ob = self.__get_outbox(retention_s=0, prune_interval_s=0)
+        ob.put('10.0.0.1', 'post', 'n', 'data')
+
+        time.sleep(.01)
+        ob.put('10.0.0.2', 'post', 'n', 'data')
+
+        self.assertEqual(ob.get_depth('10.0.0.1'), 0)
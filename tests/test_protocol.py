@@ -0,0 +1,153 @@
+import io
+import json
+import unittest
+
+import rpipe.event
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.protocols
+
+import tests.harness
+
+
+def _build_event():
+    return rpipe.event.build_event(
+            'get',
+            'thing',
+            '{"a": 1}',
+            'application/json',
+            parameters=['x', 'y'],
+            timeout_s=2)
+
+
+class TestFrames(unittest.TestCase):
+    def __assert_same_event(self, message_obj, expected):
+        self.assertEqual(message_obj.verb, expected.verb)
+        self.assertEqual(message_obj.noun, expected.noun)
+        self.assertEqual(list(message_obj.parameters),
+                         list(expected.parameters))
+        self.assertEqual(message_obj.data, expected.data)
+        self.assertEqual(message_obj.timeout_ms, expected.timeout_ms)
+
+    def test_v2_round_trip(self):
+        message_obj = _build_event()
+
+        (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                message_obj,
+                                is_response=True,
+                                frame_version=rpipe.protocol.FRAME_V2,
+                                stream_id=300,
+                                fragment_id=70000)
+
+        # The header is a marker and then varints.
+        self.assertLess(
+            len(frame) - len(message_obj.SerializeToString()),
+            rpipe.protocol.get_standard_header_length() + 6)
+
+        for (message_info, message_obj_) in (
+                rpipe.protocol.read_message_from_file_object(
+                    io.BytesIO(frame)),
+                rpipe.protocol.read_message_from_buffer(bytearray(frame))):
+            self.assertEqual(
+                rpipe.protocol.get_frame_version_from_info(message_info),
+                rpipe.protocol.FRAME_V2)
+
+            self.assertEqual(
+                rpipe.protocol.get_message_type_from_info(message_info),
+                rpipe.protocols.MT_EVENT)
+
+            self.assertEqual(
+                rpipe.protocol.get_message_id_from_info(message_info),
+                message_id)
+
+            self.assertTrue(
+                rpipe.protocol.get_is_response_from_info(message_info))
+
+            self.assertEqual(message_info['stream_id'], 300)
+            self.assertEqual(message_info['fragment_id'], 70000)
+
+            self.__assert_same_event(message_obj_, message_obj)
+
+    def test_v1_folds_parameters_into_the_noun(self):
+        message_obj = _build_event()
+
+        (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                message_obj,
+                                frame_version=rpipe.protocol.FRAME_V1)
+
+        (message_info, message_obj_) = \
+            rpipe.protocol.read_message_from_buffer(bytearray(frame))
+
+        self.assertEqual(
+            rpipe.protocol.get_frame_version_from_info(message_info),
+            rpipe.protocol.FRAME_V1)
+
+        self.assertEqual(message_obj_.noun, 'thing//x/y')
+        self.assertEqual(list(message_obj_.parameters), [])
+
+        # The original is untouched.
+        self.assertEqual(list(message_obj.parameters), ['x', 'y'])
+
+    def test_partial_buffer(self):
+        (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                _build_event(),
+                                frame_version=rpipe.protocol.FRAME_V2)
+
+        frame += frame
+
+        buffer_ = bytearray()
+        messages = []
+        for i in range(len(frame)):
+            buffer_.append(frame[i])
+
+            message = rpipe.protocol.read_message_from_buffer(buffer_)
+            if message is not None:
+                messages.append(message)
+
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(len(buffer_), 0)
+
+    def test_mixed_versions_on_one_stream(self):
+        f = io.BytesIO()
+        for frame_version in (rpipe.protocol.FRAME_V1,
+                              rpipe.protocol.FRAME_V2,
+                              rpipe.protocol.FRAME_V1):
+            (frame, message_id) = rpipe.protocol.serialize_message_obj(
+                                    _build_event(),
+                                    frame_version=frame_version)
+
+            f.write(frame)
+
+        f.seek(0)
+
+        versions = [rpipe.protocol.get_frame_version_from_info(
+                        rpipe.protocol.read_message_from_file_object(f)[0])
+                    for _ in range(3)]
+
+        self.assertEqual(
+            versions,
+            [rpipe.protocol.FRAME_V1,
+             rpipe.protocol.FRAME_V2,
+             rpipe.protocol.FRAME_V1])
+
+
+class _Handler(object):
+    def get_thing(self, ctx, post_data, *parameters):
+        return { 'parameters': list(parameters) }
+
+
+class TestV2Events(unittest.TestCase):
+    def test_parameters_reach_the_handler(self):
+        for frame_version in (rpipe.protocol.FRAME_V1,
+                              rpipe.protocol.FRAME_V2):
+            with tests.harness.LoopHarness(_Handler()) as h:
+                rpipe.message_exchange.set_frame_version(
+                    h.caller_address,
+                    frame_version)
+
+                reply = h.send_and_receive(_build_event())
+
+            self.assertEqual(reply.code, 0)
+            self.assertEqual(
+                json.loads(reply.data),
+                { 'parameters': ['x', 'y'] })
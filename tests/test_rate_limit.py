@@ -0,0 +1,87 @@
+import unittest
+import unittest.mock
+
+import rpipe.config.web_server
+import rpipe.server.rate_limit
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_take_until_empty(self):
+        b = rpipe.server.rate_limit.TokenBucket(1, 3)
+
+        self.assertEqual(b.take(2), 0)
+        self.assertEqual(b.take(1), 0)
+
+        retry_after_s = b.take(1)
+        self.assertGreater(retry_after_s, 0)
+        self.assertLessEqual(retry_after_s, 1)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            unittest.mock.patch.object(
+                rpipe.config.web_server, 'CALLER_RATE_PER_S', .001),
+            unittest.mock.patch.object(
+                rpipe.config.web_server, 'CALLER_RATE_BURST', 5),
+            unittest.mock.patch.object(
+                rpipe.config.web_server,
+                'RATE_LIMITS_BY_ROUTE',
+                { 'get_small': (0, 0, .001, 2) }),
+        ]
+
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.__rl = rpipe.server.rate_limit.RateLimiter()
+
+    def __levels(self):
+        return dict((route, level)
+                    for ((scope, identity, route), level)
+                    in self.__rl.get_levels().items())
+
+    def test_rejected_batch_takes_nothing(self):
+        scope = rpipe.server.rate_limit.SCOPE_CALLER
+
+        self.__rl.take_all(scope, 'caller', { 'get_a': 3 })
+
+        # Only two are left, so none of these four are let through.
+        with self.assertRaises(rpipe.server.rate_limit.RateLimitedError):
+            self.__rl.take_all(scope, 'caller', { 'get_a': 2, 'get_b': 2 })
+
+        self.assertAlmostEqual(self.__levels()[None], 2, places=1)
+
+        self.__rl.take_all(scope, 'caller', { 'get_a': 1, 'get_b': 1 })
+        self.assertAlmostEqual(self.__levels()[None], 0, places=1)
+
+    def test_any_short_bucket_rejects_the_batch(self):
+        scope = rpipe.server.rate_limit.SCOPE_CALLER
+
+        self.__rl.take_all(scope, 'caller', { 'get_small': 1 })
+
+        # The shared bucket has room but the handler's own bucket doesn't.
+        with self.assertRaises(rpipe.server.rate_limit.RateLimitedError):
+            self.__rl.take_all(scope, 'caller', { 'get_a': 1, 'get_small': 2 })
+
+        levels = self.__levels()
+        self.assertAlmostEqual(levels[None], 5, places=1)
+        self.assertAlmostEqual(levels['get_small'], 1, places=1)
+
+    def test_identities_are_separate(self):
+        scope = rpipe.server.rate_limit.SCOPE_CALLER
+
+        self.__rl.take(scope, 'caller1', 'get_a', count=5)
+
+        with self.assertRaises(rpipe.server.rate_limit.RateLimitedError):
+            self.__rl.take(scope, 'caller1', 'get_a')
+
+        self.__rl.take(scope, 'caller2', 'get_a')
+
+    def test_unlimited(self):
+        self.__rl.take_all(
+            rpipe.server.rate_limit.SCOPE_CLIENT,
+            '127.0.0.1',
+            { 'get_a': 1000 })
+
+        self.assertEqual(self.__rl.get_levels(), {})
@@ -0,0 +1,107 @@
+import time
+import unittest
+import unittest.mock
+
+import rpipe.capabilities
+import rpipe.config.protocol
+import rpipe.connection
+import rpipe.event
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.server.response_cache
+
+
+class _FakeConnection(rpipe.connection.Connection):
+    def __init__(self, features):
+        self.sent = []
+        self.__peer = rpipe.capabilities.PeerCapabilities(features=features)
+
+    def send_message(self, message_obj):
+        self.sent.append(message_obj)
+
+    @property
+    def peer_capabilities(self):
+        return self.__peer
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.__rc = rpipe.server.response_cache.ResponseCache(max_entries=3)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.__rc.get('1.1.1.1', 'get', 'thing'))
+
+        self.__rc.put('1.1.1.1', 'get', 'thing', 'value', 60)
+
+        cached = self.__rc.get('1.1.1.1', 'get', 'thing')
+        self.assertEqual(cached.value, 'value')
+        self.assertTrue(cached.is_fresh)
+
+        # Keyed by client.
+        self.assertIsNone(self.__rc.get('2.2.2.2', 'get', 'thing'))
+
+    def test_expiry(self):
+        self.__rc.put('1.1.1.1', 'get', 'thing', 'value', 60)
+
+        with unittest.mock.patch.object(
+                time,
+                'time',
+                return_value=time.time() + 61):
+            self.assertIsNone(self.__rc.get('1.1.1.1', 'get', 'thing'))
+
+        self.assertEqual(self.__rc.count, 0)
+
+    def test_no_ttl_isnt_kept(self):
+        self.__rc.put('1.1.1.1', 'get', 'thing', 'value', 0)
+        self.assertEqual(self.__rc.count, 0)
+
+    def test_least_recently_used_is_evicted(self):
+        for noun in ('a', 'b', 'c'):
+            self.__rc.put('1.1.1.1', 'get', noun, noun, 60)
+
+        self.__rc.get('1.1.1.1', 'get', 'a')
+        self.__rc.put('1.1.1.1', 'get', 'd', 'd', 60)
+
+        self.assertIsNone(self.__rc.get('1.1.1.1', 'get', 'b'))
+
+        for noun in ('a', 'c', 'd'):
+            self.assertIsNotNone(self.__rc.get('1.1.1.1', 'get', noun))
+
+    def test_invalidate(self):
+        self.__rc.put('1.1.1.1', 'get', 'thing//1', 'one', 60)
+        self.__rc.put('1.1.1.1', 'get', 'thing//2', 'two', 60)
+        self.__rc.put('1.1.1.1', 'get', 'other', 'other', 60)
+
+        # A noun covers all of its parameters.
+        self.__rc.invalidate('1.1.1.1', 'thing')
+
+        self.assertIsNone(self.__rc.get('1.1.1.1', 'get', 'thing//1'))
+        self.assertIsNone(self.__rc.get('1.1.1.1', 'get', 'thing//2'))
+        self.assertIsNotNone(self.__rc.get('1.1.1.1', 'get', 'other'))
+
+        self.__rc.invalidate('1.1.1.1')
+        self.assertEqual(self.__rc.count, 0)
+
+        # Nothing to forget.
+        self.__rc.invalidate('2.2.2.2')
+
+
+class TestCacheInvalidation(unittest.TestCase):
+    def test_only_sent_to_servers_that_take_them(self):
+        c = _FakeConnection([])
+        rpipe.event.send_cache_invalidation(c, 'thing')
+
+        self.assertEqual(c.sent, [])
+
+        c = _FakeConnection(
+                [rpipe.config.protocol.FEATURE_CACHE_INVALIDATION])
+
+        rpipe.event.send_cache_invalidation(c, 'thing')
+
+        (message_obj,) = c.sent
+
+        self.assertEqual(
+            rpipe.protocol.get_message_type(message_obj),
+            rpipe.protocols.MT_CACHE_INVALIDATE)
+
+        self.assertEqual(message_obj.noun, 'thing')
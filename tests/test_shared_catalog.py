@@ -0,0 +1,153 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+import gevent
+import gevent.server
+import gevent.socket
+
+import rpipe.event
+import rpipe.event_handling
+import rpipe.exceptions
+import rpipe.server.shared_catalog
+
+
+class _FakeConnection(object):
+    def initiate_message(self, message_obj, timeout_s=None, chunks=None):
+        return rpipe.event_handling.build_event_reply(
+                0, 
+                'text/plain', 
+                'relayed ' + message_obj.noun)
+
+
+class _FakeCatalog(object):
+    def __init__(self):
+        self.connections = {}
+
+    def get_connection_by_ip(self, ip):
+        return self.connections[ip]
+
+
+class TestRelay(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.relay_path = os.path.join(self.path, 'acceptor.1.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def __start_relay(self, catalog):
+        relay = rpipe.server.shared_catalog.Relay(catalog, self.relay_path)
+        g = gevent.spawn(relay.serve_forever)
+        gevent.sleep(.01)
+
+        self.addCleanup(g.kill)
+        self.addCleanup(relay.stop)
+
+    def __start_server(self, handle):
+        if os.path.exists(self.relay_path) is True:
+            os.unlink(self.relay_path)
+
+        listener = gevent.socket.socket(
+                    gevent.socket.AF_UNIX, 
+                    gevent.socket.SOCK_STREAM)
+
+        listener.bind(self.relay_path)
+        listener.listen(1)
+
+        server = gevent.server.StreamServer(listener, handle)
+        server.start()
+
+        self.addCleanup(server.stop)
+
+    def __send(self, timeout_s=None):
+        c = rpipe.server.shared_catalog.RemoteConnection(
+                '10.0.0.1', 
+                self.relay_path)
+
+        return c.initiate_message(
+                rpipe.event.build_event('get', 'thing', ''),
+                timeout_s=timeout_s)
+
+    def test_round_trip(self):
+        catalog = _FakeCatalog()
+        catalog.connections['10.0.0.1'] = _FakeConnection()
+
+        self.__start_relay(catalog)
+
+        reply = self.__send()
+        self.assertEqual(reply.data, b'relayed thing')
+
+    def test_relay_not_running(self):
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            self.__send()
+
+    def test_client_not_held_by_relay(self):
+        self.__start_relay(_FakeCatalog())
+
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            self.__send()
+
+    def test_short_reply(self):
+        def handle(s, address):
+            s.recv(1024)
+            s.sendall(b'\x81\x01')
+            s.close()
+
+        self.__start_server(handle)
+
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            self.__send()
+
+    def test_garbage_reply(self):
+        def handle(s, address):
+            s.recv(1024)
+
+            # A v1 header for an event-reply, with a body that won't parse.
+            s.sendall(b'\x81\x01\x00\x00\x00\x04\x49\x96\x02\xd2\xff\xff\xff'
+                      b'\xff')
+
+            gevent.sleep(1)
+
+        self.__start_server(handle)
+
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            self.__send()
+
+    def test_stalled_relay_times_out(self):
+        def handle(s, address):
+            gevent.sleep(5)
+
+        self.__start_server(handle)
+
+        with self.assertRaises(
+                rpipe.server.shared_catalog.rpipe.message_exchange.\
+                    ResponseTimeoutError):
+            self.__send(timeout_s=.1)
+
+
+class TestSharedCatalogView(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_claim_over_stale_relay_socket(self):
+        view = rpipe.server.shared_catalog.SharedCatalogView(0, self.path)
+
+        # An acceptor that died left its entry and its socket-file behind.
+        stale_relay_path = os.path.join(self.path, 'acceptor.1.sock')
+
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.bind(stale_relay_path)
+        s.close()
+
+        with open(os.path.join(self.path, '10.0.0.1'), 'w') as f:
+            f.write(stale_relay_path)
+
+        view.claim('10.0.0.1')
+        self.assertEqual(view.list_ips(), ['10.0.0.1'])
+        self.assertIsNone(view.lookup('10.0.0.1'))
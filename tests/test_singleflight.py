@@ -0,0 +1,74 @@
+import unittest
+
+import gevent
+import gevent.event
+
+import rpipe.message_exchange
+import rpipe.server.singleflight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.__sf = rpipe.server.singleflight.SingleFlight()
+        self.__calls = 0
+        self.__release_e = gevent.event.Event()
+
+    def __fn(self):
+        self.__calls += 1
+        self.__release_e.wait()
+
+        return self.__calls
+
+    def test_concurrent_callers_share_one_call(self):
+        gs = [gevent.spawn(self.__sf.do, 'key', self.__fn) for _ in range(5)]
+        gevent.sleep(0)
+
+        self.__release_e.set()
+        gevent.joinall(gs, timeout=1)
+
+        self.assertEqual([g.value for g in gs], [1] * 5)
+        self.assertEqual(self.__calls, 1)
+
+        # Once it's finished, the next caller gets a call of its own.
+        self.assertEqual(self.__sf.do('key', self.__fn), 2)
+
+    def test_different_keys(self):
+        self.__release_e.set()
+
+        self.__sf.do('key1', self.__fn)
+        self.__sf.do('key2', self.__fn)
+
+        self.assertEqual(self.__calls, 2)
+
+    def test_abandoned_when_nobody_waits(self):
+        with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+            self.__sf.do('key', self.__fn, timeout_s=.01)
+
+        gevent.sleep(0)
+
+        # The call was killed, so a new caller starts over.
+        self.__release_e.set()
+        self.assertEqual(self.__sf.do('key', self.__fn), 2)
+
+    def test_one_timeout_doesnt_kill_the_call(self):
+        g = gevent.spawn(self.__sf.do, 'key', self.__fn)
+        gevent.sleep(0)
+
+        with self.assertRaises(rpipe.message_exchange.ResponseTimeoutError):
+            self.__sf.do('key', self.__fn, timeout_s=.01)
+
+        self.__release_e.set()
+
+        self.assertEqual(g.get(timeout=1), 1)
+        self.assertEqual(self.__calls, 1)
+
+    def test_exception_reaches_every_caller(self):
+        def fn():
+            gevent.sleep(.01)
+            raise RuntimeError("failed")
+
+        gs = [gevent.spawn(self.__sf.do, 'key', fn) for _ in range(2)]
+        gevent.joinall(gs, timeout=1)
+
+        for g in gs:
+            self.assertIsInstance(g.exception, RuntimeError)
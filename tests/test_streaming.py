@@ -0,0 +1,79 @@
+import json
+import unittest
+
+import gevent
+
+import rpipe.event
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.message_loop
+
+import tests.harness
+
+
+class _Handler(object):
+    def post_upload(self, ctx, post_data):
+        (mimetype, body) = post_data
+
+        first = body.read(4)
+        rest = b''.join(body)
+
+        return { 'first': first.decode('ascii'), 'rest': len(rest) }
+
+
+class TestStreamedBody(unittest.TestCase):
+    def test_read_and_iterate(self):
+        body = rpipe.message_loop.StreamedBody()
+        body.feed(b'abc')
+        body.feed(b'defg')
+        body.finish()
+
+        self.assertEqual(body.read(2), b'ab')
+        self.assertEqual(list(body), [b'c', b'defg'])
+        self.assertEqual(body.read(), b'')
+
+    def test_read_waits_for_chunks(self):
+        body = rpipe.message_loop.StreamedBody()
+
+        g = gevent.spawn(body.read)
+        gevent.sleep(0)
+
+        body.feed(b'abc')
+        gevent.sleep(0)
+        self.assertFalse(g.ready())
+
+        body.finish()
+        self.assertEqual(g.get(timeout=1), b'abc')
+
+    def test_abandoned(self):
+        body = rpipe.message_loop.StreamedBody()
+        body.feed(b'abc')
+        body.abandon()
+
+        with self.assertRaises(rpipe.exceptions.RpConnectionClosed):
+            body.read()
+
+
+class TestStreamedEvents(unittest.TestCase):
+    def test_body_arrives_in_chunks(self):
+        chunks = [b'head'] + [b'x' * 1000] * 20
+
+        message_obj = rpipe.event.build_event(
+                        'post',
+                        'upload',
+                        b'',
+                        'application/octet-stream')
+
+        message_obj.is_streamed = True
+
+        with tests.harness.LoopHarness(_Handler()) as h:
+            reply = rpipe.message_exchange.send_and_receive(
+                        h.caller_address,
+                        message_obj,
+                        timeout_s=5,
+                        chunks=rpipe.event.build_event_chunks(chunks))
+
+        self.assertEqual(reply.code, 0)
+        self.assertEqual(
+            json.loads(reply.data),
+            { 'first': 'head', 'rest': 20000 })
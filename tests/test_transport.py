@@ -0,0 +1,241 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+import gevent
+
+import rpipe.config.statsd
+import rpipe.event
+import rpipe.exceptions
+import rpipe.message_exchange
+import rpipe.protocol
+import rpipe.protocols
+import rpipe.stats
+import rpipe.transport
+
+
+class TestBandwidthShaper(unittest.TestCase):
+    def test_chunks_are_no_larger_than_the_burst(self):
+        s = rpipe.transport.BandwidthShaper(1000, 10)
+
+        chunks = s.get_chunks(b'x' * 25)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(b''.join(bytes(chunk) for chunk in chunks), b'x' * 25)
+
+    def test_waits_before_the_write(self):
+        s = rpipe.transport.BandwidthShaper(1000, 100)
+
+        # The bucket starts full.
+        started_at = time.time()
+        s.wait(100)
+        self.assertLess(time.time() - started_at, 0.05)
+
+        # Nothing is left, so this has to wait for it to be paid for.
+        started_at = time.time()
+        s.wait(100)
+        self.assertGreaterEqual(time.time() - started_at, 0.08)
+
+    def test_memory_stream_is_paced(self):
+        (a, b) = rpipe.transport.create_memory_pipe('test-shaper')
+        a.set_shaper(rpipe.transport.BandwidthShaper(1000, 100))
+
+        received = []
+        def read():
+            received.append(b.read(300))
+
+        g = gevent.spawn(read)
+
+        started_at = time.time()
+        a.write(b'x' * 300)
+        g.join(timeout=5)
+
+        # The first burst is free and the rest is paced.
+        self.assertGreaterEqual(time.time() - started_at, 0.18)
+        self.assertEqual(received, [b'x' * 300])
+        self.assertEqual(a.bytes_written, 300)
+
+
+class TestWritePriority(unittest.TestCase):
+    def test_heartbeat_is_written_ahead_of_queued_events(self):
+        (a, b) = rpipe.transport.create_memory_pipe('test-priority')
+
+        # Slow enough that the events are all still queued when the heartbeat
+        # is.
+        a.set_shaper(rpipe.transport.BandwidthShaper(100000, 1024))
+
+        me = rpipe.message_exchange.start_exchange(a, 'test-priority')
+
+        try:
+            for _ in range(3):
+                me.send(
+                    rpipe.event.build_event('post', 'bulk', b'x' * 4096),
+                    expect_response=False)
+
+            heartbeat = rpipe.protocol.get_obj_from_type(
+                            rpipe.protocols.MT_HEARTBEAT)
+
+            heartbeat.version = 1
+
+            me.send(heartbeat, expect_response=False)
+
+            types = []
+            for _ in range(4):
+                (message_info, message_obj) = \
+                    rpipe.protocol.read_message_from_file_object(b)
+
+                types.append(
+                    rpipe.protocol.get_message_type_from_info(message_info))
+
+            self.assertEqual(types[0], rpipe.protocols.MT_HEARTBEAT)
+            self.assertEqual(types[1:], [rpipe.protocols.MT_EVENT] * 3)
+        finally:
+            b.close()
+            rpipe.message_exchange.stop_exchange('test-priority')
+
+
+_CONNECT_SCRIPT = """
+import socket, sys, time
+s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+s.connect(sys.argv[1])
+time.sleep(5)
+"""
+
+
+class TestUnixPeerAddress(unittest.TestCase):
+    def setUp(self):
+        self.__path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.__path)
+
+    def test_each_process_gets_its_own_address(self):
+        binding = os.path.join(self.__path, 'rp.sock')
+
+        addresses = []
+        def handle(ws, address):
+            addresses.append(address)
+
+        transport = rpipe.transport.UnixTransport()
+        server = transport.create_server(binding, handle)
+        server.start()
+
+        ps = [subprocess.Popen([sys.executable, '-c', _CONNECT_SCRIPT, binding])
+              for _ in range(2)]
+
+        try:
+            for _ in range(100):
+                if len(addresses) == 2:
+                    break
+
+                gevent.sleep(.05)
+        finally:
+            for p in ps:
+                p.kill()
+                p.wait()
+
+            server.stop()
+
+        self.assertEqual(
+            sorted(port for (ip, port) in addresses), 
+            sorted(p.pid for p in ps))
+
+        ips = [ip for (ip, port) in addresses]
+        self.assertEqual(len(set(ips)), 2)
+
+        for (ip, pid) in addresses:
+            self.assertEqual(
+                ip, 
+                '127.%d.%d.%d' % (pid >> 16, (pid >> 8) & 0xff, pid & 0xff))
+
+
+def _openssl(path, *args):
+    subprocess.check_call(
+        ('openssl',) + args, 
+        cwd=path, 
+        stdout=subprocess.DEVNULL, 
+        stderr=subprocess.DEVNULL)
+
+def _make_certs(path):
+    """The certificates under dev/ are signed with a digest that current 
+    OpenSSL builds refuse, so make our own.
+    """
+
+    _openssl(path, 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-sha256', 
+             '-days', '1', '-subj', '/CN=test-ca', '-keyout', 'ca.key.pem', 
+             '-out', 'ca.crt.pem')
+
+    for name in ('server', 'client'):
+        _openssl(path, 'req', '-newkey', 'rsa:2048', '-nodes', '-sha256', 
+                 '-subj', '/CN=test-' + name, '-keyout', name + '.key.pem', 
+                 '-out', name + '.csr.pem')
+
+        _openssl(path, 'x509', '-req', '-sha256', '-days', '1', '-in', 
+                 name + '.csr.pem', '-CA', 'ca.crt.pem', '-CAkey', 
+                 'ca.key.pem', '-CAcreateserial', '-out', name + '.crt.pem')
+
+
+@unittest.skipUnless(
+    rpipe.transport._CAN_RESUME_CLIENT_SESSIONS, 
+    "Client-side session resumption isn't supported.")
+@unittest.skipUnless(shutil.which('openssl'), "OpenSSL isn't available.")
+class TestTlsSessionResumption(unittest.TestCase):
+    def setUp(self):
+        self.__path = tempfile.mkdtemp()
+        _make_certs(self.__path)
+
+    def tearDown(self):
+        shutil.rmtree(self.__path)
+
+    def test_reconnect_resumes_the_session(self):
+        def handle(ws, address):
+            # Echo until the client goes away.
+            while 1:
+                try:
+                    ws.write(ws.read(1))
+                except rpipe.exceptions.RpConnectionClosed:
+                    break
+
+        server_transport = rpipe.transport.TlsTcpTransport(
+                            os.path.join(self.__path, 'server.key.pem'),
+                            os.path.join(self.__path, 'server.crt.pem'),
+                            ca_certs=os.path.join(self.__path, 'ca.crt.pem'))
+
+        server = server_transport.create_server(('127.0.0.1', 0), handle)
+        server.start()
+
+        client_transport = rpipe.transport.TlsTcpTransport(
+                            os.path.join(self.__path, 'client.key.pem'),
+                            os.path.join(self.__path, 'client.crt.pem'))
+
+        posted = []
+
+        try:
+            with unittest.mock.patch.object(
+                    rpipe.stats, 
+                    'post_to_counter', 
+                    side_effect=lambda name, *args, **kwargs: \
+                        posted.append(name)):
+                for _ in range(2):
+                    ws = client_transport.connect(
+                            ('127.0.0.1', server.server_port))
+
+                    ws.write(b'x')
+                    self.assertEqual(ws.read(1), b'x')
+
+                    ws.close()
+        finally:
+            server.stop()
+
+        self.assertIn(
+            rpipe.config.statsd.EVENT_TLS_CLIENT_SESSION_RESUMED_TICK, 
+            posted)
+
+        self.assertNotIn(
+            rpipe.config.statsd.EVENT_TLS_CLIENT_SESSION_NOT_RESUMED_TICK, 
+            posted)